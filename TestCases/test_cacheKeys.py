@@ -0,0 +1,329 @@
+import threading
+import time
+import unittest
+from flask import Flask, Response, jsonify, request, stream_with_context
+from app.caching import SpongeCache, format_prometheus, apply_http_cache_headers
+
+LATEST = 2
+
+
+def get_genes(gene_symbol=None, ensg_number=None, limit=100, sponge_db_version: int = LATEST):
+    return {"gene_symbol": gene_symbol, "ensg_number": ensg_number, "limit": limit}
+
+
+def get_ordered(ensg_number):
+    return list(ensg_number)
+
+
+########################################################################################################################
+"""Test Cases for canonical cache keys"""
+########################################################################################################################
+
+class TestCacheKeys(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["CACHE_TYPE"] = "SimpleCache"
+        self.cache = SpongeCache(self.app, latest_version=LATEST)
+        self.calls = 0
+
+        def counted(f):
+            def wrapper(*args, **kwargs):
+                self.calls += 1
+                return f(*args, **kwargs)
+            wrapper.__name__ = f.__name__
+            wrapper.__module__ = f.__module__
+            wrapper.__wrapped__ = f
+            return wrapper
+
+        self.get_genes = self.cache.cached(query_string=True)(counted(get_genes))
+        self.get_ordered = self.cache.cached(query_string=True, order_sensitive=("ensg_number",))(counted(get_ordered))
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_list_order_is_ignored(self):
+        key = self.get_genes.make_cache_key
+        self.assertEqual(key(gene_symbol=["A", "B"]), key(gene_symbol=["B", "A"]))
+
+    def test_defaults_are_dropped(self):
+        key = self.get_genes.make_cache_key
+        self.assertEqual(key(), key(limit=100, sponge_db_version="2"))
+        self.assertEqual(key(), key(gene_symbol=[], ensg_number=None))
+        self.assertNotEqual(key(), key(limit=10))
+
+    def test_positional_and_keyword_arguments(self):
+        key = self.get_genes.make_cache_key
+        self.assertEqual(key(["A"], None, 10), key(limit=10, gene_symbol=["A"]))
+
+    def test_key_is_namespaced(self):
+        key = self.get_genes.make_cache_key
+        self.assertTrue(key().startswith("test_cacheKeys.get_genes:v2:"))
+        self.assertTrue(key(sponge_db_version="1").startswith("test_cacheKeys.get_genes:v1:"))
+
+    def test_order_sensitive_parameters(self):
+        key = self.get_ordered.make_cache_key
+        self.assertNotEqual(key(["ENSG2", "ENSG1"]), key(["ENSG1", "ENSG2"]))
+        self.assertEqual(self.get_ordered(["ENSG2", "ENSG1"]), ["ENSG2", "ENSG1"])
+
+    def test_equivalent_requests_share_entry(self):
+        self.get_genes(gene_symbol=["A", "B"])
+        self.get_genes(gene_symbol=["B", "A"], limit=100, sponge_db_version="2")
+        self.assertEqual(self.calls, 1)
+
+    def test_delete_version(self):
+        self.get_genes(gene_symbol=["A"])
+        self.get_genes(gene_symbol=["A"], sponge_db_version=1)
+        self.assertEqual(self.cache.delete_version(2), 1)
+        self.get_genes(gene_symbol=["A"], sponge_db_version=1)
+        self.assertEqual(self.calls, 2)
+        self.get_genes(gene_symbol=["A"])
+        self.assertEqual(self.calls, 3)
+
+
+class TestStreamCache(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["CACHE_TYPE"] = "SimpleCache"
+        self.app.config["CACHE_STREAM_MAX_BYTES"] = 1000
+        self.cache = SpongeCache(self.app, latest_version=LATEST)
+        self.calls = 0
+
+        @self.app.route("/expr")
+        def expr():
+            from flask import request
+            return get_expr(int(request.args["n"]))
+
+        @self.cache.cached_stream()
+        def get_expr(n):
+            self.calls += 1
+            if n < 0:
+                return jsonify({"status": 400}), 400
+
+            def _generate():
+                yield "["
+                yield ",".join(str(i) for i in range(n))
+                yield "]"
+            return Response(stream_with_context(_generate()), content_type='application/json')
+
+        self.client = self.app.test_client()
+
+    def test_stream_is_replayed(self):
+        first = self.client.get("/expr?n=3")
+        self.assertEqual(first.get_json(), [0, 1, 2])
+        second = self.client.get("/expr?n=3")
+        self.assertEqual(second.get_json(), [0, 1, 2])
+        self.assertEqual(second.content_type, "application/json")
+        self.assertEqual(self.calls, 1)
+
+    def test_large_streams_are_not_stored(self):
+        for _ in range(2):
+            response = self.client.get("/expr?n=1000")
+            self.assertEqual(len(response.get_json()), 1000)
+        self.assertEqual(self.calls, 2)
+
+    def test_error_responses_are_cached(self):
+        self.assertEqual(self.client.get("/expr?n=-1").status_code, 400)
+        self.assertEqual(self.client.get("/expr?n=-1").status_code, 400)
+        self.assertEqual(self.calls, 1)
+
+
+class TestCoalesce(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["CACHE_TYPE"] = "SimpleCache"
+        self.app.config["CACHE_COALESCE_POLL_INTERVAL"] = 0.01
+        self.cache = SpongeCache(self.app, latest_version=LATEST)
+        self.calls = 0
+
+        @self.cache.cached(query_string=True, coalesce=True)
+        def get_network(dataset_ID=None, fail=False):
+            self.calls += 1
+            time.sleep(0.1)
+            if fail:
+                raise ValueError("failed")
+            return {"nodes": [dataset_ID]}
+
+        self.get_network = get_network
+
+    def _run_concurrently(self, n, **kwargs):
+        results = []
+
+        def request():
+            with self.app.app_context():
+                try:
+                    results.append(self.get_network(**kwargs))
+                except ValueError as e:
+                    results.append(e)
+
+        threads = [threading.Thread(target=request) for _ in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_concurrent_misses_compute_once(self):
+        results = self._run_concurrently(5, dataset_ID=1)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [{"nodes": [1]}] * 5)
+
+    def test_failed_computation_releases_lock(self):
+        results = self._run_concurrently(2, dataset_ID=1, fail=True)
+        self.assertEqual(self.calls, 2)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+
+class TestStaleWhileRevalidate(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["CACHE_TYPE"] = "SimpleCache"
+        self.app.config["CACHE_DEFAULT_TIMEOUT"] = 60
+        self.app.config["CACHE_REFRESH_AHEAD"] = 30
+        self.cache = SpongeCache(self.app, latest_version=LATEST)
+        self.calls = 0
+
+        def get_counts(sponge_db_version=LATEST):
+            self.calls += 1
+            return {"calls": self.calls}
+
+        self.get_counts = get_counts
+
+    def _wait_for_refreshes(self):
+        for _ in range(100):
+            if not self.cache._refreshing:
+                return
+            time.sleep(0.01)
+
+    def test_stale_entry_is_served_and_refreshed(self):
+        get_counts = self.cache.cached(query_string=True, soft_timeout=0.05)(self.get_counts)
+        with self.app.app_context():
+            self.assertEqual(get_counts(), {"calls": 1})
+            time.sleep(0.06)
+            self.assertEqual(get_counts(), {"calls": 1})
+            self._wait_for_refreshes()
+            self.assertEqual(get_counts(), {"calls": 2})
+        self.assertEqual(self.calls, 2)
+
+    def test_hot_keys_are_refreshed_before_expiry(self):
+        get_counts = self.cache.cached(query_string=True, timeout=20)(self.get_counts)
+        with self.app.app_context():
+            get_counts()
+            get_counts()
+            get_counts(sponge_db_version=1)
+            self.assertEqual(len(self.cache.refresh_hot_keys()), 2)
+            self._wait_for_refreshes()
+            self.assertEqual(self.calls, 4)
+
+    def test_refresh_recreates_the_request(self):
+        @self.cache.cached(query_string=True, soft_timeout=0.05)
+        def get_limit(limit: int = None, sponge_db_version=LATEST):
+            self.calls += 1
+            return {"calls": self.calls, "limit": request.args.get("limit", default=100, type=int)}
+
+        with self.app.test_request_context("/limit", query_string={"limit": 5}):
+            self.assertEqual(get_limit(limit=5), {"calls": 1, "limit": 5})
+            time.sleep(0.06)
+            get_limit(limit=5)
+            self._wait_for_refreshes()
+            self.assertEqual(get_limit(limit=5), {"calls": 2, "limit": 5})
+
+    def test_fresh_hot_keys_are_not_refreshed(self):
+        get_counts = self.cache.cached(query_string=True)(self.get_counts)
+        with self.app.app_context():
+            get_counts()
+            self.assertEqual(self.cache.refresh_hot_keys(), [])
+
+
+class TestCacheMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["CACHE_TYPE"] = "app.caching.LocalLRUCache"
+        self.cache = SpongeCache(self.app, latest_version=LATEST)
+        self.get_genes = self.cache.cached(query_string=True)(get_genes)
+
+    def test_metrics(self):
+        with self.app.app_context():
+            self.get_genes(gene_symbol=["A"])
+            self.get_genes(gene_symbol=["A"])
+            self.get_genes(gene_symbol=["A"])
+            self.get_genes(gene_symbol=["B"])
+            metrics = self.cache.get_metrics()["test_cacheKeys.get_genes"]
+        self.assertEqual(metrics["hits"], 2)
+        self.assertEqual(metrics["misses"], 2)
+        self.assertEqual(metrics["hit_ratio"], 0.5)
+        self.assertEqual(metrics["keys"], 2)
+        self.assertGreater(metrics["avg_bytes"], 0)
+        self.assertIsNotNone(metrics["avg_compute_seconds"])
+        self.assertIsNotNone(metrics["avg_hit_seconds"])
+
+        text = format_prometheus({"test_cacheKeys.get_genes": metrics})
+        self.assertIn('sponge_cache_hits_total{endpoint="test_cacheKeys.get_genes"} 2', text)
+        self.assertIn("# TYPE sponge_cache_keys gauge", text)
+
+
+class TestConditionalRequests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["CACHE_TYPE"] = "SimpleCache"
+        self.app.config["CACHE_HTTP_MAX_AGE"] = 3600
+        self.cache = SpongeCache(self.app, latest_version=LATEST)
+        self.calls = 0
+
+        @self.cache.cached(query_string=True)
+        def get_genes(gene_symbol=None, sponge_db_version=LATEST):
+            self.calls += 1
+            if gene_symbol is None:
+                return jsonify({"status": 400}), 400
+            return jsonify([gene_symbol, get_ordered([sponge_db_version])])
+
+        def view():
+            from flask import request
+            return get_genes(request.args.get("gene_symbol"), request.args.get("sponge_db_version", LATEST))
+
+        # connexion names the endpoints after the operationId
+        self.app.add_url_rule("/genes", endpoint="/sponge-api.app_controllers_test_cacheKeys_get_genes", view_func=view)
+
+        @self.app.after_request
+        def add_header(response):
+            apply_http_cache_headers(response)
+            return response
+
+        self.client = self.app.test_client()
+
+    def test_not_modified(self):
+        first = self.client.get("/genes?gene_symbol=A&sponge_db_version=2")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers["Cache-Control"], "public, max-age=3600")
+        etag = first.headers["ETag"]
+
+        second = self.client.get("/genes?gene_symbol=A&sponge_db_version=2", headers={"If-None-Match": etag})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.headers["ETag"], etag)
+        self.assertEqual(second.data, b"")
+
+        other = self.client.get("/genes?gene_symbol=B&sponge_db_version=2", headers={"If-None-Match": etag})
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other.headers["ETag"], etag)
+        self.assertEqual(self.calls, 2)
+
+    def test_latest_version_is_revalidated(self):
+        response = self.client.get("/genes?gene_symbol=A")
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        self.assertIn("ETag", response.headers)
+
+    def test_errors_have_no_etag(self):
+        response = self.client.get("/genes?sponge_db_version=2")
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn("ETag", response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
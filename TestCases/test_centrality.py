@@ -0,0 +1,194 @@
+import os
+import unittest
+from unittest import mock
+
+os.environ.setdefault("SPONGE_DB_URI", "sqlite://")
+os.environ.setdefault("SPONGE_CACHE_BACKEND", "local")
+
+import numpy as np
+
+import server
+from app.config import app, db, cache
+import app.models as models
+from app import centrality, columnar, identifiers
+from app.controllers import dataset
+
+
+def brute_force_betweenness(n, edges):
+    """betweenness from all shortest paths, enumerated by BFS path counting per pair"""
+    adjacency = {v: set() for v in range(n)}
+    for a, b in edges:
+        if a != b:
+            adjacency[a].add(b)
+            adjacency[b].add(a)
+
+    def counts(source):
+        distance, sigma, queue = {source: 0}, {source: 1}, [source]
+        for v in queue:
+            for w in adjacency[v]:
+                if w not in distance:
+                    distance[w], sigma[w] = distance[v] + 1, 0
+                    queue.append(w)
+                if distance[w] == distance[v] + 1:
+                    sigma[w] += sigma[v]
+        return distance, sigma
+
+    tables = [counts(v) for v in range(n)]
+    values = np.zeros(n)
+    for s in range(n):
+        for t in range(s + 1, n):
+            distance_s, sigma_s = tables[s]
+            if t not in distance_s:
+                continue
+            for v in range(n):
+                distance_v, sigma_v = tables[v]
+                if v not in (s, t) and v in distance_s and t in distance_v \
+                        and distance_s[v] + distance_v[t] == distance_s[t]:
+                    values[v] += sigma_s[v] * sigma_v[t] / sigma_s[t]
+    return values
+
+
+########################################################################################################################
+"""Test Cases for the centralities of filtered subnetworks"""
+########################################################################################################################
+
+class TestCompute(unittest.TestCase):
+
+    def test_path(self):
+        result = centrality.compute([10, 20, 30, 40, 50], [10, 20, 30, 40], [20, 30, 40, 50])
+        self.assertEqual(result.betweenness, [0, 3, 4, 3, 0])
+        self.assertEqual(result.node_degree, [1, 2, 2, 2, 1])
+        self.assertEqual(np.argmax(result.eigenvector), 2)
+        self.assertAlmostEqual(max(result.eigenvector), 1)
+        self.assertFalse(result.approximate)
+
+    def test_random_graphs(self):
+        rng = np.random.default_rng(5)
+        for n in (1, 2, 7, 40):
+            edges = rng.integers(0, n, size=(2 * n, 2))
+            result = centrality.compute(list(range(n)), edges[:, 0], edges[:, 1])
+            self.assertTrue(np.allclose(result.betweenness, brute_force_betweenness(n, edges.tolist())))
+            matrix = centrality.adjacency(n, edges[:, 0], edges[:, 1]).toarray()
+            vector = np.asarray(result.eigenvector)
+            if vector.any():
+                # an eigenvector of the largest eigenvalue
+                largest = np.linalg.eigvalsh(matrix)[-1]
+                self.assertTrue(np.allclose(matrix @ vector, largest * vector, atol=1e-6))
+
+    def test_sampled(self):
+        rng = np.random.default_rng(2)
+        edges = rng.integers(0, 300, size=(900, 2))
+        exact = centrality.compute(list(range(300)), edges[:, 0], edges[:, 1])
+        sampled = centrality.compute(list(range(300)), edges[:, 0], edges[:, 1], exact_nodes=100, samples=150)
+        self.assertTrue(sampled.approximate)
+        self.assertGreater(np.corrcoef(exact.betweenness, sampled.betweenness)[0, 1], 0.9)
+        self.assertEqual(sampled.node_degree, exact.node_degree)
+
+    def test_time_budget(self):
+        edges = np.random.default_rng(3).integers(0, 300, size=(900, 2))
+        with mock.patch.object(centrality, "BATCH_CELLS", 300 * 10):
+            result = centrality.compute(list(range(300)), edges[:, 0], edges[:, 1], budget=0)
+        # only the first batch of searches is done and extrapolated
+        self.assertTrue(result.approximate)
+        self.assertGreater(sum(result.betweenness), 0)
+
+
+@unittest.skipUnless(os.environ["SPONGE_DB_URI"].startswith("sqlite"), "needs a scratch sqlite database")
+class TestSubnetworkCentrality(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app_context = app.app_context()
+        cls.app_context.push()
+        db.create_all()
+        rows = [
+            models.Disease(disease_ID=1, disease_name="breast"),
+            models.Dataset(dataset_ID=1, disease_ID=1, disease_name="breast", sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=1, dataset_ID=1, sponge_db_version=2),
+        ]
+        for i in range(1, 7):
+            rows += [models.Gene(gene_ID=i, ensg_number=f"ENSG{i}", gene_symbol=f"G{i}", gene_type="lincRNA"),
+                     models.Transcript(transcript_ID=i, gene_ID=i, enst_number=f"ENST{i}", transcript_type="lincRNA"),
+                     models.networkAnalysis(gene_ID=i, sponge_run_ID=1, betweenness=100, eigenvector=0.5,
+                                            node_degree=10),
+                     models.networkAnalysisTranscript(transcript_ID=i, sponge_run_ID=1, betweenness=100,
+                                                      eigenvector=0.5, node_degree=10)]
+        # the path 1 - 2 - 3 - 4 - 5, shortcut 2 - 4 with a low mscor and 5 - 6 with a high p_value
+        edges = [(1, 2, 0.5), (2, 3, 0.5), (3, 4, 0.5), (4, 5, 0.5), (2, 4, 0.1)]
+        for ID, (i, j, mscor) in enumerate(edges, start=1):
+            rows += [models.GeneInteraction(interactions_genegene_ID=ID, sponge_run_ID=1, gene_ID1=i, gene_ID2=j,
+                                            p_value=0.01, mscor=mscor, correlation=0.3),
+                     models.GeneInteractionAdjacency(sponge_run_ID=1, gene_ID=i, interactions_genegene_ID=ID),
+                     models.GeneInteractionAdjacency(sponge_run_ID=1, gene_ID=j, interactions_genegene_ID=ID),
+                     models.TranscriptInteraction(interactions_transcripttranscript_ID=ID, sponge_run_ID=1,
+                                                  transcript_ID_1=i, transcript_ID_2=j,
+                                                  p_value=0.01, mscor=mscor, correlation=0.3),
+                     models.TranscriptInteractionAdjacency(sponge_run_ID=1, transcript_ID=i,
+                                                           interactions_transcripttranscript_ID=ID),
+                     models.TranscriptInteractionAdjacency(sponge_run_ID=1, transcript_ID=j,
+                                                           interactions_transcripttranscript_ID=ID)]
+        rows.append(models.GeneInteraction(interactions_genegene_ID=6, sponge_run_ID=1, gene_ID1=5, gene_ID2=6,
+                                           p_value=0.5, mscor=0.5, correlation=0.3))
+        db.session.add_all(rows)
+        db.session.commit()
+        cls.client = server.connex_app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        app.config["COLUMNAR_ENGINE"] = False
+        db.drop_all()
+        cls.app_context.pop()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+        columnar.reset()
+
+    def setUp(self):
+        cache.clear()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+        columnar.reset()
+
+    def get(self, url):
+        response = self.client.get("/sponge-api/ceRNAInteraction/" + url)
+        self.assertEqual(response.status_code, 200, response.text)
+        return response.json()
+
+    def test_gene_network(self):
+        result = self.get("getGeneNetwork?dataset_ID=1&edgeSorting=pValue&minMscor=0.3&centrality=subnetwork&maxEdges=1")
+        self.assertEqual(result["centrality"], {"scope": "subnetwork", "approximate": False})
+        values = {n["gene"]["ensg_number"]: (n["betweenness"], n["node_degree"]) for n in result["nodes"]}
+        self.assertEqual(values, {"ENSG1": (0, 1), "ENSG2": (3, 2), "ENSG3": (4, 2), "ENSG4": (3, 2), "ENSG5": (0, 1)})
+        # the precomputed values of the run
+        result = self.get("getGeneNetwork?dataset_ID=1&edgeSorting=pValue&minMscor=0.3")
+        self.assertNotIn("centrality", result)
+        self.assertEqual({n["betweenness"] for n in result["nodes"]}, {100})
+
+    def test_formats_and_engine_agree(self):
+        for url in ("getGeneNetwork?dataset_ID=1&edgeSorting=pValue&centrality=subnetwork&ensemblID=ENSG2,ENSG3,ENSG4",
+                    "getTranscriptNetwork?dataset_ID=1&edgeSorting=mscor&centrality=subnetwork&minMscor=0.3"):
+            outputs = []
+            for engine in (False, True):
+                app.config["COLUMNAR_ENGINE"] = engine
+                cache.clear()
+                full, compact = self.get(url), self.get(url + "&format=compact")
+                self.assertEqual([n["betweenness"] for n in full["nodes"]], compact["nodes"]["betweenness"])
+                self.assertEqual(compact["centrality"], full["centrality"])
+                outputs.append(full)
+            self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual([n["node_degree"] for n in outputs[0]["nodes"]], [1, 2, 2, 2, 1])
+        # the shortcut 2 - 4 belongs to the subnetwork of 2, 3, 4 without an mscor filter
+        self.assertEqual({n["node_degree"] for n in self.get(
+            "getGeneNetwork?dataset_ID=1&edgeSorting=pValue&centrality=subnetwork&ensemblID=ENSG2,ENSG3,ENSG4")["nodes"]}, {2})
+
+    def test_cached_by_filters(self):
+        with mock.patch.object(centrality, "compute", wraps=centrality.compute) as compute:
+            for sorting in ("pValue", "mscor", "correlation"):
+                self.get(f"getGeneNetwork?dataset_ID=1&minMscor=0.3&centrality=subnetwork&edgeSorting={sorting}")
+            self.get("getGeneNetwork?dataset_ID=1&minMscor=0.3&centrality=subnetwork&edgeSorting=pValue&format=compact&maxEdges=2")
+            self.assertEqual(compute.call_count, 1)
+            self.get("getGeneNetwork?dataset_ID=1&minMscor=0.4&centrality=subnetwork&edgeSorting=pValue")
+            self.assertEqual(compute.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
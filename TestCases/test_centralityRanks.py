@@ -0,0 +1,158 @@
+import os
+import random
+import unittest
+from types import SimpleNamespace
+
+os.environ.setdefault("SPONGE_DB_URI", "sqlite://")
+os.environ.setdefault("SPONGE_CACHE_BACKEND", "local")
+
+from sqlalchemy import event
+
+import server
+from app.config import app, db, cache
+import app.models as models
+from app import identifiers
+from app.controllers import dataset, levels
+
+N = 40
+KEYS = ("betweenness", "eigenvector", "node_degree")
+
+
+def ranks(values):
+    """rank() OVER (ORDER BY value DESC) of MySQL: ties share the lowest rank, NULL last"""
+    keys = [(v is None, -(v or 0)) for v in values]
+    return [1 + sum(other < key for other in keys) for key in keys]
+
+
+def fill_ranks(rows):
+    """the ranks otherStuff/scripts/centrality_ranks.sql stores at ingestion, per run"""
+    for run in {row.sponge_run_ID for row in rows}:
+        nodes = [row for row in rows if row.sponge_run_ID == run]
+        for key in KEYS:
+            for node, rank in zip(nodes, ranks([getattr(node, key) for node in nodes])):
+                setattr(node, f"{key}_rank", rank)
+        for node in nodes:
+            node.combined_rank = sum(getattr(node, f"{key}_rank") for key in KEYS) / 3
+
+
+########################################################################################################################
+"""Test Cases for node sorting by the precomputed centrality ranks of the network endpoints"""
+########################################################################################################################
+
+@unittest.skipUnless(os.environ["SPONGE_DB_URI"].startswith("sqlite"), "needs a scratch sqlite database")
+class TestCentralityRanks(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app_context = app.app_context()
+        cls.app_context.push()
+        db.create_all()
+        rows = [
+            models.Disease(disease_ID=1, disease_name="breast"),
+            models.Dataset(dataset_ID=1, disease_ID=1, disease_name="breast", sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=1, dataset_ID=1, sponge_db_version=2),
+            models.Dataset(dataset_ID=2, disease_ID=1, disease_name="breast", sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=2, dataset_ID=2, sponge_db_version=2),
+        ]
+        rng = random.Random(11)
+        nodes, transcript_nodes, unranked = [], [], []
+        for i in range(1, N + 1):
+            # few distinct values for ties, some NULLs
+            for run, target in ((1, nodes), (2, unranked)):
+                values = dict(betweenness=rng.choice([None, 1.0, 5.0, 20.0, 100.0]), eigenvector=rng.random(),
+                              node_degree=rng.randint(1, 6))
+                target.append(models.networkAnalysis(gene_ID=i, sponge_run_ID=run, **values))
+                transcript_nodes.append(models.networkAnalysisTranscript(transcript_ID=i, sponge_run_ID=run, **values))
+            rows += [models.Gene(gene_ID=i, ensg_number=f"ENSG{i}", gene_symbol=f"G{i}", gene_type="lincRNA"),
+                     models.Transcript(transcript_ID=i, gene_ID=i, enst_number=f"ENST{i}", transcript_type="lincRNA")]
+        fill_ranks(nodes)
+        fill_ranks([node for node in transcript_nodes if node.sponge_run_ID == 1])
+        pairs = rng.sample([(i, j) for i in range(1, N + 1) for j in range(i + 1, N + 1)], 200)
+        for ID, (run, (i, j)) in enumerate([(run, pair) for run in (1, 2) for pair in pairs], start=1):
+            rows += [models.GeneInteraction(interactions_genegene_ID=ID, sponge_run_ID=run, gene_ID1=i, gene_ID2=j,
+                                            p_value=0.01, mscor=0.2, correlation=0.3),
+                     models.TranscriptInteraction(interactions_transcripttranscript_ID=ID, sponge_run_ID=run,
+                                                  transcript_ID_1=i, transcript_ID_2=j,
+                                                  p_value=0.01, mscor=0.2, correlation=0.3)]
+        db.session.add_all(rows + nodes + unranked + transcript_nodes)
+        db.session.commit()
+        cls.nodes = {node.gene_ID: node for node in nodes}
+        # run 2 was imported without ranks: the expected ranks are kept apart from the stored rows
+        cls.unranked = {node.gene_ID: SimpleNamespace(
+            gene_ID=node.gene_ID, sponge_run_ID=2, network_analysis_gene_ID=node.network_analysis_gene_ID,
+            **{key: getattr(node, key) for key in KEYS}) for node in unranked}
+        fill_ranks(list(cls.unranked.values()))
+        cls.client = server.connex_app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.drop_all()
+        cls.app_context.pop()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+
+    def setUp(self):
+        cache.clear()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+        identifiers.genes(), identifiers.transcripts(), dataset._run_catalog(2)
+        levels.unranked_runs(levels.GENE, 2), levels.unranked_runs(levels.TRANSCRIPT, 2)
+        self.statements = []
+
+        def count(conn, cursor, statement, *args):
+            self.statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", count)
+        self.addCleanup(event.remove, db.engine, "before_cursor_execute", count)
+
+    def get(self, url):
+        response = self.client.get("/sponge-api/ceRNAInteraction/" + url)
+        self.assertEqual(response.status_code, 200, response.text)
+        return response.json()
+
+    def expected(self, keys, limit, nodes=None):
+        """gene_IDs ordered by the mean of their ranks, ties by primary key"""
+        nodes = sorted((nodes or self.nodes).values(), key=lambda node: (
+            sum(getattr(node, f"{key}_rank") for key in keys) / len(keys), node.network_analysis_gene_ID))
+        return [f"ENSG{node.gene_ID}" for node in nodes[:limit]]
+
+    def test_node_sorting(self):
+        for keys in (["betweenness"], ["node_degree"], ["eigenvector", "betweenness"], list(KEYS),
+                     ["node_degree", "betweenness", "eigenvector", "node_degree"]):
+            url = f"getGeneNetwork?dataset_ID=1&edgeSorting=pValue&maxNodes=12&nodeSorting={','.join(keys)}"
+            expected = self.expected(sorted(set(keys)), 12)
+            self.assertEqual([n["gene"]["ensg_number"] for n in self.get(url)["nodes"]], expected, keys)
+            compact = self.get(url + "&format=compact")
+            self.assertEqual([compact["genes"][n]["ensg_number"] for n in compact["nodes"]["gene"]], expected, keys)
+            transcripts = self.get(url.replace("getGeneNetwork", "getTranscriptNetwork"))["nodes"]
+            self.assertEqual([n["transcript"]["enst_number"] for n in transcripts],
+                             [e.replace("ENSG", "ENST") for e in expected], keys)
+
+    def test_unranked_run(self):
+        # nodes without precomputed ranks are ranked within their run when they are read
+        for keys in (["betweenness"], ["eigenvector", "node_degree"], list(KEYS)):
+            url = f"getGeneNetwork?dataset_ID=2&edgeSorting=pValue&maxNodes=12&nodeSorting={','.join(keys)}"
+            expected = self.expected(keys, 12, self.unranked)
+            self.statements.clear()
+            self.assertEqual([n["gene"]["ensg_number"] for n in self.get(url)["nodes"]], expected, keys)
+            self.assertIn("rank(", [s for s in self.statements if "FROM network_analysis" in s][0].lower())
+            compact = self.get(url + "&format=compact")
+            self.assertEqual([compact["genes"][n]["ensg_number"] for n in compact["nodes"]["gene"]], expected, keys)
+            transcripts = self.get(url.replace("getGeneNetwork", "getTranscriptNetwork"))["nodes"]
+            self.assertEqual([n["transcript"]["enst_number"] for n in transcripts],
+                             [e.replace("ENSG", "ENST") for e in expected], keys)
+
+    def test_nodes_are_read_once(self):
+        for url in ("getGeneNetwork?dataset_ID=1&edgeSorting=pValue&nodeSorting=betweenness,eigenvector",
+                    "getGeneNetwork?dataset_ID=1&edgeSorting=pValue&nodeSorting=betweenness&format=compact",
+                    "getTranscriptNetwork?dataset_ID=1&edgeSorting=mscor&fields=nodes.betweenness",
+                    "getTranscriptNetwork?dataset_ID=1&edgeSorting=mscor&format=compact"):
+            self.statements.clear()
+            self.get(url)
+            node_queries = [s for s in self.statements if "FROM network_analysis" in s]
+            self.assertEqual(len(node_queries), 1, "\n".join(self.statements))
+            # the runs are ranked: sorted by the rank columns, no window functions
+            self.assertNotIn("rank(", node_queries[0].lower())
+
+
+if __name__ == '__main__':
+    unittest.main()
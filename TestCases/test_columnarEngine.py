@@ -0,0 +1,258 @@
+import os
+import random
+import tempfile
+import threading
+import unittest
+
+os.environ.setdefault("SPONGE_DB_URI", "sqlite://")
+os.environ.setdefault("SPONGE_CACHE_BACKEND", "local")
+
+import numpy as np
+
+import server
+from app.config import app, db, cache
+import app.models as models
+from app import columnar, identifiers
+from app.controllers import dataset
+
+N = 30
+
+
+########################################################################################################################
+"""Test Cases for the columnar interaction engine: its responses must equal the SQL responses"""
+########################################################################################################################
+
+class TestSelect(unittest.TestCase):
+
+    def test_run_cache(self):
+        runs = columnar.RunCache()
+        with app.app_context():
+            release, max_runs = app.config["SPONGE_DATA_RELEASE"], app.config["COLUMNAR_MAX_RUNS"]
+            self.addCleanup(app.config.update, SPONGE_DATA_RELEASE=release, COLUMNAR_MAX_RUNS=max_runs)
+            app.config["COLUMNAR_MAX_RUNS"] = 2
+            loaded = []
+
+            def load(run):
+                loaded.append(run)
+                return f"{release}:{run}"
+
+            for run in (1, 2, 1, 3, 1, 2):
+                self.assertEqual(runs.get("gene", run, lambda: load(run)), f"{release}:{run}")
+            # least recently used first out: 2 is dropped for 3, 3 for 2
+            self.assertEqual(loaded, [1, 2, 3, 2])
+            self.assertEqual(len(runs), 2)
+
+            # entries of other releases are dropped
+            app.config["SPONGE_DATA_RELEASE"] = release + "-next"
+            runs.get("gene", 4, lambda: "next")
+            self.assertEqual(len(runs), 1)
+
+        # loading a run does not block runs that are loaded already
+        started, finish = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            finish.wait(5)
+            return "slow"
+
+        def get_slow():
+            with app.app_context():
+                runs.get("gene", 5, slow)
+
+        thread = threading.Thread(target=get_slow)
+        thread.start()
+        started.wait(5)
+        with app.app_context():
+            self.assertEqual(runs.get("gene", 4, lambda: "reloaded"), "next")
+        finish.set()
+        thread.join()
+
+    def test_top_k_equals_full_sort(self):
+        rng = np.random.default_rng(1)
+        values = rng.integers(0, 5, 200).astype(float)
+        values[rng.integers(0, 200, 20)] = np.nan
+        run = columnar.RunColumns({"ID": np.arange(200, dtype=np.int64), "node1": np.zeros(200, dtype=np.int64),
+                                   "node2": np.ones(200, dtype=np.int64),
+                                   "p_value": values, "mscor": values, "correlation": values})
+        interactions = columnar.Interactions([run])
+        mask = np.ones(200, dtype=bool)
+        for descending in (False, True):
+            # NULL first in ascending, last in descending order, ties by primary key
+            keys = [(v if not np.isnan(v) else -np.inf) * (-1 if descending else 1) for v in values]
+            expected = sorted(range(200), key=lambda i: (keys[i], i))
+            if descending:
+                expected = [i for i in expected if not np.isnan(values[i])] + \
+                           [i for i in expected if np.isnan(values[i])]
+            self.assertEqual(interactions.select(mask, "mscor", descending), expected)
+            for offset, limit in [(0, 10), (15, 7), (190, 20), (250, 5)]:
+                self.assertEqual(interactions.select(mask, "mscor", descending, offset, limit),
+                                 expected[offset:offset + limit])
+
+    def test_save_and_load(self):
+        run = columnar.RunColumns.from_rows([(1, 2, 3, 0.5, None, -0.25), (4, 5, 6, 0.1, 0.2, 0.3)])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "gene", "1")
+            run.save(path)
+            run.save(path)
+            loaded = columnar.RunColumns.load(path)
+            self.assertIsInstance(loaded.columns["mscor"], np.memmap)
+            self.assertEqual(loaded.columns["ID"].tolist(), [1, 4])
+            self.assertTrue(np.isnan(loaded.columns["mscor"][0]))
+            self.assertEqual(sorted(os.listdir(os.path.dirname(path))), ["1"])
+
+
+@unittest.skipUnless(os.environ["SPONGE_DB_URI"].startswith("sqlite"), "needs a scratch sqlite database")
+class TestColumnarEngine(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app_context = app.app_context()
+        cls.app_context.push()
+        db.create_all()
+        rows = [
+            models.Disease(disease_ID=1, disease_name="breast"),
+            models.Dataset(dataset_ID=1, disease_ID=1, disease_name="breast", sponge_db_version=2),
+            models.Dataset(dataset_ID=2, disease_ID=1, disease_name="breast cancer", sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=1, dataset_ID=1, sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=2, dataset_ID=2, sponge_db_version=2),
+        ]
+        rng = random.Random(7)
+        pairs = [(i, j) for i in range(1, N + 1) for j in range(i + 1, N + 1)]
+        for i in range(1, N + 1):
+            rows += [
+                models.Gene(gene_ID=i, ensg_number=f"ENSG{i}", gene_symbol=f"G{i}", gene_type="lincRNA" if i % 3 else "protein_coding"),
+                models.Transcript(transcript_ID=i, gene_ID=i, enst_number=f"ENST{i}", transcript_type="lincRNA"),
+            ]
+            for run in (1, 2):
+                rows += [
+                    models.networkAnalysis(gene_ID=i, sponge_run_ID=run, betweenness=i, eigenvector=i / 10, node_degree=i),
+                    models.networkAnalysisTranscript(transcript_ID=i, sponge_run_ID=run, betweenness=i,
+                                                     eigenvector=i / 10, node_degree=i),
+                ]
+        for ID, (i, j) in enumerate(rng.sample(pairs, 300), start=1):
+            run = 1 + ID % 2
+            # few distinct values for ties, some NULLs
+            p_value, mscor, correlation = rng.choice([0.001, 0.01, 0.04, 0.2, None]), rng.randint(-3, 5) / 10, \
+                rng.choice([-0.5, 0.1, 0.3, 0.5, None])
+            rows += [
+                models.GeneInteraction(interactions_genegene_ID=ID, sponge_run_ID=run, gene_ID1=i, gene_ID2=j,
+                                       p_value=p_value, mscor=mscor, correlation=correlation),
+                models.GeneInteractionAdjacency(sponge_run_ID=run, gene_ID=i, interactions_genegene_ID=ID),
+                models.GeneInteractionAdjacency(sponge_run_ID=run, gene_ID=j, interactions_genegene_ID=ID),
+                models.TranscriptInteraction(interactions_transcripttranscript_ID=ID, sponge_run_ID=run,
+                                             transcript_ID_1=i, transcript_ID_2=j,
+                                             p_value=p_value, mscor=mscor, correlation=correlation),
+                models.TranscriptInteractionAdjacency(sponge_run_ID=run, transcript_ID=i,
+                                                      interactions_transcripttranscript_ID=ID),
+                models.TranscriptInteractionAdjacency(sponge_run_ID=run, transcript_ID=j,
+                                                      interactions_transcripttranscript_ID=ID),
+            ]
+        db.session.add_all(rows)
+        db.session.commit()
+        cls.client = server.connex_app.test_client()
+        cls.directory = tempfile.TemporaryDirectory()
+
+    @classmethod
+    def tearDownClass(cls):
+        app.config["COLUMNAR_ENGINE"] = False
+        app.config["COLUMNAR_DIR"] = None
+        db.drop_all()
+        cls.app_context.pop()
+        cls.directory.cleanup()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+        columnar.reset()
+
+    def setUp(self):
+        identifiers.reset()
+        dataset._reset_run_catalog()
+        columnar.reset()
+
+    def get(self, url):
+        response = self.client.get("/sponge-api" + url)
+        self.assertEqual(response.status_code, 200, response.text)
+        return response.content, response.headers.get("X-Next-Cursor")
+
+    def assertSameResponses(self, urls, directory=None):
+        for url in urls:
+            outputs = []
+            for engine in (False, True):
+                cache.clear()
+                app.config["COLUMNAR_ENGINE"] = engine
+                app.config["COLUMNAR_DIR"] = directory
+                outputs.append(self.get(url))
+            self.assertEqual(outputs[0], outputs[1], url)
+            self.assertGreater(len(outputs[0][0]), 100, url)
+
+    def test_find_all(self):
+        urls = []
+        for sorting in ("", "&sorting=pValue", "&sorting=mscor", "&sorting=correlation"):
+            for descending in ("true", "false"):
+                urls += [f"/ceRNAInteraction/findAll?disease_name=breast&limit=7&offset=3{sorting}&descending={descending}",
+                         f"/ceRNAInteraction/findAll?dataset_ID=1&pValue=0.05&mscor=0&mscorDirection=>"
+                         f"&limit=10{sorting}&descending={descending}",
+                         f"/ceRNAInteraction/findAll?ensg_number=ENSG1,ENSG5&pValue=0.2&correlation=0.3"
+                         f"&limit=5{sorting}&descending={descending}",
+                         f"/ceRNAInteraction/findAll?gene_type=protein_coding&pValue=0.01&pValueDirection=>"
+                         f"&information=false&limit=4{sorting}&descending={descending}"]
+        self.assertSameResponses(urls)
+        self.assertSameResponses([u.replace("/findAll?", "/findAllTranscripts?").replace("ensg_number", "enst_number")
+                                  .replace("ENSG", "ENST").replace("gene_type=protein_coding", "transcript_type=lincRNA")
+                                  for u in urls], directory=self.directory.name)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory.name, "release-1"))), ["transcript"])
+
+    def test_find_specific(self):
+        genes = ",".join(f"G{i}" for i in range(1, 20))
+        self.assertSameResponses([f"/ceRNAInteraction/findSpecific?disease_name=breast&gene_symbol={genes}&limit=8&offset=2",
+                                  f"/ceRNAInteraction/findSpecific?dataset_ID=2&gene_symbol={genes}&pValue=0.01&pValueDirection=>",
+                                  "/ceRNAInteraction/findSpecificTranscripts?disease_name=breast&limit=9&offset=4",
+                                  "/ceRNAInteraction/findSpecificTranscripts?dataset_ID=1&pValue=0.3&enst_number="
+                                  + ",".join(f"ENST{i}" for i in range(5, 25))])
+
+    def test_network(self):
+        urls = []
+        for sorting in ("pValue", "mscor", "correlation"):
+            urls += [f"/ceRNAInteraction/getGeneNetwork?disease_name=breast&edgeSorting={sorting}&maxEdges=15&offsetEdges=2",
+                     f"/ceRNAInteraction/getGeneNetwork?dataset_ID=1&edgeSorting={sorting}&maxPValue=0.2&minMscor=0.1"
+                     f"&minCorrelation=0.2&maxNodes=20&nodeSorting=betweenness",
+                     f"/ceRNAInteraction/getGeneNetwork?dataset_ID=2&edgeSorting={sorting}&ensemblID=ENSG3,ENSG7,ENSG11"
+                     f"&format=compact",
+                     f"/ceRNAInteraction/getTranscriptNetwork?disease_name=breast&edgeSorting={sorting}&maxEdges=15",
+                     f"/ceRNAInteraction/getTranscriptNetwork?dataset_ID=1&edgeSorting={sorting}&ensemblID=ENST2,ENST9"
+                     f"&minMscor=0.1&format=compact"]
+        self.assertSameResponses(urls, directory=self.directory.name)
+
+    def test_more_runs_than_loaded_fall_back_to_sql(self):
+        max_runs = app.config["COLUMNAR_MAX_RUNS"]
+        self.addCleanup(app.config.__setitem__, "COLUMNAR_MAX_RUNS", max_runs)
+        app.config["COLUMNAR_MAX_RUNS"] = 1
+        # both runs match the disease name, they would evict each other on every request
+        self.assertSameResponses(["/ceRNAInteraction/findAll?disease_name=breast&sorting=mscor&limit=20",
+                                  "/ceRNAInteraction/findAll?dataset_ID=1&sorting=mscor&limit=20"])
+        app.config["COLUMNAR_ENGINE"] = True
+        columnar.reset()
+        cache.clear()
+        self.get("/ceRNAInteraction/findAll?disease_name=breast&sorting=mscor&limit=20")
+        self.assertEqual(len(columnar._runs), 0)
+        with app.test_request_context():
+            self.assertIsNone(columnar.interactions("gene", [1, 2]))
+            self.assertIsNotNone(columnar.interactions("gene", [2, 2]))
+
+    def test_cursor_falls_back_to_sql(self):
+        app.config["COLUMNAR_ENGINE"] = True
+        cache.clear()
+        url = "/ceRNAInteraction/findAll?disease_name=breast&sorting=mscor&limit=20"
+        first, cursor = self.get(url)
+        self.assertIsNotNone(cursor)
+        app.config["COLUMNAR_ENGINE"] = False
+        cache.clear()
+        self.assertEqual(self.get(url), (first, cursor))
+        app.config["COLUMNAR_ENGINE"] = True
+        cache.clear()
+        columnar.reset()
+        self.get(url + "&cursor=" + cursor)
+        self.assertEqual(len(columnar._runs), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
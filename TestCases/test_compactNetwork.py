@@ -0,0 +1,115 @@
+import os
+import unittest
+
+os.environ.setdefault("SPONGE_DB_URI", "sqlite://")
+os.environ.setdefault("SPONGE_CACHE_BACKEND", "local")
+
+import server
+from app.config import app, db, cache
+import app.models as models
+from app import identifiers
+from app.controllers import dataset
+
+N = 20
+
+
+########################################################################################################################
+"""Test Cases for the compact network format: decoding it must give the edges and nodes of the full format"""
+########################################################################################################################
+
+@unittest.skipUnless(os.environ["SPONGE_DB_URI"].startswith("sqlite"), "needs a scratch sqlite database")
+class TestCompactNetwork(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app_context = app.app_context()
+        cls.app_context.push()
+        db.create_all()
+        rows = [
+            models.Disease(disease_ID=1, disease_name="breast"),
+            models.Dataset(dataset_ID=1, disease_ID=1, disease_name="breast", data_origin="TCGA", sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=1, dataset_ID=1, sponge_db_version=2),
+        ]
+        for i in range(1, N + 1):
+            j = i % N + 1
+            rows += [
+                models.Gene(gene_ID=i, ensg_number=f"ENSG{i}", gene_symbol=f"G{i}", chromosome_name="1"),
+                models.Transcript(transcript_ID=i, gene_ID=(i + 1) // 2, enst_number=f"ENST{i}", transcript_type="lnc"),
+                models.GeneInteraction(interactions_genegene_ID=i, sponge_run_ID=1, gene_ID1=min(i, j), gene_ID2=max(i, j),
+                                       p_value=i / 1000, mscor=i / 10, correlation=-i / 20),
+                models.TranscriptInteraction(interactions_transcripttranscript_ID=i, sponge_run_ID=1,
+                                             transcript_ID_1=min(i, j), transcript_ID_2=max(i, j),
+                                             p_value=i / 1000, mscor=i / 10, correlation=-i / 20),
+                models.networkAnalysis(network_analysis_gene_ID=i, gene_ID=i, sponge_run_ID=1,
+                                       betweenness=i, eigenvector=i / 100, node_degree=2),
+                models.networkAnalysisTranscript(network_analysis_transcript_ID=i, transcript_ID=i, sponge_run_ID=1,
+                                                 betweenness=i, eigenvector=i / 100, node_degree=2),
+            ]
+        db.session.add_all(rows)
+        db.session.commit()
+        cls.client = server.connex_app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.drop_all()
+        cls.app_context.pop()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+
+    def setUp(self):
+        cache.clear()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+
+    def get(self, url):
+        response = self.client.get("/sponge-api" + url)
+        self.assertEqual(response.status_code, 200, response.text)
+        return response.json()
+
+    def decode(self, columns, tables):
+        """expand the parallel arrays, references are replaced by the entries of their lookup tables"""
+        names = list(columns)
+        rows = []
+        for values in zip(*columns.values()):
+            rows.append({name: tables[name][value] if name in tables else value for name, value in zip(names, values)})
+        return rows
+
+    def assertNetworkEqual(self, url, element, element_table):
+        full = self.get(url)
+        result = self.get(url + "&format=compact")
+        self.assertEqual(result["format"], "compact")
+        self.assertEqual(len(result["edges"]["p_value"]), N)
+        self.assertEqual(len(result["runs"]), 1)
+        self.assertEqual(result["datasets"], [{"data_origin": "TCGA", "dataset_ID": 1, "disease_name": "breast"}])
+
+        elements = result[element_table]
+        runs = [{"sponge_run_ID": r["sponge_run_ID"], "dataset": result["datasets"][r["dataset"]]} for r in result["runs"]]
+        edges = self.decode(result["edges"], {f"{element}1": elements, f"{element}2": elements, "sponge_run": runs})
+        nodes = self.decode(result["nodes"], {element.rstrip("_"): elements, "sponge_run": runs})
+        self.assertEqual((len(edges), len(nodes)), (len(full["edges"]), len(full["nodes"])))
+        return full, edges, nodes
+
+    def test_gene_network(self):
+        full, edges, nodes = self.assertNetworkEqual("/ceRNAInteraction/getGeneNetwork?edgeSorting=pValue", "gene", "genes")
+        for edge, expected in zip(edges, full["edges"]):
+            del edge["sponge_run"]
+            self.assertEqual(edge, expected)
+        for node, expected in zip(nodes, full["nodes"]):
+            node["gene"] = {k: node["gene"][k] for k in ("ensg_number", "gene_symbol")}
+            self.assertEqual(node, expected)
+
+    def test_transcript_network(self):
+        full, edges, nodes = self.assertNetworkEqual(
+            "/ceRNAInteraction/getTranscriptNetwork?edgeSorting=mscor", "transcript_", "transcripts")
+        genes = self.get("/ceRNAInteraction/getTranscriptNetwork?edgeSorting=mscor&format=compact")["genes"]
+        for edge, expected in zip(edges, full["edges"]):
+            for key in ("transcript_1", "transcript_2"):
+                edge[key] = dict(edge[key], gene=genes[edge[key]["gene"]])
+            self.assertEqual(edge, expected)
+        for node, expected in zip(nodes, full["nodes"]):
+            node["transcript"] = {"enst_number": node["transcript"]["enst_number"], "gene": genes[node["transcript"]["gene"]]}
+            self.assertEqual(node, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import unittest
+import zlib
+
+os.environ.setdefault("SPONGE_DB_URI", "sqlite://")
+os.environ.setdefault("SPONGE_CACHE_BACKEND", "local")
+
+import brotli
+import zstandard
+from starlette.testclient import TestClient
+
+import server
+from app.config import app, db, cache
+import app.models as models
+from app import identifiers
+from app.compression import CompressionMiddleware, negotiate
+from app.controllers import dataset
+
+N = 200
+BODY = b'{"expr_value": 0.5, "sample_ID": "TCGA"}' * 100
+
+
+def decompressor(encoding):
+    """function decompressing the consecutive parts of a compressed body"""
+    if encoding == "br":
+        return brotli.Decompressor().process
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj().decompress
+    return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress
+
+
+########################################################################################################################
+"""Test Cases for the response compression middleware"""
+########################################################################################################################
+
+class TestNegotiation(unittest.TestCase):
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate("gzip, deflate, br, zstd"), "br")
+        self.assertEqual(negotiate("gzip, br;q=0.5"), "gzip")
+        self.assertEqual(negotiate("br;q=0, *"), "zstd")
+        self.assertEqual(negotiate("identity"), None)
+        self.assertEqual(negotiate("gzip;q=0"), None)
+        self.assertEqual(negotiate(""), None)
+
+
+class TestCompressionMiddleware(unittest.TestCase):
+
+    def client(self, chunks, headers=(), content_type=b"application/json", **kwargs):
+        async def application(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", content_type), *headers]})
+            for i, chunk in enumerate(chunks):
+                await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+        self.middleware = CompressionMiddleware(application, **kwargs)
+        return TestClient(self.middleware)
+
+    def messages(self, encoding):
+        """the messages the middleware sends for one request"""
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+        scope = {"type": "http", "method": "GET", "headers": [(b"accept-encoding", encoding.encode())]}
+        asyncio.run(self.middleware(scope, None, send))
+        return messages
+
+    def test_encodings(self):
+        for encoding in ("br", "zstd", "gzip"):
+            response = self.client([BODY]).get("/", headers={"Accept-Encoding": encoding})
+            self.assertEqual(response.headers["content-encoding"], encoding)
+            self.assertEqual(response.headers["vary"], "Accept-Encoding")
+            self.assertLess(int(response.headers["content-length"]), len(BODY))
+            self.assertEqual(response.content, BODY)
+
+    def test_minimum_size(self):
+        response = self.client([b"{}" * 10, b"[]"]).get("/", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+        self.assertEqual(response.content, b"{}" * 10 + b"[]")
+        response = self.client([BODY], minimum_size=len(BODY) + 1).get("/", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("content-encoding", response.headers)
+
+    def test_not_compressible(self):
+        client = self.client([BODY], headers=[(b"content-encoding", b"identity")])
+        self.assertNotIn("vary", client.get("/", headers={"Accept-Encoding": "gzip"}).headers)
+        client = self.client([BODY], content_type=b"image/png")
+        self.assertNotIn("content-encoding", client.get("/", headers={"Accept-Encoding": "gzip"}).headers)
+
+    def test_stream_is_compressed_chunk_by_chunk(self):
+        chunks = [BODY[:10], BODY[10:2000], BODY[2000:3000], BODY[3000:]]
+        for encoding in ("br", "zstd", "gzip"):
+            self.client(chunks, headers=[(b"etag", b'"abc"')], cache_max_bytes=0)
+            start, *parts = self.messages(encoding)
+            self.assertEqual(dict(start["headers"])[b"content-encoding"], encoding.encode())
+            self.assertNotIn(b"content-length", dict(start["headers"]))
+            # the first two chunks are buffered up to the minimum size, every later chunk is flushed on its own
+            self.assertEqual([p["more_body"] for p in parts], [True, True, False])
+            decompress = decompressor(encoding)
+            decoded = [decompress(part["body"]) for part in parts]
+            self.assertEqual(decoded[0], BODY[:2000])
+            self.assertEqual(b"".join(decoded), BODY)
+
+    def test_cache_hit_is_not_recompressed(self):
+        client = self.client([BODY[:500], BODY[500:]], headers=[(b"etag", b'"abc"')])
+        first = client.get("/", headers={"Accept-Encoding": "br"})
+        self.assertEqual(self.middleware.cache.get_stats()["hits"], 0)
+        second = client.get("/", headers={"Accept-Encoding": "br"})
+        self.assertEqual(self.middleware.cache.get_stats()["hits"], 1)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first.headers["etag"], '"abc-br"')
+        self.assertEqual(second.headers["etag"], '"abc-br"')
+        self.assertEqual(second.headers["content-length"], str(len(self.middleware.cache.get('"abc":br'))))
+        client.get("/", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(self.middleware.cache.get_stats()["entries"], 2)
+
+
+@unittest.skipUnless(os.environ["SPONGE_DB_URI"].startswith("sqlite"), "needs a scratch sqlite database")
+class TestCompressedEndpoints(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app_context = app.app_context()
+        cls.app_context.push()
+        db.create_all()
+        rows = [
+            models.Disease(disease_ID=1, disease_name="breast"),
+            models.Dataset(dataset_ID=1, disease_ID=1, disease_name="breast", sponge_db_version=2),
+            models.Gene(gene_ID=1, ensg_number="ENSG1", gene_symbol="G1"),
+        ]
+        rows += [models.GeneExpressionValues(expression_data_gene_ID=i, dataset_ID=1, gene_ID=1, expr_value=i / 7,
+                                             sample_ID=f"S{i}") for i in range(1, N + 1)]
+        db.session.add_all(rows)
+        db.session.commit()
+        cls.client = server.connex_app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        app.config["FAST_SERIALIZATION"] = False
+        db.drop_all()
+        cls.app_context.pop()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+
+    def setUp(self):
+        cache.clear()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+
+    def test_gene_expression(self):
+        url = "/sponge-api/exprValue/getceRNA?ensg_number=ENSG1"
+        for fast in (False, True):
+            app.config["FAST_SERIALIZATION"] = fast
+            cache.clear()
+            expected = self.client.get(url, headers={"Accept-Encoding": "identity"})
+            self.assertNotIn("content-encoding", expected.headers)
+            for encoding in ("br", "zstd", "gzip"):
+                response = self.client.get(url, headers={"Accept-Encoding": encoding})
+                self.assertEqual(response.status_code, 200, response.text)
+                self.assertEqual(response.headers["content-encoding"], encoding)
+                self.assertEqual(response.headers["etag"], expected.headers["etag"][:-1] + f'-{encoding}"')
+                self.assertEqual(response.content, expected.content)
+                # each representation is revalidated with its own ETag
+                not_modified = self.client.get(url, headers={"Accept-Encoding": encoding,
+                                                             "If-None-Match": response.headers["etag"]})
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified.headers["etag"], response.headers["etag"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import unittest
+
+os.environ.setdefault("SPONGE_DB_URI", "sqlite://")
+os.environ.setdefault("SPONGE_CACHE_BACKEND", "local")
+
+from sqlalchemy import event
+
+import server
+from app.config import app, db, cache
+import app.models as models
+from app import identifiers
+from app.controllers import dataset
+
+N = 40
+
+
+########################################################################################################################
+"""Test Cases for eager loading of nested schemas: the number of queries must not grow with the number of rows"""
+########################################################################################################################
+
+@unittest.skipUnless(os.environ["SPONGE_DB_URI"].startswith("sqlite"), "needs a scratch sqlite database")
+class TestEagerLoading(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app_context = app.app_context()
+        cls.app_context.push()
+        db.create_all()
+        rows = [
+            models.Disease(disease_ID=1, disease_name="breast"),
+            models.Dataset(dataset_ID=1, disease_ID=1, disease_name="breast", sponge_db_version=2),
+            models.Dataset(dataset_ID=2, disease_ID=1, disease_name="breast", sponge_db_version=1),
+            models.SpongeRun(sponge_run_ID=1, dataset_ID=1, sponge_db_version=2),
+            models.miRNA(miRNA_ID=1, mir_ID="MIMAT1", hs_nr="hsa-1"),
+        ]
+        for i in range(1, N + 1):
+            rows += [
+                models.Gene(gene_ID=i, ensg_number=f"ENSG{i}", gene_symbol=f"G{i}"),
+                models.Transcript(transcript_ID=i, gene_ID=i, enst_number=f"ENST{i}"),
+                models.miRNA(miRNA_ID=i + 1, mir_ID=f"MIMAT{i + 1}", hs_nr=f"hsa-{i + 1}"),
+                models.GeneInteraction(interactions_genegene_ID=i, sponge_run_ID=1, gene_ID1=i, gene_ID2=i % N + 1, p_value=0.01),
+                models.networkAnalysis(network_analysis_gene_ID=i, gene_ID=i, sponge_run_ID=1, betweenness=i),
+                models.OccurencesMiRNA(occurences_mirna_gene_ID=i, miRNA_ID=i + 1, sponge_run_ID=1, occurences=i),
+                models.GeneCount(gene_count_ID=i, gene_ID=i, sponge_run_ID=1, count_all=i, count_sign=i),
+                models.PatientInformation(patient_information_ID=i, dataset_ID=2, disease_ID=1, sample_ID=f"S{i}"),
+                models.SurvivalRate(survival_rate_ID=i, dataset_ID=2, gene_ID=1, patient_information_ID=i),
+                models.ExpressionDataTranscript(expression_data_transcript_ID=i, dataset_ID=1, transcript_ID=i % 4 + 1,
+                                                expr_value=i, sample_ID=f"S{i}"),
+            ]
+        db.session.add_all(rows)
+        db.session.commit()
+        cls.client = server.connex_app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.drop_all()
+        cls.app_context.pop()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+
+    def setUp(self):
+        cache.clear()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+        # the identifier index and the run catalog are loaded once per worker, not per request
+        identifiers.genes(), identifiers.transcripts(), identifiers.mirnas(), dataset._run_catalog(2)
+        self.statements = []
+
+        def count(conn, cursor, statement, *args):
+            self.statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", count)
+        self.addCleanup(event.remove, db.engine, "before_cursor_execute", count)
+
+    def assertQueries(self, url, max_queries, min_rows=N):
+        response = self.client.get("/sponge-api" + url)
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertGreaterEqual(len(response.json()), min_rows)
+        self.assertLessEqual(len(self.statements), max_queries, "\n".join(self.statements))
+
+    def test_find_all(self):
+        self.assertQueries("/ceRNAInteraction/findAll", 1)
+
+    def test_find_all_short(self):
+        self.assertQueries("/ceRNAInteraction/findAll?information=false", 1)
+
+    def test_find_cerna(self):
+        self.assertQueries("/findceRNA", 1)
+
+    def test_occurence(self):
+        self.assertQueries("/miRNAInteraction/getOccurence", 1)
+
+    def test_gene_count(self):
+        self.assertQueries("/getGeneCount?ensg_number=" + ",".join(f"ENSG{i}" for i in range(1, N + 1)), 1)
+
+    def test_survival_rates(self):
+        self.assertQueries("/survivalAnalysis/getRates?ensg_number=ENSG1", 2)
+
+    def test_transcript_expression(self):
+        self.assertQueries("/exprValue/getTranscriptExpr?enst_number=ENST1,ENST2,ENST3,ENST4", 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
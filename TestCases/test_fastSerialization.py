@@ -0,0 +1,105 @@
+import os
+import unittest
+
+os.environ.setdefault("SPONGE_DB_URI", "sqlite://")
+os.environ.setdefault("SPONGE_CACHE_BACKEND", "local")
+
+import server
+from app.config import app, db, cache
+import app.models as models
+from app import identifiers, serialization
+from app.controllers import dataset
+
+N = 30
+
+
+########################################################################################################################
+"""Test Cases for the fast serialization path: the output must equal the marshmallow output byte for byte"""
+########################################################################################################################
+
+@unittest.skipUnless(os.environ["SPONGE_DB_URI"].startswith("sqlite"), "needs a scratch sqlite database")
+class TestFastSerialization(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app_context = app.app_context()
+        cls.app_context.push()
+        db.create_all()
+        rows = [
+            models.Disease(disease_ID=1, disease_name="breast"),
+            models.Dataset(dataset_ID=1, disease_ID=1, disease_name="breast", disease_subtype="Basal", sponge_db_version=2),
+            # gene without symbol, transcript without gene row
+            models.Gene(gene_ID=99, ensg_number="ENSG99"),
+            models.Transcript(transcript_ID=99, gene_ID=98, enst_number="ENST99"),
+        ]
+        for i in range(1, N + 1):
+            rows += [
+                models.Gene(gene_ID=i, ensg_number=f"ENSG{i}", gene_symbol=f"Gä{i}"),
+                models.Transcript(transcript_ID=i, gene_ID=i, enst_number=f"ENST{i}"),
+                models.miRNA(miRNA_ID=i, mir_ID=f"MIMAT{i}", hs_nr=f"hsa-{i}"),
+                models.GeneExpressionValues(expression_data_gene_ID=i, dataset_ID=1, gene_ID=i % 3 + 1,
+                                            expr_value=i / 7 if i % 5 else None, sample_ID=f"S{i}"),
+                models.ExpressionDataTranscript(expression_data_transcript_ID=i, dataset_ID=1, transcript_ID=i % 3 + 1,
+                                                expr_value=i / 3, sample_ID=f"S{i}"),
+                models.MiRNAExpressionValues(expression_data_mirna_ID=i, dataset_ID=1, miRNA_ID=i % 3 + 1,
+                                             expr_value=i * 1e-9, sample_ID=f"S{i}"),
+            ]
+        rows += [
+            models.GeneExpressionValues(expression_data_gene_ID=N + 1, dataset_ID=1, gene_ID=99, expr_value=1.5, sample_ID=None),
+            models.ExpressionDataTranscript(expression_data_transcript_ID=N + 1, dataset_ID=1, transcript_ID=99, expr_value=2.5),
+        ]
+        db.session.add_all(rows)
+        db.session.commit()
+        cls.client = server.connex_app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        app.config["FAST_SERIALIZATION"] = False
+        db.drop_all()
+        cls.app_context.pop()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+
+    def setUp(self):
+        identifiers.reset()
+        dataset._reset_run_catalog()
+
+    def assertSameOutput(self, url):
+        outputs = []
+        for fast in (False, True):
+            cache.clear()
+            app.config["FAST_SERIALIZATION"] = fast
+            response = self.client.get("/sponge-api" + url)
+            self.assertEqual(response.status_code, 200, response.text)
+            outputs.append(response.content)
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertGreater(len(outputs[0]), 2)
+
+    def test_layout_matches_schema(self):
+        for model, schema in [(models.GeneExpressionValues, models.geneExpressionSchema),
+                              (models.ExpressionDataTranscript, models.ExpressionDataTranscriptSchema),
+                              (models.MiRNAExpressionValues, models.miRNAExpressionSchema)]:
+            layout = serialization.layout(schema)
+            primary_key = model.__mapper__.primary_key[0]
+            rows = db.session.execute(layout.select().order_by(primary_key)).all()
+            objects = model.query.order_by(primary_key).all()
+            self.assertEqual(len(rows), len(objects))
+            self.assertEqual([layout.dumps(r) for r in rows], [schema().dumps(o) for o in objects])
+            self.assertEqual([layout.dump(r) for r in rows], schema(many=True).dump(objects))
+            expected = "[" + ",".join(schema().dumps(o) for o in objects) + "]"
+            self.assertEqual("".join(layout.stream(rows, batch=4)), expected)
+            self.assertEqual("".join(layout.stream([])), "[]")
+
+    def test_gene_expression(self):
+        self.assertSameOutput("/exprValue/getceRNA?ensg_number=ENSG1,ENSG2,ENSG3,ENSG99")
+        self.assertSameOutput("/exprValue/getceRNA?gene_symbol=Gä1&limit=3&offset=2")
+
+    def test_transcript_expression(self):
+        self.assertSameOutput("/exprValue/getTranscriptExpr?enst_number=ENST1,ENST2,ENST99")
+
+    def test_mirna_expression(self):
+        self.assertSameOutput("/exprValue/getmiRNA?mimat_number=MIMAT1,MIMAT2")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import unittest
+
+os.environ.setdefault("SPONGE_DB_URI", "sqlite://")
+os.environ.setdefault("SPONGE_CACHE_BACKEND", "local")
+
+from sqlalchemy import event
+
+import server
+from app.config import app, db, cache
+import app.models as models
+from app import identifiers, serialization
+from app.controllers import dataset
+
+N = 10
+
+
+########################################################################################################################
+"""Test Cases for the fields parameter: only the requested fields are selected and returned"""
+########################################################################################################################
+
+class TestProjectSchema(unittest.TestCase):
+
+    def test_nested_fields(self):
+        schema = serialization.project(models.GeneInteractionDatasetLongSchema, ["gene1.ensg_number", "mscor"])
+        self.assertEqual(set(schema.dump_fields), {"gene1", "mscor"})
+        self.assertEqual(set(schema.dump_fields["gene1"].schema.dump_fields), {"ensg_number"})
+
+    def test_nested_object_is_complete(self):
+        schema = serialization.project(models.GeneInteractionDatasetLongSchema, ["gene1", "gene1.ensg_number"])
+        self.assertIn("description", schema.dump_fields["gene1"].schema.dump_fields)
+
+    def test_unknown_fields(self):
+        with self.assertRaises(serialization.InvalidFields) as error:
+            serialization.project(models.GeneInteractionDatasetLongSchema, ["gene1.foo", "bar", "mscor.x", "p_value"])
+        self.assertEqual(str(error.exception), "Unknown field(s) bar, gene1.foo, mscor.x")
+
+    def test_split_fields(self):
+        self.assertEqual(serialization.split_fields(["edges.mscor", "edges.gene1.ensg_number"], ("edges", "nodes")),
+                         {"edges": ["mscor", "gene1.ensg_number"], "nodes": None})
+        self.assertEqual(serialization.split_fields(["edges", "edges.mscor"], ("edges", "nodes")),
+                         {"edges": None, "nodes": None})
+        with self.assertRaises(serialization.InvalidFields):
+            serialization.split_fields(["mscor"], ("edges", "nodes"))
+
+
+@unittest.skipUnless(os.environ["SPONGE_DB_URI"].startswith("sqlite"), "needs a scratch sqlite database")
+class TestFieldProjection(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app_context = app.app_context()
+        cls.app_context.push()
+        db.create_all()
+        rows = [
+            models.Disease(disease_ID=1, disease_name="breast"),
+            models.Dataset(dataset_ID=1, disease_ID=1, disease_name="breast", sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=1, dataset_ID=1, sponge_db_version=2),
+        ]
+        for i in range(1, N + 1):
+            j = i % N + 1
+            rows += [
+                models.Gene(gene_ID=i, ensg_number=f"ENSG{i}", gene_symbol=f"G{i}", description="a gene"),
+                models.Transcript(transcript_ID=i, gene_ID=i, enst_number=f"ENST{i}"),
+                models.GeneInteraction(interactions_genegene_ID=i, sponge_run_ID=1, gene_ID1=min(i, j), gene_ID2=max(i, j),
+                                       p_value=i / 1000, mscor=i / 10, correlation=-i / 20),
+                models.GeneInteractionAdjacency(sponge_run_ID=1, gene_ID=i, interactions_genegene_ID=i),
+                models.GeneInteractionAdjacency(sponge_run_ID=1, gene_ID=j, interactions_genegene_ID=i),
+                models.networkAnalysis(network_analysis_gene_ID=i, gene_ID=i, sponge_run_ID=1, betweenness=i),
+                models.ExpressionDataTranscript(expression_data_transcript_ID=i, dataset_ID=1, transcript_ID=i,
+                                                expr_value=i / 3, sample_ID=f"S{i}"),
+            ]
+        db.session.add_all(rows)
+        db.session.commit()
+        cls.client = server.connex_app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        app.config["FAST_SERIALIZATION"] = False
+        db.drop_all()
+        cls.app_context.pop()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+
+    def setUp(self):
+        cache.clear()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+        self.statements = []
+
+        def count(conn, cursor, statement, *args):
+            self.statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", count)
+        self.addCleanup(event.remove, db.engine, "before_cursor_execute", count)
+
+    def get(self, url, status=200):
+        response = self.client.get("/sponge-api" + url)
+        self.assertEqual(response.status_code, status, response.text)
+        return response.json()
+
+    def test_interactions(self):
+        url = "/ceRNAInteraction/findAll?ensg_number=ENSG1,ENSG2&sorting=mscor&pValue=1"
+        full = self.get(url)
+        self.statements.clear()
+        cache.clear()
+        result = self.get(url + "&fields=gene1.ensg_number,mscor,p_value")
+        expected = [{"gene1": {"ensg_number": r["gene1"]["ensg_number"]}, "mscor": r["mscor"], "p_value": r["p_value"]}
+                    for r in full]
+        self.assertEqual(result, expected)
+        select = [s for s in self.statements if "interactions_genegene.mscor" in s][-1]
+        self.assertNotIn("description", select)
+        self.assertNotIn("correlation", select.split("FROM")[0])
+
+    def test_unknown_field(self):
+        result = self.get("/ceRNAInteraction/findAll?ensg_number=ENSG1&fields=gene1.foo", status=400)
+        self.assertIn("gene1.foo", result["detail"])
+        self.get("/ceRNAInteraction/getGeneNetwork?edgeSorting=pValue&fields=mscor", status=400)
+
+    def test_network(self):
+        result = self.get("/ceRNAInteraction/getGeneNetwork?edgeSorting=pValue&fields=edges.mscor,nodes.gene.ensg_number")
+        self.assertEqual(len(result["edges"]), N)
+        self.assertEqual({tuple(e) for e in result["edges"]}, {("mscor",)})
+        self.assertEqual(result["nodes"][0], {"gene": {"ensg_number": result["nodes"][0]["gene"]["ensg_number"]}})
+
+    def test_expression(self):
+        url = "/exprValue/getTranscriptExpr?enst_number=ENST1,ENST2&fields=expr_value,transcript.enst_number"
+        outputs = []
+        for fast in (False, True):
+            cache.clear()
+            app.config["FAST_SERIALIZATION"] = fast
+            outputs.append(self.get(url))
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0][0], {"expr_value": 1 / 3, "transcript": {"enst_number": "ENST1"}})
+        self.assertFalse(any("JOIN dataset" in s or "JOIN gene" in s for s in self.statements))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+import os
+import random
+import unittest
+
+os.environ.setdefault("SPONGE_DB_URI", "sqlite://")
+os.environ.setdefault("SPONGE_CACHE_BACKEND", "local")
+
+from sqlalchemy import event
+
+import server
+from app.config import app, db, cache
+import app.models as models
+from app import columnar, identifiers, idsets
+from app.controllers import dataset
+
+N = 60
+
+
+########################################################################################################################
+"""Test Cases for the pushdown of large ID sets (inline IN list, subquery, temporary table)"""
+########################################################################################################################
+
+@unittest.skipUnless(os.environ["SPONGE_DB_URI"].startswith("sqlite"), "needs a scratch sqlite database")
+class TestIDSets(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app_context = app.app_context()
+        cls.app_context.push()
+        db.create_all()
+        rows = [
+            models.Disease(disease_ID=1, disease_name="breast"),
+            models.Dataset(dataset_ID=1, disease_ID=1, disease_name="breast", sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=1, dataset_ID=1, sponge_db_version=2),
+        ]
+        for i in range(1, N + 1):
+            gene_type = "lincRNA" if i % 3 else "protein_coding"
+            rows += [models.Gene(gene_ID=i, ensg_number=f"ENSG{i}", gene_symbol=f"G{i}", gene_type=gene_type),
+                     models.Transcript(transcript_ID=i, gene_ID=i, enst_number=f"ENST{i}", transcript_type=gene_type),
+                     models.networkAnalysis(gene_ID=i, sponge_run_ID=1, betweenness=i, eigenvector=1 / i,
+                                            node_degree=i % 7),
+                     models.networkAnalysisTranscript(transcript_ID=i, sponge_run_ID=1, betweenness=i,
+                                                      eigenvector=1 / i, node_degree=i % 7)]
+        rows += [models.miRNA(miRNA_ID=m, mir_ID=f"MIR{m}", hs_nr=f"hsa-mir-{m}") for m in (1, 2)]
+        # miRNA 1 is part of interactions with every gene, miRNA 2 only with the first ones
+        rows += [models.miRNAInteraction(sponge_run_ID=1, gene_ID=i, miRNA_ID=m, coefficient=0.5)
+                 for i in range(1, N + 1) for m in (1, 2) if m == 1 or i <= 5]
+        rng = random.Random(4)
+        for ID, (i, j) in enumerate(rng.sample([(i, j) for i in range(1, N + 1) for j in range(i + 1, N + 1)], 300),
+                                    start=1):
+            values = dict(p_value=rng.choice([0.01, 0.2]), mscor=rng.random(), correlation=rng.random())
+            rows += [models.GeneInteraction(interactions_genegene_ID=ID, sponge_run_ID=1, gene_ID1=i, gene_ID2=j,
+                                            **values),
+                     models.TranscriptInteraction(interactions_transcripttranscript_ID=ID, sponge_run_ID=1,
+                                                  transcript_ID_1=i, transcript_ID_2=j, **values)]
+            for node in (i, j):
+                rows += [models.GeneInteractionAdjacency(sponge_run_ID=1, gene_ID=node, interactions_genegene_ID=ID),
+                         models.TranscriptInteractionAdjacency(sponge_run_ID=1, transcript_ID=node,
+                                                               interactions_transcripttranscript_ID=ID)]
+        db.session.add_all(rows)
+        db.session.commit()
+        cls.client = server.connex_app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        app.config["COLUMNAR_ENGINE"] = False
+        app.config["ID_SET_INLINE_MAX"] = 2000
+        db.drop_all()
+        cls.app_context.pop()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+        columnar.reset()
+
+    def setUp(self):
+        app.config["COLUMNAR_ENGINE"] = False
+        app.config["ID_SET_INLINE_MAX"] = 2000
+        cache.clear()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+        columnar.reset()
+        self.statements = []
+
+        def record(conn, cursor, statement, parameters, *args):
+            self.statements.append((statement, parameters))
+        event.listen(db.engine, "before_cursor_execute", record)
+        self.addCleanup(event.remove, db.engine, "before_cursor_execute", record)
+
+    def get(self, url):
+        response = self.client.get("/sponge-api/" + url)
+        self.assertEqual(response.status_code, 200, response.text)
+        return response.json()
+
+    def genes(self, *filters):
+        query = db.select(models.Gene.gene_ID).where(*filters).order_by(models.Gene.gene_ID)
+        return db.session.execute(query).scalars().all()
+
+    def test_strategies_agree(self):
+        IDs = list(range(5, 50, 2)) + [1000]
+        expected = [ID for ID in IDs if ID <= N]
+        self.assertEqual(self.genes(idsets.member(models.Gene.gene_ID, IDs)), expected)
+        self.assertNotIn("sponge_id_set", " ".join(s for s, _ in self.statements))
+
+        app.config["ID_SET_INLINE_MAX"] = 10
+        self.statements.clear()
+        self.assertEqual(self.genes(idsets.member(models.Gene.gene_ID, IDs)), expected)
+        self.assertTrue(any("sponge_id_set_" in s for s, _ in self.statements))
+
+        subquery = db.select(models.Gene.gene_ID).where(models.Gene.gene_ID.in_(IDs))
+        self.assertEqual(self.genes(idsets.member(models.Gene.gene_ID, subquery)), expected)
+        self.assertTrue(idsets.IDSet(query=subquery.where(models.Gene.gene_ID > N)).is_empty())
+        self.assertEqual(idsets.IDSet(query=subquery).values(), expected)
+
+    def test_temporary_tables_per_filter(self):
+        app.config["ID_SET_INLINE_MAX"] = 10
+        first, second = idsets.IDSet(range(1, 40)), idsets.IDSet(range(20, 60))
+        # one set filtered twice and another set in the same statement
+        genes = self.genes(first.filter(models.Gene.gene_ID), first.filter(models.Gene.gene_ID),
+                           second.filter(models.Gene.gene_ID))
+        self.assertEqual(genes, list(range(20, 40)))
+        tables = {s.split()[6] for s, _ in self.statements if s.lstrip().startswith("CREATE TEMPORARY TABLE")}
+        self.assertEqual(len(tables), 3)
+        # the tables are reused and emptied by the next transaction
+        db.session.commit()
+        self.assertEqual(self.genes(idsets.IDSet(range(50, 70)).filter(models.Gene.gene_ID)), list(range(50, 61)))
+        db.session.commit()
+
+    def test_type_filter_is_pushed_down(self):
+        for url in ("ceRNAInteraction/findAll?dataset_ID=1&gene_type=protein_coding&limit=1000&information=false",
+                    "ceRNAInteraction/findAll?dataset_ID=1&gene_type=lincRNA&limit=1000&information=false",
+                    "ceRNAInteraction/findAllTranscripts?dataset_ID=1&transcript_type=lincRNA&limit=1000"):
+            outputs = []
+            for engine in (False, True):
+                app.config["COLUMNAR_ENGINE"] = engine
+                cache.clear()
+                self.statements.clear()
+                outputs.append(self.get(url))
+                if not engine:
+                    # the IDs of the type are not sent back to the database
+                    self.assertLess(max(len(p) for _, p in self.statements), 20)
+            self.assertEqual(outputs[0], outputs[1])
+            self.assertGreater(len(outputs[0]), 0)
+
+        protein_coding = set(self.genes(models.Gene.gene_type == "protein_coding"))
+        interactions = self.get("ceRNAInteraction/findAll?dataset_ID=1&gene_type=protein_coding&limit=1000&pValue=1")
+        self.assertTrue(all({int(i["gene1"]["ensg_number"][4:]), int(i["gene2"]["ensg_number"][4:])} & protein_coding
+                            for i in interactions))
+        self.assertEqual(len(interactions), len(db.session.execute(
+            db.select(models.GeneInteraction.interactions_genegene_ID)
+            .where(models.GeneInteraction.gene_ID1.in_(protein_coding) | models.GeneInteraction.gene_ID2.in_(protein_coding))
+        ).all()))
+
+    def test_mirnas_of_all_genes(self):
+        # without identifiers the genes are not filtered (and not sent to the database)
+        interactions = self.get("miRNAInteraction/findceRNA?dataset_ID=1&between=false")
+        self.assertEqual(len(interactions), N + 5)
+        self.assertLess(max(len(p) for _, p in self.statements), 20)
+        between = self.get("miRNAInteraction/findceRNA?dataset_ID=1&between=true")
+        self.assertEqual({i["mirna"]["mir_ID"] for i in between}, {"MIR1"})
+        self.assertEqual(len(between), N)
+
+        app.config["ID_SET_INLINE_MAX"] = 3
+        cache.clear()
+        between = self.get("miRNAInteraction/findceRNA?dataset_ID=1&between=true&ensg_number="
+                           + ",".join(f"ENSG{i}" for i in range(1, 6)))
+        self.assertEqual(len(between), 10)
+
+    def test_network_nodes_are_pushed_down(self):
+        for url in ("ceRNAInteraction/getGeneNetwork?dataset_ID=1&edgeSorting=pValue&nodeSorting=betweenness&maxNodes=40",
+                    "ceRNAInteraction/getGeneNetwork?dataset_ID=1&edgeSorting=mscor&maxPValue=0.05&ensemblID="
+                    + ",".join(f"ENSG{i}" for i in range(1, 30)),
+                    "ceRNAInteraction/getTranscriptNetwork?dataset_ID=1&edgeSorting=pValue&nodeSorting=node_degree"
+                    "&maxNodes=40&format=compact"):
+            outputs = []
+            for engine, inline_max in ((False, 2000), (False, 5), (True, 2000), (True, 5)):
+                app.config["COLUMNAR_ENGINE"], app.config["ID_SET_INLINE_MAX"] = engine, inline_max
+                cache.clear()
+                self.statements.clear()
+                outputs.append(self.get(url))
+                if not engine:
+                    # the prefiltered edges are not loaded, only the page of edges is read
+                    self.assertEqual(len([s for s, _ in self.statements
+                                          if s.startswith(("SELECT interactions_genegene.", "SELECT interactions_transcript"))]),
+                                     1, url)
+            for output in outputs[1:]:
+                self.assertEqual(output, outputs[0], url)
+            self.assertGreater(len(outputs[0]["nodes"]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from app.identifiers import IdentifierIndex
+
+
+########################################################################################################################
+"""Test Cases for the identifier index"""
+########################################################################################################################
+
+class TestIdentifierIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.genes = IdentifierIndex("gene_ID", [3, 1, 2, 4], {
+            "ensg_number": ["ENSG00000003", "ENSG00000001", "ENSG00000002", "ENSG00000004"],
+            "gene_symbol": ["TP53", "BRCA1", "brca1", None],
+        })
+        self.transcripts = IdentifierIndex("transcript_ID", [10, 11, 12], {
+            "enst_number": ["ENST10", "ENST11", "ENST12"],
+            "gene_ID": [1, 1, 3],
+        })
+
+    def test_lookup(self):
+        self.assertEqual(self.genes.lookup("ensg_number", ["ENSG00000002", "ENSG00000003", "ENSG0000000"]), [2, 3])
+        self.assertEqual(self.genes.lookup("ensg_number", "ensg00000001"), [1])
+        self.assertEqual(self.genes.lookup("gene_symbol", ["BRCA1"]), [1, 2])
+        self.assertEqual(self.genes.lookup("gene_symbol", ["BRCA1"], ignore_case=False), [1])
+        self.assertEqual(self.genes.lookup("gene_symbol", [""]), [])
+        self.assertEqual(self.genes.lookup("gene_symbol", []), [])
+        self.assertEqual(self.transcripts.lookup("gene_ID", [1, 3]), [10, 11, 12])
+
+    def test_prefix_and_contains(self):
+        self.assertEqual(self.genes.prefix("gene_symbol", "br"), [1, 2])
+        self.assertEqual(self.genes.prefix("ensg_number", "ENSG0000000"), [1, 2, 3, 4])
+        self.assertEqual(self.genes.prefix("ensg_number", "ENSG000000010"), [])
+        self.assertEqual(self.genes.contains("gene_symbol", "rca"), [1, 2])
+
+    def test_reverse_lookup(self):
+        self.assertEqual(self.genes.values("ensg_number", [3, 5, 1]), ["ENSG00000003", "ENSG00000001"])
+        self.assertEqual(self.transcripts.values("gene_ID", [12]), [3])
+        records = self.genes.records([4, 2])
+        self.assertEqual([(r.gene_ID, r.gene_symbol) for r in records], [(4, None), (2, "brca1")])
+        self.assertEqual(len(self.genes.records()), 4)
+
+    def test_empty_index(self):
+        index = IdentifierIndex("miRNA_ID", [], {"mir_ID": [], "hs_nr": []})
+        self.assertEqual(index.lookup("mir_ID", ["MIMAT1"]), [])
+        self.assertEqual(index.values("hs_nr", [1]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
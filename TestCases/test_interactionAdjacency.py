@@ -0,0 +1,94 @@
+import os
+import unittest
+
+os.environ.setdefault("SPONGE_DB_URI", "sqlite://")
+os.environ.setdefault("SPONGE_CACHE_BACKEND", "local")
+
+from sqlalchemy import event
+
+from app.config import app, db
+import app.models as models
+from app.controllers import dataset, levels
+
+
+########################################################################################################################
+"""Test Cases for the canonical interaction storage and its adjacency table"""
+########################################################################################################################
+
+class TestInteractionAdjacency(unittest.TestCase):
+
+    def setUp(self):
+        dataset._reset_run_catalog()
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+        dataset._reset_run_catalog()
+
+    @unittest.skipUnless(os.environ["SPONGE_DB_URI"].startswith("sqlite"), "needs a scratch sqlite database")
+    def test_interactions_of(self):
+        tables = [models.Dataset.__table__, models.SpongeRun.__table__, models.GeneInteraction.__table__,
+                  models.GeneInteractionAdjacency.__table__]
+        db.metadata.create_all(db.engine, tables=tables)
+        self.addCleanup(db.metadata.drop_all, db.engine, tables=tables)
+        db.session.add_all([
+            models.Dataset(dataset_ID=1, disease_ID=1, disease_name="breast invasive carcinoma", data_origin="TCGA", sponge_db_version=2),
+            models.Dataset(dataset_ID=2, disease_ID=1, disease_name="kidney clear cell carcinoma", data_origin="TCGA", sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=10, dataset_ID=1, sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=11, dataset_ID=2, sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=12, dataset_ID=2, sponge_db_version=2),
+        ])
+        # canonical order: gene_ID1 < gene_ID2
+        interactions = [(1, 10, 1, 2), (2, 10, 2, 3), (3, 10, 3, 4), (4, 11, 1, 4)]
+        for ID, run, gene_ID1, gene_ID2 in interactions:
+            db.session.add(models.GeneInteraction(interactions_genegene_ID=ID, sponge_run_ID=run,
+                                                  gene_ID1=gene_ID1, gene_ID2=gene_ID2, p_value=0.01))
+            for gene_ID in (gene_ID1, gene_ID2):
+                db.session.add(models.GeneInteractionAdjacency(sponge_run_ID=run, gene_ID=gene_ID,
+                                                               interactions_genegene_ID=ID))
+        # run 12 was imported without canonical order and adjacency rows
+        for ID, gene_ID1, gene_ID2 in [(5, 4, 2), (6, 3, 5)]:
+            db.session.add(models.GeneInteraction(interactions_genegene_ID=ID, sponge_run_ID=12,
+                                                  gene_ID1=gene_ID1, gene_ID2=gene_ID2, p_value=0.01))
+        db.session.commit()
+
+        def interactions_of(run_IDs, gene_IDs):
+            query = db.select(models.GeneInteraction.interactions_genegene_ID) \
+                .where(levels.interactions_of(levels.GENE, 2, run_IDs, gene_IDs)) \
+                .order_by(models.GeneInteraction.interactions_genegene_ID)
+            return db.session.execute(query).scalars().all()
+
+        # both endpoints are found
+        self.assertEqual(interactions_of([10], [2]), [1, 2])
+        self.assertEqual(interactions_of([10, 11], [4]), [3, 4])
+        self.assertEqual(interactions_of([11], [2, 3]), [])
+
+        # runs without adjacency rows are filtered over both endpoints
+        self.assertEqual(interactions_of([12], [2]), [5])
+        self.assertEqual(interactions_of([10, 12], [3]), [2, 3, 6])
+        self.assertEqual(interactions_of([12], [1]), [])
+
+        # the indexed runs are looked up once per version, not per request
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        self.addCleanup(event.remove, db.engine, "before_cursor_execute", record)
+        interactions_of([10, 11, 12], [2])
+
+        # gene x run presence matrix
+        labels = {2: "ENSG2", 3: "ENSG3", 4: "ENSG4"}
+        result = levels.presence_matrix(levels.GENE, 2, None, [2, 4], labels)
+        self.assertEqual([(r["sponge_run_ID"], r["include"], r["genes"]) for r in result],
+                         [(10, 1, {"ENSG2": 1, "ENSG4": 1}), (11, 1, {"ENSG2": 0, "ENSG4": 1}),
+                          (12, 1, {"ENSG2": 1, "ENSG4": 1})])
+        result = levels.presence_matrix(levels.GENE, "2", 2, [3], labels)
+        self.assertEqual([(r["sponge_run_ID"], r["include"], r["genes"]) for r in result],
+                         [(11, 0, {"ENSG3": 0}), (12, 1, {"ENSG3": 1})])
+        self.assertFalse([s for s in statements if "DISTINCT" in s], statements)
+
+
+if __name__ == '__main__':
+    unittest.main()
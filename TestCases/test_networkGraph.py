@@ -0,0 +1,195 @@
+import os
+import random
+import tempfile
+import unittest
+from collections import deque
+
+os.environ.setdefault("SPONGE_DB_URI", "sqlite://")
+os.environ.setdefault("SPONGE_CACHE_BACKEND", "local")
+
+import numpy as np
+
+import server
+from app.config import app, db, cache
+import app.models as models
+from app import columnar, graph, identifiers
+from app.controllers import dataset
+
+N = 30
+
+
+def bfs(adjacency, seeds, allowed, hops=None):
+    """distances of all nodes reachable from the seeds"""
+    distance = {seed: 0 for seed in seeds}
+    queue = deque(seeds)
+    while queue:
+        node = queue.popleft()
+        if hops is not None and distance[node] == hops:
+            continue
+        for neighbour, edge in adjacency.get(node, []):
+            if allowed[edge] and neighbour not in distance:
+                distance[neighbour] = distance[node] + 1
+                queue.append(neighbour)
+    return distance
+
+
+########################################################################################################################
+"""Test Cases for the adjacency graph of a sponge run and the neighbourhood endpoints"""
+########################################################################################################################
+
+class TestGraph(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(3)
+        pairs = rng.sample([(i, j) for i in range(100) for j in range(i + 1, 100)], 150)
+        rows = [(ID, 10 * i, 10 * j, rng.random(), rng.random(), rng.random()) for ID, (i, j) in enumerate(pairs)]
+        self.run = columnar.RunColumns.from_rows(rows)
+        self.graph = graph.Graph.from_run(self.run)
+        self.allowed = self.graph.edge_mask([("p_value", "<=", 0.7)])
+        self.adjacency = {}
+        for edge, (_, i, j, *_) in enumerate(rows):
+            i, j = self.graph.positions([i])[0], self.graph.positions([j])[0]
+            self.adjacency.setdefault(i, []).append((j, edge))
+            self.adjacency.setdefault(j, []).append((i, edge))
+
+    def test_csr(self):
+        self.assertEqual(self.graph.nodes.tolist(), sorted(self.graph.nodes.tolist()))
+        self.assertEqual(self.graph.indptr[-1], 2 * len(self.run))
+        for node, neighbours in self.adjacency.items():
+            _, found, edges = self.graph.expand(np.array([node]), np.ones(len(self.run), dtype=bool))
+            self.assertEqual(sorted(zip(found.tolist(), edges.tolist())), sorted(neighbours))
+        self.assertEqual(self.graph.positions([10, 15, 990, 10]).tolist(), self.graph.positions([10, 990]).tolist())
+
+    def test_neighbourhood(self):
+        seeds = self.graph.positions([0, 50])
+        for hops in (1, 2, 3):
+            expected = bfs(self.adjacency, seeds.tolist(), self.allowed, hops)
+            positions, distances = self.graph.neighbourhood(seeds, hops, self.allowed)
+            self.assertEqual(dict(zip(positions.tolist(), distances.tolist())), expected)
+            self.assertEqual(list(zip(distances.tolist(), positions.tolist())),
+                             sorted(zip(distances.tolist(), positions.tolist())))
+        positions, distances = self.graph.neighbourhood(seeds, 3, self.allowed, max_nodes=7)
+        self.assertEqual(len(positions), 7)
+        self.assertEqual(distances[:2].tolist(), [0, 0])
+
+    def test_induced(self):
+        positions = np.arange(0, len(self.graph), 2)
+        expected = [edge for edge, (i, j) in enumerate(zip(self.run.columns["node1"], self.run.columns["node2"]))
+                    if self.allowed[edge] and set(self.graph.positions([i, j])) <= set(positions.tolist())
+                    and i != j]
+        self.assertEqual(self.graph.induced(positions, self.allowed).tolist(), expected)
+
+    def test_shortest_paths(self):
+        sources, targets = self.graph.positions([0, 10]), self.graph.positions(range(0, 1000, 70))
+        distance = bfs(self.adjacency, sources.tolist(), self.allowed)
+        for max_length in (1, 2, 4, 8):
+            paths = self.graph.shortest_paths(sources, targets, self.allowed, max_length)
+            reachable = [t for t in targets.tolist() if distance.get(t, max_length + 1) <= max_length]
+            self.assertEqual([nodes[-1] for nodes, _ in paths], reachable)
+            for nodes, edges in paths:
+                self.assertIn(nodes[0], sources.tolist())
+                self.assertEqual(len(edges), distance[nodes[-1]])
+                for a, b, edge in zip(nodes, nodes[1:], edges):
+                    self.assertTrue(self.allowed[edge])
+                    self.assertIn((b, edge), self.adjacency[a])
+
+
+@unittest.skipUnless(os.environ["SPONGE_DB_URI"].startswith("sqlite"), "needs a scratch sqlite database")
+class TestNetworkGraphEndpoints(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app_context = app.app_context()
+        cls.app_context.push()
+        db.create_all()
+        rows = [
+            models.Disease(disease_ID=1, disease_name="breast"),
+            models.Dataset(dataset_ID=1, disease_ID=1, disease_name="breast", sponge_db_version=2),
+            models.Dataset(dataset_ID=2, disease_ID=1, disease_name="breast cancer", sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=1, dataset_ID=1, sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=2, dataset_ID=2, sponge_db_version=2),
+        ]
+        for i in range(1, N + 1):
+            rows += [models.Gene(gene_ID=i, ensg_number=f"ENSG{i}", gene_symbol=f"G{i}", gene_type="lincRNA"),
+                     models.Transcript(transcript_ID=i, gene_ID=i, enst_number=f"ENST{i}", transcript_type="lincRNA")]
+        # run 1 is the chain 1 - 2 - ... - N with a shortcut 1 - 5 failing the p_value cutoff
+        edges = [(i, i + 1, 0.001 * i) for i in range(1, N)] + [(1, 5, 0.5)]
+        for ID, (i, j, p_value) in enumerate(edges, start=1):
+            rows += [models.GeneInteraction(interactions_genegene_ID=ID, sponge_run_ID=1, gene_ID1=i, gene_ID2=j,
+                                            p_value=p_value, mscor=0.1, correlation=0.2),
+                     models.TranscriptInteraction(interactions_transcripttranscript_ID=ID, sponge_run_ID=1,
+                                                  transcript_ID_1=i, transcript_ID_2=j,
+                                                  p_value=p_value, mscor=0.1, correlation=0.2)]
+        db.session.add_all(rows)
+        db.session.commit()
+        cls.client = server.connex_app.test_client()
+        cls.directory = tempfile.TemporaryDirectory()
+
+    @classmethod
+    def tearDownClass(cls):
+        app.config["COLUMNAR_DIR"] = None
+        db.drop_all()
+        cls.app_context.pop()
+        cls.directory.cleanup()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+        graph.reset()
+
+    def setUp(self):
+        cache.clear()
+        identifiers.reset()
+        dataset._reset_run_catalog()
+        graph.reset()
+
+    def get(self, url, status=200):
+        response = self.client.get("/sponge-api/ceRNAInteraction/" + url)
+        self.assertEqual(response.status_code, status, response.text)
+        return response.json()
+
+    def test_neighbourhood(self):
+        result = self.get("getGeneNeighbourhood?dataset_ID=1&ensemblID=ENSG5&hops=2")
+        self.assertEqual([(n["gene"]["ensg_number"], n["distance"]) for n in result["nodes"]],
+                         [("ENSG5", 0), ("ENSG4", 1), ("ENSG6", 1), ("ENSG3", 2), ("ENSG7", 2)])
+        self.assertEqual([(e["gene1"]["ensg_number"], e["gene2"]["ensg_number"]) for e in result["edges"]],
+                         [("ENSG3", "ENSG4"), ("ENSG4", "ENSG5"), ("ENSG5", "ENSG6"), ("ENSG6", "ENSG7")])
+        result = self.get("getGeneNeighbourhood?dataset_ID=1&ensemblID=ENSG5&maxPValue=1&maxEdges=1")
+        self.assertEqual([n["gene"]["ensg_number"] for n in result["nodes"]], ["ENSG5", "ENSG1", "ENSG4", "ENSG6"])
+        self.assertEqual(len(result["edges"]), 1)
+        self.assertEqual(result["edges"][0]["p_value"], 0.004)
+
+    def test_subnetwork(self):
+        app.config["COLUMNAR_DIR"] = self.directory.name
+        result = self.get("getTranscriptSubnetwork?dataset_ID=1&ensemblID=ENST1,ENST2,ENST5,ENST6,ENST40"
+                          "&sponge_db_version=2")
+        self.assertEqual([n["transcript"]["enst_number"] for n in result["nodes"]], ["ENST1", "ENST2", "ENST5", "ENST6"])
+        self.assertEqual(result["nodes"][0]["transcript"]["gene"]["ensg_number"], "ENSG1")
+        self.assertEqual([(e["transcript_1"]["enst_number"], e["transcript_2"]["enst_number"]) for e in result["edges"]],
+                         [("ENST1", "ENST2"), ("ENST5", "ENST6")])
+        self.assertTrue(os.path.isdir(columnar.path("transcript", 1) + ".graph"))
+        app.config["COLUMNAR_DIR"] = None
+
+    def test_paths(self):
+        result = self.get("getGenePaths?dataset_ID=1&sources=ENSG1,ENSG20&targets=ENSG4,ENSG17,ENSG30")
+        self.assertEqual([(p["source"], p["target"], p["length"]) for p in result["paths"]],
+                         [("ENSG1", "ENSG4", 3), ("ENSG20", "ENSG17", 3)])
+        self.assertEqual(result["paths"][0]["genes"], ["ENSG1", "ENSG2", "ENSG3", "ENSG4"])
+        self.assertEqual(len(result["edges"]), 6)
+        result = self.get("getTranscriptPaths?dataset_ID=1&sources=ENST1&targets=ENST5&maxPValue=1")
+        self.assertEqual(result["paths"][0]["transcripts"], ["ENST1", "ENST5"])
+
+    def test_columnar_runs_are_not_kept(self):
+        # without the columnar engine the graph reads the run itself, the engine's runs stay empty
+        app.config["COLUMNAR_ENGINE"] = False
+        self.get("getGeneNeighbourhood?dataset_ID=1&ensemblID=ENSG5")
+        self.assertEqual(len(columnar._runs), 0)
+        self.assertEqual(len(graph._graphs), 1)
+
+    def test_errors(self):
+        self.get("getGeneNeighbourhood?disease_name=breast&ensemblID=ENSG1", status=400)
+        self.get("getGeneNeighbourhood?dataset_ID=1&ensemblID=ENSG99", status=400)
+        self.get("getGeneNeighbourhood?dataset_ID=1&ensemblID=ENSG1&hops=4", status=400)
+        self.get("getGenePaths?dataset_ID=1&sources=ENSG1&targets=ENSG2&maxLength=7", status=400)
+
+
+if __name__ == '__main__':
+    unittest.main()
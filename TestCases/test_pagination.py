@@ -0,0 +1,105 @@
+import os
+import unittest
+
+os.environ.setdefault("SPONGE_DB_URI", "sqlite://")
+os.environ.setdefault("SPONGE_CACHE_BACKEND", "local")
+
+import sqlalchemy as sa
+
+from app.config import app, db
+import app.models as models
+from app import pagination
+
+
+class MySQLFloat(sa.types.TypeDecorator):
+    """FLOAT as returned by MySQL: the stored value rounded to 6 significant digits"""
+    impl = sa.Float
+    cache_ok = True
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else float(f"{value:.6g}")
+
+
+class Score(db.Model):
+    __tablename__ = "test_pagination_score"
+    score_ID = db.Column(db.Integer, primary_key=True)
+    value = db.Column(MySQLFloat)
+
+
+########################################################################################################################
+"""Test Cases for keyset pagination"""
+########################################################################################################################
+
+class TestPagination(unittest.TestCase):
+
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    @unittest.skipUnless(os.environ["SPONGE_DB_URI"].startswith("sqlite"), "needs a scratch sqlite database")
+    def test_pages(self):
+        tables = [models.OccurencesMiRNA.__table__]
+        db.metadata.create_all(db.engine, tables=tables)
+        self.addCleanup(db.metadata.drop_all, db.engine, tables=tables)
+        # many ties in the sort key
+        for i in range(1, 24):
+            db.session.add(models.OccurencesMiRNA(occurences_mirna_gene_ID=i, miRNA_ID=1, sponge_run_ID=1, occurences=i % 4))
+        db.session.commit()
+
+        query = models.OccurencesMiRNA.query
+        pk = models.OccurencesMiRNA.occurences_mirna_gene_ID
+        for sort in ([], [models.OccurencesMiRNA.occurences.desc()], [models.OccurencesMiRNA.occurences]):
+            expected, _ = pagination.paginate(query, sort, pk, None)
+            pages, cursor = [], None
+            while True:
+                rows, cursor = pagination.paginate(query, sort, pk, 5, cursor=cursor)
+                pages.append(rows)
+                if cursor is None:
+                    break
+            self.assertEqual([len(p) for p in pages], [5, 5, 5, 5, 3])
+            self.assertEqual([r.occurences_mirna_gene_ID for p in pages for r in p],
+                             [r.occurences_mirna_gene_ID for r in expected])
+
+            # offset pages are the same and return a cursor as well
+            rows, cursor = pagination.paginate(query, sort, pk, 5, offset=5)
+            self.assertEqual(rows, pages[1])
+            self.assertEqual(pagination.paginate(query, sort, pk, 5, cursor=cursor)[0], pages[2])
+
+    @unittest.skipUnless(os.environ["SPONGE_DB_URI"].startswith("sqlite"), "needs a scratch sqlite database")
+    def test_float_keys(self):
+        tables = [Score.__table__]
+        db.metadata.create_all(db.engine, tables=tables)
+        self.addCleanup(db.metadata.drop_all, db.engine, tables=tables)
+        # values that do not survive the rounding of the driver, with ties and NULLs at page boundaries
+        for i in range(1, 41):
+            db.session.add(Score(score_ID=i, value=None if i % 9 == 0 else (i % 6) / 7 + 1e-9))
+        db.session.commit()
+
+        for sort in ([Score.value.desc()], [Score.value]):
+            expected, _ = pagination.paginate(Score.query, sort, Score.score_ID, None)
+            for limit in (3, 4, 7):
+                pages, cursor = [], None
+                for _ in range(len(expected)):
+                    rows, cursor = pagination.paginate(Score.query, sort, Score.score_ID, limit, cursor=cursor)
+                    pages += [row.score_ID for row in rows]
+                    if cursor is None:
+                        break
+                # no duplicates and no gaps
+                self.assertEqual(pages, [row.score_ID for row in expected], (sort, limit))
+
+    def test_invalid_cursor(self):
+        pk = models.OccurencesMiRNA.occurences_mirna_gene_ID
+        keys = pagination._order_keys([models.OccurencesMiRNA.occurences.desc(), pk])
+        cursor = pagination.encode_cursor(keys, [3, 7])
+        self.assertEqual(pagination.decode_cursor(keys, cursor), [3, 7])
+        with self.assertRaises(pagination.InvalidCursor):
+            pagination.decode_cursor(pagination._order_keys([models.OccurencesMiRNA.occurences, pk]), cursor)
+        with self.assertRaises(pagination.InvalidCursor):
+            pagination.decode_cursor(keys, "not a cursor")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import unittest
+
+os.environ.setdefault("SPONGE_DB_URI", "sqlite://")
+os.environ.setdefault("SPONGE_CACHE_BACKEND", "local")
+
+from app.config import app, db
+import app.models as models
+from app.controllers import dataset
+
+
+########################################################################################################################
+"""Test Cases for the run ID resolver"""
+########################################################################################################################
+
+class TestRunResolver(unittest.TestCase):
+
+    def setUp(self):
+        dataset._reset_run_catalog()
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+        dataset._reset_run_catalog()
+
+    @unittest.skipUnless(os.environ["SPONGE_DB_URI"].startswith("sqlite"), "needs a scratch sqlite database")
+    def test_resolve(self):
+        tables = [models.Dataset.__table__, models.SpongeRun.__table__]
+        db.metadata.create_all(db.engine, tables=tables)
+        self.addCleanup(db.metadata.drop_all, db.engine, tables=tables)
+        db.session.add_all([
+            models.Dataset(dataset_ID=1, disease_ID=1, disease_name="breast invasive carcinoma", disease_subtype=None, sponge_db_version=2),
+            models.Dataset(dataset_ID=2, disease_ID=1, disease_name="breast invasive carcinoma", disease_subtype="LumA", sponge_db_version=2),
+            models.Dataset(dataset_ID=3, disease_ID=1, disease_name="kidney clear cell carcinoma", sponge_db_version=2),
+            models.Dataset(dataset_ID=4, disease_ID=1, disease_name="breast invasive carcinoma", sponge_db_version=1),
+            models.SpongeRun(sponge_run_ID=10, dataset_ID=1, sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=11, dataset_ID=2, sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=12, dataset_ID=3, sponge_db_version=2),
+            models.SpongeRun(sponge_run_ID=13, dataset_ID=4, sponge_db_version=1),
+        ])
+        db.session.commit()
+
+        self.assertEqual(dataset._run_IDs(), [10, 11, 12])
+        self.assertEqual(dataset._run_IDs("2", disease_name="Breast"), [10, 11])
+        self.assertEqual(dataset._run_IDs(disease_name="breast", disease_subtype="unspecific"), [10])
+        self.assertEqual(dataset._run_IDs(disease_name="breast", disease_subtype="luma"), [11])
+        self.assertEqual(dataset._run_IDs(dataset_ID=3), [12])
+        # dataset_ID without disease_name must not match runs of other datasets
+        self.assertEqual(dataset._run_IDs(dataset_ID=4), [])
+        self.assertEqual(dataset._run_IDs(1, disease_name="breast"), [13])
+        self.assertEqual(dataset._run_IDs('any', disease_name="breast"), [10, 11, 13])
+        self.assertEqual(dataset._run_IDs(disease_name="lung"), [])
+        self.assertEqual(dataset._run_IDs(disease_name="kidney%cell"), [12])
+
+        # the catalog is loaded once per version
+        db.session.add(models.SpongeRun(sponge_run_ID=14, dataset_ID=3, sponge_db_version=2))
+        db.session.commit()
+        self.assertEqual(dataset._run_IDs(dataset_ID=3), [12])
+        dataset._reset_run_catalog()
+        self.assertEqual(dataset._run_IDs(dataset_ID=3), [12, 14])
+
+        # and again for a new data release
+        db.session.add(models.SpongeRun(sponge_run_ID=15, dataset_ID=3, sponge_db_version=2))
+        db.session.commit()
+        release = app.config["SPONGE_DATA_RELEASE"]
+        self.addCleanup(app.config.__setitem__, "SPONGE_DATA_RELEASE", release)
+        app.config["SPONGE_DATA_RELEASE"] = release + "-next"
+        self.assertEqual(dataset._run_IDs(dataset_ID=3), [12, 14, 15])
+        self.assertEqual(set(dataset._run_catalogs), {(2, release + "-next")})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+import time
+import unittest
+import redis
+from flask import jsonify, Flask
+from cachelib.serializers import RedisSerializer
+from flask_caching.backends.simplecache import SimpleCache
+from flask_caching.backends.rediscache import RedisCache
+from app.caching import LocalLRUCache, TwoTierCache, ZstdRedisSerializer, train_zstd_dictionary, SpongeCache
+
+
+########################################################################################################################
+"""Test Cases for the in-process LRU cache in front of redis"""
+########################################################################################################################
+
+class TestLocalLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LocalLRUCache(max_bytes=250, default_timeout=0)
+        cache.set("a", "a", size=100)
+        cache.set("b", "b", size=100)
+        cache.get("a")
+        cache.set("c", "c", size=100)
+        self.assertEqual(cache.get("a"), "a")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get_stats()["evictions"], 1)
+        self.assertEqual(cache.get_stats()["bytes"], 200)
+
+    def test_large_values_are_not_stored(self):
+        cache = LocalLRUCache(max_bytes=1000, max_item_bytes=10)
+        self.assertFalse(cache.set("a", "x" * 100))
+        self.assertIsNone(cache.get("a"))
+
+    def test_timeout(self):
+        cache = LocalLRUCache(default_timeout=60)
+        cache.set("a", 1, timeout=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get_stats()["misses"], 1)
+
+    def test_responses_are_copied(self):
+        app = Flask(__name__)
+        cache = LocalLRUCache()
+        with app.app_context():
+            response = jsonify({"a": 1})
+            cache.set("a", response)
+            response.headers["X-Test"] = "1"
+            hit = cache.get("a")
+            self.assertIsNot(hit, response)
+            self.assertNotIn("X-Test", hit.headers)
+            self.assertEqual(hit.get_json(), {"a": 1})
+
+
+class TestTwoTierCache(unittest.TestCase):
+
+    def setUp(self):
+        self.remote = SimpleCache()
+        self.cache = TwoTierCache(LocalLRUCache(default_timeout=60), self.remote)
+
+    def test_local_tier_is_filled_from_remote(self):
+        self.remote.set("a", [1, 2])
+        self.assertEqual(self.cache.get("a"), [1, 2])
+        self.assertEqual(self.cache.get("a"), [1, 2])
+        stats = self.cache.get_stats()
+        self.assertEqual(stats["local"]["hits"], 1)
+        self.assertEqual(stats["local"]["misses"], 1)
+        self.assertEqual(stats["remote"]["hits"], 1)
+
+    def test_set_and_delete_both_tiers(self):
+        self.cache.set("a", 1)
+        self.assertEqual(self.remote.get("a"), 1)
+        self.assertEqual(self.cache.local.get("a"), 1)
+        self.cache.delete("a")
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get_stats()["remote"]["misses"], 1)
+
+    def test_delete_pattern(self):
+        self.cache.set("dataset.get_datasets:v1:x", 1)
+        self.cache.set("dataset.get_datasets:v2:x", 2)
+        self.cache.delete_pattern("*:v2:*")
+        self.assertEqual(self.cache.get("dataset.get_datasets:v1:x"), 1)
+        self.assertIsNone(self.cache.get("dataset.get_datasets:v2:x"))
+
+
+class TestUnreachableRedis(unittest.TestCase):
+
+    def setUp(self):
+        # nothing listens on port 1, connections are refused immediately
+        client = redis.Redis(host="localhost", port=1, socket_connect_timeout=0.2, socket_timeout=0.2)
+        self.cache = TwoTierCache(LocalLRUCache(default_timeout=60), RedisCache(host=client))
+        self.cache.breaker.reset_timeout = 60
+
+    def test_falls_back_to_local_tier(self):
+        self.assertTrue(self.cache.local.get_stats()["entries"] == 0)
+        self.cache.set("a", 1)
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertTrue(self.cache.add("c", 1))
+
+    def test_circuit_breaker_opens(self):
+        for key in ["a", "b", "c"]:
+            self.assertIsNone(self.cache.get(key))
+        self.assertFalse(self.cache.remote_available)
+        start = time.monotonic()
+        self.assertIsNone(self.cache.get("d"))
+        self.assertLess(time.monotonic() - start, 0.05)
+        stats = self.cache.get_stats()["remote"]["circuit_breaker"]
+        self.assertEqual(stats["opened"], 1)
+        self.assertTrue(stats["open"])
+
+    def test_circuit_breaker_closes_after_probe(self):
+        remote = SimpleCache()
+        cache = TwoTierCache(LocalLRUCache(), remote)
+        cache.breaker.reset_timeout = 0
+        for _ in range(3):
+            cache.breaker.failure()
+        self.assertFalse(cache.remote_available)
+        remote.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertTrue(cache.remote_available)
+
+
+class TestLocalBackend(unittest.TestCase):
+
+    def test_local_backend(self):
+        app = Flask(__name__)
+        app.config["CACHE_TYPE"] = "app.caching.LocalLRUCache"
+        app.config["CACHE_LOCAL_MAX_BYTES"] = 1024
+        cache = SpongeCache(app, latest_version=2)
+
+        @cache.cached(query_string=True, coalesce=True)
+        def get_datasets(sponge_db_version=2):
+            return [sponge_db_version]
+
+        with app.app_context():
+            self.assertIsInstance(cache.cache, LocalLRUCache)
+            self.assertEqual(get_datasets(), [2])
+            self.assertEqual(get_datasets(), [2])
+            self.assertEqual(cache.cache.get_stats()["hits"], 1)
+            self.assertEqual(cache.delete_version(2), 1)
+
+
+class TestZstdRedisSerializer(unittest.TestCase):
+
+    def setUp(self):
+        self.value = [{"gene1": {"ensg_number": f"ENSG{i:011d}", "gene_symbol": f"GENE{i}"},
+                       "mscor": i / 1000, "p_value": 0.01} for i in range(200)]
+
+    def test_large_values_are_compressed(self):
+        serializer = ZstdRedisSerializer(threshold=1024)
+        dump = serializer.dumps(self.value)
+        self.assertTrue(dump.startswith(b"~"))
+        self.assertEqual(serializer.loads(dump), self.value)
+        self.assertEqual(serializer.last_size, len(dump))
+        self.assertGreater(serializer.get_stats()["ratio"], 2)
+
+    def test_compatible_with_redis_serializer(self):
+        serializer = ZstdRedisSerializer(threshold=1024)
+        self.assertEqual(serializer.dumps("small"), RedisSerializer().dumps("small"))
+        self.assertEqual(serializer.loads(b"3"), 3)
+        self.assertEqual(serializer.loads(RedisSerializer().dumps(self.value)), self.value)
+        self.assertIsNone(serializer.loads(None))
+
+    def test_dictionary(self):
+        samples = [[{"ensg_number": f"ENSG{i:011d}", "gene_symbol": f"GENE{i}", "gene_type": "protein_coding"}]
+                   for i in range(500)]
+        dictionary = train_zstd_dictionary(samples, dict_size=4096)
+        serializer = ZstdRedisSerializer(threshold=0, dictionary=dictionary)
+        dump = serializer.dumps(samples[0])
+        self.assertEqual(serializer.loads(dump), samples[0])
+        # values written with another dictionary are missing, not broken
+        self.assertIsNone(ZstdRedisSerializer(threshold=0).loads(dump))
+
+    def test_unreadable_values_are_deleted(self):
+        class Client(dict):
+            def delete(self, key):
+                self.pop(key, None)
+
+        serializer = ZstdRedisSerializer(threshold=0)
+        client = Client(truncated=serializer.dumps(self.value)[:50], pickle=b"!not a pickle",
+                        valid=serializer.dumps(self.value))
+        remote = RedisCache(host=client, key_prefix="")
+        remote.serializer = serializer
+        cache = TwoTierCache(LocalLRUCache(default_timeout=60), remote)
+        self.assertIsNone(cache.get("truncated"))
+        self.assertIsNone(cache.get("pickle"))
+        self.assertEqual(cache.get("valid"), self.value)
+        self.assertEqual(list(client), ["valid"])
+
+    def test_unreadable_values_without_compression(self):
+        class Client(dict):
+            def delete(self, key):
+                self.pop(key, None)
+
+        # cachelib only returns None for pickle errors, a class that no longer exists raises
+        client = Client(removed=b"!cremoved_module\nThing\n.", valid=RedisSerializer().dumps(self.value))
+        cache = TwoTierCache(LocalLRUCache(default_timeout=60), RedisCache(host=client, key_prefix=""))
+        self.assertIsNone(cache.get("removed"))
+        self.assertEqual(cache.breaker.failures, 0)
+        self.assertEqual(cache.get("valid"), self.value)
+        self.assertEqual(list(client), ["valid"])
+
+
+if __name__ == '__main__':
+    unittest.main()
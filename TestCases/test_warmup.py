@@ -0,0 +1,86 @@
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from connexion import FlaskApp
+from flask import request, jsonify
+from app.warmup import canonical_url, parse_manifest_line, read_manifest, warm_up
+
+
+########################################################################################################################
+"""Test Cases for the cache warm-up"""
+########################################################################################################################
+
+class TestWarmup(unittest.TestCase):
+
+    def test_canonical_url(self):
+        self.assertEqual(canonical_url("http://localhost:5000/sponge-api/datasets?b=2&a=1"),
+                         "/sponge-api/datasets?a=1&b=2")
+        self.assertEqual(canonical_url("/getOverallCounts"), "/sponge-api/getOverallCounts")
+
+    def test_parse_manifest_line(self):
+        self.assertEqual(parse_manifest_line(json.dumps({"path": "/gseaSets", "query": {"dataset_ID_1": [1, 2]}})),
+                         "/sponge-api/gseaSets?dataset_ID_1=1&dataset_ID_1=2")
+        self.assertEqual(parse_manifest_line(
+            '10.0.0.1 - - [01/Jan/2025:10:00:00 +0000] "GET /sponge-api/diseases?sponge_db_version=2 HTTP/1.1" 200 512'),
+            "/sponge-api/diseases?sponge_db_version=2")
+        self.assertIsNone(parse_manifest_line(
+            '10.0.0.1 - - [01/Jan/2025:10:00:00 +0000] "GET /sponge-api/diseases HTTP/1.1" 404 512'))
+        self.assertEqual(parse_manifest_line(
+            "2025-01-01 10:00:00,000 - app.config - INFO - Incoming request: GET http://localhost/sponge-api/datasets"),
+            "/sponge-api/datasets")
+        self.assertIsNone(parse_manifest_line(json.dumps({"method": "POST", "path": "/spongEffects/predictCancerType"})))
+
+    def test_warm_up(self):
+        lines = ['{"url": "/sponge-api/datasets?sponge_db_version=2"}',
+                 '{"path": "/datasets", "query": {"sponge_db_version": 2}}',
+                 '{"path": "/diseases"}',
+                 'not a request']
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as f:
+            f.write("\n".join(lines))
+        try:
+            urls = read_manifest(f.name)
+        finally:
+            os.remove(f.name)
+        self.assertEqual(urls, ["/sponge-api/datasets?sponge_db_version=2", "/sponge-api/diseases"])
+
+        connex_app = FlaskApp(__name__)
+        requested = []
+
+        @connex_app.route("/sponge-api/datasets")
+        def datasets():
+            requested.append(request.full_path)
+            return jsonify([])
+
+        report = warm_up(connex_app, urls, concurrency=2)
+        self.assertEqual(requested, ["/sponge-api/datasets?sponge_db_version=2"])
+        self.assertEqual(report["/sponge-api/datasets"]["requests"], 1)
+        self.assertEqual(report["/sponge-api/diseases"]["failed"], 0)
+
+    def test_gunicorn_hooks(self):
+        os.environ.setdefault("SPONGE_DB_URI", "sqlite://")
+        os.environ.setdefault("SPONGE_CACHE_BACKEND", "local")
+        import server
+        from app.config import app, db, cache
+        spec = importlib.util.spec_from_file_location(
+            "gunicorn_conf", os.path.join(os.path.dirname(server.__file__), "gunicorn.conf.py"))
+        hooks = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(hooks)
+
+        # the master closes its connections before the fork
+        with app.app_context(), mock.patch.object(db.engine, "dispose") as dispose, \
+                mock.patch.object(cache, "disconnect") as disconnect:
+            hooks.pre_fork(None, None)
+        dispose.assert_called_once()
+        disconnect.assert_called_once()
+        # the worker starts the warm-up
+        with mock.patch("app.warmup.start_warmup_thread") as start_warmup_thread, \
+                mock.patch.dict(os.environ, {"CACHE_WARMUP_MANIFEST": "requests.jsonl"}):
+            hooks.post_worker_init(None)
+        self.assertEqual(start_warmup_thread.call_args.args[2], "requests.jsonl")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,1346 @@
+"""
+Caching helpers for the SPONGE API.
+
+All controllers cache their responses with ``@cache.cached(query_string=True)``.
+``SpongeCache`` replaces the raw query string based keys of Flask-Caching with
+canonical keys: the arguments connexion hands to a controller are resolved
+against the controller's signature, list parameters are sorted, parameters that
+equal their default are dropped and the key is namespaced by the endpoint and
+the ``sponge_db_version``. Requests that mean the same thing therefore share one
+cache entry and all entries of a data version can be dropped at once.
+"""
+
+import fnmatch
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import pickle
+import re
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from cachelib.serializers import RedisSerializer
+from flask import Response, g, has_request_context, request
+from flask_caching import Cache
+from flask_caching.backends.base import BaseCache
+from flask_caching.backends.rediscache import RedisCache
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+VERSION_PARAM = "sponge_db_version"
+
+
+def _canonical_value(value, ordered=False):
+    """
+    Bring a single (connexion parsed) parameter value into a canonical form.
+    :param value: parameter value
+    :param ordered: if False, lists are sorted because their order does not change the result
+    :return: json serializable canonical value
+    """
+    if isinstance(value, (list, tuple, set, frozenset)):
+        values = [_canonical_value(v) for v in value]
+        if not ordered or isinstance(value, (set, frozenset)):
+            values = sorted(values, key=lambda v: json.dumps(v, sort_keys=True, default=str))
+        return values
+    if isinstance(value, dict):
+        return {str(k): _canonical_value(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    return str(value)
+
+
+def _canonical_version(value, latest):
+    """
+    The version parameter is declared as string in the swagger file, but as integer in the controllers.
+    """
+    if value is None:
+        return latest
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+class CacheKeyBuilder:
+    """
+    Builds canonical cache keys for one controller function.
+
+    Keys have the form ``<module>.<function>:v<sponge_db_version>:<digest>`` where the digest is computed
+    from all parameters that differ from their default value.
+    """
+
+    def __init__(self, f, latest_version, order_sensitive=()):
+        self.f = f
+        self.endpoint = f"{f.__module__.rsplit('.', 1)[-1]}.{f.__name__}"
+        self.signature = inspect.signature(f)
+        self.latest_version = latest_version
+        self.order_sensitive = set(order_sensitive)
+
+    def canonical_params(self, *args, **kwargs):
+        """
+        Resolve the given arguments against the signature of the controller.
+        :return: (sponge_db_version, dict of all parameters that are not set to their default)
+        """
+        bound = self.signature.bind_partial(*args, **kwargs)
+        params = {}
+        version = self.latest_version
+        for name, parameter in self.signature.parameters.items():
+            if parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD):
+                extra = bound.arguments.get(name)
+                if extra:
+                    params[name] = _canonical_value(extra)
+                continue
+            default = None if parameter.default is parameter.empty else parameter.default
+            value = bound.arguments.get(name, default)
+            if name == VERSION_PARAM:
+                version = _canonical_version(value, self.latest_version)
+                continue
+            ordered = name in self.order_sensitive
+            value = _canonical_value(value, ordered)
+            if value in (None, []) and default is None:
+                # explicitly given empty parameters behave like missing ones
+                continue
+            if value == _canonical_value(default, ordered) and type(value) is type(default):
+                continue
+            params[name] = value
+        return version, params
+
+    def __call__(self, *args, **kwargs):
+        version, params = self.canonical_params(*args, **kwargs)
+        payload = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+        digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+        return f"{self.endpoint}:v{version}:{digest}"
+
+
+class CacheEntry(namedtuple("CacheEntry", ["value", "soft_expires", "hard_expires"])):
+    """
+    Envelope of a cached response with its soft and hard expiry (unix timestamps, None for never).
+    After the soft expiry the value is still served, but recomputed in the background.
+    """
+    __slots__ = ()
+
+    def is_stale(self, now=None):
+        return self.soft_expires is not None and (now or time.time()) >= self.soft_expires
+
+
+def _unwrap(entry):
+    return entry.value if isinstance(entry, CacheEntry) else entry
+
+
+class AccessCounter:
+    """
+    Approximate access counts of the cache keys of one worker. Only ``capacity`` keys are tracked,
+    when more are seen the counts are halved and the least accessed keys are forgotten.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self._counts = {}
+        self._refresh = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, refresh):
+        """
+        :param key: cache key
+        :param refresh: callable recomputing the cache entry
+        """
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self._refresh[key] = refresh
+            if len(self._counts) > self.capacity:
+                keep = sorted(self._counts.items(), key=lambda kv: kv[1], reverse=True)[:self.capacity // 2]
+                self._counts = {k: max(c // 2, 1) for k, c in keep}
+                self._refresh = {k: self._refresh[k] for k in self._counts}
+
+    def top(self, n):
+        """
+        :return: list of (key, refresh callable) of the n most accessed keys
+        """
+        with self._lock:
+            keys = sorted(self._counts, key=self._counts.get, reverse=True)[:n]
+            return [(k, self._refresh[k]) for k in keys]
+
+
+class CacheMetrics:
+    """
+    Per endpoint counters of the cache: hits, misses, background refreshes, number and bytes of stored
+    values, seconds spent computing misses and serving hits. The counters of each worker are added to
+    a redis hash every ``flush_interval`` seconds, so all workers report the same numbers.
+    """
+
+    fields = ("hits", "misses", "not_modified", "refreshes", "stores", "bytes", "compute_seconds", "hit_seconds")
+
+    def __init__(self, flush_interval=10):
+        self.flush_interval = flush_interval
+        self._counts = defaultdict(Counter)
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def add(self, endpoint, **values):
+        with self._lock:
+            self._counts[endpoint].update(values)
+
+    def flush_due(self):
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def _take(self):
+        with self._lock:
+            counts, self._counts = self._counts, defaultdict(Counter)
+            self._last_flush = time.monotonic()
+        return counts
+
+    def flush(self, client, prefix=""):
+        """
+        Add the counters of this worker to the redis hashes ``<prefix>metrics:<endpoint>``.
+        """
+        counts = self._take()
+        if not counts:
+            return
+        pipe = client.pipeline(transaction=False)
+        for endpoint, values in counts.items():
+            for field, value in values.items():
+                if isinstance(value, float):
+                    pipe.hincrbyfloat(f"{prefix}metrics:{endpoint}", field, value)
+                else:
+                    pipe.hincrby(f"{prefix}metrics:{endpoint}", field, value)
+        try:
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not write cache metrics: {e!r}")
+
+    def collect(self, client=None, prefix=""):
+        """
+        :return: dict endpoint -> counters, read from redis if a client is given
+        """
+        if client is None:
+            with self._lock:
+                return {endpoint: dict(values) for endpoint, values in self._counts.items()}
+        self.flush(client, prefix)
+        result = {}
+        for key in client.scan_iter(match=f"{prefix}metrics:*", count=1000):
+            key = key.decode() if isinstance(key, bytes) else key
+            values = client.hgetall(key)
+            result[key[len(prefix) + len("metrics:"):]] = {
+                (k.decode() if isinstance(k, bytes) else k): float(v) for k, v in values.items()}
+        return result
+
+
+_endpoint_key = re.compile(r"^([\w.]+):v[^:]+:[0-9a-f]{40}$")
+
+
+def count_keys(backend):
+    """
+    Count the distinct cache keys per endpoint.
+    :param backend: cachelib backend
+    :return: Counter endpoint -> number of keys
+    """
+    counts = Counter()
+    client = getattr(backend, "_read_client", None)
+    if client is not None:
+        prefix = backend._get_prefix() if hasattr(backend, "_get_prefix") else ""
+        keys = (k.decode() if isinstance(k, bytes) else k
+                for k in client.scan_iter(match=f"{prefix}*:v*", count=1000))
+        keys = (k[len(prefix):] for k in keys)
+    else:
+        keys = list(getattr(backend, "_cache", ()))
+    for key in keys:
+        match = _endpoint_key.match(key)
+        if match:
+            counts[match.group(1)] += 1
+    return counts
+
+
+def format_prometheus(metrics):
+    """
+    :param metrics: result of :meth:`SpongeCache.get_metrics`
+    :return: metrics in the Prometheus text format
+    """
+    series = [
+        ("sponge_cache_hits_total", "counter", "Requests served from the cache", "hits"),
+        ("sponge_cache_misses_total", "counter", "Requests computed because of a cache miss", "misses"),
+        ("sponge_cache_not_modified_total", "counter", "Requests answered with 304 Not Modified", "not_modified"),
+        ("sponge_cache_refreshes_total", "counter", "Cache entries recomputed in the background", "refreshes"),
+        ("sponge_cache_hit_ratio", "gauge", "Share of requests served from the cache", "hit_ratio"),
+        ("sponge_cache_value_bytes_avg", "gauge", "Average size of stored values", "avg_bytes"),
+        ("sponge_cache_compute_seconds_avg", "gauge", "Average time to compute a missing value", "avg_compute_seconds"),
+        ("sponge_cache_hit_seconds_avg", "gauge", "Average time to serve a cached value", "avg_hit_seconds"),
+        ("sponge_cache_keys", "gauge", "Distinct keys in the cache", "keys"),
+    ]
+    lines = []
+    for name, kind, description, field in series:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for endpoint, values in metrics.items():
+            if values[field] is not None:
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {values[field]}')
+    return "\n".join(lines) + "\n"
+
+
+class SpongeCache(Cache):
+    """
+    Flask-Caching extension with canonical, version-namespaced cache keys.
+
+    Entries written by :meth:`cached` have a soft and a hard timeout (stale-while-revalidate): entries
+    older than CACHE_SOFT_TIMEOUT are served as they are while a background thread recomputes them.
+    Additionally the CACHE_REFRESH_TOP_N most accessed keys of each worker are checked every
+    CACHE_REFRESH_INTERVAL seconds and recomputed if they are stale or expire within CACHE_REFRESH_AHEAD
+    seconds.
+    """
+
+    def __init__(self, app=None, latest_version=None, **kwargs):
+        self.latest_version = latest_version
+        self._access = AccessCounter()
+        self._refreshing = set()
+        self._guard = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._sweeper_pid = None
+        self.metrics = CacheMetrics()
+        super().__init__(app=app, **kwargs)
+
+    def cached(self, timeout=None, query_string=False, order_sensitive=(), coalesce=False, soft_timeout=None,
+               max_age=None, **kwargs):
+        """
+        Decorator caching the return value of a controller function.
+
+        With ``query_string=True`` the cache key is built by :class:`CacheKeyBuilder` from the arguments
+        the function is called with instead of the raw query string of the request. All other
+        cases are handed to Flask-Caching.
+        :param timeout: cache timeout in seconds, defaults to CACHE_DEFAULT_TIMEOUT
+        :param query_string: build the key from the function arguments
+        :param order_sensitive: names of list parameters whose order changes the response
+        :param coalesce: on a miss, only one worker computes the response while concurrent identical
+                         requests wait for it to be stored (for expensive endpoints)
+        :param soft_timeout: seconds after which the entry is recomputed in the background,
+                             defaults to CACHE_SOFT_TIMEOUT
+        :param max_age: Cache-Control max-age of responses to requests with an explicit sponge_db_version,
+                        defaults to CACHE_HTTP_MAX_AGE
+        """
+        if not query_string or kwargs.get("make_cache_key") is not None:
+            return super().cached(timeout=timeout, query_string=query_string, **kwargs)
+
+        def decorator(f):
+            @functools.wraps(f)
+            def decorated_function(*args, **kwargs):
+                start = time.perf_counter()
+                endpoint = decorated_function.make_cache_key.endpoint
+                cache_key = self._key(decorated_function, *args, **kwargs)
+                if cache_key is None:
+                    return self._call_fn(f, *args, **kwargs)
+                not_modified = self._conditional(endpoint, cache_key, max_age, decorated_function.cache_timeout)
+                if not_modified is not None:
+                    self._record(endpoint, not_modified=1)
+                    return not_modified
+                found, entry = self._get(cache_key)
+                if not found:
+                    return self._call_fn(f, *args, **kwargs)
+
+                # controllers may read the request, the refresh recreates it from path and query string
+                origin = (request.path, request.query_string.decode("latin-1")) if has_request_context() else None
+                refresh = functools.partial(self._refresh, cache_key, f, args, kwargs,
+                                            decorated_function.cache_timeout, soft_timeout, origin)
+                self._track(cache_key, refresh)
+                if entry is not None:
+                    if isinstance(entry, CacheEntry) and entry.is_stale():
+                        self._refresh_async(cache_key, refresh)
+                    self._record(endpoint, hits=1, hit_seconds=time.perf_counter() - start)
+                    return _unwrap(entry)
+
+                computed = []
+
+                def compute():
+                    value = self._call_fn(f, *args, **kwargs)
+                    size = self._store(self.cache, cache_key, value, decorated_function.cache_timeout, soft_timeout)
+                    self._record(endpoint, misses=1, compute_seconds=time.perf_counter() - start,
+                                 **({"stores": 1, "bytes": size} if size else {}))
+                    computed.append(True)
+                    return value
+
+                if coalesce:
+                    rv = self._compute_once(cache_key, compute)
+                    if not computed:
+                        # served by the value another request computed
+                        self._record(endpoint, hits=1, hit_seconds=time.perf_counter() - start)
+                    return rv
+                return compute()
+
+            decorated_function.uncached = f
+            decorated_function.cache_timeout = timeout
+            decorated_function.make_cache_key = CacheKeyBuilder(f, self.latest_version, order_sensitive)
+            return decorated_function
+
+        return decorator
+
+    def cached_stream(self, timeout=None, order_sensitive=(), max_bytes=None, max_age=None):
+        """
+        Decorator caching controller functions that return a streamed ``Response``.
+
+        On a miss the response is streamed to the client as before while its chunks are collected. Once the
+        stream is complete, the body is stored under the same key :meth:`cached` would use and later
+        requests get the stored body without calling the controller. Streams that are aborted by the
+        client or larger than ``max_bytes`` are not stored. Other return values (e.g. error responses)
+        are cached as with :meth:`cached`.
+        :param timeout: cache timeout in seconds, defaults to CACHE_DEFAULT_TIMEOUT
+        :param order_sensitive: names of list parameters whose order changes the response
+        :param max_bytes: maximum size of a stored body, defaults to CACHE_STREAM_MAX_BYTES
+        :param max_age: Cache-Control max-age of responses to requests with an explicit sponge_db_version,
+                        defaults to CACHE_HTTP_MAX_AGE
+        """
+        def decorator(f):
+            @functools.wraps(f)
+            def decorated_function(*args, **kwargs):
+                start = time.perf_counter()
+                endpoint = decorated_function.make_cache_key.endpoint
+                cache_key = self._key(decorated_function, *args, **kwargs)
+                if cache_key is None:
+                    return self._call_fn(f, *args, **kwargs)
+                not_modified = self._conditional(endpoint, cache_key, max_age, decorated_function.cache_timeout)
+                if not_modified is not None:
+                    self._record(endpoint, not_modified=1)
+                    return not_modified
+                found, rv = self._get(cache_key)
+                if not found:
+                    return self._call_fn(f, *args, **kwargs)
+                if rv is not None:
+                    self._record(endpoint, hits=1, hit_seconds=time.perf_counter() - start)
+                    return _unwrap(rv)
+
+                rv = self._call_fn(f, *args, **kwargs)
+                if isinstance(rv, Response) and rv.is_streamed:
+                    limit = max_bytes or self.app.config.get("CACHE_STREAM_MAX_BYTES", 64 * 1024 * 1024)
+                    rv.response = self._tee_stream(rv, rv.response, self.cache, cache_key,
+                                                   decorated_function.cache_timeout, limit, endpoint, start)
+                else:
+                    size = self._store(self.cache, cache_key, rv, decorated_function.cache_timeout)
+                    self._record(endpoint, misses=1, compute_seconds=time.perf_counter() - start,
+                                 **({"stores": 1, "bytes": size} if size else {}))
+                return rv
+
+            decorated_function.uncached = f
+            decorated_function.cache_timeout = timeout
+            decorated_function.make_cache_key = CacheKeyBuilder(f, self.latest_version, order_sensitive)
+            return decorated_function
+
+        return decorator
+
+    def _tee_stream(self, response, stream, backend, cache_key, timeout, max_bytes, endpoint, start):
+        """
+        Pass the chunks of a streamed response through and store the complete body afterwards.
+        """
+        chunks = []
+        size = 0
+        try:
+            for chunk in stream:
+                if chunks is not None:
+                    data = chunk.encode("utf-8") if isinstance(chunk, str) else bytes(chunk)
+                    size += len(data)
+                    if size > max_bytes:
+                        logger.info(f"Not caching {cache_key}, streamed body exceeds {max_bytes} bytes")
+                        chunks = None
+                    else:
+                        chunks.append(data)
+                yield chunk
+        finally:
+            if hasattr(stream, "close"):
+                stream.close()
+
+        if chunks is not None:
+            headers = [(k, v) for k, v in response.headers.items() if k.lower() != "content-length"]
+            body = Response(b"".join(chunks), status=response.status_code, headers=headers)
+            try:
+                backend.set(cache_key, body, timeout=timeout)
+            except Exception:
+                # the response is already sent, errors of the cache backend must not break it
+                logger.exception("Exception possibly due to cache backend.")
+            self._record(endpoint, misses=1, compute_seconds=time.perf_counter() - start, stores=1,
+                         bytes=getattr(backend, "last_size", None) or size)
+        else:
+            self._record(endpoint, misses=1, compute_seconds=time.perf_counter() - start)
+
+    def _compute_once(self, cache_key, compute):
+        """
+        Single-flight computation of a missing cache entry: the worker holding the lock for the cache key
+        computes the value, all others poll the cache until the value is stored or the lock is released.
+        If the lock holder dies, the lock expires after CACHE_COALESCE_TIMEOUT seconds.
+        """
+        lock_timeout = self.app.config.get("CACHE_COALESCE_TIMEOUT", 120)
+        try:
+            lock = self._lock(cache_key, lock_timeout)
+        except Exception:
+            if self.app.debug:
+                raise
+            logger.exception("Exception possibly due to cache backend.")
+            return compute()
+
+        delay = self.app.config.get("CACHE_COALESCE_POLL_INTERVAL", 0.05)
+        deadline = time.monotonic() + lock_timeout
+        while True:
+            try:
+                acquired = lock.acquire()
+            except Exception as e:
+                # an unreachable lock backend must not fail the request
+                logger.warning(f"Could not acquire cache lock for {cache_key}: {e!r}")
+                return compute()
+
+            if acquired:
+                try:
+                    # the previous lock holder may have stored the value in the meantime
+                    rv = _unwrap(self.cache.get(cache_key))
+                    return rv if rv is not None else compute()
+                finally:
+                    lock.release()
+
+            time.sleep(delay)
+            delay = min(delay * 2, 1)
+            rv = _unwrap(self.cache.get(cache_key))
+            if rv is not None:
+                return rv
+            if time.monotonic() > deadline:
+                logger.warning(f"Waited {lock_timeout}s for {cache_key}, computing it without lock")
+                return compute()
+
+    def _lock(self, cache_key, timeout):
+        """
+        Lock for the computation of one cache entry, shared via redis if available.
+        """
+        client, prefix = self._redis()
+        if client is not None:
+            return RedisLock(client, f"{prefix}lock:{cache_key}", timeout)
+        # without redis the lock only coordinates the threads of this worker
+        return LocalLock(f"lock:{cache_key}", timeout)
+
+    def _redis(self):
+        """
+        :return: (redis client, key prefix) of the cache backend, (None, "") if redis is not used or not available
+        """
+        backend = self.cache
+        if hasattr(backend, "remote"):
+            if not backend.remote_available:
+                return None, ""
+            backend = backend.remote
+        client = getattr(backend, "_write_client", None)
+        if client is None:
+            return None, ""
+        return client, backend._get_prefix() if hasattr(backend, "_get_prefix") else ""
+
+    def disconnect(self):
+        """
+        Close the pooled redis connections, e.g. before gunicorn forks the workers (see gunicorn.conf.py).
+        Connections inherited by a forked process would be shared with the parent. The pool opens new
+        connections on the next command.
+        """
+        backend = getattr(self.cache, "remote", self.cache)
+        clients = {getattr(backend, name, None) for name in ("_read_client", "_write_client")}
+        for client in clients - {None}:
+            client.connection_pool.disconnect()
+
+    def _record(self, endpoint, **values):
+        self.metrics.add(endpoint, **values)
+        if self.metrics.flush_due():
+            client, prefix = self._redis()
+            if client is not None:
+                self.metrics.flush(client, prefix)
+
+    def get_metrics(self):
+        """
+        Per endpoint cache metrics: hits, misses, hit ratio, average bytes of stored values, average
+        seconds to compute a miss and to serve a hit, and the number of distinct keys in the cache.
+        Without redis only the counters of this worker are reported.
+        """
+        client, prefix = self._redis()
+        counts = self.metrics.collect(client, prefix)
+        try:
+            keys = count_keys(getattr(self.cache, "remote", self.cache) if client is not None
+                              else getattr(self.cache, "local", self.cache))
+        except Exception as e:
+            logger.warning(f"Could not count cache keys: {e!r}")
+            keys = Counter()
+
+        metrics = {}
+        for endpoint in sorted(set(counts) | set(keys)):
+            values = Counter(counts.get(endpoint, {}))
+            requests = values["hits"] + values["misses"]
+            computed = values["misses"] + values["refreshes"]
+            metrics[endpoint] = {
+                "hits": int(values["hits"]),
+                "misses": int(values["misses"]),
+                "not_modified": int(values["not_modified"]),
+                "refreshes": int(values["refreshes"]),
+                "hit_ratio": round(values["hits"] / requests, 4) if requests else None,
+                "avg_bytes": round(values["bytes"] / values["stores"]) if values["stores"] else None,
+                "avg_compute_seconds": round(values["compute_seconds"] / computed, 6) if computed else None,
+                "avg_hit_seconds": round(values["hit_seconds"] / values["hits"], 6) if values["hits"] else None,
+                "keys": keys.get(endpoint, 0),
+            }
+        return metrics
+
+    def _track(self, cache_key, refresh):
+        self._access.hit(cache_key, refresh)
+        interval = self.app.config.get("CACHE_REFRESH_INTERVAL")
+        if not interval or self._sweeper_pid == os.getpid():
+            return
+        with self._guard:
+            if self._sweeper_pid == os.getpid():
+                return
+            # threads do not survive the fork of the gunicorn workers, so every worker starts its own
+            self._sweeper_pid = os.getpid()
+
+        def sweep():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh_hot_keys()
+                except Exception:
+                    logger.exception("Refreshing hot cache entries failed")
+
+        threading.Thread(target=sweep, name="cache-refresh", daemon=True).start()
+
+    def refresh_hot_keys(self):
+        """
+        Schedule the recomputation of the most accessed cache entries that are stale, missing or
+        expire within CACHE_REFRESH_AHEAD seconds.
+        :return: list of the scheduled cache keys
+        """
+        top_n = self.app.config.get("CACHE_REFRESH_TOP_N", 100)
+        ahead = self.app.config.get("CACHE_REFRESH_AHEAD", 0)
+        now = time.time()
+        scheduled = []
+        for cache_key, refresh in self._access.top(top_n):
+            try:
+                entry = self.cache.get(cache_key)
+            except Exception:
+                logger.exception("Exception possibly due to cache backend.")
+                continue
+            if isinstance(entry, CacheEntry):
+                expiring = entry.hard_expires is not None and entry.hard_expires - now < ahead
+                if not entry.is_stale(now) and not expiring:
+                    continue
+            elif entry is not None:
+                continue
+            if self._refresh_async(cache_key, refresh):
+                scheduled.append(cache_key)
+        return scheduled
+
+    def _refresh_async(self, cache_key, refresh):
+        """
+        Recompute a cache entry in the background unless this worker is already doing so.
+        :return: True if the refresh was scheduled
+        """
+        with self._guard:
+            if cache_key in self._refreshing:
+                return False
+            self._refreshing.add(cache_key)
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.app.config.get("CACHE_REFRESH_WORKERS", 2),
+                                                    thread_name_prefix="cache-refresh")
+                self._executor_pid = os.getpid()
+        self._executor.submit(self._run_refresh, cache_key, refresh)
+        return True
+
+    def _run_refresh(self, cache_key, refresh):
+        try:
+            refresh()
+        except Exception:
+            logger.exception(f"Background refresh of {cache_key} failed")
+        finally:
+            with self._guard:
+                self._refreshing.discard(cache_key)
+
+    def _refresh(self, cache_key, f, args, kwargs, timeout, soft_timeout, origin=None):
+        # only one worker recomputes the entry
+        lock = self._lock(f"refresh:{cache_key}", self.app.config.get("CACHE_COALESCE_TIMEOUT", 120))
+        if not lock.acquire():
+            return
+        try:
+            if origin is not None:
+                path, query_string = origin
+                context = self.app.test_request_context(path, query_string=query_string)
+            else:
+                context = self.app.app_context()
+            with context:
+                start = time.perf_counter()
+                value = self._call_fn(f, *args, **kwargs)
+                size = self._store(self.cache, cache_key, value, timeout, soft_timeout)
+                self._record(cache_key.split(":", 1)[0], refreshes=1, compute_seconds=time.perf_counter() - start,
+                             **({"stores": 1, "bytes": size} if size else {}))
+        finally:
+            lock.release()
+
+    def _key(self, decorated_function, *args, **kwargs):
+        """
+        :return: cache key, None if it could not be built
+        """
+        try:
+            return decorated_function.make_cache_key(*args, **kwargs)
+        except Exception:
+            if self.app.debug:
+                raise
+            logger.exception("Could not build cache key.")
+            return None
+
+    def _get(self, cache_key):
+        """
+        :return: (False, None) if the cache backend failed, else (True, cached entry or None)
+        """
+        try:
+            return True, self.cache.get(cache_key)
+        except Exception:
+            if self.app.debug:
+                raise
+            logger.exception("Exception possibly due to cache backend.")
+            return False, None
+
+    def etag(self, cache_key):
+        """
+        Strong ETag of a response: the cache key contains endpoint, canonical parameters and data version,
+        SPONGE_DATA_RELEASE changes all ETags when the data of a version is reloaded.
+        """
+        release = self.app.config.get("SPONGE_DATA_RELEASE", "")
+        return hashlib.sha1(f"{cache_key}:{release}".encode("utf-8")).hexdigest()
+
+    def _conditional(self, endpoint, cache_key, max_age, timeout):
+        """
+        HTTP caching of the response to the current request: the ETag and the Cache-Control policy are kept
+        on ``flask.g`` for :func:`apply_http_cache_headers`. Requests whose If-None-Match matches the ETag
+        are answered with 304 right away. Nested calls of other cached functions are ignored.
+        :return: 304 response or None
+        """
+        if not has_request_context() or request.method not in ("GET", "HEAD") or "_sponge_http_cache" in g \
+                or not (request.endpoint or "").endswith(endpoint.replace(".", "_")):
+            return None
+        etag = self.etag(cache_key)
+        if VERSION_PARAM in request.args:
+            # data of a version does not change, responses can be reused without asking again
+            if max_age is None:
+                max_age = self.app.config.get("CACHE_HTTP_MAX_AGE", 0)
+                if timeout:
+                    max_age = min(max_age, timeout)
+            cache_control = f"public, max-age={max_age}"
+        else:
+            # the latest version changes with new releases, clients have to revalidate
+            cache_control = "no-cache"
+        # compressed responses carry the ETag with the encoding appended (see app.compression.encoded_etag),
+        # the 304 repeats the ETag of the representation the client has
+        matched = etag if request.if_none_match.contains(etag) else \
+            next((tag for tag in request.if_none_match if tag.startswith(f"{etag}-")), None)
+        g._sponge_http_cache = (matched or etag, cache_control)
+        if matched is not None:
+            response = Response(status=304)
+            apply_http_cache_headers(response)
+            return response
+        return None
+
+    def _store(self, backend, cache_key, rv, timeout, soft_timeout=None):
+        """
+        Store a value as :class:`CacheEntry` with its soft and hard expiry.
+        :return: size of the stored value in bytes if known
+        """
+        hard = timeout if timeout is not None else self.app.config.get("CACHE_DEFAULT_TIMEOUT", 300)
+        soft = soft_timeout if soft_timeout is not None else self.app.config.get("CACHE_SOFT_TIMEOUT")
+        now = time.time()
+        entry = CacheEntry(rv,
+                           now + soft if soft and (not hard or soft < hard) else None,
+                           now + hard if hard else None)
+        try:
+            backend.set(cache_key, entry, timeout=timeout)
+        except Exception:
+            if self.app.debug:
+                raise
+            logger.exception("Exception possibly due to cache backend.")
+            return None
+        return getattr(backend, "last_size", None)
+
+    def delete_version(self, sponge_db_version):
+        """
+        Drop all cached responses of one data version, e.g. after new SPONGE runs were loaded.
+        :param sponge_db_version: version of the sponge database
+        :return: number of deleted cache entries
+        """
+        pattern = f"*:v{_canonical_version(sponge_db_version, self.latest_version)}:*"
+        return delete_matching(self.cache, pattern)
+
+    def get_stats(self):
+        """
+        Hit, miss and eviction counters of the cache backend (per tier for :class:`TwoTierCache`).
+        """
+        if hasattr(self.cache, "get_stats"):
+            return self.cache.get_stats()
+        return {}
+
+
+def apply_http_cache_headers(response):
+    """
+    after_request handler adding the ETag and Cache-Control header of cached endpoints to successful responses.
+    The policy is removed from ``flask.g``, which outlives the request if an app context was pushed before.
+    :return: True if the headers were set
+    """
+    policy = g.pop("_sponge_http_cache", None)
+    if policy is None or response.status_code not in (200, 304):
+        return False
+    etag, cache_control = policy
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    return True
+
+
+def delete_matching(backend, pattern):
+    """
+    Delete all keys of a cache backend matching a glob pattern.
+    :param backend: cachelib backend
+    :param pattern: glob pattern of the (unprefixed) keys
+    :return: number of deleted cache entries
+    """
+    if hasattr(backend, "delete_pattern"):
+        return backend.delete_pattern(pattern)
+
+    client = getattr(backend, "_write_client", None)
+    if client is not None:
+        # redis: scan instead of KEYS to not block the server
+        prefix = backend._get_prefix() if hasattr(backend, "_get_prefix") else ""
+        deleted = 0
+        batch = []
+        for key in client.scan_iter(match=prefix + pattern, count=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                deleted += client.delete(*batch)
+                batch = []
+        if batch:
+            deleted += client.delete(*batch)
+        return deleted
+
+    local = getattr(backend, "_cache", None)
+    if local is not None:
+        keys = [key for key in list(local) if fnmatch.fnmatchcase(key, pattern)]
+        backend.delete_many(*keys)
+        return len(keys)
+
+    logger.warning(f"Cache backend {type(backend).__name__} does not support deleting by pattern")
+    return 0
+
+
+class RedisLock:
+    """
+    Non-blocking lock held in redis that expires after ``timeout`` seconds.
+    Only the holder of the lock (identified by a random token) can release it.
+    """
+
+    _release_script = """
+        if redis.call("get", KEYS[1]) == ARGV[1] then
+            return redis.call("del", KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, client, name, timeout):
+        self.client = client
+        self.name = name
+        self.timeout = timeout
+        self.token = uuid.uuid4().hex
+
+    def acquire(self):
+        return bool(self.client.set(self.name, self.token, nx=True, px=int(self.timeout * 1000)))
+
+    def release(self):
+        self.client.eval(self._release_script, 1, self.name, self.token)
+
+
+class LocalLock:
+    """
+    Stand-in for :class:`RedisLock` without redis, shared by the threads of one process.
+    """
+
+    _locks = {}
+    _guard = threading.Lock()
+
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+        self.token = uuid.uuid4().hex
+
+    def acquire(self):
+        now = time.monotonic()
+        with self._guard:
+            holder = self._locks.get(self.name)
+            if holder is not None and holder[1] > now:
+                return False
+            self._locks[self.name] = (self.token, now + self.timeout)
+            return True
+
+    def release(self):
+        with self._guard:
+            holder = self._locks.get(self.name)
+            if holder is not None and holder[0] == self.token:
+                del self._locks[self.name]
+
+
+def _detach(value):
+    """
+    Responses kept in the in-process cache are shared between requests, every hit gets its own copy
+    because after_request handlers modify the headers.
+    """
+    if isinstance(value, Response):
+        return value.__class__(value.get_data(), status=value.status_code, headers=list(value.headers.items()))
+    if isinstance(value, CacheEntry):
+        return value._replace(value=_detach(value.value))
+    if type(value) is tuple:
+        return tuple(_detach(v) for v in value)
+    return value
+
+
+class LocalLRUCache(BaseCache):
+    """
+    In-process cache bounded by the (serialized) size of its values in bytes, the least recently used
+    entries are evicted first. Values are kept as python objects, so hits need no deserialization.
+
+    :param max_bytes: maximum size of all values
+    :param max_item_bytes: values larger than this are not stored
+    :param default_timeout: default timeout in seconds, 0 means entries only leave the cache by eviction
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_item_bytes=None, default_timeout=60):
+        super().__init__(default_timeout=default_timeout)
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes or max_bytes
+        self._cache = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._thread = threading.local()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(max_bytes=config.get("CACHE_LOCAL_MAX_BYTES", 64 * 1024 * 1024),
+                      max_item_bytes=config.get("CACHE_LOCAL_MAX_ITEM_BYTES"))
+        return cls(*args, **kwargs)
+
+    def _remove(self, key):
+        _, size, _ = self._cache.pop(key)
+        self._size -= size
+
+    def _lookup(self, key):
+        """
+        :return: the stored value or None, does not count hits and misses
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires, _, value = entry
+            if expires and expires <= time.monotonic():
+                self._remove(key)
+                return None
+            self._cache.move_to_end(key)
+            return value
+
+    def get(self, key):
+        value = self._lookup(key)
+        with self._lock:
+            self.stats["hits" if value is not None else "misses"] += 1
+        return _detach(value)
+
+    def has(self, key):
+        return self._lookup(key) is not None
+
+    def set(self, key, value, timeout=None, size=None):
+        """
+        :param size: size of the value in bytes, pickled size if not given
+        """
+        if size is None:
+            size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        self._thread.last_size = size
+        timeout = self._normalize_timeout(timeout)
+        with self._lock:
+            if key in self._cache:
+                self._remove(key)
+            if size > self.max_item_bytes:
+                return False
+            self._cache[key] = (time.monotonic() + timeout if timeout else 0, size, _detach(value))
+            self._size += size
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._cache)))
+                self.stats["evictions"] += 1
+        return True
+
+    def add(self, key, value, timeout=None, size=None):
+        if self.has(key):
+            return False
+        return self.set(key, value, timeout, size)
+
+    def delete(self, key):
+        with self._lock:
+            if key not in self._cache:
+                return False
+            self._remove(key)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._size = 0
+        return True
+
+    @property
+    def last_size(self):
+        """
+        Size in bytes of the last value stored by the current thread.
+        """
+        return getattr(self._thread, "last_size", None)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._cache), bytes=self._size, max_bytes=self.max_bytes)
+
+
+class ZstdRedisSerializer(RedisSerializer):
+    """
+    Redis serializer compressing pickled values larger than ``threshold`` bytes with zstandard.
+
+    Compressed values are marked with a leading ``~``, all other values are written and read as by the
+    default ``RedisSerializer``, so existing cache entries stay readable. Values that cannot be read
+    (e.g. written with another dictionary, truncated or pickled by another version of a class) are treated
+    as missing, :class:`TwoTierCache` deletes them.
+
+    :param threshold: minimum size of the pickled value in bytes to be compressed
+    :param level: zstandard compression level
+    :param dictionary: trained zstandard dictionary (see :func:`train_zstd_dictionary`)
+    """
+
+    marker = b"~"
+
+    def __init__(self, threshold=1024, level=3, dictionary=None):
+        self.threshold = threshold
+        self.level = level
+        self.dictionary = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        # zstandard (de)compressors must not be shared between threads
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {"values": 0, "compressed": 0, "bytes_in": 0, "bytes_out": 0}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        :return: serializer configured by CACHE_COMPRESSION_THRESHOLD, CACHE_COMPRESSION_LEVEL and
+                 CACHE_COMPRESSION_DICT (path to a trained dictionary), None if compression is disabled
+        """
+        threshold = config.get("CACHE_COMPRESSION_THRESHOLD")
+        if threshold is None:
+            return None
+        if zstandard is None:
+            logger.warning("zstandard is not installed, cache values are stored uncompressed")
+            return None
+        dictionary = None
+        if config.get("CACHE_COMPRESSION_DICT"):
+            with open(config["CACHE_COMPRESSION_DICT"], "rb") as f:
+                dictionary = f.read()
+        return cls(threshold=threshold, level=config.get("CACHE_COMPRESSION_LEVEL", 3), dictionary=dictionary)
+
+    def _compressor(self):
+        if not hasattr(self._local, "compressor"):
+            self._local.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary)
+            self._local.decompressor = zstandard.ZstdDecompressor(dict_data=self.dictionary)
+        return self._local.compressor
+
+    def _decompressor(self):
+        self._compressor()
+        return self._local.decompressor
+
+    @property
+    def last_size(self):
+        """
+        Size in bytes of the last value serialized by the current thread.
+        """
+        return getattr(self._local, "last_size", None)
+
+    def dumps(self, value, protocol=pickle.HIGHEST_PROTOCOL):
+        dump = super().dumps(value, protocol)
+        size = len(dump)
+        if size >= self.threshold and dump.startswith(b"!"):
+            compressed = self.marker + self._compressor().compress(dump[1:])
+            if len(compressed) < size:
+                dump = compressed
+        with self._lock:
+            self.stats["values"] += 1
+            self.stats["bytes_in"] += size
+            self.stats["bytes_out"] += len(dump)
+            if dump.startswith(self.marker):
+                self.stats["compressed"] += 1
+        self._local.last_size = len(dump)
+        return dump
+
+    def loads(self, value):
+        try:
+            if value is not None and value.startswith(self.marker):
+                return pickle.loads(self._decompressor().decompress(value[1:]))
+            return super().loads(value)
+        except Exception as e:
+            logger.warning(f"Could not read cache value, treating it as missing: {e!r}")
+            return None
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["ratio"] = round(stats["bytes_in"] / stats["bytes_out"], 2) if stats["bytes_out"] else None
+        return stats
+
+
+def train_zstd_dictionary(samples, dict_size=112640):
+    """
+    Train a zstandard dictionary on typical cache values, e.g. to store in CACHE_COMPRESSION_DICT:
+    ``open(path, "wb").write(train_zstd_dictionary(values))``.
+    :param samples: cached values (python objects as returned by the controllers)
+    :param dict_size: maximum size of the dictionary in bytes
+    :return: dictionary as bytes
+    """
+    data = [pickle.dumps(sample, pickle.HIGHEST_PROTOCOL) for sample in samples]
+    return zstandard.train_dictionary(dict_size, data).as_bytes()
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for the connection to redis: after ``failure_threshold`` consecutive failures the
+    circuit opens and redis is not used for ``reset_timeout`` seconds. Afterwards one thread runs the
+    ``probe`` (e.g. a ping) and closes the circuit if it succeeds.
+    """
+
+    def __init__(self, probe, failure_threshold=3, reset_timeout=30):
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "failures": 0}
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        """
+        :return: True if redis may be used
+        """
+        if self.opened_at is None:
+            return True
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._probing = True
+        try:
+            healthy = bool(self.probe())
+        except Exception:
+            healthy = False
+        with self._lock:
+            self._probing = False
+            if healthy:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.opened_at = time.monotonic()
+        if healthy:
+            logger.info("Cache backend is reachable again, closing circuit breaker")
+        return healthy
+
+    def success(self):
+        if self.failures:
+            with self._lock:
+                self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self.stats["failures"] += 1
+            if self.opened_at is None and self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self.stats["opened"] += 1
+                logger.warning(f"Cache backend failed {self.failures} times, opening circuit breaker "
+                               f"for {self.reset_timeout}s")
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, open=self.opened_at is not None)
+
+
+class TwoTierCache(BaseCache):
+    """
+    Cache backend with a per worker :class:`LocalLRUCache` in front of the shared redis cache.
+
+    Hits of the local tier skip the network round trip and the deserialization, entries fetched from
+    redis are copied to the local tier. The local tier keeps entries only for ``CACHE_LOCAL_TIMEOUT``
+    seconds, so entries deleted in redis by another worker are dropped here shortly after.
+
+    Errors of redis are logged and handled like misses. After repeated errors a :class:`CircuitBreaker`
+    stops using redis and the local tier serves as the only cache until redis answers a ping again.
+
+    :param local: in-process cache
+    :param remote: shared cache, usually redis
+    :param breaker: circuit breaker for the remote cache
+    """
+
+    def __init__(self, local, remote, default_timeout=300, breaker=None):
+        super().__init__(default_timeout=default_timeout)
+        self.local = local
+        self.remote = remote
+        self.breaker = breaker or CircuitBreaker(self._ping)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        local = LocalLRUCache(max_bytes=config.get("CACHE_LOCAL_MAX_BYTES", 64 * 1024 * 1024),
+                              max_item_bytes=config.get("CACHE_LOCAL_MAX_ITEM_BYTES"),
+                              default_timeout=config.get("CACHE_LOCAL_TIMEOUT", 60))
+        redis_kwargs = dict(kwargs)
+        if config.get("CACHE_REDIS_URL"):
+            import redis
+            # RedisCache.factory ignores CACHE_OPTIONS for urls, short timeouts keep requests from blocking
+            redis_kwargs["host"] = redis.from_url(
+                config["CACHE_REDIS_URL"],
+                socket_timeout=config.get("CACHE_REDIS_SOCKET_TIMEOUT"),
+                socket_connect_timeout=config.get("CACHE_REDIS_CONNECT_TIMEOUT"))
+            if config.get("CACHE_KEY_PREFIX"):
+                redis_kwargs["key_prefix"] = config["CACHE_KEY_PREFIX"]
+            remote = RedisCache(*args, **redis_kwargs)
+        else:
+            remote = RedisCache.factory(app, config, list(args), redis_kwargs)
+        serializer = ZstdRedisSerializer.from_config(config)
+        if serializer is not None:
+            remote.serializer = serializer
+        cache = cls(local, remote, default_timeout=kwargs.get("default_timeout", 300))
+        cache.breaker.failure_threshold = config.get("CACHE_BREAKER_THRESHOLD", 3)
+        cache.breaker.reset_timeout = config.get("CACHE_BREAKER_RESET_TIMEOUT", 30)
+        return cache
+
+    @property
+    def remote_available(self):
+        return not self.breaker.is_open
+
+    def _ping(self):
+        client = getattr(self.remote, "_read_client", None)
+        return client.ping() if client is not None else True
+
+    def _remote(self, method, *args, default=None):
+        """
+        Call a method of the remote cache unless the circuit breaker is open.
+        :return: result of the method, ``default`` if redis is not available
+        """
+        if not self.breaker.allow():
+            return default
+        try:
+            rv = method(*args)
+        except Exception as e:
+            logger.warning(f"Cache backend error: {e!r}")
+            self.breaker.failure()
+            return default
+        self.breaker.success()
+        return rv
+
+    def _local_timeout(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        if not timeout:
+            return self.local.default_timeout
+        return min(timeout, self.local.default_timeout) if self.local.default_timeout else timeout
+
+    def _remote_get(self, key):
+        """
+        :return: (value, size of the stored value in bytes)
+        """
+        client = getattr(self.remote, "_read_client", None)
+        if client is None:
+            value = self.remote.get(key)
+            return value, None
+        raw = client.get(f"{self.remote._get_prefix()}{key}")
+        if raw is None:
+            return None, 0
+        try:
+            value = self.remote.serializer.loads(raw)
+        except Exception as e:
+            # a corrupt value is not a failure of the backend and must not open the circuit breaker
+            logger.warning(f"Could not deserialize cache entry {key}: {e!r}")
+            value = None
+        if value is None:
+            # unreadable values are deleted, so the next request stores a new one instead of missing again
+            self.remote._write_client.delete(f"{self.remote._get_prefix()}{key}")
+            return None, 0
+        return value, len(raw)
+
+    def _count(self, hit):
+        with self._lock:
+            self.stats["hits" if hit else "misses"] += 1
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        value, size = self._remote(self._remote_get, key, default=(None, None))
+        self._count(value is not None)
+        if value is None:
+            return None
+        # the remaining lifetime in redis is unknown, the local timeout bounds the staleness
+        self.local.set(key, value, self._local_timeout(None), size)
+        return value
+
+    def has(self, key):
+        return self.local.has(key) or bool(self._remote(self.remote.has, key, default=False))
+
+    @property
+    def last_size(self):
+        """
+        Size in bytes of the last value stored by the current thread.
+        """
+        return self.local.last_size
+
+    def set(self, key, value, timeout=None):
+        result = self._remote(self.remote.set, key, value, timeout, default=False)
+        # the size of the serialized value saves pickling it again for the local tier
+        size = getattr(self.remote.serializer, "last_size", None) if result else None
+        self.local.set(key, value, self._local_timeout(timeout), size)
+        return result
+
+    def add(self, key, value, timeout=None):
+        created = self._remote(self.remote.add, key, value, timeout)
+        if created is None:
+            return self.local.add(key, value, self._local_timeout(timeout))
+        if created:
+            self.local.set(key, value, self._local_timeout(timeout))
+        return created
+
+    def delete(self, key):
+        deleted = self.local.delete(key)
+        return self._remote(self.remote.delete, key, default=deleted)
+
+    def delete_pattern(self, pattern):
+        deleted = delete_matching(self.local, pattern)
+        return self._remote(delete_matching, self.remote, pattern, default=deleted)
+
+    def clear(self):
+        self.local.clear()
+        return self._remote(self.remote.clear, default=True)
+
+    def get_stats(self):
+        with self._lock:
+            remote = dict(self.stats)
+        remote["circuit_breaker"] = self.breaker.get_stats()
+        client = getattr(self.remote, "_read_client", None)
+        if client is not None and self.remote_available:
+            try:
+                remote["evictions"] = client.info("stats").get("evicted_keys")
+            except Exception as e:
+                logger.warning(f"Could not read redis statistics: {e!r}")
+        serializer = getattr(self.remote, "serializer", None)
+        if hasattr(serializer, "get_stats"):
+            remote["compression"] = serializer.get_stats()
+        return {"local": self.local.get_stats(), "remote": remote}
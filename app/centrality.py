@@ -0,0 +1,193 @@
+"""
+Centralities of filtered ceRNA subnetworks.
+
+networkAnalysis and networkAnalysisTranscript hold betweenness, eigenvector centrality and degree of the
+complete network of a run. Once the network endpoints drop edges (mscor, correlation, gene list, node
+limit) these values no longer describe the returned graph; with ``centrality=subnetwork`` they are
+computed here for the subnetwork instead.
+
+The subnetwork of a run is the set of returned nodes with all interactions between them that pass the
+edge filters (before edge pagination, so all pages of a network agree). Degree is the number of
+interactions of a node, eigenvector centrality the principal eigenvector of the adjacency matrix
+(``scipy.sparse.linalg.eigsh``) scaled to a maximum of 1 and betweenness the unnormalized shortest path
+betweenness of Brandes' algorithm, with the breadth-first searches of many sources run together as
+sparse matrix products.
+
+Betweenness is exact up to ``CENTRALITY_EXACT_NODES`` nodes; larger subnetworks use the searches of
+``CENTRALITY_SAMPLES`` random sources, scaled to all nodes. Searches stop when ``CENTRALITY_TIME_BUDGET``
+seconds are used up, the result is then extrapolated from the sources done so far. Results that are not
+exact are marked approximate.
+
+Results are cached per run under a canonical key of the filters (sorted node IDs and edge cutoffs), so
+requests that only differ in sorting, pagination of the edges, format or fields share them.
+"""
+
+import hashlib
+import json
+import time
+from collections import namedtuple
+
+import numpy as np
+import scipy.sparse as sp
+from flask import current_app
+from scipy.sparse.linalg import ArpackNoConvergence, eigsh
+
+from app import columnar
+
+VALUES = ("betweenness", "eigenvector", "node_degree")
+
+# number of (node, source) cells of the matrices of one batch of breadth-first searches
+BATCH_CELLS = 1 << 20
+
+Centrality = namedtuple("Centrality", ["node_IDs", "betweenness", "eigenvector", "node_degree", "approximate"])
+
+
+def adjacency(n, first, second):
+    """
+    :param n: number of nodes
+    :param first: node positions of one endpoint of the interactions
+    :param second: node positions of the other endpoint
+    :return: symmetric 0/1 adjacency matrix without self loops (CSR)
+    """
+    keep = first != second
+    rows = np.concatenate([first[keep], second[keep]])
+    columns = np.concatenate([second[keep], first[keep]])
+    matrix = sp.csr_matrix((np.ones(len(rows)), (rows, columns)), shape=(n, n))
+    matrix.data[:] = 1.0
+    return matrix
+
+
+def eigenvector(matrix):
+    """
+    :param matrix: symmetric adjacency matrix
+    :return: principal eigenvector, absolute values scaled to a maximum of 1 (0 for a graph without edges)
+    """
+    n = matrix.shape[0]
+    if matrix.nnz == 0:
+        return np.zeros(n)
+    if n < 3:
+        _, vectors = np.linalg.eigh(matrix.toarray())
+        vector = vectors[:, -1]
+    else:
+        try:
+            _, vectors = eigsh(matrix, k=1, which="LA", v0=np.ones(n), tol=1e-10, maxiter=max(1000, 10 * n))
+            vector = vectors[:, 0]
+        except ArpackNoConvergence as e:
+            vector = e.eigenvectors[:, 0] if e.eigenvectors.shape[1] else np.ones(n)
+    vector = np.abs(vector)
+    return vector / vector.max()
+
+
+def betweenness(matrix, sources, deadline=None):
+    """
+    Dependencies of Brandes' algorithm accumulated over the breadth-first searches from the given sources.
+    :param matrix: symmetric 0/1 adjacency matrix
+    :param sources: node positions to search from
+    :param deadline: time.monotonic() after which no further batch of searches is started
+    :return: summed dependencies per node and the number of sources searched
+    """
+    n = matrix.shape[0]
+    total = np.zeros(n)
+    done = 0
+    batch = max(1, BATCH_CELLS // max(n, 1))
+    for start in range(0, len(sources), batch):
+        if deadline is not None and done > 0 and time.monotonic() > deadline:
+            break
+        batch_sources = sources[start:start + batch]
+        columns = np.arange(len(batch_sources))
+        # sigma: number of shortest paths from every source, levels: nodes at each distance
+        sigma = np.zeros((n, len(batch_sources)))
+        sigma[batch_sources, columns] = 1.0
+        visited = sigma > 0
+        levels = [visited.copy()]
+        frontier = sigma
+        while True:
+            paths = matrix @ frontier
+            paths[visited] = 0.0
+            reached = paths > 0
+            if not reached.any():
+                break
+            sigma += paths
+            visited |= reached
+            levels.append(reached)
+            frontier = paths
+        delta = np.zeros_like(sigma)
+        for distance in range(len(levels) - 1, 0, -1):
+            successors = np.where(levels[distance], (1.0 + delta) / np.where(levels[distance], sigma, 1.0), 0.0)
+            delta += np.where(levels[distance - 1], (matrix @ successors) * sigma, 0.0)
+        delta[batch_sources, columns] = 0.0
+        total += delta.sum(axis=1)
+        done += len(batch_sources)
+    return total, done
+
+
+def compute(node_IDs, node1, node2, exact_nodes=2000, samples=500, budget=None, seed=0):
+    """
+    :param node_IDs: sorted IDs of the nodes of the subnetwork
+    :param node1: IDs of one endpoint of the interactions (all endpoints have to be nodes)
+    :param node2: IDs of the other endpoint
+    :param exact_nodes: betweenness is computed from every node up to this number of nodes
+    :param samples: number of sources of the betweenness of larger subnetworks
+    :param budget: seconds the betweenness searches may take, unlimited if None
+    :param seed: seed of the sampled sources
+    :return: Centrality of the nodes
+    """
+    node_IDs = np.asarray(node_IDs, dtype=np.int64)
+    n = len(node_IDs)
+    first = np.searchsorted(node_IDs, np.asarray(node1, dtype=np.int64))
+    second = np.searchsorted(node_IDs, np.asarray(node2, dtype=np.int64))
+    degree = np.bincount(first, minlength=n) + np.bincount(second, minlength=n)
+    matrix = adjacency(n, first, second)
+    deadline = time.monotonic() + budget if budget is not None else None
+
+    if n <= exact_nodes:
+        sources = np.arange(n)
+    else:
+        sources = np.sort(np.random.default_rng(seed).choice(n, size=samples, replace=False))
+    dependencies, done = betweenness(matrix, sources, deadline)
+    # every shortest path of the undirected graph is counted from both of its ends
+    values = dependencies * (n / done if done else 0.0) / 2.0
+    return Centrality(node_IDs.tolist(), values.tolist(), eigenvector(matrix).tolist(), degree.tolist(),
+                      bool(done < n))
+
+
+def _key(table, sponge_db_version, sponge_run_ID, node_IDs, cutoffs):
+    payload = json.dumps({
+        "table": table,
+        "run": int(sponge_run_ID),
+        "release": current_app.config.get("SPONGE_DATA_RELEASE", ""),
+        "nodes": [int(ID) for ID in node_IDs],
+        "cutoffs": sorted([column, operator, float(value)] for column, operator, value in cutoffs),
+    }, separators=(",", ":"))
+    return f"centrality.{table}:v{sponge_db_version}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+
+def subnetwork_centralities(table, sponge_db_version, nodes, cutoffs):
+    """
+    :param table: "gene" or "transcript"
+    :param sponge_db_version: version of the sponge database (namespace of the cache keys)
+    :param nodes: (sponge_run_ID, gene_ID / transcript_ID) of the nodes of the network
+    :param cutoffs: list of (column, operator, value) the interactions of the subnetwork have to pass
+    :return: dict (sponge_run_ID, node ID) -> dict of VALUES, whether any value is approximate
+    """
+    from app.config import cache
+
+    config = current_app.config
+    runs = {}
+    for run_ID, node_ID in nodes:
+        runs.setdefault(int(run_ID), set()).add(int(node_ID))
+
+    values, approximate = {}, False
+    for run_ID, node_IDs in sorted(runs.items()):
+        node_IDs = sorted(node_IDs)
+        key = _key(table, sponge_db_version, run_ID, node_IDs, cutoffs)
+        result = cache.get(key)
+        if result is None:
+            node1, node2 = columnar.endpoints(table, run_ID, node_IDs, cutoffs)
+            result = compute(node_IDs, node1, node2, config.get("CENTRALITY_EXACT_NODES", 2000),
+                             config.get("CENTRALITY_SAMPLES", 500), config.get("CENTRALITY_TIME_BUDGET"))
+            cache.set(key, result)
+        approximate |= result.approximate
+        for i, node_ID in enumerate(result.node_IDs):
+            values[(run_ID, node_ID)] = {name: getattr(result, name)[i] for name in VALUES}
+    return values, approximate
@@ -0,0 +1,381 @@
+"""
+Columnar in-memory engine for the ceRNA interaction tables.
+
+findAll, findSpecific and the network endpoints filter and sort the interactions of one or a few
+sponge runs by p_value, mscor and correlation. ``RunColumns`` keeps the interactions of a run as
+NumPy column arrays (primary key, both endpoints and the three values) sorted by primary key, so
+these filters are vectorized masks and top-k sorts an ``argpartition``. The engine only selects
+the primary keys of a page; the controllers load and dump the interactions of the page as before.
+
+The arrays of a run are read with one query and, if ``SPONGE_COLUMNAR_DIR`` is set, written as
+``.npy`` files below ``<dir>/release-<SPONGE_DATA_RELEASE>/<table>/<sponge_run_ID>`` and
+memory-mapped, so all workers share one copy in the page cache and later workers skip the query.
+Runs never change within a data version; a new SPONGE_DATA_RELEASE starts a new directory.
+
+The engine is opt-in (``SPONGE_COLUMNAR_ENGINE=1``); endpoints check ``enabled()`` and use SQL for
+everything the engine cannot answer (e.g. cursor pagination).
+
+Values are read as double precision (MySQL FLOAT columns converted to DOUBLE), so comparisons and ties
+equal those of the database. NULL values are NaN: they fail every comparison and sort like NULL in
+MySQL, first in ascending and last in descending order. Ties are broken by the primary key, as in
+``app.pagination``.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import sqlalchemy as sa
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+VALUES = ("p_value", "mscor", "correlation")
+COLUMNS = ("ID", "node1", "node2") + VALUES
+
+OPERATORS = {
+    "<": (np.less, lambda column, value: column < value),
+    "<=": (np.less_equal, lambda column, value: column <= value),
+    ">": (np.greater, lambda column, value: column > value),
+    ">=": (np.greater_equal, lambda column, value: column >= value),
+}
+
+
+def _sources():
+    import app.models as models
+    return {
+        "gene": (models.GeneInteraction, models.GeneInteraction.interactions_genegene_ID,
+                 models.GeneInteraction.gene_ID1, models.GeneInteraction.gene_ID2),
+        "transcript": (models.TranscriptInteraction, models.TranscriptInteraction.interactions_transcripttranscript_ID,
+                       models.TranscriptInteraction.transcript_ID_1, models.TranscriptInteraction.transcript_ID_2),
+    }
+
+
+def where(model, cutoffs):
+    """
+    SQL equivalent of the cutoffs of ``Interactions.mask``.
+    :param model: models.GeneInteraction or models.TranscriptInteraction
+    :param cutoffs: list of (column, operator, value), operator one of <, <=, >, >=
+    :return: list of filters
+    """
+    return [OPERATORS[operator][1](getattr(model, column), value) for column, operator, value in cutoffs]
+
+
+def save_arrays(path, arrays):
+    """
+    Write arrays as .npy files to a new directory. The directory is renamed into place when it is complete,
+    if another worker was faster its files are kept.
+    :param path: directory
+    :param arrays: dict name -> array
+    """
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        for name, values in arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), values)
+        os.rename(tmp, path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_arrays(path, names):
+    """
+    :param path: directory written by ``save_arrays``
+    :param names: names of the arrays
+    :return: dict name -> array memory-mapped read-only, None if the directory does not exist
+    """
+    if not os.path.isdir(path):
+        return None
+    return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in names}
+
+
+class RunColumns:
+    """
+    Interactions of one sponge run as column arrays in the order of their primary key.
+    """
+
+    def __init__(self, columns):
+        """
+        :param columns: dict column name (see COLUMNS) -> array
+        """
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns["ID"])
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        :param rows: rows with the values of COLUMNS, ordered by primary key
+        """
+        data = list(zip(*rows)) or [[] for _ in COLUMNS]
+        columns = {name: np.asarray(values, dtype=np.int64) for name, values in zip(COLUMNS[:3], data[:3])}
+        columns.update({name: np.asarray([np.nan if v is None else v for v in values], dtype=np.float64)
+                        for name, values in zip(VALUES, data[3:])})
+        return cls(columns)
+
+    def save(self, path):
+        """
+        :param path: directory of the run, see ``save_arrays``
+        """
+        save_arrays(path, self.columns)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: directory written by ``save``
+        :return: columns memory-mapped read-only, None if the directory does not exist
+        """
+        columns = load_arrays(path, COLUMNS)
+        return cls(columns) if columns is not None else None
+
+
+class Interactions:
+    """
+    Interactions of one or more sponge runs.
+    """
+
+    def __init__(self, runs):
+        """
+        :param runs: list of RunColumns
+        """
+        if not runs:
+            runs = [RunColumns.from_rows([])]
+        if len(runs) == 1:
+            self.columns = runs[0].columns
+        else:
+            self.columns = {name: np.concatenate([run.columns[name] for run in runs]) for name in COLUMNS}
+
+    def __len__(self):
+        return len(self.columns["ID"])
+
+    def mask(self, nodes=None, both=False, cutoffs=()):
+        """
+        :param nodes: node IDs (gene_IDs / transcript_IDs) interactions must involve, all interactions if None
+        :param both: if True both endpoints have to be one of the nodes, otherwise at least one
+        :param cutoffs: list of (column, operator, value), see ``where``
+        :return: boolean mask of the matching interactions
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if nodes is not None:
+            nodes = np.asarray(list(nodes), dtype=np.int64)
+            first, second = np.isin(self.columns["node1"], nodes), np.isin(self.columns["node2"], nodes)
+            mask &= (first & second) if both else (first | second)
+        for column, operator, value in cutoffs:
+            mask &= OPERATORS[operator][0](self.columns[column], float(value))
+        return mask
+
+    def nodes(self, mask):
+        """
+        :param mask: boolean mask of interactions
+        :return: sorted IDs of the nodes taking part in the interactions
+        """
+        return np.union1d(self.columns["node1"][mask], self.columns["node2"][mask])
+
+    def select(self, mask, sort=None, descending=False, offset=None, limit=None):
+        """
+        Primary keys of one page of the matching interactions.
+        :param mask: boolean mask of the matching interactions
+        :param sort: column to sort by (one of VALUES), by primary key if None
+        :param descending: sort order of the column
+        :param offset: number of interactions to skip
+        :param limit: number of interactions of the page, all if None
+        :return: list of primary keys in the order of ``ORDER BY sort, primary key``
+        """
+        IDs = self.columns["ID"][mask]
+        if sort is None:
+            keys = IDs
+        else:
+            values = self.columns[sort][mask]
+            keys = -values if descending else values.copy()
+            # NULL sorts first in ascending and last in descending order
+            keys[np.isnan(keys)] = np.inf if descending else -np.inf
+        offset = offset or 0
+        end = len(keys) if limit is None else min(offset + limit, len(keys))
+        if offset >= end:
+            return []
+        if end < len(keys):
+            # only the first `end` keys (and their ties) have to be sorted
+            kth = keys[np.argpartition(keys, end - 1)[end - 1]]
+            candidates = np.flatnonzero(keys <= kth)
+            IDs, keys = IDs[candidates], keys[candidates]
+        order = np.lexsort((IDs, keys))
+        return IDs[order[offset:end]].tolist()
+
+
+class RunCache:
+    """
+    Objects loaded per (table, sponge_run_ID, SPONGE_DATA_RELEASE), at most ``COLUMNAR_MAX_RUNS`` of them,
+    the least recently used is dropped first. Entries of other releases are dropped when an entry of a new
+    release is added. Every key is loaded under a lock of its own, so loading one run does not block
+    requests for runs that are already loaded or loaded by another thread.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def get(self, table, sponge_run_ID, load):
+        """
+        :param table: "gene" or "transcript"
+        :param sponge_run_ID: ID of the sponge run
+        :param load: function returning the entry of the run if it is not loaded yet
+        :return: entry of the run
+        """
+        release = current_app.config.get("SPONGE_DATA_RELEASE", "")
+        key = (table, int(sponge_run_ID), release)
+        entry = self._get(key)
+        if entry is not None:
+            return entry
+        with self._lock:
+            lock = self._loading.setdefault(key, threading.Lock())
+        with lock:
+            entry = self._get(key)
+            if entry is not None:
+                return entry
+            try:
+                entry = load()
+                with self._lock:
+                    for other in [other for other in self._entries if other[2] != release]:
+                        del self._entries[other]
+                    self._entries[key] = entry
+                    while len(self._entries) > max_runs():
+                        self._entries.popitem(last=False)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_runs = RunCache()
+
+
+def enabled():
+    """
+    :return: whether the endpoints should use the columnar engine
+    """
+    return current_app.config.get("COLUMNAR_ENGINE", False)
+
+
+def max_runs():
+    """
+    :return: number of runs kept loaded per worker (COLUMNAR_MAX_RUNS)
+    """
+    return max(current_app.config.get("COLUMNAR_MAX_RUNS", 16), 1)
+
+
+def path(table, sponge_run_ID):
+    """
+    :return: directory of the arrays of a run in the column directory, None if no directory is configured
+    """
+    directory = current_app.config.get("COLUMNAR_DIR")
+    if not directory:
+        return None
+    release = current_app.config.get("SPONGE_DATA_RELEASE", "")
+    return os.path.join(directory, f"release-{release}", table, str(int(sponge_run_ID)))
+
+
+def _build(table, sponge_run_ID):
+    from app.config import db
+
+    model, primary_key, node1, node2 = _sources()[table]
+    # adding a DOUBLE literal returns the exact value of a FLOAT column (a CAST to DOUBLE needs MySQL >= 8.0.17)
+    query = db.select(primary_key, node1, node2, *[getattr(model, v) + sa.literal_column("0E0") for v in VALUES]) \
+        .where(model.sponge_run_ID == sponge_run_ID) \
+        .order_by(primary_key)
+    return RunColumns.from_rows(db.session.execute(query).all())
+
+
+def load_run(table, sponge_run_ID):
+    """
+    :param table: "gene" or "transcript"
+    :param sponge_run_ID: ID of the sponge run
+    :return: RunColumns of the run, read from the column directory or the database (and stored in the directory)
+    """
+    directory = path(table, sponge_run_ID)
+    run = RunColumns.load(directory) if directory else None
+    if run is None:
+        run = _build(table, sponge_run_ID)
+        if directory:
+            run.save(directory)
+            run = RunColumns.load(directory)
+        logger.info(f"Loaded {len(run)} {table} interactions of sponge run {sponge_run_ID}")
+    return run
+
+
+def run_columns(table, sponge_run_ID):
+    """
+    :param table: "gene" or "transcript"
+    :param sponge_run_ID: ID of the sponge run
+    :return: RunColumns of the run, loaded on first use and kept loaded (see RunCache)
+    """
+    return _runs.get(table, sponge_run_ID, lambda: load_run(table, sponge_run_ID))
+
+
+def interactions(table, run_IDs):
+    """
+    :param table: "gene" or "transcript"
+    :param run_IDs: sponge_run_IDs of interest
+    :return: Interactions of the runs, None if the engine is disabled or the runs do not fit into the loaded
+        runs (more than COLUMNAR_MAX_RUNS would evict each other on every request), SQL answers those
+    """
+    run_IDs = sorted(set(run_IDs))
+    if not enabled() or len(run_IDs) > max_runs():
+        return None
+    return Interactions([run_columns(table, run_ID) for run_ID in run_IDs])
+
+
+def endpoints(table, sponge_run_ID, nodes, cutoffs=()):
+    """
+    Interactions of a run between the given nodes, from the run columns if the engine is enabled.
+    :param table: "gene" or "transcript"
+    :param sponge_run_ID: ID of the sponge run
+    :param nodes: node IDs both endpoints have to be one of
+    :param cutoffs: list of (column, operator, value), see ``where``
+    :return: arrays of both endpoints of the interactions, in the order of their primary key
+    """
+    if enabled():
+        run = Interactions([run_columns(table, sponge_run_ID)])
+        mask = run.mask(nodes=nodes, both=True, cutoffs=cutoffs)
+        return run.columns["node1"][mask], run.columns["node2"][mask]
+
+    from app.config import db
+
+    model, primary_key, node1, node2 = _sources()[table]
+    nodes = list(nodes)
+    rows = db.session.execute(db.select(node1, node2)
+                              .where(model.sponge_run_ID == sponge_run_ID, node1.in_(nodes), node2.in_(nodes),
+                                     *where(model, cutoffs))
+                              .order_by(primary_key)).all()
+    return np.asarray([row[0] for row in rows], dtype=np.int64), np.asarray([row[1] for row in rows], dtype=np.int64)
+
+
+def reset():
+    """
+    Drop the loaded runs, e.g. after interactions were imported. Files of the column directory are kept,
+    a new SPONGE_DATA_RELEASE uses a new directory.
+    """
+    _runs.clear()
@@ -0,0 +1,62 @@
+"""
+Dictionary-encoded ("compact") response format of the network endpoints.
+
+The default network response repeats the full gene / transcript objects (and the sponge run
+with its dataset) in every edge and again in every node. The compact format lists every gene,
+transcript, run and dataset once in a lookup table and encodes edges and nodes as parallel
+arrays: references are positions in the lookup tables, values are copied as they are.
+
+    {"format": "compact",
+     "genes": [{...}, ...], "runs": [{"sponge_run_ID": 1, "dataset": 0}], "datasets": [{...}],
+     "edges": {"gene1": [0, ...], "gene2": [1, ...], "sponge_run": [0, ...], "mscor": [0.3, ...], ...},
+     "nodes": {"gene": [0, ...], "sponge_run": [0, ...], "betweenness": [12.0, ...], ...}}
+
+Edge i consists of the i-th entry of every array of "edges".
+"""
+
+FORMATS = ("full", "compact")
+
+
+def lookup_table(schema, objects, key):
+    """
+    :param schema: schema with many=True the entries of the table are dumped with
+    :param objects: objects of the table
+    :param key: attribute the rows refer to the objects with
+    :return: dumped objects and dict key -> position in the table
+    """
+    return schema.dump(objects), {getattr(o, key): i for i, o in enumerate(objects)}
+
+
+def run_tables(catalog, run_IDs):
+    """
+    :param catalog: run catalog of the database version (see dataset._run_catalog)
+    :param run_IDs: IDs of the runs referenced by the response
+    :return: runs table, datasets table and dict sponge_run_ID -> position in the runs table
+    """
+    run_IDs = set(run_IDs)
+    runs, datasets = [], []
+    run_positions, dataset_positions = {}, {}
+    for run in catalog:
+        if run.sponge_run_ID not in run_IDs:
+            continue
+        if run.dataset_ID not in dataset_positions:
+            dataset_positions[run.dataset_ID] = len(datasets)
+            datasets.append({"data_origin": run.data_origin, "dataset_ID": run.dataset_ID, "disease_name": run.disease_name})
+        run_positions[run.sponge_run_ID] = len(runs)
+        runs.append({"dataset": dataset_positions[run.dataset_ID], "sponge_run_ID": run.sponge_run_ID})
+    return runs, datasets, run_positions
+
+
+def encode(rows, references, values):
+    """
+    :param rows: result rows
+    :param references: dict output name -> (column of the rows, dict value -> position in a lookup table)
+    :param values: columns of the rows copied as they are
+    :return: dict of parallel arrays, one per reference and value column
+    """
+    columns = {}
+    for name, (column, positions) in references.items():
+        columns[name] = [positions[getattr(row, column)] for row in rows]
+    for column in values:
+        columns[column] = [getattr(row, column) for row in rows]
+    return columns
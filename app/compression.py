@@ -0,0 +1,303 @@
+"""
+Content negotiated response compression for the ASGI stack of ``config.connex_app``.
+
+Responses are compressed with brotli, zstandard or gzip, whichever the client prefers in its
+``Accept-Encoding`` header (ties are broken in that order). Bodies smaller than ``minimum_size``
+are sent as they are. Streamed responses (e.g. the expression endpoints) are compressed chunk by
+chunk: the compressor is flushed after every chunk, so the client can decode each part as soon as
+it arrives.
+
+The ETag of cached endpoints is derived from the cache key and the data release (see
+:func:`app.caching.SpongeCache.etag`), i.e. it identifies the response body. Compressed bodies of
+responses with an ETag are therefore kept in a byte bounded in-process LRU cache keyed by ETag and
+encoding, so cache hits are not compressed again. A strong ETag identifies the bytes sent, so the
+encoding is appended to the ETag of compressed responses (see :func:`encoded_etag`).
+"""
+
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.caching import LocalLRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/problem+json", "application/javascript",
+                      "application/xml")
+
+
+class _GzipCompressor:
+
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _ZstdCompressor:
+
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# encodings in order of preference with their compressor and default level
+ENCODINGS = {}
+if brotli is not None:
+    ENCODINGS["br"] = (_BrotliCompressor, 4)
+if zstandard is not None:
+    ENCODINGS["zstd"] = (_ZstdCompressor, 3)
+ENCODINGS["gzip"] = (_GzipCompressor, 6)
+
+
+def negotiate(accept_encoding, encodings=ENCODINGS):
+    """
+    Choose the content encoding of a response.
+    :param accept_encoding: value of the Accept-Encoding request header
+    :param encodings: supported encodings in order of preference
+    :return: the accepted encoding with the highest q value, None if no supported encoding is accepted
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def encoded_etag(etag, encoding):
+    """
+    ETag of a response body in a content encoding, e.g. ``"abc"`` -> ``"abc-br"``.
+    :param etag: ETag header of the uncompressed response
+    :param encoding: content encoding of the body
+    """
+    if not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def is_compressible(content_type):
+    """
+    :param content_type: value of the Content-Type response header
+    """
+    return content_type.split(";")[0].strip().lower().startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing http responses with the encoding negotiated from Accept-Encoding.
+
+    :param app: ASGI application
+    :param minimum_size: responses smaller than this (in bytes) are not compressed
+    :param levels: dict encoding -> compression level, encodings not given use their default level
+    :param cache_max_bytes: maximum size of all precompressed bodies kept, 0 disables the cache
+    :param cache_max_item_bytes: compressed bodies larger than this are not kept
+    """
+
+    def __init__(self, app, minimum_size=1024, levels=None, cache_max_bytes=32 * 1024 * 1024,
+                 cache_max_item_bytes=4 * 1024 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {encoding: level for encoding, (_, level) in ENCODINGS.items()}
+        self.levels.update({k: v for k, v in (levels or {}).items() if v is not None})
+        self.cache = LocalLRUCache(max_bytes=cache_max_bytes, max_item_bytes=cache_max_item_bytes,
+                                   default_timeout=0) if cache_max_bytes else None
+
+    def compressor(self, encoding):
+        return ENCODINGS[encoding][0](self.levels[encoding])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        await _CompressionResponder(self, encoding, send)(scope, receive, self.app)
+
+
+class _CompressionResponder:
+    """
+    Wraps the ``send`` of one request. The response start is held back until the first body
+    message arrived, because the headers depend on whether the body is compressed.
+    """
+
+    def __init__(self, middleware, encoding, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start = None
+        self.mode = None  # None: no body yet, "buffer", "identity", "compress" or "drain"
+        self.buffer = []
+        self.buffered = 0
+        self.compressor = None
+        self.cache_key = None
+        self.output = []
+        self.output_size = 0
+
+    async def __call__(self, scope, receive, app):
+        await app(scope, receive, self.send_wrapper)
+
+    async def send_wrapper(self, message):
+        if message["type"] == "http.response.start":
+            self.start = dict(message, headers=list(message.get("headers", [])))
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+        if self.mode is None:
+            await self.decide(message)
+        elif self.mode == "buffer":
+            await self.buffer_body(message)
+        elif self.mode == "identity":
+            await self.send(message)
+        elif self.mode == "compress":
+            await self.compress(message.get("body", b""), message.get("more_body", False))
+        # "drain": the precompressed body was sent already, the rest of the app's body is dropped
+
+    async def decide(self, message):
+        """
+        Called with the first body message: pass the response through, answer it from the cache of
+        precompressed bodies or start buffering it.
+        """
+        headers = Headers(raw=self.start["headers"])
+        status = self.start["status"]
+        if status in (204, 304) or "content-encoding" in headers \
+                or not is_compressible(headers.get("content-type", "")):
+            await self.send_identity(message)
+            return
+        MutableHeaders(raw=self.start["headers"]).add_vary_header("Accept-Encoding")
+        if self.encoding is None:
+            await self.send_identity(message)
+            return
+
+        cache = self.middleware.cache
+        if cache is not None and status == 200 and headers.get("etag"):
+            self.cache_key = f"{headers['etag']}:{self.encoding}"
+            compressed = cache.get(self.cache_key)
+            if compressed is not None:
+                self.mode = "drain"
+                await self.send_start(len(compressed))
+                await self.send({"type": "http.response.body", "body": compressed, "more_body": False})
+                return
+        self.mode = "buffer"
+        await self.buffer_body(message)
+
+    async def buffer_body(self, message):
+        """
+        Collect the body until it reaches the minimum size, then start compressing it.
+        """
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+        self.buffer.append(body)
+        self.buffered += len(body)
+        if self.buffered < self.middleware.minimum_size:
+            if more_body:
+                # wait for more of the stream before deciding
+                return
+            await self.send_identity({"type": "http.response.body", "body": b"".join(self.buffer), "more_body": False})
+            return
+
+        self.mode = "compress"
+        self.compressor = self.middleware.compressor(self.encoding)
+        body = b"".join(self.buffer)
+        self.buffer = []
+        if more_body:
+            await self.send_start(None)
+        else:
+            compressed = self.compressor.compress(body) + self.compressor.finish()
+            if self.cache_key is not None:
+                self.middleware.cache.set(self.cache_key, compressed, size=len(compressed))
+            await self.send_start(len(compressed))
+            await self.send({"type": "http.response.body", "body": compressed, "more_body": False})
+            return
+        await self.compress(body, more_body)
+
+    async def compress(self, body, more_body):
+        if more_body:
+            chunk = self.compressor.compress(body) + self.compressor.flush()
+        else:
+            chunk = self.compressor.compress(body) + self.compressor.finish()
+        self.keep(chunk)
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+        if not more_body and self.output is not None and self.cache_key is not None:
+            self.middleware.cache.set(self.cache_key, b"".join(self.output), size=self.output_size)
+
+    def keep(self, chunk):
+        """
+        Collect the compressed body for the cache of precompressed bodies, as long as it fits.
+        """
+        if self.cache_key is None or self.output is None:
+            return
+        self.output_size += len(chunk)
+        if self.output_size > self.middleware.cache.max_item_bytes:
+            self.output = None
+            return
+        self.output.append(chunk)
+
+    async def send_start(self, content_length):
+        headers = MutableHeaders(raw=self.start["headers"])
+        headers["Content-Encoding"] = self.encoding
+        if "etag" in headers:
+            headers["ETag"] = encoded_etag(headers["etag"], self.encoding)
+        if content_length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(content_length)
+        await self.send(self.start)
+
+    async def send_identity(self, message):
+        self.mode = "identity"
+        await self.send(self.start)
+        await self.send(message)
@@ -5,10 +5,11 @@ from flask_marshmallow import Marshmallow
 from flask_sqlalchemy import SQLAlchemy
 from connexion.middleware import MiddlewarePosition
 from starlette.middleware.cors import CORSMiddleware
+from app.compression import CompressionMiddleware
 import logging
 import sys
 from flask import request
-from flask_caching import Cache
+from app.caching import SpongeCache, format_prometheus, apply_http_cache_headers
 
 
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -27,6 +28,8 @@ connex_app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # pagination cursor of the list endpoints, see app/pagination.py
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Configure logging to the console (stdout)
@@ -54,16 +57,83 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['DEBUG'] = True
 app.config['TESTING'] = True
 app.config['UPLOAD_FOLDER'] = UPLOAD_DIR
-# Configure Flask-Caching with redis
-app.config['CACHE_TYPE'] = 'RedisCache'
+# Configure Flask-Caching: per worker LRU cache in front of redis,
+# SPONGE_CACHE_BACKEND=local uses only the in-process cache (no redis needed)
+if os.getenv('SPONGE_CACHE_BACKEND', 'redis') == 'local':
+    app.config['CACHE_TYPE'] = 'app.caching.LocalLRUCache'
+else:
+    app.config['CACHE_TYPE'] = 'app.caching.TwoTierCache'
 app.config['CACHE_REDIS_URL'] = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+# redis must answer quickly, after CACHE_BREAKER_THRESHOLD failures it is not used for CACHE_BREAKER_RESET_TIMEOUT seconds
+app.config['CACHE_REDIS_SOCKET_TIMEOUT'] = float(os.getenv('CACHE_REDIS_SOCKET_TIMEOUT', 0.5))
+app.config['CACHE_REDIS_CONNECT_TIMEOUT'] = float(os.getenv('CACHE_REDIS_CONNECT_TIMEOUT', 0.5))
+app.config['CACHE_BREAKER_THRESHOLD'] = int(os.getenv('CACHE_BREAKER_THRESHOLD', 3))
+app.config['CACHE_BREAKER_RESET_TIMEOUT'] = int(os.getenv('CACHE_BREAKER_RESET_TIMEOUT', 30))
 app.config['CACHE_DEFAULT_TIMEOUT'] = 60 * 60 * 24 * 30  # 30 days default
+app.config['CACHE_LOCAL_TIMEOUT'] = int(os.getenv('CACHE_LOCAL_TIMEOUT', 60))
+app.config['CACHE_LOCAL_MAX_BYTES'] = int(os.getenv('CACHE_LOCAL_MAX_BYTES', 64 * 1024 * 1024))
+app.config['CACHE_LOCAL_MAX_ITEM_BYTES'] = int(os.getenv('CACHE_LOCAL_MAX_ITEM_BYTES', 4 * 1024 * 1024))
+# values stored in redis are compressed with zstandard from this size (in bytes) on
+app.config['CACHE_COMPRESSION_THRESHOLD'] = int(os.getenv('CACHE_COMPRESSION_THRESHOLD', 1024))
+app.config['CACHE_COMPRESSION_LEVEL'] = int(os.getenv('CACHE_COMPRESSION_LEVEL', 3))
+app.config['CACHE_COMPRESSION_DICT'] = os.getenv('CACHE_COMPRESSION_DICT')
+# entries older than CACHE_SOFT_TIMEOUT are served but recomputed in the background, the most accessed
+# entries of each worker are checked every CACHE_REFRESH_INTERVAL seconds and recomputed before they expire
+app.config['CACHE_SOFT_TIMEOUT'] = int(os.getenv('CACHE_SOFT_TIMEOUT', 60 * 60 * 24 * 7))
+app.config['CACHE_REFRESH_INTERVAL'] = int(os.getenv('CACHE_REFRESH_INTERVAL', 60 * 10))
+app.config['CACHE_REFRESH_TOP_N'] = int(os.getenv('CACHE_REFRESH_TOP_N', 100))
+app.config['CACHE_REFRESH_AHEAD'] = int(os.getenv('CACHE_REFRESH_AHEAD', 60 * 60 * 24))
+app.config['CACHE_REFRESH_WORKERS'] = int(os.getenv('CACHE_REFRESH_WORKERS', 2))
+# concurrent misses of endpoints cached with coalesce=True wait up to this many seconds for the first one
+app.config['CACHE_COALESCE_TIMEOUT'] = int(os.getenv('CACHE_COALESCE_TIMEOUT', 120))
+# browsers and proxies may reuse responses for an explicit sponge_db_version this long, bump SPONGE_DATA_RELEASE
+# when the data of an existing version is reloaded to invalidate all ETags
+app.config['CACHE_HTTP_MAX_AGE'] = int(os.getenv('CACHE_HTTP_MAX_AGE', 60 * 60 * 24 * 7))
+app.config['SPONGE_DATA_RELEASE'] = os.getenv('SPONGE_DATA_RELEASE', '1')
+# streamed responses (expression values) larger than this are not cached
+app.config['CACHE_STREAM_MAX_BYTES'] = int(os.getenv('CACHE_STREAM_MAX_BYTES', 64 * 1024 * 1024))
+
+# opt-in: the expression endpoints serialize plain rows with precompiled schema layouts instead of
+# loading ORM objects and dumping them with marshmallow (same output), see app/serialization.py
+app.config['FAST_SERIALIZATION'] = os.getenv('SPONGE_FAST_SERIALIZATION', '0').lower() in ('1', 'true')
+# opt-in: findAll, findSpecific and the network endpoints filter and sort the interactions of a run in
+# NumPy column arrays, memory-mapped from SPONGE_COLUMNAR_DIR if set, see app/columnar.py
+app.config['COLUMNAR_ENGINE'] = os.getenv('SPONGE_COLUMNAR_ENGINE', '0').lower() in ('1', 'true')
+app.config['COLUMNAR_DIR'] = os.getenv('SPONGE_COLUMNAR_DIR')
+# runs (and their graphs) kept loaded per worker, the least recently used are dropped first
+app.config['COLUMNAR_MAX_RUNS'] = int(os.getenv('SPONGE_COLUMNAR_MAX_RUNS', 16))
+# network endpoints with centrality=subnetwork compute betweenness, eigenvector and degree of the returned
+# subnetwork, betweenness is sampled above CENTRALITY_EXACT_NODES nodes, see app/centrality.py
+app.config['CENTRALITY_TIME_BUDGET'] = float(os.getenv('CENTRALITY_TIME_BUDGET', 2))
+app.config['CENTRALITY_EXACT_NODES'] = int(os.getenv('CENTRALITY_EXACT_NODES', 2000))
+app.config['CENTRALITY_SAMPLES'] = int(os.getenv('CENTRALITY_SAMPLES', 500))
+# ID sets derived from data (gene_type, network nodes) longer than this are filtered through a temporary
+# table instead of an inline IN list, see app/idsets.py and otherStuff/scripts/benchmark_id_sets.py
+app.config['ID_SET_INLINE_MAX'] = int(os.getenv('ID_SET_INLINE_MAX', 2000))
+
+# responses are compressed with br, zstd or gzip as negotiated with Accept-Encoding, see app/compression.py
+app.config['COMPRESSION_MINIMUM_SIZE'] = int(os.getenv('COMPRESSION_MINIMUM_SIZE', 1024))
+app.config['COMPRESSION_LEVELS'] = {
+    encoding: int(os.environ[f'COMPRESSION_LEVEL_{encoding.upper()}'])
+    for encoding in ('br', 'zstd', 'gzip') if os.getenv(f'COMPRESSION_LEVEL_{encoding.upper()}')
+}
+# compressed bodies of responses with an ETag are kept so cache hits are not compressed again
+app.config['COMPRESSION_CACHE_MAX_BYTES'] = int(os.getenv('COMPRESSION_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+app.config['COMPRESSION_CACHE_MAX_ITEM_BYTES'] = int(os.getenv('COMPRESSION_CACHE_MAX_ITEM_BYTES', 4 * 1024 * 1024))
+connex_app.add_middleware(
+    CompressionMiddleware,
+    position=MiddlewarePosition.BEFORE_EXCEPTION,
+    minimum_size=app.config['COMPRESSION_MINIMUM_SIZE'],
+    levels=app.config['COMPRESSION_LEVELS'],
+    cache_max_bytes=app.config['COMPRESSION_CACHE_MAX_BYTES'],
+    cache_max_item_bytes=app.config['COMPRESSION_CACHE_MAX_ITEM_BYTES'],
+)
 
-cache = Cache(app)
-cache.init_app(app)
+# cache keys are built from the controller arguments and namespaced by endpoint and sponge_db_version
+cache = SpongeCache(app, latest_version=LATEST)
 
 from app.config import cache
-from flask import jsonify
+from flask import jsonify, Response
 
 @connex_app.route("/test-cache")
 def test_cache():
@@ -71,6 +141,18 @@ def test_cache():
     value = cache.get("hello")
     return jsonify({"cached_value": value})
 
+@connex_app.route("/cache-stats")
+def cache_stats():
+    return jsonify(cache.get_stats())
+
+@connex_app.route("/cache-metrics")
+def cache_metrics():
+    # per endpoint hits, misses, payload size and time saved, as JSON or Prometheus text (?format=prometheus)
+    metrics = cache.get_metrics()
+    if request.args.get("format") == "prometheus" or "text/plain" in request.headers.get("Accept", ""):
+        return Response(format_prometheus(metrics), content_type="text/plain; version=0.0.4")
+    return jsonify({"endpoints": metrics, "backend": cache.get_stats()})
+
 @connex_app.app.before_request
 def log_request():
     logger.info(f"Incoming request: {request.method} {request.url}")
@@ -87,7 +169,8 @@ def log_request():
 
 @app.after_request
 def add_header(response):
-    if 'Cache-Control' not in response.headers:
+    # cached endpoints get an ETag and a Cache-Control policy depending on the requested data version
+    if not apply_http_cache_headers(response) and 'Cache-Control' not in response.headers:
         response.headers['Cache-Control'] = 'max-age=0'
     return response
 
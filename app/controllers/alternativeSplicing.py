@@ -2,6 +2,7 @@ from flask import jsonify
 from sqlalchemy import or_
 from app.controllers.dataset import _dataset_query
 import app.models as models
+from app import identifiers
 from flask import Response
 from app.config import db, LATEST, cache
 
@@ -22,13 +23,9 @@ def get_transcript_events(enst_number):
             "type": "about:blank"
         }), 400
 
-    transcript = models.Transcript.query \
-        .filter(models.Transcript.enst_number.in_(enst_number)) \
-        .all()
+    transcript_IDs = identifiers.transcripts().lookup("enst_number", enst_number)
 
-    if len(transcript) > 0:
-        transcript_IDs = [i.transcript_ID for i in transcript]
-    else:
+    if len(transcript_IDs) == 0:
         return jsonify({
             "detail": "No transcript(s) found for the given enst_number(s)!",
             "status": 200,
@@ -79,13 +76,9 @@ def get_event_positions(enst_number, event_type):
             "type": "about:blank"
         }), 400
 
-    transcript = models.Transcript.query \
-        .filter(models.Transcript.enst_number.in_(enst_number)) \
-        .all()
+    transcript_IDs = identifiers.transcripts().lookup("enst_number", enst_number)
 
-    if len(transcript) > 0:
-        transcript_IDs = [i.transcript_ID for i in transcript]
-    else:
+    if len(transcript_IDs) == 0:
         return jsonify({
             "detail": "No transcript found for given enst_number(s)!",
             "status": 200,
@@ -158,17 +151,17 @@ def get_psi_values(dataset_ID: str = None, disease_name: str = None, data_origin
     else: 
         data = None
 
-    # Build the transcript query
-    transcript_query = db.select(models.Transcript.transcript_ID)
-    if transcript_ID:
-        transcript_query = transcript_query.where(models.Transcript.transcript_ID == transcript_ID)
+    # Resolve the transcripts
+    transcript_IDs = None
     if enst_number:
-        transcript_query = transcript_query.where(models.Transcript.enst_number == enst_number)
+        transcript_IDs = identifiers.transcripts().lookup("enst_number", enst_number)
+    if transcript_ID:
+        transcript_IDs = [transcript_ID] if transcript_IDs is None else [t for t in transcript_IDs if t == transcript_ID]
 
     # Build the alternative splicing events query
-    as_query = db.select(models.AlternativeSplicingEventTranscripts.alternative_splicing_event_transcripts_ID).where(
-        models.AlternativeSplicingEventTranscripts.transcript_ID.in_(transcript_query)
-    )
+    as_query = db.select(models.AlternativeSplicingEventTranscripts.alternative_splicing_event_transcripts_ID)
+    if transcript_IDs is not None:
+        as_query = as_query.where(models.AlternativeSplicingEventTranscripts.transcript_ID.in_(transcript_IDs))
     if alternative_splicing_event_transcripts_ID:
         as_query = as_query.where(
             models.AlternativeSplicingEventTranscripts.alternative_splicing_event_transcripts_ID == alternative_splicing_event_transcripts_ID
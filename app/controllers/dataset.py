@@ -1,9 +1,10 @@
-from flask import jsonify
+from flask import current_app, jsonify
 from sqlalchemy import and_
 import app.models as models
 from app.config import LATEST, db, cache
 from typing import List
 import re
+import threading
 
 
 def _dataset_query(query = None, sponge_db_version = LATEST, **kwargs):
@@ -44,6 +45,112 @@ def _dataset_query(query = None, sponge_db_version = LATEST, **kwargs):
     return data
 
 
+# sponge runs with their dataset per (sponge_db_version ('any' for all versions), SPONGE_DATA_RELEASE),
+# loaded once per worker
+_run_catalogs = {}
+# subsets of the runs of a catalog (see _run_subset) per (name, sponge_db_version, SPONGE_DATA_RELEASE)
+_run_subsets = {}
+_run_catalog_lock = threading.Lock()
+
+
+def _run_catalog(sponge_db_version=LATEST):
+    """
+    In-memory catalog of the sponge runs of a database version and the dataset each run belongs to.
+    Runs and datasets only change with a new database version or data release (SPONGE_DATA_RELEASE), so the
+    catalog is loaded with a single query per version, release and worker. Catalogs of other releases are
+    dropped when a new one is loaded.
+
+    :param sponge_db_version: sponge_db_version of the database or 'any'
+    :return: rows with sponge_run_ID, dataset_ID, data_origin, disease_name and disease_subtype
+    """
+    version = sponge_db_version if sponge_db_version == 'any' else int(sponge_db_version)
+    release = current_app.config.get("SPONGE_DATA_RELEASE", "")
+    catalog = _run_catalogs.get((version, release))
+    if catalog is None:
+        with _run_catalog_lock:
+            catalog = _run_catalogs.get((version, release))
+            if catalog is None:
+                query = db.select(models.SpongeRun.sponge_run_ID, models.Dataset.dataset_ID, models.Dataset.data_origin,
+                                  models.Dataset.disease_name, models.Dataset.disease_subtype) \
+                    .join(models.Dataset, models.SpongeRun.dataset_ID == models.Dataset.dataset_ID) \
+                    .order_by(models.SpongeRun.sponge_run_ID)
+                if version != 'any':
+                    query = query.where(models.SpongeRun.sponge_db_version == version)
+                catalog = db.session.execute(query).all()
+                for key in [key for key in _run_catalogs if key[1] != release]:
+                    del _run_catalogs[key]
+                _run_catalogs[(version, release)] = catalog
+    return catalog
+
+
+def _run_subset(name, sponge_db_version, query):
+    """
+    Runs of the catalog of a database version with a property that, like the catalog, only changes at
+    ingestion (e.g. the runs with adjacency rows), selected with a single query per version, release and worker.
+
+    :param name: name of the property
+    :param sponge_db_version: sponge_db_version of the database or 'any'
+    :param query: function of the sponge_run_IDs of the catalog returning a select of those with the property
+    :return: frozenset of the sponge_run_IDs with the property
+    """
+    version = sponge_db_version if sponge_db_version == 'any' else int(sponge_db_version)
+    release = current_app.config.get("SPONGE_DATA_RELEASE", "")
+    subset = _run_subsets.get((name, version, release))
+    if subset is None:
+        run_IDs = [r.sponge_run_ID for r in _run_catalog(version)]
+        with _run_catalog_lock:
+            subset = _run_subsets.get((name, version, release))
+            if subset is None:
+                subset = frozenset(db.session.execute(query(run_IDs)).scalars().all()) if run_IDs else frozenset()
+                for key in [key for key in _run_subsets if key[2] != release]:
+                    del _run_subsets[key]
+                _run_subsets[(name, version, release)] = subset
+    return subset
+
+
+def _reset_run_catalog():
+    """
+    Drop the loaded run catalogs, e.g. after new runs were imported into the database.
+    """
+    with _run_catalog_lock:
+        _run_catalogs.clear()
+        _run_subsets.clear()
+
+
+def _like(pattern):
+    """
+    :param pattern: SQL LIKE pattern
+    :return: compiled regular expression matching like the (case insensitive) LIKE of the database
+    """
+    regex = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in pattern)
+    return re.compile(regex, re.IGNORECASE | re.DOTALL)
+
+
+def _run_IDs(sponge_db_version=LATEST, disease_name=None, disease_subtype=None, dataset_ID=None):
+    """
+    Resolve the sponge runs of the datasets matching the filters from the run catalog instead of
+    querying sponge_run and dataset for every request.
+
+    :param sponge_db_version: sponge_db_version of the database or 'any'
+    :param disease_name: (part of the) name of the disease
+    :param disease_subtype: (part of the) subtype of the disease, 'unspecific' for datasets without subtype
+    :param dataset_ID: ID of the dataset
+    :return: list of sponge_run_IDs, empty if no run matches
+    """
+    runs = _run_catalog(sponge_db_version)
+    if disease_name is not None:
+        name = _like("%" + disease_name + "%")
+        runs = [run for run in runs if run.disease_name is not None and name.fullmatch(run.disease_name)]
+    if disease_subtype == 'unspecific':
+        runs = [run for run in runs if run.disease_subtype is None]
+    elif disease_subtype is not None and disease_subtype != 'any':
+        subtype = _like("%" + disease_subtype + "%")
+        runs = [run for run in runs if run.disease_subtype is not None and subtype.fullmatch(run.disease_subtype)]
+    if dataset_ID is not None:
+        runs = [run for run in runs if run.dataset_ID == int(dataset_ID)]
+    return [run.sponge_run_ID for run in runs]
+
+
 @cache.cached(query_string=True)
 def get_diseases(disease_ID: int = None, disease_name: str = None, disease_subtype: str = None, versions: List[int] = None):
     """
@@ -1,5 +1,6 @@
 from flask import jsonify
 import app.models as models
+from app import identifiers, pagination
 from app.config import LATEST, cache
 from app.controllers.dataset import _dataset_query
 from app.controllers.comparison import _comparison_query
@@ -9,7 +10,7 @@ from app.controllers.comparison import _comparison_query
 def get_diff_expr(dataset_ID_1: str = None, dataset_ID_2: int = None, 
                   condition_1=None, condition_2=None, 
                   ensg_number=None, gene_symbol=None, sponge_db_version: int = LATEST, 
-                  limit: int = None, offset: int = None):
+                  limit: int = None, offset: int = None, cursor=None):
     """
     API call /differentialExpression,
     get differential expression results between genes
@@ -20,6 +21,9 @@ def get_diff_expr(dataset_ID_1: str = None, dataset_ID_2: int = None,
     :param ensg_number: esng number of the gene(s) of interest
     :param gene_symbol: gene symbol of the gene(s) of interest
     :param sponge_db_version: version of the database
+    :param limit: number of results that should be shown
+    :param offset: startpoint from where results should be shown
+    :param cursor: cursor of the previous page (X-Next-Cursor header), replaces offset
     :return: differential expression information for the genes of interest and the selected comparison
     """
 
@@ -31,19 +35,12 @@ def get_diff_expr(dataset_ID_1: str = None, dataset_ID_2: int = None,
             "type": "about:blank"
         }), 400
 
-    gene = []
+    gene_IDs = []
     # if ensg_numer is given for specify gene, get the intern gene_ID(primary_key) for requested ensg_nr(gene_ID)
     if ensg_number is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.ensg_number.in_(ensg_number)) \
-            .all()
+        gene_IDs = identifiers.genes().lookup("ensg_number", ensg_number)
     elif gene_symbol is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.gene_symbol.in_(gene_symbol)) \
-            .all()
-
-    if len(gene) > 0:
-        gene_IDs = [i.gene_ID for i in gene]
+        gene_IDs = identifiers.genes().lookup("gene_symbol", gene_symbol)
 
     dataset_1 = _dataset_query(sponge_db_version=sponge_db_version, dataset_ID=dataset_ID_1)
     dataset_1 = [x.dataset_ID for x in dataset_1]
@@ -61,14 +58,14 @@ def get_diff_expr(dataset_ID_1: str = None, dataset_ID_2: int = None,
     result = models.DifferentialExpression.query \
         .filter(models.DifferentialExpression.comparison_ID == comparison_ID)
 
-    if len(gene) > 0:
+    if len(gene_IDs) > 0:
         result = result.filter(models.DifferentialExpression.gene_ID.in_(gene_IDs))
 
-    if limit is not None:
-        result = result.limit(limit)
-    if offset is not None:
-        result = result.offset(offset)
-    result = result.all()
+    try:
+        result, next_cursor = pagination.paginate(result, [], models.DifferentialExpression.differential_expression_gene_ID,
+                                                  limit, offset, cursor)
+    except pagination.InvalidCursor as e:
+        return pagination.invalid_cursor(e)
 
     if len(result) > 0:
         out = models.DESchema(many=True).dump(result)
@@ -77,7 +74,7 @@ def get_diff_expr(dataset_ID_1: str = None, dataset_ID_2: int = None,
                 out[i]["log2FoldChange"] = -out[i]["log2FoldChange"]
                 out[i]["stat"] = -out[i]["stat"]
 
-        return out
+        return out, 200, pagination.cursor_headers(next_cursor)
     else:
         return jsonify({
             "detail": "No data found.",
@@ -105,15 +102,10 @@ def get_diff_expr_transcript(dataset_ID_1: int = None, dataset_ID_2: int = None,
     :return: differential expression information for the transcript of interest and the selected comparison
     """
 
-    transcript = []
+    transcript_IDs = []
 
     if enst_number is not None:
-        transcript = models.Transcript.query \
-            .filter(models.Transcript.enst_number.in_(enst_number)) \
-            .all()
-
-    if len(transcript) > 0:
-        transcript_IDs = [i.transcript_ID for i in transcript]
+        transcript_IDs = identifiers.transcripts().lookup("enst_number", enst_number)
 
     dataset_1 = _dataset_query(sponge_db_version=sponge_db_version, dataset_ID=dataset_ID_1)
     dataset_1 = [x.dataset_ID for x in dataset_1]
@@ -127,7 +119,7 @@ def get_diff_expr_transcript(dataset_ID_1: int = None, dataset_ID_2: int = None,
     result = models.DifferentialExpression.query \
         .filter(models.DifferentialExpression.comparison_ID == comparison_ID)
 
-    if len(transcript) > 0:
+    if len(transcript_IDs) > 0:
         result = result.filter(models.DifferentialExpression.transcript_ID.in_(transcript_IDs))
 
     if limit is not None:
@@ -4,6 +4,7 @@ from scipy.cluster.hierarchy import linkage, dendrogram
 import pandas as pd
 from app.controllers.dataset import _dataset_query
 import app.models as models
+from app import identifiers, serialization
 from app.config import LATEST, db, cache
 import numpy as np
 from scipy.cluster.vq import kmeans
@@ -11,8 +12,8 @@ from scipy.cluster.vq import kmeans
 np.random.seed(0)
 
 
-# @cache.cached(query_string=True) I would like to cache that but can't cache streams
-def get_gene_expr(dataset_ID: int = None, disease_name=None, disease_subtype: str = None, ensg_number=None, gene_symbol=None, cluster: bool = False, limit: int = None, offset: int = None, sponge_db_version: int = LATEST):
+@cache.cached_stream()
+def get_gene_expr(dataset_ID: int = None, disease_name=None, disease_subtype: str = None, ensg_number=None, gene_symbol=None, cluster: bool = False, limit: int = None, offset: int = None, fields=None, sponge_db_version: int = LATEST):
     """˜
     Handles API call /exprValue/getceRNA to get gene expression values
     :param dataset_ID: dataset_ID of interest
@@ -23,8 +24,14 @@ def get_gene_expr(dataset_ID: int = None, disease_name=None, disease_subtype: st
     :param sponge_db_version: version of the database
     :param cluster: whether to cluster the gene expression (rows and columns)
     :param limit: limit the number of results
+    :param fields: fields of the response (dotted paths for nested fields), all if None
     :return: all expression values for the genes of interest
     """
+    try:
+        schema = serialization.project(models.geneExpressionSchema, fields)
+    except serialization.InvalidFields as e:
+        return serialization.invalid_fields(e)
+
     # test if any of the two identification possibilities is given
     if ensg_number is None and gene_symbol is None:
         return jsonify({
@@ -42,20 +49,14 @@ def get_gene_expr(dataset_ID: int = None, disease_name=None, disease_subtype: st
             "type": "about:blank"
         }), 400
 
-    gene = []
+    gene_IDs = []
     # if ensg_numer is given for specify gene, get the intern gene_ID(primary_key) for requested ensg_nr(gene_ID)
     if ensg_number is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.ensg_number.in_(ensg_number)) \
-            .all()
+        gene_IDs = identifiers.genes().lookup("ensg_number", ensg_number)
     elif gene_symbol is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.gene_symbol.in_(gene_symbol)) \
-            .all()
+        gene_IDs = identifiers.genes().lookup("gene_symbol", gene_symbol)
 
-    if len(gene) > 0:
-        gene_IDs = [i.gene_ID for i in gene]
-    else:
+    if len(gene_IDs) == 0:
         return jsonify({
             "detail": "No gene(s) found for given ensg_number(s) or gene_symbol(s)",
             "status": 400,
@@ -80,10 +81,19 @@ def get_gene_expr(dataset_ID: int = None, disease_name=None, disease_subtype: st
             "type": "about:blank"
         }), 400
 
-    result = models.GeneExpressionValues.query \
-        .filter(*queries) \
-        .all()
-    
+    # the clustering below needs the ORM objects
+    fast = serialization.enabled() and not cluster
+    order = models.GeneExpressionValues.expression_data_gene_ID
+    if fast:
+        layout = serialization.layout(models.geneExpressionSchema, fields)
+        result = db.session.execute(layout.select(*queries).order_by(order)).all()
+    else:
+        result = models.GeneExpressionValues.query \
+            .filter(*queries) \
+            .options(*models.eager_load_options(schema)) \
+            .order_by(order) \
+            .all()
+
     if len(result) > 0:
         # perform hierarchical clustering on rows and columns
         if cluster:
@@ -153,13 +163,16 @@ def get_gene_expr(dataset_ID: int = None, disease_name=None, disease_subtype: st
         if limit is not None:
             result = result[:limit]
 
+        if fast:
+            return Response(stream_with_context(layout.stream(result)), content_type='application/json')
+
         def _generate():
             yield "["
             first = True
             for r in result:
                 if not first:
                     yield ","
-                yield models.geneExpressionSchema().dumps(r)
+                yield schema.dumps(r)
                 first = False
             yield "]"
             
@@ -176,8 +189,8 @@ def get_gene_expr(dataset_ID: int = None, disease_name=None, disease_subtype: st
         }), 200
 
 
-@cache.cached(query_string=True)
-def get_transcript_expression(dataset_ID: int = None, disease_name: str = None, enst_number: str = None, ensg_number: str = None, gene_symbol: str = None, cluster: bool = False, limit: int = None, offset: int = None, sponge_db_version: int = LATEST):
+@cache.cached_stream()
+def get_transcript_expression(dataset_ID: int = None, disease_name: str = None, enst_number: str = None, ensg_number: str = None, gene_symbol: str = None, cluster: bool = False, limit: int = None, offset: int = None, fields=None, sponge_db_version: int = LATEST):
     """
     Handles API call /exprValue/getTranscriptExpr to return transcript expressions
     :param dataset_ID: dataset_ID of interest
@@ -187,9 +200,15 @@ def get_transcript_expression(dataset_ID: int = None, disease_name: str = None,
     :param gene_symbol: gene symbol
     :param limit: limit the number of results
     :param cluster: whether to cluster the gene expression (rows and columns)
+    :param fields: fields of the response (dotted paths for nested fields), all if None
     :param sponge_db_version: version of the database
     :return: expression values for given search parameters
     """
+    try:
+        schema = serialization.project(models.ExpressionDataTranscriptSchema, fields)
+    except serialization.InvalidFields as e:
+        return serialization.invalid_fields(e)
+
     if ensg_number is None and gene_symbol is None and enst_number is None:
         return jsonify({
             "detail": "Please supply one of 'enst_number' ensg_number', or 'gene_symbol",
@@ -200,23 +219,15 @@ def get_transcript_expression(dataset_ID: int = None, disease_name: str = None,
 
     elif enst_number is not None:
         # query by enst_numbers only
-        transcript = models.Transcript.query \
-            .filter(models.Transcript.enst_number.in_(enst_number)) \
-            .all()
+        transcript_IDs = identifiers.transcripts().lookup("enst_number", enst_number)
     elif ensg_number is not None or gene_symbol is not None:
         if ensg_number is not None:
             # query all transcripts with matching ensg_number
-            gene = models.Gene.query \
-                .filter(models.Gene.ensg_number.in_(enst_number)) \
-                .all()
+            gene_IDs = identifiers.genes().lookup("ensg_number", ensg_number)
         else:
             # query all transcripts with matching gene symbol
-            gene = models.Gene.query \
-                .filter(models.Gene.gene_symbol.in_(gene_symbol)) \
-                .all()
-        if len(gene) > 0:
-            gene_IDs = [i.gene_ID for i in gene]
-        else:
+            gene_IDs = identifiers.genes().lookup("gene_symbol", gene_symbol)
+        if len(gene_IDs) == 0:
             return jsonify({
                 "detail": "No gene(s) found for given ensg_number(s) or gene_symbol(s)",
                 "status": 400,
@@ -225,9 +236,7 @@ def get_transcript_expression(dataset_ID: int = None, disease_name: str = None,
             }), 400
 
         # get associated transcripts
-        transcript = models.Transcript.query \
-            .filter(models.Transcript.gene_ID.in_(gene_IDs)) \
-            .all()
+        transcript_IDs = identifiers.transcripts().lookup("gene_ID", gene_IDs)
     else:
         return jsonify({
             "detail": "Multiple filters supplied, please give one of 'enst_number' ensg_number', or 'gene_symbol",
@@ -236,8 +245,6 @@ def get_transcript_expression(dataset_ID: int = None, disease_name: str = None,
             "type": "about:blank"
         }), 400
 
-    # collect transcript IDs
-    transcript_IDs = [i.transcript_ID for i in transcript]
     # build filters
     filters = [models.ExpressionDataTranscript.transcript_ID.in_(transcript_IDs)]
     
@@ -266,9 +273,18 @@ def get_transcript_expression(dataset_ID: int = None, disease_name: str = None,
             "type": "about:blank"
         }), 400
     
-    # apply all filters
-    query = db.select(models.ExpressionDataTranscript).filter(*filters)
-    result = db.session.execute(query).scalars().all()
+    # apply all filters, the clustering below needs the ORM objects
+    fast = serialization.enabled() and not cluster
+    order = models.ExpressionDataTranscript.expression_data_transcript_ID
+    if fast:
+        layout = serialization.layout(models.ExpressionDataTranscriptSchema, fields)
+        result = db.session.execute(layout.select(*filters).order_by(order)).all()
+    else:
+        query = db.select(models.ExpressionDataTranscript) \
+            .filter(*filters) \
+            .order_by(order) \
+            .options(*models.eager_load_options(schema))
+        result = db.session.execute(query).scalars().all()
 
     if len(result) > 0:
                 # perform hierarchical clustering on rows and columns
@@ -311,13 +327,16 @@ def get_transcript_expression(dataset_ID: int = None, disease_name: str = None,
         if limit is not None:
             result = result[:limit]
 
+        if fast:
+            return Response(stream_with_context(layout.stream(result)), content_type='application/json')
+
         def _generate():
             yield "["
             first = True
             for r in result:
                 if not first:
                     yield ","
-                yield models.ExpressionDataTranscriptSchema().dumps(r)
+                yield schema.dumps(r)
                 first = False
             yield "]"
             
@@ -335,16 +354,21 @@ def get_transcript_expression(dataset_ID: int = None, disease_name: str = None,
 
 
 @cache.cached(query_string=True)
-def get_mirna_expr(dataset_ID: int = None, disease_name=None, mimat_number=None, hs_number=None, sponge_db_version: int = LATEST):
+def get_mirna_expr(dataset_ID: int = None, disease_name=None, mimat_number=None, hs_number=None, fields=None, sponge_db_version: int = LATEST):
     """
     Handles API call /exprValue/getmiRNA to get miRNA expression values
     :param dataset_ID: dataset_ID of interest
     :param disease_name: disease_name of interest
     :param mimat_number: comma-separated list of mimat_id(s) of miRNA of interest
     :param: hs_nr: comma-separated list of hs_number(s) of miRNA of interest
+    :param fields: fields of the response (dotted paths for nested fields), all if None
     :param sponge_db_version: version of the database
     :return: all expression values for the mimats of interest
     """
+    try:
+        schema = serialization.project(models.miRNAExpressionSchema, fields, many=True)
+    except serialization.InvalidFields as e:
+        return serialization.invalid_fields(e)
 
     # test if any of the two identification possibilites is given
     if mimat_number is None and hs_number is None:
@@ -363,20 +387,14 @@ def get_mirna_expr(dataset_ID: int = None, disease_name=None, mimat_number=None,
             "type": "about:blank"
         }), 400
 
-    mirna = []
+    mirna_IDs = []
     # if ensg_numer is given for specify gene, get the intern gene_ID(primary_key) for requested ensg_nr(gene_ID)
     if mimat_number is not None:
-        mirna = models.miRNA.query \
-            .filter(models.miRNA.mir_ID.in_(mimat_number)) \
-            .all()
+        mirna_IDs = identifiers.mirnas().lookup("mir_ID", mimat_number)
     elif hs_number is not None:
-        mirna = models.miRNA.query \
-            .filter(models.miRNA.hs_nr.in_(hs_number)) \
-            .all()
+        mirna_IDs = identifiers.mirnas().lookup("hs_nr", hs_number)
 
-    if len(mirna) > 0:
-        mirna_IDs = [i.miRNA_ID for i in mirna]
-    else:
+    if len(mirna_IDs) == 0:
         return jsonify({
             "detail": "No miRNA(s) found for given mimat_number(s) or hs_number(s)",
             "status": 400,
@@ -412,12 +430,21 @@ def get_mirna_expr(dataset_ID: int = None, disease_name=None, mimat_number=None,
             "type": "about:blank"
         }), 400
 
-    result = models.MiRNAExpressionValues.query \
-        .filter(*queries) \
-        .all()
+    order = models.MiRNAExpressionValues.expression_data_mirna_ID
+    if serialization.enabled():
+        layout = serialization.layout(models.miRNAExpressionSchema, fields)
+        result = db.session.execute(layout.select(*queries).order_by(order)).all()
+    else:
+        result = models.MiRNAExpressionValues.query \
+            .filter(*queries) \
+            .options(*models.eager_load_options(schema)) \
+            .order_by(order) \
+            .all()
 
     if len(result) > 0:
-        return models.miRNAExpressionSchema(many=True).dump(result)
+        if serialization.enabled():
+            return [layout.dump(r) for r in result]
+        return schema.dump(result)
     else:
         return jsonify({
             "detail": "No results.",
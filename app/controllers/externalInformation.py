@@ -1,9 +1,10 @@
 from flask import jsonify
 from app.controllers import dataset
 import app.models as models
+from app import identifiers
 from flask import Response
 from sqlalchemy.sql import text
-from sqlalchemy import case, func, select, join
+from sqlalchemy import func, select, join
 from sqlalchemy.orm import aliased
 from app.config import LATEST, db, cache
 from app.controllers.dataset import _dataset_query
@@ -19,9 +20,8 @@ def getAutocomplete(searchString):
     # Note: this function does not check for the database version because this would take too long
 
     if searchString.startswith("ENSG") or searchString.startswith("ensg"):
-        data = models.Gene.query.with_entities(models.Gene.ensg_number, models.Gene.gene_symbol) \
-            .filter(models.Gene.ensg_number.ilike(searchString + "%")) \
-            .all()
+        index = identifiers.genes()
+        data = index.records(index.prefix("ensg_number", searchString))
         if len(data) > 0:
             return models.GeneSchemaShort(many=True).dump(data)
         else:
@@ -34,9 +34,8 @@ def getAutocomplete(searchString):
             }), 200
 
     elif searchString.startswith("HSA") or searchString.startswith("hsa"):
-        data = models.miRNA.query.with_entities(models.miRNA.mir_ID, models.miRNA.hs_nr) \
-            .filter(models.miRNA.hs_nr.ilike(searchString + "%")) \
-            .all()
+        index = identifiers.mirnas()
+        data = index.records(index.prefix("hs_nr", searchString))
         if len(data) > 0:
             return models.miRNASchemaShort(many=True).dump(data)
         else:
@@ -49,9 +48,8 @@ def getAutocomplete(searchString):
             }), 200
 
     elif searchString.startswith("MIMAT") or searchString.startswith("mimat"):
-        data = models.miRNA.query.with_entities(models.miRNA.mir_ID, models.miRNA.hs_nr) \
-            .filter(models.miRNA.mir_ID.ilike(searchString + "%")) \
-            .all()
+        index = identifiers.mirnas()
+        data = index.records(index.prefix("mir_ID", searchString))
         if len(data) > 0:
             return models.miRNASchemaShort(many=True).dump(data)
         else:
@@ -64,9 +62,8 @@ def getAutocomplete(searchString):
             }), 200
 
     else:
-        data = models.Gene.query.with_entities(models.Gene.ensg_number, models.Gene.gene_symbol) \
-            .filter(models.Gene.gene_symbol.ilike(searchString + "%")) \
-            .all()
+        index = identifiers.genes()
+        data = index.records(index.prefix("gene_symbol", searchString))
         if len(data) > 0:
             return models.GeneSchemaShort(many=True).dump(data)
         else:
@@ -209,7 +206,7 @@ def getTranscriptInformation(enst_number):
         }), 200
 
 
-@cache.cached(query_string=True)
+@cache.cached(query_string=True, coalesce=True)
 def getOverallCount(sponge_db_version: int = LATEST, level: str = "gene"):
     """
     Function return current statistic about database - amount of shared miRNA, significant and insignificant
@@ -333,13 +330,9 @@ def getGeneOntology(gene_symbol):
             "type": "about:blank"
         }), 400
 
-    gene = models.Gene.query \
-        .filter(models.Gene.gene_symbol.in_(gene_symbol)) \
-        .all()
+    gene_IDs = identifiers.genes().lookup("gene_symbol", gene_symbol)
 
-    if len(gene) > 0:
-        gene_IDs = [i.gene_ID for i in gene]
-    else:
+    if len(gene_IDs) == 0:
         return jsonify({
             "detail": "No gene(s) found for given gene_symbol(s)!",
             "status": 400,
@@ -379,13 +372,9 @@ def getHallmark(gene_symbol):
             "title": "Bad Request",
             "type": "about:blank"
         }), 400
-    gene = models.Gene.query \
-        .filter(models.Gene.gene_symbol.in_(gene_symbol)) \
-        .all()
+    gene_IDs = identifiers.genes().lookup("gene_symbol", gene_symbol)
 
-    if len(gene) > 0:
-        gene_IDs = [i.gene_ID for i in gene]
-    else:
+    if len(gene_IDs) == 0:
         return jsonify({
             "detail": "No gene(s) found for given gene_symbol(s)!",
             "status": 400,
@@ -426,13 +415,9 @@ def getWikipathway(gene_symbol):
             "type": "about:blank"
         }), 400
 
-    gene = models.Gene.query \
-        .filter(models.Gene.gene_symbol.in_(gene_symbol)) \
-        .all()
+    gene_IDs = identifiers.genes().lookup("gene_symbol", gene_symbol)
 
-    if len(gene) > 0:
-        gene_IDs = [i.gene_ID for i in gene]
-    else:
+    if len(gene_IDs) == 0:
         return jsonify({
             "detail": "No gene(s) found for given gene_symbol(s)!",
             "status": 400,
@@ -457,7 +442,7 @@ def getWikipathway(gene_symbol):
         }), 200
 
 
-@cache.cached(query_string=True)
+@cache.cached(query_string=True, order_sensitive=("enst_number",))
 def getTranscriptGene(enst_number):
     """
     This function handles the route /getTranscriptGene and returns the gene id(s) for the given transcript id(s).
@@ -474,22 +459,13 @@ def getTranscriptGene(enst_number):
             "type": "about:blank"
         }), 400
 
-    # Create a CASE statement to preserve the order of enst_number
-    case_statement = case(
-        *[(models.Transcript.enst_number == enst, index) for index, enst in enumerate(enst_number)]
-    )
-
-    query = select(models.Gene.ensg_number).select_from(
-            join(models.Gene, models.Transcript, models.Gene.gene_ID == models.Transcript.gene_ID)
-        ).where(models.Transcript.enst_number.in_(enst_number)) \
-        .order_by(case_statement)
-    
-
-    result = db.session.execute(query).fetchall()
+    # resolve the transcripts in the order of enst_number
+    transcripts, genes = identifiers.transcripts(), identifiers.genes()
+    result = [ensg for enst in dict.fromkeys(enst_number)
+              for ensg in genes.values("ensg_number", transcripts.values("gene_ID", transcripts.lookup("enst_number", enst)))]
 
     if len(result) > 0:
-        # return models.GeneSchemaShort(many=True).dump(result)
-        return [r[0] for r in result]
+        return result
     else:
         return jsonify({
             "detail": "No gene(s) associated for transcript(s) of interest!",
@@ -500,7 +476,7 @@ def getTranscriptGene(enst_number):
         }), 200
 
 
-@cache.cached(query_string=True)
+@cache.cached(query_string=True, order_sensitive=("ensg_number",))
 def getGeneTranscripts(ensg_number):
     """
     This function handles the route /getGeneTranscripts and returns the transcript id(s) for the given gene id(s).
@@ -517,24 +493,13 @@ def getGeneTranscripts(ensg_number):
             "type": "about:blank"
         }), 400
 
-    case_statement = case(
-        *[(models.Gene.ensg_number == ensg, index) for index, ensg in enumerate(ensg_number)]
-    )
-
-    query = select(models.Gene.ensg_number, models.Transcript.enst_number).select_from(
-        join(models.Gene, models.Transcript, models.Gene.gene_ID == models.Transcript.gene_ID)
-    ).where(models.Gene.ensg_number.in_(ensg_number)) \
-        .order_by(case_statement)
+    # resolve the transcripts of every gene, in the order of ensg_number
+    transcripts, genes = identifiers.transcripts(), identifiers.genes()
+    result = [transcripts.values("enst_number", transcripts.lookup("gene_ID", genes.lookup("ensg_number", ensg)))
+              for ensg in ensg_number]
 
-    result = db.session.execute(query).fetchall()
-
-    if len(result) > 0:
-        # return models.TranscriptSchemaShort(many=True).dump(result)
-        # return [r[0] for r in result]
-        gene_transcripts = {ensg: [] for ensg in ensg_number}
-        for gene_id, transcript_id in result:
-            gene_transcripts[gene_id].append(transcript_id)
-        return [gene_transcripts[ensg] for ensg in ensg_number]
+    if any(len(r) > 0 for r in result):
+        return result
     else:
         return jsonify({
             "detail": "No transcript(s) associated for gene(s) of interest!",
@@ -551,41 +516,44 @@ def get_genes(gene_ID: int = None, ensg_number: str = None, gene_symbol: str = N
     :param gene_ID: int
     :param ensg_number: str
     :param gene_symbol: str
-    :return: list of all genes with the given parameters
+    :param execute: if False, return the select statement instead of the genes
+    :return: list of all genes (gene_ID, ensg_number, gene_symbol) with the given parameters
     """
-    
-    gene_query = db.select(models.Gene) 
-    if ensg_number is not None:
-        gene_query = gene_query.where(models.Gene.ensg_number == ensg_number)
-    if gene_symbol is not None:
-        gene_query = gene_query.where(models.Gene.gene_symbol == gene_symbol)
-    if gene_ID is not None:
-        gene_query = gene_query.where(models.Gene.gene_ID == gene_ID)
-
-    if execute: 
-        gene_data = db.session.execute(gene_query).scalars().all()
-        return gene_data
-    else: 
+
+    if not execute:
+        gene_query = db.select(models.Gene)
+        if ensg_number is not None:
+            gene_query = gene_query.where(models.Gene.ensg_number == ensg_number)
+        if gene_symbol is not None:
+            gene_query = gene_query.where(models.Gene.gene_symbol == gene_symbol)
+        if gene_ID is not None:
+            gene_query = gene_query.where(models.Gene.gene_ID == gene_ID)
         return gene_query
 
+    index = identifiers.genes()
+    gene_IDs = None
+    for column, value in (("ensg_number", ensg_number), ("gene_symbol", gene_symbol), ("gene_ID", gene_ID)):
+        if value is not None:
+            IDs = [value] if column == "gene_ID" else index.lookup(column, value)
+            gene_IDs = IDs if gene_IDs is None else [i for i in gene_IDs if i in IDs]
+    return index.records(gene_IDs)
+
 
 def get_transcripts(gene_ID: int = None, ensg_number: str = None, gene_symbol: str = None, transcript_ID: int = None, enst_number: str = None, execute=True):
     """
     Function to retrieve all transcripts with the given parameters
     :param transcript_ID: int
     :param enst_number: str
-    :return: list of all transcripts with the given parameters
+    :return: list of all transcripts (transcript_ID, enst_number, gene_ID) with the given parameters
     """
 
-    gene_data = get_genes(gene_ID=gene_ID, ensg_number=ensg_number, gene_symbol=gene_symbol)
-    gene_IDs = [gene.gene_ID for gene in gene_data]
-    
-    transcript_query = db.select(models.Transcript).where(models.Transcript.gene_ID.in_(gene_IDs))
-    if enst_number is not None:
-        transcript_query = transcript_query.where(models.Transcript.enst_number == enst_number)
-    if transcript_ID is not None:
-        transcript_query = transcript_query.where(models.Transcript.transcript_ID == transcript_ID)
-    
-    transcript_data = db.session.execute(transcript_query).scalars().all()
-
-    return transcript_data
+    index = identifiers.transcripts()
+    transcript_IDs = None
+    if gene_ID is not None or ensg_number is not None or gene_symbol is not None:
+        gene_IDs = [gene.gene_ID for gene in get_genes(gene_ID=gene_ID, ensg_number=ensg_number, gene_symbol=gene_symbol)]
+        transcript_IDs = index.lookup("gene_ID", gene_IDs)
+    for column, value in (("enst_number", enst_number), ("transcript_ID", transcript_ID)):
+        if value is not None:
+            IDs = [value] if column == "transcript_ID" else index.lookup(column, value)
+            transcript_IDs = IDs if transcript_IDs is None else [i for i in transcript_IDs if i in IDs]
+    return index.records(transcript_IDs)
@@ -2,16 +2,19 @@ import sqlalchemy as sa
 import os
 from flask import jsonify
 from sqlalchemy import desc, engine_from_config, literal_column, or_, and_
-from sqlalchemy.sql import text
-from app.controllers.dataset import _dataset_query
+from app.controllers.dataset import _run_IDs
+from app.controllers import levels
 import app.models as models
+from app import columnar, identifiers, idsets, pagination, serialization
+from app.centrality import subnetwork_centralities
 from app.config import LATEST, db, cache
 
 
 @cache.cached(query_string=True)
 def read_all_genes(dataset_ID: int = None, disease_name=None, ensg_number=None, gene_symbol=None, gene_type=None, pValue=0.05,
                    pValueDirection="<", mscor=None, mscorDirection="<", correlation=None, correlationDirection="<",
-                   sorting=None, descending=True, limit=100, offset=0, information=True, sponge_db_version: int = LATEST):
+                   sorting=None, descending=True, limit=100, offset=0, cursor=None, information=True, fields=None,
+                   sponge_db_version: int = LATEST):
     """
     This function responds to a request for /ceRNAInteraction/findAll
     and returns all interactions the given identification (ensg_number or gene_symbol) in all available datasets is in involved
@@ -30,7 +33,9 @@ def read_all_genes(dataset_ID: int = None, disease_name=None, ensg_number=None,
     :param descending: should the results be sorted in descending or ascending order
     :param limit: number of results that shouls be shown
     :param offset: startpoint from where results should be shown
+    :param cursor: cursor of the previous page (X-Next-Cursor header), replaces offset
     :param information: defines if each gene should contain all available information or not (default: True, if False: just ensg_nr will be shown)
+    :param fields: fields of the response (dotted paths for nested fields), all if None
     :param sponge_db_version: version of the sponge database
     :return: all interactions given gene is involved
     """
@@ -54,27 +59,12 @@ def read_all_genes(dataset_ID: int = None, disease_name=None, ensg_number=None,
         }), 400
 
 
-    queries_1 = []
-    queries_2 = []
+    queries = []
 
-    # filter for database version 
-    run = models.SpongeRun.query \
-        .filter(models.SpongeRun.sponge_db_version == sponge_db_version)
+    run_IDs = _run_IDs(sponge_db_version, disease_name=disease_name, dataset_ID=dataset_ID)
 
-    # if specific disease_name is given:
-    if disease_name is not None:
-        run = run.join(models.Dataset, models.Dataset.dataset_ID == models.SpongeRun.dataset_ID) \
-            .filter(models.Dataset.disease_name.like("%" + disease_name + "%")) \
-    
-    if dataset_ID is not None:
-        run = run.filter(models.Dataset.dataset_ID == dataset_ID)
-    
-    run = run.all()
-
-    if len(run) > 0:
-        run_IDs = [i.sponge_run_ID for i in run]
-        queries_1.append(models.GeneInteraction.sponge_run_ID.in_(run_IDs))
-        queries_2.append(models.GeneInteraction.sponge_run_ID.in_(run_IDs))
+    if len(run_IDs) > 0:
+        queries.append(models.GeneInteraction.sponge_run_ID.in_(run_IDs))
     else:
         return jsonify({
             "detail": "No dataset with given disease_name / dataset_ID found",
@@ -84,28 +74,21 @@ def read_all_genes(dataset_ID: int = None, disease_name=None, ensg_number=None,
         }), 400
 
 
-    gene = []
+    gene_IDs = None
     # if ensg_numer is given to specify gene(s), get the intern gene_ID(primary_key) for requested ensg_nr(gene_ID)
     if ensg_number is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.ensg_number.in_(ensg_number)) \
-            .all()
+        gene_IDs = idsets.IDSet(identifiers.genes().lookup("ensg_number", ensg_number))
     # if gene_symbol is given to specify gene(s), get the intern gene_ID(primary_key) for requested gene_symbol(gene_ID)
     elif gene_symbol is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.gene_symbol.in_(gene_symbol)) \
-            .all()
+        gene_IDs = idsets.IDSet(identifiers.genes().lookup("gene_symbol", gene_symbol))
     elif gene_type is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.gene_type == gene_type) \
-            .all()
+        # tens of thousands of genes per type: the select is pushed down instead of its gene_IDs
+        gene_IDs = idsets.IDSet(query=db.select(models.Gene.gene_ID).where(models.Gene.gene_type == gene_type))
 
     # save all needed queries to get correct results
-    if ensg_number is not None or gene_symbol is not None or gene_type is not None:
-        if len(gene) > 0:
-            gene_IDs = [i.gene_ID for i in gene]
-            queries_1.append(models.GeneInteraction.gene_ID1.in_(gene_IDs))
-            queries_2.append(models.GeneInteraction.gene_ID2.in_(gene_IDs))
+    if gene_IDs is not None:
+        if not gene_IDs.is_empty():
+            queries.append(levels.interactions_of(levels.GENE, sponge_db_version, run_IDs, gene_IDs))
         else:
             return jsonify({
                 "detail": "No gene found for given ensg_number(s) or gene_symbol(s)",
@@ -115,27 +98,14 @@ def read_all_genes(dataset_ID: int = None, disease_name=None, ensg_number=None,
             }), 400
 
     # filter further depending on given statistics cutoffs
+    cutoffs = []
     if pValue is not None:
-        if pValueDirection == "<":
-            queries_1.append(models.GeneInteraction.p_value <= pValue)
-            queries_2.append(models.GeneInteraction.p_value <= pValue)
-        else:
-            queries_1.append(models.GeneInteraction.p_value >= pValue)
-            queries_2.append(models.GeneInteraction.p_value >= pValue)
+        cutoffs.append(("p_value", "<=" if pValueDirection == "<" else ">=", pValue))
     if mscor is not None:
-        if mscorDirection == "<":
-            queries_1.append(models.GeneInteraction.mscor <= mscor)
-            queries_2.append(models.GeneInteraction.mscor <= mscor)
-        else:
-            queries_1.append(models.GeneInteraction.mscor >= mscor)
-            queries_2.append(models.GeneInteraction.mscor >= mscor)
+        cutoffs.append(("mscor", "<=" if mscorDirection == "<" else ">=", mscor))
     if correlation is not None:
-        if correlationDirection == "<":
-            queries_1.append(models.GeneInteraction.correlation <= correlation)
-            queries_2.append(models.GeneInteraction.correlation <= correlation)
-        else:
-            queries_1.append(models.GeneInteraction.correlation >= correlation)
-            queries_2.append(models.GeneInteraction.correlation >= correlation)
+        cutoffs.append(("correlation", "<=" if correlationDirection == "<" else ">=", correlation))
+    queries += columnar.where(models.GeneInteraction, cutoffs)
 
     # add all sorting if given:
     sort = []
@@ -158,14 +128,32 @@ def read_all_genes(dataset_ID: int = None, disease_name=None, ensg_number=None,
 
     # interaction_result = []
 
-    interaction_result = models.GeneInteraction.query \
-        .filter(*queries_1) \
-        .order_by(*sort) \
-        .union(models.GeneInteraction.query
-               .filter(*queries_2)
-               .order_by(*sort)) \
-        .slice(offset, offset + limit) \
-        .all()
+    try:
+        if information:
+            # Serialize the data for the response depending on parameter all
+            schema = serialization.project(models.GeneInteractionDatasetLongSchema, fields, many=True)
+        else:
+            # Serialize the data for the response depending on parameter all
+            schema = serialization.project(models.GeneInteractionDatasetShortSchema, fields, many=True)
+    except serialization.InvalidFields as e:
+        return serialization.invalid_fields(e)
+
+    query = models.GeneInteraction.query.filter(*queries).options(*models.eager_load_options(schema))
+    interactions = columnar.interactions("gene", run_IDs) if not cursor else None
+    if interactions is not None:
+        # the engine selects the primary keys of the page (and one more for the next cursor)
+        mask = interactions.mask(nodes=gene_IDs.values() if gene_IDs is not None else None, cutoffs=cutoffs)
+        sort_column = {"pValue": "p_value", "mscor": "mscor", "correlation": "correlation"}.get(sorting)
+        IDs = interactions.select(mask, sort_column, descending, offset, limit + 1)
+        query = models.GeneInteraction.query \
+            .filter(models.GeneInteraction.interactions_genegene_ID.in_(IDs)) \
+            .options(*models.eager_load_options(schema))
+        offset = None
+    try:
+        interaction_result, next_cursor = pagination.paginate(query, sort, models.GeneInteraction.interactions_genegene_ID,
+                                                              limit, offset, cursor)
+    except pagination.InvalidCursor as e:
+        return pagination.invalid_cursor(e)
 
     # if len(tmp) > 0:
     #    interaction_result.append(tmp)
@@ -175,13 +163,7 @@ def read_all_genes(dataset_ID: int = None, disease_name=None, ensg_number=None,
     # interaction_result = [val for sublist in interaction_result for val in sublist]
 
     if len(interaction_result) > 0:
-        if information:
-            # Serialize the data for the response depending on parameter all
-            schema = models.GeneInteractionDatasetLongSchema(many=True)
-        else:
-            # Serialize the data for the response depending on parameter all
-            schema = models.GeneInteractionDatasetShortSchema(many=True)
-        return schema.dump(interaction_result)
+        return schema.dump(interaction_result), 200, pagination.cursor_headers(next_cursor)
     else:
         return jsonify({
             "detail": "No information with given parameters found",
@@ -250,20 +232,14 @@ def read_specific_interaction(dataset_ID: int = None, disease_name=None, ensg_nu
             "type": "about:blank"
         }), 400
 
-    gene = []
+    gene_IDs = []
     # if ensg_numer is given for specify gene, get the intern gene_ID(primary_key) for requested ensg_nr(gene_ID)
     if ensg_number is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.ensg_number.in_(ensg_number)) \
-            .all()
+        gene_IDs = identifiers.genes().lookup("ensg_number", ensg_number)
     elif gene_symbol is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.gene_symbol.in_(gene_symbol)) \
-            .all()
+        gene_IDs = identifiers.genes().lookup("gene_symbol", gene_symbol)
 
-    if len(gene) > 0:
-        gene_IDs = [i.gene_ID for i in gene]
-    else:
+    if len(gene_IDs) == 0:
         return jsonify({
             "detail": "No gene found for given ensg_number(s) or gene_symbol(s)",
             "status": 400,
@@ -275,22 +251,9 @@ def read_specific_interaction(dataset_ID: int = None, disease_name=None, ensg_nu
     # save all needed queries to get correct results
     queries = [sa.and_(models.GeneInteraction.gene_ID1.in_(gene_IDs), models.GeneInteraction.gene_ID2.in_(gene_IDs))]
 
-    # filter for database version 
-    run = models.SpongeRun.query \
-        .filter(models.SpongeRun.sponge_db_version == sponge_db_version)
+    run_IDs = _run_IDs(sponge_db_version, disease_name=disease_name, dataset_ID=dataset_ID)
 
-    # if specific disease_name is given:
-    if disease_name is not None:
-        run = run.join(models.Dataset, models.Dataset.dataset_ID == models.SpongeRun.dataset_ID) \
-            .filter(models.Dataset.disease_name.like("%" + disease_name + "%")) \
-    
-    if dataset_ID is not None:
-        run = run.filter(models.Dataset.dataset_ID == dataset_ID)
-            
-    run = run.all()
-
-    if len(run) > 0:
-        run_IDs = [i.sponge_run_ID for i in run]
+    if len(run_IDs) > 0:
         queries.append(models.GeneInteraction.sponge_run_ID.in_(run_IDs))
     else:
         return jsonify({
@@ -301,14 +264,21 @@ def read_specific_interaction(dataset_ID: int = None, disease_name=None, ensg_nu
         }), 400
 
     # filter further depending on given statistics cutoffs
+    cutoffs = []
     if pValue is not None:
-        if pValueDirection == "<":
-            queries.append(models.GeneInteraction.p_value < pValue)
-        else:
-            queries.append(models.GeneInteraction.p_value > pValue)
+        cutoffs.append(("p_value", "<" if pValueDirection == "<" else ">", pValue))
+    queries += columnar.where(models.GeneInteraction, cutoffs)
+
+    interactions = columnar.interactions("gene", run_IDs)
+    if interactions is not None:
+        IDs = interactions.select(interactions.mask(nodes=gene_IDs, both=True, cutoffs=cutoffs), offset=offset, limit=limit)
+        queries = [models.GeneInteraction.interactions_genegene_ID.in_(IDs)]
+        offset = 0
 
     interaction_result = models.GeneInteraction.query \
         .filter(*queries) \
+        .options(*models.eager_load_options(models.GeneInteractionDatasetShortSchema)) \
+        .order_by(models.GeneInteraction.interactions_genegene_ID) \
         .slice(offset, offset + limit) \
         .all()
 
@@ -328,7 +298,7 @@ def read_specific_interaction(dataset_ID: int = None, disease_name=None, ensg_nu
 @cache.cached(query_string=True)
 def read_all_gene_network_analysis(dataset_ID: int = None, disease_name=None, ensg_number=None, gene_symbol=None, gene_type=None,
                                    minBetweenness=None, minNodeDegree=None, minEigenvector=None,
-                                   sorting=None, descending=True, limit=100, offset=0, sponge_db_version: int = LATEST):
+                                   sorting=None, descending=True, limit=100, offset=0, cursor=None, sponge_db_version: int = LATEST):
     """
     This function responds to a request for /findceRNA
     and returns all interactions the given identification (ensg_number or gene_symbol) in all available datasets is in involved and satisfies the given filters
@@ -344,6 +314,7 @@ def read_all_gene_network_analysis(dataset_ID: int = None, disease_name=None, en
     :param descending: should the results be sorted in descending or ascending order
     :param limit: number of results that shouls be shown
     :param offset: startpoint from where results should be shown
+    :param cursor: cursor of the previous page (X-Next-Cursor header), replaces offset
     :param sponge_db_version: version of the sponge database
     :return: all ceRNAInteractions in the dataset of interest that satisfy the given filters
     """
@@ -361,21 +332,9 @@ def read_all_gene_network_analysis(dataset_ID: int = None, disease_name=None, en
     queries = []
 
     # select runs for database version 
-    run = models.SpongeRun.query \
-        .filter(models.SpongeRun.sponge_db_version == sponge_db_version)
-
-    # if specific disease_name is given (should be because for this endpoint is it required):
-    if disease_name is not None:
-        run = run.join(models.Dataset, models.Dataset.dataset_ID == models.SpongeRun.dataset_ID) \
-            .filter(models.Dataset.disease_name.like("%" + disease_name + "%")) \
-            
-    if dataset_ID is not None:
-        run = run.filter(models.Dataset.dataset_ID == dataset_ID)
-        
-    run = run.all()
-
-    if len(run) > 0:
-        run_IDs = [i.sponge_run_ID for i in run]
+    run_IDs = _run_IDs(sponge_db_version, disease_name=disease_name, dataset_ID=dataset_ID)
+
+    if len(run_IDs) > 0:
         queries.append(models.networkAnalysis.sponge_run_ID.in_(run_IDs))
     else:
         return jsonify({
@@ -394,14 +353,10 @@ def read_all_gene_network_analysis(dataset_ID: int = None, disease_name=None, en
         }), 400
 
 
-    gene = []
     # if ensg_numer is given for specify gene, get the intern gene_ID(primary_key) for requested ensg_nr(gene_ID)
     if ensg_number is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.ensg_number.in_(ensg_number)) \
-            .all()
-        if len(gene) > 0:
-            gene_IDs = [i.gene_ID for i in gene]
+        gene_IDs = identifiers.genes().lookup("ensg_number", ensg_number)
+        if len(gene_IDs) > 0:
             queries.append(models.networkAnalysis.gene_ID.in_(gene_IDs))
         else:
             return jsonify({
@@ -412,11 +367,8 @@ def read_all_gene_network_analysis(dataset_ID: int = None, disease_name=None, en
             }), 400
 
     elif gene_symbol is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.gene_symbol.in_(gene_symbol)) \
-            .all()
-        if len(gene) > 0:
-            gene_IDs = [i.gene_ID for i in gene]
+        gene_IDs = identifiers.genes().lookup("gene_symbol", gene_symbol)
+        if len(gene_IDs) > 0:
             queries.append(models.networkAnalysis.gene_ID.in_(gene_IDs))
         else:
             return jsonify({
@@ -455,16 +407,18 @@ def read_all_gene_network_analysis(dataset_ID: int = None, disease_name=None, en
             else:
                 sort.append(models.networkAnalysis.eigenvector.asc())
 
-    result = models.networkAnalysis.query \
+    query = models.networkAnalysis.query \
         .join(models.Gene, models.Gene.gene_ID == models.networkAnalysis.gene_ID) \
         .filter(*queries) \
-        .order_by(*sort) \
-        .slice(offset, offset + limit) \
-        .all()
+        .options(*models.eager_load_options(models.networkAnalysisSchema))
+    try:
+        result, next_cursor = pagination.paginate(query, sort, models.networkAnalysis.network_analysis_gene_ID, limit, offset, cursor)
+    except pagination.InvalidCursor as e:
+        return pagination.invalid_cursor(e)
     
     if len(result) > 0:
         schema = models.networkAnalysisSchema(many=True)
-        return schema.dump(result)
+        return schema.dump(result), 200, pagination.cursor_headers(next_cursor)
     else:
         return jsonify({
             "detail": "No data found that satisfies the given filters",
@@ -480,9 +434,10 @@ def testGeneInteraction(dataset_ID: int = None, ensg_number=None, gene_symbol=No
     """
     This function responds to a request for /ceRNAInteraction/checkGeneInteraction
     :param dataset_ID: dataset_ID of interest
-    :param ensg_number: ensg number of the gene of interest
-    :param gene_symbol: gene symbol of the gene of interest
-    :return: lists of all cancer types gene of interest has at least one interaction in the corresponding ceRNA II network
+    :param ensg_number: ensg number(s) of the gene(s) of interest
+    :param gene_symbol: gene symbol(s) of the gene(s) of interest
+    :param sponge_db_version: version of the sponge database
+    :return: lists of all cancer types with a flag for each gene of interest whether it has at least one interaction in the corresponding ceRNA II network
     """
 
     # test if any of the two identification possibilites is given
@@ -503,20 +458,11 @@ def testGeneInteraction(dataset_ID: int = None, ensg_number=None, gene_symbol=No
             "type": "about:blank"
         }), 400
 
-    gene = []
     # if ensg_numer is given for specify gene, get the intern gene_ID(primary_key) for requested ensg_nr(gene_ID)
-    if ensg_number is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.ensg_number == ensg_number) \
-            .all()
-    elif gene_symbol is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.gene_symbol == gene_symbol) \
-            .all()
+    column = "ensg_number" if ensg_number is not None else "gene_symbol"
+    gene_ID = identifiers.genes().lookup(column, ensg_number if ensg_number is not None else gene_symbol)
 
-    if len(gene) > 0:
-        gene_ID = [i.gene_ID for i in gene]
-    else:
+    if len(gene_ID) == 0:
         return jsonify({
             "detail": "No gene found for given ensg_number(s) or gene_symbol(s)",
             "status": 400,
@@ -524,31 +470,9 @@ def testGeneInteraction(dataset_ID: int = None, ensg_number=None, gene_symbol=No
             "type": "about:blank"
         }), 400
 
-    # test for each dataset if the gene(s) of interest are included in the ceRNA network
-    run = db.session.execute(text(f"SELECT * from dataset join sponge_run on dataset.dataset_ID = sponge_run.dataset_ID where dataset.sponge_db_version = {sponge_db_version}"))
-
-    if dataset_ID is not None:
-        run = run.filter(models.Dataset.dataset_ID == dataset_ID)
-
-    result = []
-    for r in run:
-        tmp = db.session.execute(text("SELECT EXISTS(SELECT * FROM interactions_genegene where sponge_run_ID = " + str(r.sponge_run_ID) +
-                              " and gene_ID1 = " + str(gene_ID[0]) + " limit 1) as include;")).fetchone()
-
-        if (tmp[0] == 1):
-            check = {"data_origin": r.data_origin, "disease_name": r.disease_name, "disease_subtype": r.disease_subtype, "sponge_run_ID": r.sponge_run_ID,
-                     "include": tmp[0]}
-        else:
-            tmp2 = db.session.execute(text("SELECT EXISTS(SELECT * FROM interactions_genegene where sponge_run_ID = " + str(r.sponge_run_ID) +
-                                   " and gene_ID2 = " + str(gene_ID[0]) + " limit 1) as include;")).fetchone()
-            if (tmp2[0] == 1):
-                check = {"data_origin": r.data_origin, "disease_name": r.disease_name, "disease_subtype": r.disease_subtype, "sponge_run_ID": r.sponge_run_ID,
-                         "include": 1}
-            else:
-                check = {"data_origin": r.data_origin, "disease_name": r.disease_name, "disease_subtype": r.disease_subtype, "sponge_run_ID": r.sponge_run_ID,
-                         "include": 0}
-
-        result.append(check)
+    # test for each run of the database version which genes of interest are included in the ceRNA network
+    labels = dict(zip(gene_ID, identifiers.genes().values(column, gene_ID)))
+    result = levels.presence_matrix(levels.GENE, sponge_db_version, dataset_ID, gene_ID, labels)
 
     schema = models.checkGeneInteractionProCancer(many=True)
     return schema.dump(result)
@@ -603,21 +527,16 @@ def read_all_to_one_mirna(dataset_ID: int = None, disease_name=None, mimat_numbe
         }), 400
 
     # get mir_ID from given mimat_number or hs number
-    mirna = []
+    mirna_IDs = []
     if mimat_number is not None:
-        mirna = models.miRNA.query \
-            .filter(models.miRNA.mir_ID.like("%" + mimat_number + "%")) \
-            .all()
+        mirna_IDs = identifiers.mirnas().contains("mir_ID", mimat_number)
     elif hs_number is not None:
-        mirna = models.miRNA.query \
-            .filter(models.miRNA.hs_nr.like("%" + hs_number + "%")) \
-            .all()
+        mirna_IDs = identifiers.mirnas().contains("hs_nr", hs_number)
 
     # save queries
     queriesGeneInteraction = []
     queriesmirnaInteraction = []
-    if len(mirna) > 0:
-        mirna_IDs = [i.miRNA_ID for i in mirna]
+    if len(mirna_IDs) > 0:
         queriesmirnaInteraction.append(models.miRNAInteraction.miRNA_ID.in_(mirna_IDs))
     else:
         return jsonify({
@@ -627,22 +546,9 @@ def read_all_to_one_mirna(dataset_ID: int = None, disease_name=None, mimat_numbe
             "type": "about:blank"
         }), 400
 
-    # filter for database version 
-    run = models.SpongeRun.query \
-        .filter(models.SpongeRun.sponge_db_version == sponge_db_version) 
-
-    # if specific disease_name is given:
-    if disease_name is not None:
-        run = run.join(models.Dataset, models.Dataset.dataset_ID == models.SpongeRun.dataset_ID) \
-            .filter(models.Dataset.disease_name.like("%" + disease_name + "%"))
-        
-    if dataset_ID is not None:
-        run = run.filter(models.Dataset.dataset_ID == dataset_ID)
-    
-    run = run.all()
+    run_IDs = _run_IDs(sponge_db_version, disease_name=disease_name, dataset_ID=dataset_ID)
 
-    if len(run) > 0:
-        run_IDs = [i.sponge_run_ID for i in run]
+    if len(run_IDs) > 0:
         queriesmirnaInteraction.append(models.miRNAInteraction.sponge_run_ID.in_(run_IDs))
         queriesGeneInteraction.append(models.GeneInteraction.sponge_run_ID.in_(run_IDs))
     else:
@@ -692,6 +598,7 @@ def read_all_to_one_mirna(dataset_ID: int = None, disease_name=None, mimat_numbe
 
     interaction_result = models.GeneInteraction.query \
         .filter(*queriesGeneInteraction) \
+        .options(*models.eager_load_options(models.GeneInteractionDatasetLongSchema)) \
         .slice(offset, offset + limit) \
         .all()
 
@@ -711,7 +618,7 @@ def read_all_to_one_mirna(dataset_ID: int = None, disease_name=None, mimat_numbe
 
 @cache.cached(query_string=True)
 def read_all_mirna(dataset_ID: int = None, disease_name=None, mimat_number=None, hs_number=None, occurences=None, sorting=None, descending=None,
-                   limit=100, offset=0, sponge_db_version: int = LATEST):
+                   limit=100, offset=0, cursor=None, sponge_db_version: int = LATEST):
     """
     Handles API request for /miRNAInteraction/getOccurence
     and returns all miRNA that are involved in the disease of interest
@@ -724,6 +631,7 @@ def read_all_mirna(dataset_ID: int = None, disease_name=None, mimat_number=None,
     :param descending: should the results be sorted in descending or ascending order
     :param limit: number of results that should be shown
     :param offset: startpoint from where results should be shown
+    :param cursor: cursor of the previous page (X-Next-Cursor header), replaces offset
     :param sponge_db_version: version of the sponge database
     :return: all mirna involved in disease of interest (searchs not for a specific miRNA, but search for all miRNA satisfying filter functions)
     """
@@ -747,21 +655,16 @@ def read_all_mirna(dataset_ID: int = None, disease_name=None, mimat_number=None,
 
 
     # get mir_ID from given mimat_number
-    mirna = []
+    mirna_IDs = []
     if mimat_number is not None:
-        mirna = models.miRNA.query \
-            .filter(models.miRNA.mir_ID.in_(mimat_number)) \
-            .all()
+        mirna_IDs = identifiers.mirnas().lookup("mir_ID", mimat_number)
     elif hs_number is not None:
-        mirna = models.miRNA.query \
-            .filter(models.miRNA.hs_nr.in_(hs_number)) \
-            .all()
+        mirna_IDs = identifiers.mirnas().lookup("hs_nr", hs_number)
 
     # save queries
     queries = []
     if mimat_number is not None or hs_number is not None:
-        if len(mirna) > 0:
-            mirna_IDs = [i.miRNA_ID for i in mirna]
+        if len(mirna_IDs) > 0:
             queries.append(models.OccurencesMiRNA.miRNA_ID.in_(mirna_IDs))
         else:
             return jsonify({
@@ -771,22 +674,9 @@ def read_all_mirna(dataset_ID: int = None, disease_name=None, mimat_number=None,
                 "type": "about:blank"
             }), 400
 
-    # filter for database version
-    run = models.SpongeRun.query \
-        .filter(models.SpongeRun.sponge_db_version == sponge_db_version)
-
-    # if specific disease_name is given:
-    if disease_name is not None:
-        run = run.join(models.Dataset, models.Dataset.dataset_ID == models.SpongeRun.dataset_ID) \
-            .filter(models.Dataset.disease_name.like("%" + disease_name + "%"))
-        
-    if dataset_ID is not None:
-        run = run.filter(models.Dataset.dataset_ID == dataset_ID)
-        
-    run = run.all()
-        
-    if len(run) > 0:
-        run_IDs = [i.sponge_run_ID for i in run]
+    run_IDs = _run_IDs(sponge_db_version, disease_name=disease_name, dataset_ID=dataset_ID)
+
+    if len(run_IDs) > 0:
         queries.append(models.OccurencesMiRNA.sponge_run_ID.in_(run_IDs))
     else:
         return jsonify({
@@ -807,15 +697,18 @@ def read_all_mirna(dataset_ID: int = None, disease_name=None, mimat_number=None,
         else:
             sort.append(models.OccurencesMiRNA.occurences)
 
-    interaction_result = models.OccurencesMiRNA.query \
-        .filter(*queries) \
-        .order_by(*sort) \
-        .slice(offset, offset + limit) \
-        .all()
+    try:
+        query = models.OccurencesMiRNA.query \
+            .filter(*queries) \
+            .options(*models.eager_load_options(models.occurencesMiRNASchema))
+        interaction_result, next_cursor = pagination.paginate(query, sort, models.OccurencesMiRNA.occurences_mirna_gene_ID,
+                                                              limit, offset, cursor)
+    except pagination.InvalidCursor as e:
+        return pagination.invalid_cursor(e)
 
     if len(interaction_result) > 0:
         # Serialize the data for the response depending on parameter all
-        return models.occurencesMiRNASchema(many=True).dump(interaction_result)
+        return models.occurencesMiRNASchema(many=True).dump(interaction_result), 200, pagination.cursor_headers(next_cursor)
     else:
         return jsonify({
             "detail": "No information with given parameters found",
@@ -843,40 +736,38 @@ def read_mirna_for_specific_interaction(dataset_ID: int = None, disease_name=Non
     :return: all miRNAs contributing to the interactions between genes of interest
     """
 
-    # get diseases 
-    disease_query = db.select(models.Dataset.dataset_ID).where(models.Dataset.sponge_db_version == sponge_db_version)
-    if disease_name is not None:
-        disease_query = disease_query.where(models.Dataset.disease_name.like("%" + disease_name + "%"))
-    if dataset_ID is not None:
-        disease_query = disease_query.where(models.Dataset.dataset_ID == dataset_ID)
-
     # filter runs for diseases
-    run_query = db.select(models.SpongeRun.sponge_run_ID).where(models.SpongeRun.dataset_ID.in_(disease_query))
+    run_IDs = _run_IDs(sponge_db_version, disease_name=disease_name, dataset_ID=dataset_ID)
 
-    # get gene IDs 
-    gene_query = db.select(models.Gene.gene_ID)
+    # get gene IDs, all genes (no filter) if no identifier is given
+    gene_IDs = None
     if ensg_number is not None:
-        gene_query = gene_query.where(models.Gene.ensg_number.in_(ensg_number))
+        gene_IDs = identifiers.genes().lookup("ensg_number", ensg_number)
     if gene_symbol is not None:
-        gene_query = gene_query.where(models.Gene.gene_symbol.in_(gene_symbol))
+        symbol_IDs = identifiers.genes().lookup("gene_symbol", gene_symbol)
+        gene_IDs = symbol_IDs if gene_IDs is None else sorted(set(gene_IDs) & set(symbol_IDs))
+    gene_set = None if gene_IDs is None else idsets.as_set(gene_IDs)
+
+    def gene_filter():
+        return [] if gene_set is None else [gene_set.filter(models.miRNAInteraction.gene_ID)]
 
     # Get all interactions for the given genes and runs
     base_interaction_query = db.select(models.miRNAInteraction).where(
-        models.miRNAInteraction.gene_ID.in_(gene_query),
-        models.miRNAInteraction.sponge_run_ID.in_(run_query),
+        *gene_filter(),
+        models.miRNAInteraction.sponge_run_ID.in_(run_IDs),
     )
 
     if between:
         # Subquery to count distinct genes
-        distinct_gene_count_subquery = (
-            db.select(db.func.count(db.func.distinct(gene_query.c.gene_ID))).scalar_subquery()
-        )
-        print(distinct_gene_count_subquery)
+        if gene_IDs is None:
+            distinct_gene_count_subquery = db.select(db.func.count(models.Gene.gene_ID)).scalar_subquery()
+        else:
+            distinct_gene_count_subquery = len(set(gene_IDs))
 
         # Subquery to get miRNA IDs that meet the 'between' condition
         mirna_query = db.select(models.miRNAInteraction.miRNA_ID) \
-            .where(models.miRNAInteraction.gene_ID.in_(gene_query)) \
-            .where(models.miRNAInteraction.sponge_run_ID.in_(run_query)) \
+            .where(*gene_filter()) \
+            .where(models.miRNAInteraction.sponge_run_ID.in_(run_IDs)) \
             .group_by(models.miRNAInteraction.miRNA_ID) \
             .having(db.func.count(models.miRNAInteraction.gene_ID) == distinct_gene_count_subquery)
 
@@ -939,21 +830,9 @@ def getGeneCounts(dataset_ID: int = None, disease_name=None, ensg_number=None, g
     queries = []
 
     # get all sponge_runs for the given sponge_db_version
-    run = models.SpongeRun.query \
-        .filter(models.SpongeRun.sponge_db_version == sponge_db_version)
-
-    # if specific disease_name is given:
-    if disease_name is not None:
-        run = models.SpongeRun.query.join(models.Dataset, models.Dataset.dataset_ID == models.SpongeRun.dataset_ID) \
-            .filter(models.Dataset.disease_name.like("%" + disease_name + "%"))
-        
-    if dataset_ID is not None:
-        run = run.filter(models.Dataset.dataset_ID == dataset_ID)
-    
-    run = run.all()
+    run_IDs = _run_IDs(sponge_db_version, disease_name=disease_name, dataset_ID=dataset_ID)
 
-    if len(run) > 0:
-        run_IDs = [i.sponge_run_ID for i in run]
+    if len(run_IDs) > 0:
         queries.append(models.GeneCount.sponge_run_ID.in_(run_IDs))
     else:
         return jsonify({
@@ -963,15 +842,11 @@ def getGeneCounts(dataset_ID: int = None, disease_name=None, ensg_number=None, g
             "type": "about:blank"
         }), 400
 
-    gene = []
     # if ensg_numer is given to specify gene(s), get the intern gene_ID(primary_key) for requested ensg_nr(gene_ID)
     if ensg_number is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.ensg_number.in_(ensg_number)) \
-            .all()
+        gene_ID = identifiers.genes().lookup("ensg_number", ensg_number)
 
-        if len(gene) > 0:
-            gene_ID = [i.gene_ID for i in gene]
+        if len(gene_ID) > 0:
             queries.append(models.GeneCount.gene_ID.in_(gene_ID))
         else:
             return jsonify({
@@ -983,12 +858,9 @@ def getGeneCounts(dataset_ID: int = None, disease_name=None, ensg_number=None, g
 
     # if gene_symbol is given to specify gene(s), get the intern gene_ID(primary_key) for requested gene_symbol(gene_ID)
     elif gene_symbol is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.gene_symbol.in_(gene_symbol)) \
-            .all()
+        gene_ID = identifiers.genes().lookup("gene_symbol", gene_symbol)
 
-        if len(gene) > 0:
-            gene_ID = [i.gene_ID for i in gene]
+        if len(gene_ID) > 0:
             queries.append(models.GeneCount.gene_ID.in_(gene_ID))
         else:
             return jsonify({
@@ -1007,6 +879,7 @@ def getGeneCounts(dataset_ID: int = None, disease_name=None, ensg_number=None, g
     # get results
     result = models.GeneCount.query \
         .filter(*queries) \
+        .options(*models.eager_load_options(models.GeneCountSchema)) \
         .all()
 
     if len(result) > 0:
@@ -1022,7 +895,22 @@ def getGeneCounts(dataset_ID: int = None, disease_name=None, ensg_number=None, g
         }), 200
 
 
-@cache.cached(query_string=True)
+# edgeSorting of the network endpoint -> (column, descending)
+EDGE_SORTING = {"pValue": ("p_value", False), "mscor": ("mscor", True), "correlation": ("correlation", True)}
+
+
+def _network_schemas(fields):
+    """
+    :param fields: fields parameter of the network endpoint
+    :return: schemas of the edges and of the nodes, projected to the requested fields
+    :raises InvalidFields: if a requested field does not exist
+    """
+    projection = serialization.split_fields(fields, ("edges", "nodes"))
+    return serialization.project(models.GeneInteractionDatasetLongSchema, projection["edges"], many=True), \
+        serialization.project(models.networkAnalysisSchema, projection["nodes"], many=True)
+
+
+@cache.cached(query_string=True, coalesce=True)
 def get_gene_network(dataset_ID: int = None, disease_name=None,
                      ensemblID=None,
                       minBetweenness:float = None, minNodeDegree:float = None, minEigenvector:float = None,
@@ -1030,6 +918,7 @@ def get_gene_network(dataset_ID: int = None, disease_name=None,
                       edgeSorting: str = None, nodeSorting: list[str] = None,
                       maxNodes: int = 100, maxEdges: int = 100, 
                       offsetNodes: int = None, offsetEdges: int = None, 
+                      format: str = "full", fields=None, centrality: str = "run",
                       sponge_db_version: int = LATEST):
     """
     Optimized function for fetching ceRNA network nodes and edges with applied filters and sorting. Handles route /ceRNAInteraction/getGeneNetwork
@@ -1048,59 +937,58 @@ def get_gene_network(dataset_ID: int = None, disease_name=None,
     :param maxEdges: maximum number of edges
     :param offsetNodes: offset for node pagination
     :param offsetEdges: offset for edge pagination
+    :param format: "full" or "compact" (lookup tables and parallel arrays, see app/compact.py)
+    :param fields: fields of the edges and nodes in the full format, prefixed with "edges." or "nodes.", all if None
+    :param centrality: "run" for the betweenness, eigenvector and degree of the nodes in the complete network of the run,
+        "subnetwork" for those in the returned subnetwork (computed, see app/centrality.py)
     :param sponge_db_version: version of the sponge database
     :return: all ceRNAInteractions in the dataset of interest that satisfy the given filters
 
     """
-    # gene query: 
-    gene_query = db.select(models.Gene.gene_ID)
+    try:
+        edge_schema, node_schema = _network_schemas(fields)
+    except serialization.InvalidFields as e:
+        return serialization.invalid_fields(e)
+
+    # gene IDs: 
     if ensemblID is not None: 
-        gene_query = gene_query.filter(models.Gene.ensg_number.in_(ensemblID))
+        gene_IDs = identifiers.genes().lookup("ensg_number", ensemblID)
 
     # Step 1: Filter for SpongeRun IDs
-    run_query = db.select(models.SpongeRun.sponge_run_ID).filter(
-        models.SpongeRun.sponge_db_version == sponge_db_version
-    )
-    if disease_name:
-        run_query = run_query.join(models.Dataset).filter(
-            models.Dataset.disease_name.like(f"%{disease_name}%")
-        )
-    if dataset_ID:
-        run_query = run_query.filter(
-            models.SpongeRun.dataset_ID == dataset_ID
-        )
+    run_IDs = _run_IDs(sponge_db_version, disease_name=disease_name, dataset_ID=dataset_ID)
 
     # Step 2: Prefilter edges by SpongeRun ID and p-value
     edge_query = db.select(models.GeneInteraction).filter(
-        models.GeneInteraction.sponge_run_ID.in_(run_query)
+        models.GeneInteraction.sponge_run_ID.in_(run_IDs)
     )
 
     # apply gene filter: if given, filter for edges where at least one gene matches
     if ensemblID:
         edge_query = edge_query.filter(
-            sa.or_(
-                models.GeneInteraction.gene_ID1.in_(gene_query),
-                models.GeneInteraction.gene_ID2.in_(gene_query)
-            )
+            levels.interactions_of(levels.GENE, sponge_db_version, run_IDs, gene_IDs)
         )
 
-    if maxPValue:
-        edge_query = edge_query.filter(
-            models.GeneInteraction.p_value <= maxPValue
-        )
+    cutoffs = [("p_value", "<=", maxPValue)] if maxPValue else []
+    edge_query = edge_query.filter(*columnar.where(models.GeneInteraction, cutoffs))
 
-    # Get prefiltered edges
-    edges = db.session.execute(edge_query).scalars().all()
-    gene_ids_in_edges = set([edge.gene_ID1 for edge in edges] + [edge.gene_ID2 for edge in edges])
+    interactions = columnar.interactions("gene", run_IDs)
+    if interactions is not None:
+        # the genes of the prefiltered edges are found without loading the edges
+        prefiltered = interactions.mask(nodes=gene_IDs if ensemblID else None, cutoffs=cutoffs)
+        gene_ids_in_edges = interactions.nodes(prefiltered).tolist()
+    else:
+        # the genes of the prefiltered edges are selected by the database as a subquery, see app/idsets.py
+        gene_ids_in_edges = sa.union(edge_query.with_only_columns(models.GeneInteraction.gene_ID1),
+                                     edge_query.with_only_columns(models.GeneInteraction.gene_ID2))
 
     # Filter nodes by edges that pass the p-value filter & sponge run
     node_query = db.select(models.networkAnalysis).filter(
-        models.networkAnalysis.sponge_run_ID.in_(run_query),
-        models.networkAnalysis.gene_ID.in_(gene_ids_in_edges)
+        models.networkAnalysis.sponge_run_ID.in_(run_IDs),
+        idsets.member(models.networkAnalysis.gene_ID, gene_ids_in_edges)
     )
 
     if ensemblID: 
-        node_query = node_query.filter(models.networkAnalysis.gene_ID.in_(gene_query))
+        node_query = node_query.filter(idsets.member(models.networkAnalysis.gene_ID, gene_IDs))
 
     # Apply node-specific filters
     if minBetweenness:
@@ -1110,52 +998,82 @@ def get_gene_network(dataset_ID: int = None, disease_name=None,
     if minEigenvector:
         node_query = node_query.filter(models.networkAnalysis.eigenvector >= minEigenvector)
 
-    # Sorting nodes: if more than one sorting key, rank by each key individually and sort by the mean of the ranks
+    # Sorting nodes by their ranks in the run, by the mean of the ranks for more than one key
     if nodeSorting:
-        if any([key not in ['betweenness', 'node_degree', 'eigenvector'] for key in nodeSorting]):
+        if any([key not in levels.NODE_SORTING for key in nodeSorting]):
             raise ValueError("Invalid node sorting key. Choose from 'betweenness', 'node_degree', 'eigenvector'")
-        rank_columns = [db.func.rank().over(order_by=getattr(models.networkAnalysis, col).desc()).label(f"{col}_rank") for col in nodeSorting]
-        mean_rank = sum(rank_columns) / len(rank_columns)
-        node_query = node_query.order_by(mean_rank)
+        node_query = levels.sort_nodes(levels.GENE, node_query, sponge_db_version, run_IDs, nodeSorting)
 
     # node pagination
     node_query = node_query.offset(offsetNodes).limit(maxNodes)
 
+    # the nodes are read once, as plain columns for the compact format and as objects to dump otherwise
+    if format == "compact":
+        nodes = db.session.execute(node_query.with_only_columns(
+            models.networkAnalysis.gene_ID, models.networkAnalysis.sponge_run_ID,
+            models.networkAnalysis.betweenness, models.networkAnalysis.eigenvector, models.networkAnalysis.node_degree)).all()
+    else:
+        nodes = db.session.execute(node_query
+                                   .add_columns(models.networkAnalysis.gene_ID, models.networkAnalysis.sponge_run_ID)
+                                   .options(*models.eager_load_options(node_schema))).all()
+
     # filter edges based on filtered nodes
-    nodes = db.session.execute(node_query).scalars().all()
     node_gene_ids = set([node.gene_ID for node in nodes])
     edge_query = edge_query.filter(
         and_(
-            models.GeneInteraction.gene_ID1.in_(node_gene_ids),
-            models.GeneInteraction.gene_ID2.in_(node_gene_ids)
+            idsets.member(models.GeneInteraction.gene_ID1, node_gene_ids),
+            idsets.member(models.GeneInteraction.gene_ID2, node_gene_ids)
         )
     )
 
     # Apply edge-specific filters
+    edge_cutoffs = []
     if minMscor:
-        edge_query = edge_query.filter(models.GeneInteraction.mscor >= minMscor)
+        edge_cutoffs.append(("mscor", ">=", minMscor))
     if minCorrelation:
-        edge_query = edge_query.filter(models.GeneInteraction.correlation >= minCorrelation)
-
-    # Sorting edges
-    if edgeSorting == "pValue":
-        edge_query = edge_query.order_by(models.GeneInteraction.p_value.asc())
-    elif edgeSorting == "mscor":
-        edge_query = edge_query.order_by(models.GeneInteraction.mscor.desc())
-    elif edgeSorting == "correlation":
-        edge_query = edge_query.order_by(models.GeneInteraction.correlation.desc())
-    else: 
+        edge_cutoffs.append(("correlation", ">=", minCorrelation))
+    edge_query = edge_query.filter(*columnar.where(models.GeneInteraction, edge_cutoffs))
+
+    # Sorting edges, ties in the order of the primary key
+    if edgeSorting not in EDGE_SORTING:
         raise ValueError("Invalid edge sorting key. Choose one of 'pValue', 'mscor', 'correlation'")
-    
-    # edge pagination 
-    edge_query = edge_query.offset(offsetEdges).limit(maxEdges)
+    sort_column, descending = EDGE_SORTING[edgeSorting]
+    order = getattr(models.GeneInteraction, sort_column)
+    order = [order.desc() if descending else order.asc(), models.GeneInteraction.interactions_genegene_ID]
+
+    if interactions is not None:
+        # the engine selects the primary keys of the page
+        mask = prefiltered & interactions.mask(nodes=node_gene_ids, both=True, cutoffs=edge_cutoffs)
+        IDs = interactions.select(mask, sort_column, descending, offsetEdges, maxEdges)
+        edge_query = db.select(models.GeneInteraction) \
+            .filter(models.GeneInteraction.interactions_genegene_ID.in_(IDs)) \
+            .order_by(*order)
+    else:
+        # edge pagination
+        edge_query = edge_query.order_by(*order).offset(offsetEdges).limit(maxEdges)
+
+    # centralities of the returned nodes with all interactions between them that pass the edge filters
+    centralities = None
+    if centrality == "subnetwork":
+        centralities = subnetwork_centralities("gene", sponge_db_version,
+                                               [(node.sponge_run_ID, node.gene_ID) for node in nodes],
+                                               cutoffs + edge_cutoffs)
+
+    if format == "compact":
+        return levels.compact_network(levels.GENE, edge_query, nodes, sponge_db_version, centralities)
 
     # Execute queries
-    node_results = db.session.execute(node_query).scalars().all()
-    edge_results = db.session.execute(edge_query).scalars().all()
+    edge_results = db.session.execute(edge_query.options(*models.eager_load_options(edge_schema))).scalars().all()
 
     # Return results
-    return jsonify({
-        "edges": models.GeneInteractionDatasetLongSchema(many=True).dump(edge_results),
-        "nodes": models.networkAnalysisSchema(many=True).dump(node_results),
-    })
\ No newline at end of file
+    response = {
+        "edges": edge_schema.dump(edge_results),
+        "nodes": node_schema.dump([node[0] for node in nodes]),
+    }
+    if centralities is not None:
+        values, approximate = centralities
+        for dumped, node in zip(response["nodes"], nodes):
+            dumped.update({name: value for name, value in values[(node.sponge_run_ID, node.gene_ID)].items()
+                           if name in dumped})
+        response["centrality"] = {"scope": "subnetwork", "approximate": approximate}
+    return jsonify(response)
\ No newline at end of file
@@ -1,5 +1,6 @@
 from flask import jsonify
 import app.models as models
+from app import identifiers, idsets
 from gseapy.plot import GSEAPlot
 import base64
 import io 
@@ -214,7 +215,7 @@ def gsea_results(dataset_ID_1: int = None, dataset_ID_2: int = None, disease_nam
         }), 200
 
 
-@cache.cached(query_string=True)
+@cache.cached(query_string=True, coalesce=True)
 def gsea_plot(dataset_ID_1: int = None, dataset_ID_2: int = None, disease_name_1=None, disease_name_2=None, disease_subtype_1=None, disease_subtype_2=None, condition_1=None, condition_2=None, term=None, gene_set=None, sponge_db_version: int = LATEST):
     """
     This function responds to a request for /gseaPlot
@@ -275,14 +276,12 @@ def gsea_plot(dataset_ID_1: int = None, dataset_ID_2: int = None, disease_name_1
     if len(gsea) > 0:
         gsea = models.GseaSchemaPlot(many=True).dump(gsea)
 
-        gene_map = models.Gene.query \
-            .filter(models.Gene.gene_ID.in_([x.gene_ID for x in gsea[0]["gsea_ranking_genes"]])) \
-            .all()                                                               # There are some gene symbols with multiple entries in the gene table
+        gene_map = identifiers.genes().records([x.gene_ID for x in gsea[0]["gsea_ranking_genes"]])  # There are some gene symbols with multiple entries in the gene table
         ranking_gene_ids = {x.gene_symbol: x.gene_ID for x in gene_map}.values() # both ids are present with identical values in the diff expr. table, but only one is needed
 
         de = models.DifferentialExpression.query \
             .filter(models.DifferentialExpression.comparison_ID == comparison_ID) \
-            .filter(models.DifferentialExpression.gene_ID.in_(ranking_gene_ids)) \
+            .filter(idsets.member(models.DifferentialExpression.gene_ID, ranking_gene_ids)) \
             .all()
 
         de = models.DESchemaShort(many=True).dump(de)
@@ -0,0 +1,251 @@
+"""
+The gene and transcript levels of the ceRNA network. The interaction endpoints of both levels share the
+helpers below, parameterised by a Level instead of written out once per model.
+"""
+
+from collections import namedtuple
+from functools import partial
+
+from flask import jsonify
+from sqlalchemy import and_, false, func, or_, union
+
+from app.controllers.dataset import _run_catalog, _run_subset
+import app.models as models
+from app import compact, identifiers, idsets
+from app.config import db
+
+Level = namedtuple("Level", [
+    "table",                  # "gene" / "transcript"
+    "index",                  # identifier index of app/identifiers.py
+    "identifier",             # public identifier (ensg_number / enst_number)
+    "node_ID",                # primary key of the gene / transcript
+    "node_schema",            # short schema of a gene / transcript
+    "interaction",            # interaction model
+    "primary_key",            # primary key of the interaction
+    "node1",                  # endpoint columns of the interaction (canonical order: node1 < node2)
+    "node2",
+    "edge_keys",              # names of the endpoints in the compact format
+    "edge_schema",            # short schema of an interaction
+    "adjacency",              # adjacency model, one row per endpoint of an interaction
+    "adjacency_node",
+    "adjacency_interaction",
+    "lookup_schema",          # schema of the lookup table of the compact format
+    "gene_ID",                # gene of a transcript (transcripts refer to the genes table), None for genes
+    "analysis",               # network analysis model, one row per node of a run
+    "analysis_ID",            # primary key of the network analysis
+])
+
+# nodeSorting keys of the network endpoints, see sort_nodes
+NODE_SORTING = ("betweenness", "node_degree", "eigenvector")
+
+GENE = Level("gene", identifiers.genes, "ensg_number", models.Gene.gene_ID, models.GeneSchemaShort,
+             models.GeneInteraction, models.GeneInteraction.interactions_genegene_ID,
+             models.GeneInteraction.gene_ID1, models.GeneInteraction.gene_ID2, ("gene1", "gene2"),
+             models.GeneInteractionDatasetShortSchema,
+             models.GeneInteractionAdjacency, models.GeneInteractionAdjacency.gene_ID,
+             models.GeneInteractionAdjacency.interactions_genegene_ID,
+             partial(models.GeneSchema, many=True), None,
+             models.networkAnalysis, models.networkAnalysis.network_analysis_gene_ID)
+TRANSCRIPT = Level("transcript", identifiers.transcripts, "enst_number", models.Transcript.transcript_ID,
+                   models.TranscriptSchemaShort, models.TranscriptInteraction,
+                   models.TranscriptInteraction.interactions_transcripttranscript_ID,
+                   models.TranscriptInteraction.transcript_ID_1, models.TranscriptInteraction.transcript_ID_2,
+                   ("transcript_1", "transcript_2"), models.TranscriptInteractionDatasetShortSchema,
+                   models.TranscriptInteractionAdjacency, models.TranscriptInteractionAdjacency.transcript_ID,
+                   models.TranscriptInteractionAdjacency.interactions_transcripttranscript_ID,
+                   partial(models.TranscriptSchema, exclude=("gene",), many=True), models.Transcript.gene_ID,
+                   models.networkAnalysisTranscript, models.networkAnalysisTranscript.network_analysis_transcript_ID)
+
+
+def indexed_runs(level, sponge_db_version):
+    """
+    Runs are indexed in the adjacency table at ingestion (see otherStuff/scripts/fillDataBase.R and
+    otherStuff/scripts/canonical_interactions.sql), runs imported otherwise are not.
+    :param level: GENE or TRANSCRIPT
+    :param sponge_db_version: version of the sponge database
+    :return: frozenset of the runs of the version that have rows in the adjacency table, looked up once per
+        version and data release (see dataset._run_subset)
+    """
+    return _run_subset(level.table + "_adjacency", sponge_db_version, lambda run_IDs: db.select(
+        level.adjacency.sponge_run_ID).where(level.adjacency.sponge_run_ID.in_(run_IDs)).distinct())
+
+
+def interactions_of(level, sponge_db_version, run_IDs, node_IDs):
+    """
+    Interactions of indexed runs are found with one range scan over the adjacency table instead of an
+    OR over both endpoints; runs without adjacency rows fall back to the OR.
+    :param level: GENE or TRANSCRIPT
+    :param sponge_db_version: version of the sponge database
+    :param run_IDs: sponge_run_IDs of interest (of the version)
+    :param node_IDs: gene_IDs / transcript_IDs of which at least one endpoint must be part of (IDs, IDSet or
+        select, see app/idsets.py)
+    :return: filter for the interaction model of the level
+    """
+    node_IDs = idsets.as_set(node_IDs)
+    indexed = indexed_runs(level, sponge_db_version).intersection(run_IDs)
+    missing = [run_ID for run_ID in run_IDs if run_ID not in indexed]
+
+    conditions = []
+    if indexed:
+        # explicit parameter names: the generated ones ("transcript_ID_1") clash with the parameters of
+        # filters on the column TranscriptInteraction.transcript_ID_1 in the same statement
+        conditions.append(level.primary_key.in_(
+            db.select(level.adjacency_interaction)
+            .where(level.adjacency.sponge_run_ID.in_(sorted(indexed)),
+                   node_IDs.filter(level.adjacency_node, name=f"adjacency_{level.table}_IDs"))))
+    if missing:
+        conditions.append(and_(level.interaction.sponge_run_ID.in_(missing),
+                               or_(node_IDs.filter(level.node1, name=f"endpoint1_{level.table}_IDs"),
+                                   node_IDs.filter(level.node2, name=f"endpoint2_{level.table}_IDs"))))
+    return or_(*conditions) if conditions else false()
+
+
+def presence_matrix(level, sponge_db_version, dataset_ID, node_IDs, labels):
+    """
+    Gene / transcript x run presence matrix, answered by one grouped query over the adjacency table (over both
+    endpoints of the interactions for runs without adjacency rows).
+    :param level: GENE or TRANSCRIPT
+    :param sponge_db_version: version of the sponge database
+    :param dataset_ID: only runs of this dataset if given
+    :param node_IDs: gene_IDs / transcript_IDs of interest
+    :param labels: dict ID -> identifier shown in the response
+    :return: one entry per run of the database version, "genes" / "transcripts" flags for each gene / transcript
+        whether it has at least one interaction in the run, "include" whether any of them has
+    """
+    runs = [r for r in _run_catalog(sponge_db_version) if dataset_ID is None or r.dataset_ID == int(dataset_ID)]
+
+    run_IDs = [r.sponge_run_ID for r in runs]
+    indexed = indexed_runs(level, sponge_db_version).intersection(run_IDs)
+    missing = [run_ID for run_ID in run_IDs if run_ID not in indexed]
+    queries = []
+    if indexed:
+        queries.append(db.select(level.adjacency.sponge_run_ID, level.adjacency_node)
+                       .where(level.adjacency.sponge_run_ID.in_(sorted(indexed)), level.adjacency_node.in_(node_IDs))
+                       .group_by(level.adjacency.sponge_run_ID, level.adjacency_node))
+    if missing:
+        queries += [db.select(level.interaction.sponge_run_ID, node)
+                    .where(level.interaction.sponge_run_ID.in_(missing), node.in_(node_IDs))
+                    .group_by(level.interaction.sponge_run_ID, node) for node in (level.node1, level.node2)]
+
+    present = {}
+    rows = db.session.execute(union(*queries)) if len(queries) > 1 else \
+        db.session.execute(queries[0]) if queries else []
+    for sponge_run_ID, node_ID in rows:
+        present.setdefault(sponge_run_ID, set()).add(node_ID)
+
+    result = []
+    for r in runs:
+        included = present.get(r.sponge_run_ID, set())
+        flags = {}
+        for node_ID in node_IDs:
+            flags[labels[node_ID]] = max(flags.get(labels[node_ID], 0), int(node_ID in included))
+        result.append({"data_origin": r.data_origin, "disease_name": r.disease_name, "disease_subtype": r.disease_subtype,
+                       "sponge_run_ID": r.sponge_run_ID, "include": int(len(included) > 0), level.table + "s": flags})
+    return result
+
+
+def unranked_runs(level, sponge_db_version):
+    """
+    Centrality ranks are filled at ingestion (see otherStuff/scripts/centrality_ranks.sql), runs imported
+    afterwards have NULL ranks until the script runs again.
+    :param level: GENE or TRANSCRIPT
+    :param sponge_db_version: version of the sponge database
+    :return: frozenset of the runs of the version with nodes without ranks, looked up once per version and data
+        release (see dataset._run_subset)
+    """
+    analysis = level.analysis
+    return _run_subset(level.table + "_unranked", sponge_db_version, lambda run_IDs: db.select(
+        analysis.sponge_run_ID).where(analysis.sponge_run_ID.in_(run_IDs), analysis.combined_rank.is_(None)).distinct())
+
+
+def sort_nodes(level, node_query, sponge_db_version, run_IDs, keys):
+    """
+    Sorts nodes by their precomputed ranks in the run (see otherStuff/scripts/centrality_ranks.sql), by the mean
+    of the ranks for more than one key, ties by primary key. Ranked runs are ordered by the rank columns
+    themselves, so a single key (or all three, the combined rank) is read in the order of its index on
+    (sponge_run_ID, rank). Only if a run has nodes without ranks, these are ranked by window functions over the
+    unranked nodes of their run and the order is an expression over both, sorted as a whole.
+    :param level: GENE or TRANSCRIPT
+    :param node_query: select of the network analysis of the level
+    :param sponge_db_version: version of the sponge database
+    :param run_IDs: sponge_run_IDs of the nodes (of the version)
+    :param keys: nodeSorting keys, see NODE_SORTING
+    :return: node_query ordered by the ranks
+    """
+    analysis = level.analysis
+    keys = [key for key in NODE_SORTING if key in keys]
+    unranked = unranked_runs(level, sponge_db_version).intersection(run_IDs)
+    if not unranked:
+        ranks = [analysis.combined_rank] if len(keys) == len(NODE_SORTING) else \
+            [getattr(analysis, key + "_rank") for key in keys]
+        # the sum of two ranks orders like their mean
+        return node_query.order_by(sum(ranks[1:], ranks[0]), level.analysis_ID)
+
+    computed = db.select(level.analysis_ID.label("ID"), *[
+        func.rank().over(partition_by=analysis.sponge_run_ID, order_by=getattr(analysis, key).desc()).label(key)
+        for key in keys
+    ]).where(analysis.sponge_run_ID.in_(sorted(unranked)), analysis.combined_rank.is_(None)).subquery("computed_ranks")
+    if len(keys) == len(NODE_SORTING):
+        rank = func.coalesce(analysis.combined_rank, sum(computed.c[key] for key in keys) / 3.0)
+    else:
+        # the sum of two ranks orders like their mean
+        ranks = [func.coalesce(getattr(analysis, key + "_rank"), computed.c[key]) for key in keys]
+        rank = sum(ranks[1:], ranks[0])
+    return node_query.outerjoin(computed, computed.c.ID == level.analysis_ID).order_by(rank, level.analysis_ID)
+
+
+def compact_network(level, edge_query, nodes, sponge_db_version, centralities=None):
+    """
+    Network in the compact format (see app/compact.py), the edges and nodes are read as plain columns.
+    Transcripts refer to their gene by its position in the genes table.
+    :param level: GENE or TRANSCRIPT
+    :param edge_query: select of the edges with all filters, sorting and pagination applied
+    :param nodes: rows of the nodes (ID, sponge_run_ID, betweenness, eigenvector, node_degree)
+    :param sponge_db_version: version of the sponge database
+    :param centralities: values of the nodes in the subnetwork replacing those of the nodes, see app/centrality.py
+    :return: lookup tables of the genes (and transcripts), runs and datasets and the edges and nodes as parallel arrays
+    """
+    node1, node2, node_ID = level.node1.key, level.node2.key, level.node_ID.key
+    edges = db.session.execute(edge_query.with_only_columns(
+        level.node1, level.node2, level.interaction.sponge_run_ID, level.interaction.correlation,
+        level.interaction.mscor, level.interaction.p_value)).all()
+
+    node_IDs = {getattr(e, node1) for e in edges} | {getattr(e, node2) for e in edges} | {getattr(n, node_ID) for n in nodes}
+    rows = level.node_ID.class_.query \
+        .filter(idsets.member(level.node_ID, node_IDs)) \
+        .order_by(level.node_ID) \
+        .all()
+    table, positions = compact.lookup_table(level.lookup_schema(), rows, node_ID)
+    runs, datasets, run_positions = compact.run_tables(
+        _run_catalog(sponge_db_version), [e.sponge_run_ID for e in edges] + [n.sponge_run_ID for n in nodes])
+
+    response = {
+        "format": "compact",
+        level.table + "s": table,
+        "runs": runs,
+        "datasets": datasets,
+        "edges": compact.encode(edges, {
+            level.edge_keys[0]: (node1, positions),
+            level.edge_keys[1]: (node2, positions),
+            "sponge_run": ("sponge_run_ID", run_positions),
+        }, ["correlation", "mscor", "p_value"]),
+        "nodes": compact.encode(nodes, {
+            level.table: (node_ID, positions),
+            "sponge_run": ("sponge_run_ID", run_positions),
+        }, ["betweenness", "eigenvector", "node_degree"]),
+    }
+    if level.gene_ID is not None:
+        genes = models.Gene.query \
+            .filter(idsets.member(models.Gene.gene_ID, {row.gene_ID for row in rows})) \
+            .order_by(models.Gene.gene_ID) \
+            .all()
+        response["genes"], gene_positions = compact.lookup_table(
+            models.GeneSchema(only=("ensg_number", "gene_symbol"), many=True), genes, "gene_ID")
+        for entry, row in zip(table, rows):
+            entry["gene"] = gene_positions.get(row.gene_ID)
+    if centralities is not None:
+        values, approximate = centralities
+        for name in ("betweenness", "eigenvector", "node_degree"):
+            response["nodes"][name] = [values[(n.sponge_run_ID, getattr(n, node_ID))][name] for n in nodes]
+        response["centrality"] = {"scope": "subnetwork", "approximate": approximate}
+    return jsonify(response)
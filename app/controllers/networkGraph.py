@@ -0,0 +1,251 @@
+"""
+Neighbourhood queries on the ceRNA network of one sponge run, answered with the adjacency graph of
+app/graph.py: k-hop neighbourhoods, subnetworks induced by a set of genes / transcripts and shortest
+paths connecting two sets.
+"""
+
+import numpy as np
+from flask import jsonify
+
+from app.controllers.dataset import _run_IDs
+from app.controllers.levels import GENE, TRANSCRIPT
+import app.models as models
+from app import columnar, graph
+from app.config import LATEST, db, cache
+
+MAX_HOPS = 3
+MAX_PATH_LENGTH = 6
+
+
+def _bad_request(detail):
+    return jsonify({
+        "detail": detail,
+        "status": 400,
+        "title": "Bad Request",
+        "type": "about:blank"
+    }), 400
+
+
+def _run_graph(level, sponge_db_version, disease_name, dataset_ID):
+    """
+    :return: graph of the single sponge run matching the filters or an error response
+    """
+    run_IDs = _run_IDs(sponge_db_version, disease_name=disease_name, dataset_ID=dataset_ID)
+    if len(run_IDs) == 0:
+        return None, _bad_request("No dataset with given disease_name / dataset_ID found")
+    if len(run_IDs) > 1:
+        return None, _bad_request("The disease_name matches more than one dataset. Please choose one with dataset_ID.")
+    return graph.graph(level.table, run_IDs[0]), None
+
+
+def _node_IDs(level, names, parameter):
+    """
+    :return: IDs of the genes / transcripts with the given identifiers or an error response
+    """
+    IDs = level.index().lookup(level.identifier, names or [])
+    if len(IDs) == 0:
+        return None, _bad_request(f"No {level.table} found for given {parameter}")
+    return IDs, None
+
+
+def _cutoffs(maxPValue, minMscor):
+    cutoffs = []
+    if maxPValue is not None:
+        cutoffs.append(("p_value", "<=", maxPValue))
+    if minMscor is not None:
+        cutoffs.append(("mscor", ">=", minMscor))
+    return cutoffs
+
+
+def _nodes(level, run_graph, positions):
+    """
+    :return: dict node ID -> dumped gene / transcript
+    """
+    IDs = run_graph.nodes[positions].tolist()
+    rows = db.session.execute(db.select(level.node_ID.class_)
+                              .where(level.node_ID.in_(IDs))
+                              .options(*models.eager_load_options(level.node_schema))).scalars().all()
+    schema = level.node_schema()
+    return {getattr(row, level.node_ID.key): schema.dump(row) for row in rows}
+
+
+def _edges(level, run_graph, edges, maxEdges):
+    """
+    :param edges: positions of the interactions in the columns of the run
+    :return: the most significant interactions (by p_value, then primary key), dumped
+    """
+    mask = np.zeros(len(run_graph.run), dtype=bool)
+    mask[edges] = True
+    IDs = columnar.Interactions([run_graph.run]).select(mask, "p_value", False, 0, maxEdges)
+    rows = db.session.execute(db.select(level.interaction)
+                              .where(level.primary_key.in_(IDs))
+                              .order_by(level.interaction.p_value, level.primary_key)
+                              .options(*models.eager_load_options(level.edge_schema))).scalars().all()
+    return level.edge_schema(many=True).dump(rows)
+
+
+def _neighbourhood(level, ensemblID, dataset_ID, disease_name, hops, maxPValue, minMscor, maxNodes, maxEdges,
+                   sponge_db_version):
+    if hops < 1 or hops > MAX_HOPS:
+        return _bad_request(f"hops has to be between 1 and {MAX_HOPS}")
+    if maxNodes > 1000 or maxEdges > 1000:
+        return _bad_request("Limit is to high. For a high number of needed interactions please use the download section.")
+    run_graph, error = _run_graph(level, sponge_db_version, disease_name, dataset_ID)
+    if error:
+        return error
+    IDs, error = _node_IDs(level, ensemblID, "ensemblID")
+    if error:
+        return error
+
+    allowed = run_graph.edge_mask(_cutoffs(maxPValue, minMscor))
+    positions, distances = run_graph.neighbourhood(run_graph.positions(IDs), hops, allowed, maxNodes)
+    nodes = _nodes(level, run_graph, positions)
+    return jsonify({
+        "nodes": [{level.table: nodes[ID], "distance": int(distance)}
+                  for ID, distance in zip(run_graph.nodes[positions].tolist(), distances)],
+        "edges": _edges(level, run_graph, run_graph.induced(positions, allowed), maxEdges),
+    })
+
+
+def _subnetwork(level, ensemblID, dataset_ID, disease_name, maxPValue, minMscor, maxEdges, sponge_db_version):
+    if maxEdges > 1000:
+        return _bad_request("Limit is to high. For a high number of needed interactions please use the download section.")
+    run_graph, error = _run_graph(level, sponge_db_version, disease_name, dataset_ID)
+    if error:
+        return error
+    IDs, error = _node_IDs(level, ensemblID, "ensemblID")
+    if error:
+        return error
+
+    allowed = run_graph.edge_mask(_cutoffs(maxPValue, minMscor))
+    positions = run_graph.positions(IDs)
+    nodes = _nodes(level, run_graph, positions)
+    return jsonify({
+        "nodes": [{level.table: nodes[ID]} for ID in run_graph.nodes[positions].tolist()],
+        "edges": _edges(level, run_graph, run_graph.induced(positions, allowed), maxEdges),
+    })
+
+
+def _paths(level, sources, targets, dataset_ID, disease_name, maxPValue, minMscor, maxLength, sponge_db_version):
+    if maxLength < 1 or maxLength > MAX_PATH_LENGTH:
+        return _bad_request(f"maxLength has to be between 1 and {MAX_PATH_LENGTH}")
+    run_graph, error = _run_graph(level, sponge_db_version, disease_name, dataset_ID)
+    if error:
+        return error
+    source_IDs, error = _node_IDs(level, sources, "sources")
+    if error:
+        return error
+    target_IDs, error = _node_IDs(level, targets, "targets")
+    if error:
+        return error
+
+    allowed = run_graph.edge_mask(_cutoffs(maxPValue, minMscor))
+    paths = run_graph.shortest_paths(run_graph.positions(source_IDs), run_graph.positions(target_IDs), allowed, maxLength)
+    positions = np.unique([p for path, _ in paths for p in path]).astype(np.int64)
+    nodes = _nodes(level, run_graph, positions)
+    identifier = {ID: node[level.identifier] for ID, node in nodes.items()}
+    edges = np.unique([e for _, path_edges in paths for e in path_edges]).astype(np.int64)
+    return jsonify({
+        "paths": [{"source": identifier[run_graph.nodes[path[0]]], "target": identifier[run_graph.nodes[path[-1]]],
+                   "length": len(path) - 1, level.table + "s": [identifier[run_graph.nodes[p]] for p in path]}
+                  for path, _ in paths],
+        "nodes": [{level.table: nodes[ID]} for ID in run_graph.nodes[positions].tolist()],
+        "edges": _edges(level, run_graph, edges, None),
+    })
+
+
+@cache.cached(query_string=True)
+def get_gene_neighbourhood(ensemblID, dataset_ID: int = None, disease_name=None, hops: int = 1, maxPValue=0.05,
+                           minMscor=None, maxNodes: int = 100, maxEdges: int = 100, sponge_db_version: int = LATEST):
+    """
+    This function responds to a request for /ceRNAInteraction/getGeneNeighbourhood
+    and returns all genes within the given number of hops of the given genes and the interactions between them
+    :param ensemblID: ENSG number(s) of the genes to start from
+    :param dataset_ID: dataset_ID of interest
+    :param disease_name: disease_name of interest, has to match a single dataset
+    :param hops: maximum distance to the given genes (1 to 3)
+    :param maxPValue: only interactions with a p_value <= this are followed
+    :param minMscor: only interactions with an mscor >= this are followed
+    :param maxNodes: maximum number of genes, the closest genes are returned first
+    :param maxEdges: maximum number of interactions, the most significant are returned first
+    :param sponge_db_version: version of the sponge database
+    :return: genes with their distance and the interactions between them
+    """
+    return _neighbourhood(GENE, ensemblID, dataset_ID, disease_name, hops, maxPValue, minMscor, maxNodes, maxEdges,
+                          sponge_db_version)
+
+
+@cache.cached(query_string=True)
+def get_gene_subnetwork(ensemblID, dataset_ID: int = None, disease_name=None, maxPValue=0.05, minMscor=None,
+                        maxEdges: int = 100, sponge_db_version: int = LATEST):
+    """
+    This function responds to a request for /ceRNAInteraction/getGeneSubnetwork
+    and returns the subnetwork induced by the given genes
+    :param ensemblID: ENSG number(s) of the genes of interest
+    :param dataset_ID: dataset_ID of interest
+    :param disease_name: disease_name of interest, has to match a single dataset
+    :param maxPValue: p_value cutoff (<=) of the interactions
+    :param minMscor: mscor cutoff (>=) of the interactions
+    :param maxEdges: maximum number of interactions, the most significant are returned first
+    :param sponge_db_version: version of the sponge database
+    :return: the given genes that are part of the network and the interactions between them
+    """
+    return _subnetwork(GENE, ensemblID, dataset_ID, disease_name, maxPValue, minMscor, maxEdges, sponge_db_version)
+
+
+@cache.cached(query_string=True)
+def get_gene_paths(sources, targets, dataset_ID: int = None, disease_name=None, maxPValue=0.05, minMscor=None,
+                   maxLength: int = 3, sponge_db_version: int = LATEST):
+    """
+    This function responds to a request for /ceRNAInteraction/getGenePaths
+    and returns a shortest path to every target gene from the closest source gene
+    :param sources: ENSG number(s) of the genes the paths start at
+    :param targets: ENSG number(s) of the genes the paths end at
+    :param dataset_ID: dataset_ID of interest
+    :param disease_name: disease_name of interest, has to match a single dataset
+    :param maxPValue: only interactions with a p_value <= this are followed
+    :param minMscor: only interactions with an mscor >= this are followed
+    :param maxLength: maximum number of interactions of a path (1 to 6)
+    :param sponge_db_version: version of the sponge database
+    :return: paths, the genes on them and their interactions
+    """
+    return _paths(GENE, sources, targets, dataset_ID, disease_name, maxPValue, minMscor, maxLength, sponge_db_version)
+
+
+@cache.cached(query_string=True)
+def get_transcript_neighbourhood(ensemblID, dataset_ID: int = None, disease_name=None, hops: int = 1, maxPValue=0.05,
+                                 minMscor=None, maxNodes: int = 100, maxEdges: int = 100,
+                                 sponge_db_version: int = LATEST):
+    """
+    This function responds to a request for /ceRNAInteraction/getTranscriptNeighbourhood,
+    see get_gene_neighbourhood
+    :param ensemblID: ENST number(s) of the transcripts to start from
+    :return: transcripts with their distance and the interactions between them
+    """
+    return _neighbourhood(TRANSCRIPT, ensemblID, dataset_ID, disease_name, hops, maxPValue, minMscor, maxNodes,
+                          maxEdges, sponge_db_version)
+
+
+@cache.cached(query_string=True)
+def get_transcript_subnetwork(ensemblID, dataset_ID: int = None, disease_name=None, maxPValue=0.05, minMscor=None,
+                              maxEdges: int = 100, sponge_db_version: int = LATEST):
+    """
+    This function responds to a request for /ceRNAInteraction/getTranscriptSubnetwork, see get_gene_subnetwork
+    :param ensemblID: ENST number(s) of the transcripts of interest
+    :return: the given transcripts that are part of the network and the interactions between them
+    """
+    return _subnetwork(TRANSCRIPT, ensemblID, dataset_ID, disease_name, maxPValue, minMscor, maxEdges,
+                       sponge_db_version)
+
+
+@cache.cached(query_string=True)
+def get_transcript_paths(sources, targets, dataset_ID: int = None, disease_name=None, maxPValue=0.05, minMscor=None,
+                         maxLength: int = 3, sponge_db_version: int = LATEST):
+    """
+    This function responds to a request for /ceRNAInteraction/getTranscriptPaths, see get_gene_paths
+    :param sources: ENST number(s) of the transcripts the paths start at
+    :param targets: ENST number(s) of the transcripts the paths end at
+    :return: paths, the transcripts on them and their interactions
+    """
+    return _paths(TRANSCRIPT, sources, targets, dataset_ID, disease_name, maxPValue, minMscor, maxLength,
+                  sponge_db_version)
@@ -4,10 +4,10 @@ import numpy as np
 from sklearn import manifold
 import pandas as pd
 from app.config import LATEST, cache
-from app.controllers.dataset import _dataset_query
+from app.controllers.dataset import _dataset_query, _run_catalog
 
 
-@cache.cached(query_string=True)
+@cache.cached(query_string=True, coalesce=True)
 def get_network_results(dataset_ID: int = None, disease_name="Breast invasive carcinoma",
                         level="gene", sponge_db_version=LATEST):
     """
@@ -49,9 +49,7 @@ def get_network_results(dataset_ID: int = None, disease_name="Breast invasive ca
     type_datasets = pd.DataFrame({'dataset_ID': [entry.dataset_ID for entry in dataset],
                                   'subtype': [entry.disease_subtype for entry in dataset]})
 
-    run_ids = models.SpongeRun.query \
-        .filter(models.SpongeRun.sponge_db_version == sponge_db_version) \
-        .all()
+    run_ids = _run_catalog(sponge_db_version)
 
     all_run_ids = pd.DataFrame({'sponge_run_ID': [entry.sponge_run_ID for entry in run_ids],
                                 'dataset_ID': [entry.dataset_ID for entry in run_ids]})
@@ -11,7 +11,9 @@ from sklearn import cluster
 import app.config as config
 from app.controllers.externalInformation import get_genes, get_transcripts
 import app.models as models
+from app import serialization
 from app.config import LATEST, db, logger, cache
+from app.controllers.dataset import _run_IDs
 import traceback    
 
 
@@ -41,18 +43,7 @@ def get_spongEffects_run_ID(dataset_ID: int = None, disease_name: str = None, le
     #     " LIMIT 1;"
     # ).fetchall()
 
-    query = db.select(models.SpongeRun.sponge_run_ID).join(models.Dataset, models.SpongeRun.dataset_ID == models.Dataset.dataset_ID)
-
-    # Filter for sponge_db_version
-    query = query.where(models.Dataset.sponge_db_version == sponge_db_version)
-
-    if dataset_ID is not None:
-        query = query.where(models.SpongeRun.dataset_ID == dataset_ID)
-    if disease_name is not None:
-        query = query.where(models.Dataset.disease_name.like(f"%{disease_name}%"))
-
-    # Execute the query and fetch the sponge_run_ID
-    sponge_run_IDs = db.session.execute(query).scalars().all()
+    sponge_run_IDs = _run_IDs(sponge_db_version, disease_name=disease_name, dataset_ID=dataset_ID)
 
     if len(sponge_run_IDs) == 0:
         return jsonify({
@@ -214,7 +205,7 @@ def get_enrichment_score_class_distributions(dataset_ID: int = None, disease_nam
 
 @cache.cached(query_string=True)
 def get_gene_modules(spongEffects_gene_module_ID: int = None, dataset_ID: int = None, disease_name: str = None, gene_ID: str = None, ensg_number: str = None, gene_symbol: str = None, limit: int = None, offset: int = None, 
-                     m_scor_threshold: float = None, p_adj_threshold: float = None, modules_cutoff = None, 
+                     m_scor_threshold: float = None, p_adj_threshold: float = None, modules_cutoff = None, fields=None,
                      sponge_db_version: int = LATEST):
     """
     API request for /spongEffects/getSpongEffectsGeneModules
@@ -229,9 +220,15 @@ def get_gene_modules(spongEffects_gene_module_ID: int = None, dataset_ID: int =
     :param m_scor_threshold: Minimum m_scor threshold
     :param p_adj_threshold: Minimum p_adj threshold
     :param modules_cutoff: Minimum number of modules
+    :param fields: Fields of the response (dotted paths for nested fields), all if None
     :param sponge_db_version: Database version (defaults to most recent version)
     :return: Best spongEffects gene modules for given disease
     """
+    try:
+        schema = serialization.project(models.SpongEffectsGeneModuleSchema, fields, many=True)
+    except serialization.InvalidFields as e:
+        return serialization.invalid_fields(e)
+
     # get spongEffects_run_ID
     spongEffects_params = {
         "m_scor_threshold": m_scor_threshold,
@@ -248,7 +245,8 @@ def get_gene_modules(spongEffects_gene_module_ID: int = None, dataset_ID: int =
     query = db.select(models.SpongEffectsGeneModule) \
         .where(models.SpongEffectsGeneModule.spongEffects_run_ID.in_(spongEffects_run_IDs)) \
         .where(models.SpongEffectsGeneModule.gene_ID.in_(gene_IDs)) \
-        .order_by(models.SpongEffectsGeneModule.mean_accuracy_decrease.desc(), models.SpongEffectsGeneModule.mean_accuracy_decrease.desc())
+        .order_by(models.SpongEffectsGeneModule.mean_accuracy_decrease.desc(), models.SpongEffectsGeneModule.mean_accuracy_decrease.desc()) \
+        .options(*models.eager_load_options(schema))
 
     if spongEffects_gene_module_ID is not None:
         query = query.where(models.SpongEffectsGeneModule.spongEffects_gene_module_ID == spongEffects_gene_module_ID)
@@ -261,13 +259,13 @@ def get_gene_modules(spongEffects_gene_module_ID: int = None, dataset_ID: int =
     query = db.session.execute(query).scalars().all()
 
     if len(query) > 0:
-        return models.SpongEffectsGeneModuleSchema(many=True).dump(query)
+        return schema.dump(query)
     else:
         return []
 
 
 @cache.cached(query_string=True)
-def get_gene_module_members(spongEffects_gene_module_ID: int = None, dataset_ID: int = None, disease_name: str = None, gene_ID: str = None, ensg_number: str = None, gene_symbol: str = None, limit: int = None, offset: int = None, sponge_db_version: int = LATEST):
+def get_gene_module_members(spongEffects_gene_module_ID: int = None, dataset_ID: int = None, disease_name: str = None, gene_ID: str = None, ensg_number: str = None, gene_symbol: str = None, limit: int = None, offset: int = None, fields=None, sponge_db_version: int = LATEST):
     """
     API request for /spongEffects/getSpongEffectsGeneModuleMembers
     :param spongEffects_gene_module_ID: Gene module ID as string
@@ -278,9 +276,15 @@ def get_gene_module_members(spongEffects_gene_module_ID: int = None, dataset_ID:
     :param gene_symbol: Gene symbol
     :param limit: Limit for the number of results
     :param offset: Offset for the number of results
+    :param fields: Fields of the response (dotted paths for nested fields), all if None
     :param sponge_db_version: Database version (defaults to most recent version)
     :return: spongEffects gene module members for given disease and gene identifier
     """
+    try:
+        schema = serialization.project(models.SpongEffectsGeneModuleMembersSchema, fields, many=True)
+    except serialization.InvalidFields as e:
+        return serialization.invalid_fields(e)
+
     # get the modules using get_gene_modules
     modules = get_gene_modules(spongEffects_gene_module_ID, dataset_ID, disease_name, gene_ID, ensg_number, gene_symbol, sponge_db_version)
     module_IDs = [module['spongEffects_gene_module_ID'] for module in modules]
@@ -294,7 +298,8 @@ def get_gene_module_members(spongEffects_gene_module_ID: int = None, dataset_ID:
 
     # get the members
     query = db.select(models.SpongEffectsGeneModuleMembers) \
-        .where(models.SpongEffectsGeneModuleMembers.spongEffects_gene_module_ID.in_(module_IDs))
+        .where(models.SpongEffectsGeneModuleMembers.spongEffects_gene_module_ID.in_(module_IDs)) \
+        .options(*models.eager_load_options(schema))
 
     # # get the members directly by joins (this is slower):
     # query = db.select(models.SpongEffectsGeneModuleMembers) \
@@ -320,7 +325,7 @@ def get_gene_module_members(spongEffects_gene_module_ID: int = None, dataset_ID:
     data = db.session.execute(query).scalars().all()
     
     if len(data) > 0:
-        return models.SpongEffectsGeneModuleMembersSchema(many=True).dump(data)
+        return schema.dump(data)
     else:
         return jsonify({
             "detail": "No module members found for given disease name and gene identifier",
@@ -387,7 +392,7 @@ def get_gene_module_enrichment_score(spongEffects_gene_module_ID: list[int], clu
 
 @cache.cached(query_string=True)
 def get_transcript_modules(spongEffects_transcript_module_ID: int = None, dataset_ID: int = None, disease_name: str = None, gene_ID: str = None, ensg_number: str = None, gene_symbol: str = None, transcript_ID: int = None, enst_number: int = None, limit: int = None, offset: int = None, 
-                           m_scor_threshold: float = None, p_adj_threshold: float = None, modules_cutoff = None, 
+                           m_scor_threshold: float = None, p_adj_threshold: float = None, modules_cutoff = None, fields=None,
                            sponge_db_version: int = LATEST):
     """
     API request for /spongEffects/getSpongEffectsTranscriptModules
@@ -404,9 +409,15 @@ def get_transcript_modules(spongEffects_transcript_module_ID: int = None, datase
     :param m_scor_threshold: Minimum m_scor threshold
     :param p_adj_threshold: Minimum p_adj threshold
     :param modules_cutoff: Minimum number of modules
+    :param fields: Fields of the response (dotted paths for nested fields), all if None
     :param sponge_db_version: Database version (defaults to most recent version)
     :return: module hub elements for a given disease and level
     """
+    try:
+        schema = serialization.project(models.SpongEffectsTranscriptModuleSchema, fields, many=True)
+    except serialization.InvalidFields as e:
+        return serialization.invalid_fields(e)
+
 
     # get spongEffects_run_ID
     spongEffects_params = {
@@ -423,7 +434,8 @@ def get_transcript_modules(spongEffects_transcript_module_ID: int = None, datase
     query = db.select(models.SpongEffectsTranscriptModule) \
         .where(models.SpongEffectsTranscriptModule.spongEffects_run_ID.in_(spongEffects_run_IDs)) \
         .where(models.SpongEffectsTranscriptModule.transcript_ID.in_(transcript_IDs)) \
-        .order_by(models.SpongEffectsTranscriptModule.mean_accuracy_decrease.desc(), models.SpongEffectsTranscriptModule.mean_accuracy_decrease.desc())
+        .order_by(models.SpongEffectsTranscriptModule.mean_accuracy_decrease.desc(), models.SpongEffectsTranscriptModule.mean_accuracy_decrease.desc()) \
+        .options(*models.eager_load_options(schema))
 
     if spongEffects_transcript_module_ID is not None:
         modules_query = modules_query.where(models.SpongEffectsTranscriptModule.spongEffects_transcript_module_ID == spongEffects_transcript_module_ID)
@@ -436,13 +448,13 @@ def get_transcript_modules(spongEffects_transcript_module_ID: int = None, datase
     query = db.session.execute(query).scalars().all()
 
     if len(query) > 0:
-        return models.SpongEffectsTranscriptModuleSchema(many=True).dump(query)
+        return schema.dump(query)
     else:
         return []
 
 
 @cache.cached(query_string=True)
-def get_transcript_module_members(spongEffects_transcript_module_ID: int = None, dataset_ID: int = None, disease_name: str = None, gene_ID: int = None, ensg_number: str = None, gene_symbol: str = None, transcript_ID: int = None, enst_number: str = None, limit: int = None, offset: int = None, sponge_db_version: int = LATEST):
+def get_transcript_module_members(spongEffects_transcript_module_ID: int = None, dataset_ID: int = None, disease_name: str = None, gene_ID: int = None, ensg_number: str = None, gene_symbol: str = None, transcript_ID: int = None, enst_number: str = None, limit: int = None, offset: int = None, fields=None, sponge_db_version: int = LATEST):
     """
     API request for /spongEffects/getTranscriptModuleMembers
     :param spongEffects_transcript_module_ID: Transcript module ID as string
@@ -455,9 +467,15 @@ def get_transcript_module_members(spongEffects_transcript_module_ID: int = None,
     :param enst_number: ENST number of transcript
     :param limit: Limit for the number of results
     :param offset: Offset for the number of results
+    :param fields: Fields of the response (dotted paths for nested fields), all if None
     :param sponge_db_version: Database version (defaults to most recent version)
     :return: spongEffects transcript module members for given disease and gene identifier    
     """
+    try:
+        schema = serialization.project(models.SpongEffectsTranscriptModuleMembersSchema, fields, many=True)
+    except serialization.InvalidFields as e:
+        return serialization.invalid_fields(e)
+
     limit = request.args.get('limit', default=100, type=int)
 
     # get the modules using get_transcript_modules
@@ -474,7 +492,8 @@ def get_transcript_module_members(spongEffects_transcript_module_ID: int = None,
 
     # get the members
     query = db.select(models.SpongEffectsTranscriptModuleMembers) \
-        .where(models.SpongEffectsTranscriptModuleMembers.spongEffects_transcript_module_ID.in_(module_IDs))
+        .where(models.SpongEffectsTranscriptModuleMembers.spongEffects_transcript_module_ID.in_(module_IDs)) \
+        .options(*models.eager_load_options(schema))
 
     # add limit to the query
     if limit is not None:
@@ -485,7 +504,7 @@ def get_transcript_module_members(spongEffects_transcript_module_ID: int = None,
     data = db.session.execute(query).scalars().all()
 
     if len(data) > 0:
-        return models.SpongEffectsTranscriptModuleMembersSchema(many=True).dump(data)
+        return schema.dump(data)
     else:
         return jsonify({
             "detail": "No module members found for given disease name and gene identifier",
@@ -1,5 +1,6 @@
 from flask import jsonify
 import app.models as models
+from app import identifiers
 from app.config import LATEST, db, cache
 from app.controllers.dataset import _dataset_query
 
@@ -90,20 +91,15 @@ def get_survival_rate(dataset_ID: int = None, disease_name: str = None, disease_
             "type": "about:blank"
         }), 400
 
-    gene = []
+    gene_IDs = []
     queries = []
     # if ensg_numer is given for specify gene, get the intern gene_ID(primary_key) for requested ensg_nr(gene_ID)
     if ensg_number is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.ensg_number.in_(ensg_number)) \
-            .all()
+        gene_IDs = identifiers.genes().lookup("ensg_number", ensg_number)
     elif gene_symbol is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.gene_symbol.in_(gene_symbol)) \
-            .all()
+        gene_IDs = identifiers.genes().lookup("gene_symbol", gene_symbol)
 
-    if len(gene) > 0:
-        gene_IDs = [i.gene_ID for i in gene]
+    if len(gene_IDs) > 0:
         # save all needed queries to get correct results
         queries.append(models.SurvivalRate.gene_ID.in_(gene_IDs))
     else:
@@ -150,6 +146,7 @@ def get_survival_rate(dataset_ID: int = None, disease_name: str = None, disease_
 
     result = models.SurvivalRate.query \
         .filter(*queries) \
+        .options(*models.eager_load_options(models.SurvivalRateSchema)) \
         .all()
 
     if len(result) > 0:
@@ -193,20 +190,15 @@ def get_survival_pValue(dataset_ID: int = None, disease_name: str = None, diseas
             "type": "about:blank"
         }), 400
 
-    gene = []
+    gene_IDs = []
     queries = []
     # if ensg_numer is given for specify gene, get the intern gene_ID(primary_key) for requested ensg_nr(gene_ID)
     if ensg_number is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.ensg_number.in_(ensg_number)) \
-            .all()
+        gene_IDs = identifiers.genes().lookup("ensg_number", ensg_number)
     elif gene_symbol is not None:
-        gene = models.Gene.query \
-            .filter(models.Gene.gene_symbol.in_(gene_symbol)) \
-            .all()
+        gene_IDs = identifiers.genes().lookup("gene_symbol", gene_symbol)
 
-    if len(gene) > 0:
-        gene_IDs = [i.gene_ID for i in gene]
+    if len(gene_IDs) > 0:
         # save all needed queries to get correct results
         queries.append(models.SurvivalPValue.gene_ID.in_(gene_IDs))
     else:
@@ -2,9 +2,11 @@ import sqlalchemy as sa
 import os
 from flask import jsonify
 from sqlalchemy import desc, and_
-from sqlalchemy.sql import text
-from app.controllers.dataset import _dataset_query
+from app.controllers.dataset import _run_IDs
+from app.controllers import levels
 import app.models as models
+from app import columnar, identifiers, idsets, pagination, serialization
+from app.centrality import subnetwork_centralities
 from app.config import LATEST, db, cache
 
 
@@ -13,7 +15,8 @@ def read_all_transcripts(dataset_ID: int = None, disease_name=None, enst_number=
                          pValueDirection="<",
                          mscor=None,
                          mscorDirection="<", correlation=None, correlationDirection="<", sorting=None,
-                         descending=True, limit=100, offset=0, information=True, sponge_db_version: int = LATEST):
+                         descending=True, limit=100, offset=0, cursor=None, information=True, fields=None,
+                         sponge_db_version: int = LATEST):
     """
     This function responds to a request for /ceRNAInteraction/findAllTranscripts
     and returns all interactions the given identification (enst_number) in all available datasets is in involved
@@ -32,7 +35,9 @@ def read_all_transcripts(dataset_ID: int = None, disease_name=None, enst_number=
     :param descending: should the results be sorted in descending or ascending order
     :param limit: number of results that shouls be shown
     :param offset: startpoint from where results should be shown
+    :param cursor: cursor of the previous page (X-Next-Cursor header), replaces offset
     :param information: defines if each transcript should contain all available information or not (default: True, if False: just enst_nr will be shown)
+    :param fields: fields of the response (dotted paths for nested fields), all if None
     :return: all interactions given transcript is involved
     """
 
@@ -45,27 +50,12 @@ def read_all_transcripts(dataset_ID: int = None, disease_name=None, enst_number=
             "type": "about:blank"
         }), 400
 
-    queries_1 = []
-    queries_2 = []
-
-    # filter for database version
-    run = models.SpongeRun.query \
-        .filter(models.SpongeRun.sponge_db_version == sponge_db_version)
-
-    # if specific disease_name is given:
-    if disease_name is not None:
-        run = run.join(models.Dataset, models.Dataset.dataset_ID == models.SpongeRun.dataset_ID) \
-            .filter(models.Dataset.disease_name.like("%" + disease_name + "%"))
-
-    if dataset_ID is not None:
-        run = run.filter(models.SpongeRun.dataset_ID == dataset_ID)
+    queries = []
 
-    run = run.all()
+    run_IDs = _run_IDs(sponge_db_version, disease_name=disease_name, dataset_ID=dataset_ID)
 
-    if len(run) > 0:
-        run_IDs = [i.sponge_run_ID for i in run]
-        queries_1.append(models.TranscriptInteraction.sponge_run_ID.in_(run_IDs))
-        queries_2.append(models.TranscriptInteraction.sponge_run_ID.in_(run_IDs))
+    if len(run_IDs) > 0:
+        queries.append(models.TranscriptInteraction.sponge_run_ID.in_(run_IDs))
     else:
         return jsonify({
             "detail": "No dataset with given disease_name found",
@@ -74,21 +64,17 @@ def read_all_transcripts(dataset_ID: int = None, disease_name=None, enst_number=
             "type": "about:blank"
         }), 400
 
-    transcript = []
+    transcript_IDs = None
     if enst_number is not None:
-        transcript = models.Transcript.query \
-            .filter(models.Transcript.enst_number.in_(enst_number)) \
-            .all()
+        transcript_IDs = idsets.IDSet(identifiers.transcripts().lookup("enst_number", enst_number))
     elif transcript_type is not None:
-        transcript = models.Transcript.query \
-            .filter(models.Transcript.transcript_type == transcript_type) \
-            .all()
+        # tens of thousands of transcripts per type: the select is pushed down instead of its transcript_IDs
+        transcript_IDs = idsets.IDSet(query=db.select(models.Transcript.transcript_ID)
+                                      .where(models.Transcript.transcript_type == transcript_type))
 
-    if enst_number is not None or transcript_type is not None:
-        if len(transcript) > 0:
-            transcript_IDs = [t.transcript_ID for t in transcript]
-            queries_1.append(models.TranscriptInteraction.transcript_ID_1.in_(transcript_IDs))
-            queries_2.append(models.TranscriptInteraction.transcript_ID_2.in_(transcript_IDs))
+    if transcript_IDs is not None:
+        if not transcript_IDs.is_empty():
+            queries.append(levels.interactions_of(levels.TRANSCRIPT, sponge_db_version, run_IDs, transcript_IDs))
 
         else:
             return jsonify({
@@ -99,29 +85,14 @@ def read_all_transcripts(dataset_ID: int = None, disease_name=None, enst_number=
             }), 400
 
     # filter depending on given statistics cutoffs
+    cutoffs = []
     if pValue is not None:
-        if pValueDirection == "<":
-            queries_1.append(models.TranscriptInteraction.p_value <= pValue)
-            queries_2.append(models.TranscriptInteraction.p_value <= pValue)
-        else:
-            queries_1.append(models.TranscriptInteraction.p_value >= pValue)
-            queries_2.append(models.TranscriptInteraction.p_value >= pValue)
-
+        cutoffs.append(("p_value", "<=" if pValueDirection == "<" else ">=", pValue))
     if mscor is not None:
-        if mscorDirection == "<":
-            queries_1.append(models.TranscriptInteraction.mscor <= mscor)
-            queries_2.append(models.TranscriptInteraction.mscor <= mscor)
-        else:
-            queries_1.append(models.TranscriptInteraction.mscor >= mscor)
-            queries_2.append(models.TranscriptInteraction.mscor >= mscor)
-
+        cutoffs.append(("mscor", "<=" if mscorDirection == "<" else ">=", mscor))
     if correlation is not None:
-        if correlationDirection == "<":
-            queries_1.append(models.TranscriptInteraction.correlation <= correlation)
-            queries_2.append(models.TranscriptInteraction.correlation <= correlation)
-        else:
-            queries_1.append(models.TranscriptInteraction.correlation >= correlation)
-            queries_2.append(models.TranscriptInteraction.correlation >= correlation)
+        cutoffs.append(("correlation", "<=" if correlationDirection == "<" else ">=", correlation))
+    queries += columnar.where(models.TranscriptInteraction, cutoffs)
 
     # add all sorting if given:
     sort = []
@@ -142,22 +113,34 @@ def read_all_transcripts(dataset_ID: int = None, disease_name=None, enst_number=
             else:
                 sort.append(models.TranscriptInteraction.correlation.asc())
 
-    interaction_results = models.TranscriptInteraction.query \
-        .filter(*queries_1) \
-        .order_by(*sort) \
-        .union(models.TranscriptInteraction.query
-               .filter(*queries_2)
-               .order_by(*sort)) \
-        .slice(offset, offset + limit) \
-        .all()
-
-    if len(interaction_results) > 0:
+    try:
         if information:
             # Serialize the data for the response depending on parameter all
-            schema = models.TranscriptInteractionDatasetLongSchema(many=True)
+            schema = serialization.project(models.TranscriptInteractionDatasetLongSchema, fields, many=True)
         else:
-            schema = models.TranscriptInteractionDatasetShortSchema(many=True)
-        return schema.dump(interaction_results)
+            schema = serialization.project(models.TranscriptInteractionDatasetShortSchema, fields, many=True)
+    except serialization.InvalidFields as e:
+        return serialization.invalid_fields(e)
+
+    query = models.TranscriptInteraction.query.filter(*queries).options(*models.eager_load_options(schema))
+    interactions = columnar.interactions("transcript", run_IDs) if not cursor else None
+    if interactions is not None:
+        # the engine selects the primary keys of the page (and one more for the next cursor)
+        mask = interactions.mask(nodes=transcript_IDs.values() if transcript_IDs is not None else None, cutoffs=cutoffs)
+        sort_column = {"pValue": "p_value", "mscor": "mscor", "correlation": "correlation"}.get(sorting)
+        IDs = interactions.select(mask, sort_column, descending, offset, limit + 1)
+        query = models.TranscriptInteraction.query \
+            .filter(models.TranscriptInteraction.interactions_transcripttranscript_ID.in_(IDs)) \
+            .options(*models.eager_load_options(schema))
+        offset = None
+    try:
+        interaction_results, next_cursor = pagination.paginate(query, sort, models.TranscriptInteraction.interactions_transcripttranscript_ID,
+                                                               limit, offset, cursor)
+    except pagination.InvalidCursor as e:
+        return pagination.invalid_cursor(e)
+
+    if len(interaction_results) > 0:
+        return schema.dump(interaction_results), 200, pagination.cursor_headers(next_cursor)
 
     else:
         return jsonify({
@@ -192,16 +175,12 @@ def read_specific_interaction(dataset_ID: int = None, disease_name=None, enst_nu
             "type": "about:blank"
         }), 400
 
-    transcript_query = db.select(models.Transcript)
-
     if enst_number is not None:
-            transcript_query = transcript_query.where(models.Transcript.enst_number.in_(enst_number))
-
-    transcript = db.session.execute(transcript_query).scalars().all()
-
-    if len(transcript) > 0:
-        transcript_IDs = [t.transcript_ID for t in transcript]
+        transcript_IDs = identifiers.transcripts().lookup("enst_number", enst_number)
     else:
+        transcript_IDs = identifiers.transcripts().ids.tolist()
+
+    if len(transcript_IDs) == 0:
         return jsonify({
             "detail": "No transcript found for given enst_number(s)",
             "status": 400,
@@ -209,25 +188,17 @@ def read_specific_interaction(dataset_ID: int = None, disease_name=None, enst_nu
             "type": "about:blank"
         }), 400
 
-    # save all needed queries to get correct results
-    queries = [sa.and_(models.TranscriptInteraction.transcript_ID_1.in_(transcript_IDs),
-                       models.TranscriptInteraction.transcript_ID_2.in_(transcript_IDs))]
-
-    run = db.select(models.SpongeRun)
-
-    # if specific disease_name is given
-    if disease_name is not None:
-        run = run.join(models.Dataset, models.Dataset.dataset_ID == models.SpongeRun.dataset_ID) \
-            .where(models.Dataset.disease_name.like("%" + disease_name + "%"))
-
-    if dataset_ID is not None:
-        run = run.where(models.SpongeRun.dataset_ID == dataset_ID)
+    # save all needed queries to get correct results, without enst_number every transcript matches and the
+    # endpoints are not filtered (instead of an IN list of all transcript_IDs)
+    queries = []
+    if enst_number is not None:
+        queries.append(sa.and_(idsets.member(models.TranscriptInteraction.transcript_ID_1, transcript_IDs),
+                               idsets.member(models.TranscriptInteraction.transcript_ID_2, transcript_IDs)))
 
-    run = db.session.execute(run).scalars().all()
+    run_IDs = _run_IDs('any', disease_name=disease_name, dataset_ID=dataset_ID)
 
-    if len(run) > 0:
-        run_Ids = [i.sponge_run_ID for i in run]
-        queries.append(models.TranscriptInteraction.sponge_run_ID.in_(run_Ids))
+    if len(run_IDs) > 0:
+        queries.append(models.TranscriptInteraction.sponge_run_ID.in_(run_IDs))
     else:
         return jsonify({
             "detail": "No dataset with given disease_name found",
@@ -237,14 +208,22 @@ def read_specific_interaction(dataset_ID: int = None, disease_name=None, enst_nu
         }), 400
 
     # filter further depending on given statistics cutoffs
+    cutoffs = []
     if pValue is not None:
-        if pValueDirection == "<":
-            queries.append(models.TranscriptInteraction.p_value < pValue)
-        else:
-            queries.append(models.TranscriptInteraction.p_value > pValue)
+        cutoffs.append(("p_value", "<" if pValueDirection == "<" else ">", pValue))
+    queries += columnar.where(models.TranscriptInteraction, cutoffs)
+
+    interactions = columnar.interactions("transcript", run_IDs)
+    if interactions is not None:
+        mask = interactions.mask(nodes=transcript_IDs if enst_number is not None else None, both=True, cutoffs=cutoffs)
+        IDs = interactions.select(mask, offset=offset, limit=limit)
+        queries = [models.TranscriptInteraction.interactions_transcripttranscript_ID.in_(IDs)]
+        offset = 0
 
     interaction_result = models.TranscriptInteraction.query \
         .filter(*queries) \
+        .options(*models.eager_load_options(models.TranscriptInteractionDatasetLongSchema)) \
+        .order_by(models.TranscriptInteraction.interactions_transcripttranscript_ID) \
         .slice(offset, offset + limit) \
         .all()
 
@@ -264,7 +243,7 @@ def read_specific_interaction(dataset_ID: int = None, disease_name=None, enst_nu
 def read_all_transcript_network_analysis(dataset_ID: int = None, disease_name=None, enst_number=None,
                                          transcript_type=None,
                                          minBetweenness=None, minNodeDegree=None, minEigenvector=None,
-                                         sorting=None, descending=None, limit=100, offset=0,
+                                         sorting=None, descending=None, limit=100, offset=0, cursor=None,
                                          sponge_db_version: int = LATEST):
     """
         This function responds to a request for /sponge/findceRNATranscripts
@@ -281,6 +260,7 @@ def read_all_transcript_network_analysis(dataset_ID: int = None, disease_name=No
         :param descending: should the results be sorted in descending or ascending order
         :param limit: number of results that shouls be shown
         :param offset: startpoint from where results should be shown
+        :param cursor: cursor of the previous page (X-Next-Cursor header), replaces offset
         :return: all ceRNAInteractions in the dataset of interest that satisfy the given filters
         """
 
@@ -295,19 +275,9 @@ def read_all_transcript_network_analysis(dataset_ID: int = None, disease_name=No
 
     queries = []
 
-    run = models.SpongeRun.query \
-        .filter(models.SpongeRun.sponge_db_version == sponge_db_version)
-
-    if disease_name is not None:
-        run = models.SpongeRun.query.join(models.Dataset, models.Dataset.dataset_ID == models.SpongeRun.dataset_ID) \
-            .filter(models.Dataset.disease_name.like("%" + disease_name + "%"))
-
-    if dataset_ID is not None:
-        run = run.filter(models.SpongeRun.dataset_ID == dataset_ID)
+    run_IDs = _run_IDs(sponge_db_version, disease_name=disease_name, dataset_ID=dataset_ID)
 
-    run = run.all()
-    if len(run) > 0:
-        run_IDs = [i.sponge_run_ID for i in run]
+    if len(run_IDs) > 0:
         queries.append(models.networkAnalysisTranscript.sponge_run_ID.in_(run_IDs))
     else:
         return jsonify({
@@ -318,12 +288,9 @@ def read_all_transcript_network_analysis(dataset_ID: int = None, disease_name=No
         }), 400
 
     if enst_number is not None:
-        transcript = models.Transcript.query \
-            .filter(models.Transcript.enst_number.in_(enst_number)) \
-            .all()
+        transcript_IDs = identifiers.transcripts().lookup("enst_number", enst_number)
 
-        if len(transcript) > 0:
-            transcript_IDs = [t.transcript_ID for t in transcript]
+        if len(transcript_IDs) > 0:
             queries.append(models.networkAnalysisTranscript.transcript_ID.in_(transcript_IDs))
         else:
             return jsonify({
@@ -363,16 +330,18 @@ def read_all_transcript_network_analysis(dataset_ID: int = None, disease_name=No
             else:
                 sort.append(models.networkAnalysisTranscript.eigenvector.asc())
 
-    result = models.networkAnalysisTranscript.query \
+    query = models.networkAnalysisTranscript.query \
         .join(models.Transcript, models.Transcript.transcript_ID == models.networkAnalysisTranscript.transcript_ID) \
         .filter(*queries) \
-        .order_by(*sort) \
-        .slice(offset, offset + limit) \
-        .all()
+        .options(*models.eager_load_options(models.networkAnalysisSchemaTranscript))
+    try:
+        result, next_cursor = pagination.paginate(query, sort, models.networkAnalysisTranscript.network_analysis_transcript_ID, limit, offset, cursor)
+    except pagination.InvalidCursor as e:
+        return pagination.invalid_cursor(e)
 
     if len(result) > 0:
         schema = models.networkAnalysisSchemaTranscript(many=True)
-        return schema.dump(result)
+        return schema.dump(result), 200, pagination.cursor_headers(next_cursor)
     else:
         return jsonify({
             "detail": "No data found that satisfies the given filters",
@@ -432,20 +401,16 @@ def read_all_to_one_mirna(dataset_ID: int = None, disease_name=None, mimat_numbe
     # get mir_ID from given mimat_number or hs number
     mirna = []
     if mimat_number is not None:
-        mirna = models.miRNA.query \
-            .filter(models.miRNA.mir_ID.like("%" + mimat_number + "%")) \
-            .all()
+        mirna = identifiers.mirnas().contains("mir_ID", mimat_number)
     elif hs_number is not None:
-        mirna = models.miRNA.query \
-            .filter(models.miRNA.hs_nr.like("%" + hs_number + "%")) \
-            .all()
+        mirna = identifiers.mirnas().contains("hs_nr", hs_number)
 
     # save queries
     queriesTranscriptInteraction = []
     queriesmirnaInteraction = []
 
     if len(mirna) > 0:
-        mirna_IDs = [i.miRNA_ID for i in mirna]
+        mirna_IDs = mirna
         queriesmirnaInteraction.append(models.miRNAInteractionTranscript.miRNA_ID.in_(mirna_IDs))
     else:
         return jsonify({
@@ -455,20 +420,9 @@ def read_all_to_one_mirna(dataset_ID: int = None, disease_name=None, mimat_numbe
             "type": "about:blank"
         }), 400
 
-    run = db.select(models.SpongeRun)
+    run_IDs = _run_IDs('any', disease_name=disease_name, dataset_ID=dataset_ID)
 
-    # if specific disease_name is given
-    if disease_name is not None:
-        run = run.join(models.Dataset, models.Dataset.dataset_ID == models.SpongeRun.dataset_ID) \
-            .where(models.Dataset.disease_name.like("%" + disease_name + "%"))
-
-    if dataset_ID is not None:
-        run = run.where(models.SpongeRun.dataset_ID == dataset_ID)
-
-    run = db.session.execute(run).scalars().all()
-
-    if len(run) > 0:
-        run_IDs = [i.sponge_run_ID for i in run]
+    if len(run_IDs) > 0:
         queriesmirnaInteraction.append(models.miRNAInteractionTranscript.sponge_run_ID.in_(run_IDs))
         queriesTranscriptInteraction.append(models.TranscriptInteraction.sponge_run_ID.in_(run_IDs))
     else:
@@ -538,7 +492,7 @@ def read_all_to_one_mirna(dataset_ID: int = None, disease_name=None, mimat_numbe
 @cache.cached(query_string=True)
 def read_all_mirna(dataset_ID: int = None, disease_name=None, mimat_number=None, hs_number=None, occurences=None,
                    sorting=None, descending=None,
-                   limit=100, offset=0):
+                   limit=100, offset=0, cursor=None):
     """
     :param dataset_ID: dataset_ID of the dataset of interest
     :param disease_name: disease_name of interest
@@ -549,6 +503,7 @@ def read_all_mirna(dataset_ID: int = None, disease_name=None, mimat_number=None,
     :param descending: should the results be sorted in descending or ascending order
     :param limit: number of results that should be shown
     :param offset: startpoint from where results should be shown
+    :param cursor: cursor of the previous page (X-Next-Cursor header), replaces offset
     :return: all mirna involved in disease of interest (searchs not for a specific miRNA, but search for all miRNA satisfying filter functions)
     """
     # test limit
@@ -571,19 +526,15 @@ def read_all_mirna(dataset_ID: int = None, disease_name=None, mimat_number=None,
     # get mir_ID from given mimat_number
     mirna = []
     if mimat_number is not None:
-        mirna = models.miRNA.query \
-            .filter(models.miRNA.mir_ID.in_(mimat_number)) \
-            .all()
+        mirna = identifiers.mirnas().lookup("mir_ID", mimat_number)
     elif hs_number is not None:
-        mirna = models.miRNA.query \
-            .filter(models.miRNA.hs_nr.in_(hs_number)) \
-            .all()
+        mirna = identifiers.mirnas().lookup("hs_nr", hs_number)
 
     # save queries
     queries = []
     if mimat_number is not None or hs_number is not None:
         if len(mirna) > 0:
-            mirna_IDs = [i.miRNA_ID for i in mirna]
+            mirna_IDs = mirna
             queries.append(models.OccurencesMiRNATranscript.miRNA_ID.in_(mirna_IDs))
         else:
             return jsonify({
@@ -593,20 +544,9 @@ def read_all_mirna(dataset_ID: int = None, disease_name=None, mimat_number=None,
                 "type": "about:blank"
             }), 400
 
-    run = db.select(models.SpongeRun)
-
-    # if specific disease_name is given
-    if disease_name is not None:
-        run = run.join(models.Dataset, models.Dataset.dataset_ID == models.SpongeRun.dataset_ID) \
-            .where(models.Dataset.disease_name.like("%" + disease_name + "%"))
+    run_IDs = _run_IDs('any', disease_name=disease_name, dataset_ID=dataset_ID)
 
-    if dataset_ID is not None:
-        run = run.where(models.SpongeRun.dataset_ID == dataset_ID)
-
-    run = db.session.execute(run).scalars().all()
-
-    if len(run) > 0:
-        run_IDs = [i.sponge_run_ID for i in run]
+    if len(run_IDs) > 0:
         queries.append(models.OccurencesMiRNATranscript.sponge_run_ID.in_(run_IDs))
     else:
         return jsonify({
@@ -627,15 +567,18 @@ def read_all_mirna(dataset_ID: int = None, disease_name=None, mimat_number=None,
         else:
             sort.append(models.OccurencesMiRNATranscript.occurences)
 
-    interaction_result = models.OccurencesMiRNATranscript.query \
-        .filter(*queries) \
-        .order_by(*sort) \
-        .slice(offset, offset + limit) \
-        .all()
+    try:
+        query = models.OccurencesMiRNATranscript.query \
+            .filter(*queries) \
+            .options(*models.eager_load_options(models.occurencesMiRNASchemaTranscript))
+        interaction_result, next_cursor = pagination.paginate(query, sort, models.OccurencesMiRNATranscript.occurences_mirna_transcript_ID,
+                                                              limit, offset, cursor)
+    except pagination.InvalidCursor as e:
+        return pagination.invalid_cursor(e)
 
     if len(interaction_result) > 0:
         # Serialize the data for the response depending on parameter all
-        return models.occurencesMiRNASchemaTranscript(many=True).dump(interaction_result)
+        return models.occurencesMiRNASchemaTranscript(many=True).dump(interaction_result), 200, pagination.cursor_headers(next_cursor)
     else:
         return jsonify({
             "detail": "No results",
@@ -649,16 +592,14 @@ def read_all_mirna(dataset_ID: int = None, disease_name=None, mimat_number=None,
 @cache.cached(query_string=True)
 def test_transcript_interaction(dataset_ID: int = None, enst_number=None, sponge_db_version: int = LATEST):
     """
-        :param enst_number: ensg number of the gene of interest
-        :return: lists of all cancer types transcript of interest has at least one interaction in the corresponding ceRNA II network
+        :param dataset_ID: dataset_ID of interest
+        :param enst_number: enst number(s) of the transcript(s) of interest
+        :param sponge_db_version: version of the sponge database
+        :return: lists of all cancer types with a flag for each transcript of interest whether it has at least one interaction in the corresponding ceRNA II network
     """
-    transcripts = models.Transcript.query \
-        .filter(models.Transcript.enst_number == enst_number) \
-        .all()
+    transcript_ID = identifiers.transcripts().lookup("enst_number", enst_number)
 
-    if len(transcripts) > 0:
-        transcript_ID = [t.transcript_ID for t in transcripts]
-    else:
+    if len(transcript_ID) == 0:
         return jsonify({
             "detail": "No transcripts found for given enst_number(s)",
             "status": 400,
@@ -666,35 +607,9 @@ def test_transcript_interaction(dataset_ID: int = None, enst_number=None, sponge
             "type": "about:blank"
         }), 400
 
-    run = db.session.execute(text(
-        f"SELECT * from dataset join sponge_run on dataset.dataset_ID = sponge_run.dataset_ID where dataset.sponge_db_version = {sponge_db_version}"))
-
-    if dataset_ID is not None:
-        run = run.filter(models.Dataset.dataset_ID == dataset_ID)
-
-    result = []
-    for r in run:
-        tmp = db.session.execute(
-            text("SELECT EXISTS(SELECT * FROM interactions_transcripttranscript where sponge_run_ID = " + str(r.sponge_run_ID) +
-                 " and transcript_ID_1 = " + str(transcript_ID[0]) + " limit 1) as include;")).fetchone()
-
-        if (tmp[0] == 1):
-            check = {"data_origin": r.data_origin, "disease_name": r.disease_name, "disease_subtype": r.disease_subtype,
-                     "sponge_run_ID": r.sponge_run_ID, "include": tmp[0]}
-        else:
-            tmp2 = db.session.execute(
-                text("SELECT EXISTS(SELECT * FROM interactions_transcripttranscript where sponge_run_ID = " + str(
-                    r.sponge_run_ID) +
-                     " and transcript_ID_2 = " + str(transcript_ID[0]) + " limit 1) as include;")).fetchone()
-
-            if (tmp2[0] == 1):
-                check = {"data_origin": r.data_origin, "disease_name": r.disease_name, "disease_subtype": r.disease_subtype, "sponge_run_ID": r.sponge_run_ID,
-                         "include": 1}
-            else:
-                check = {"data_origin": r.data_origin, "disease_name": r.disease_name, "disease_subtype": r.disease_subtype, "sponge_run_ID": r.sponge_run_ID,
-                         "include": 0}
-
-        result.append(check)
+    # test for each run of the database version which transcripts of interest are included in the ceRNA network
+    labels = dict(zip(transcript_ID, identifiers.transcripts().values("enst_number", transcript_ID)))
+    result = levels.presence_matrix(levels.TRANSCRIPT, sponge_db_version, dataset_ID, transcript_ID, labels)
 
     schema = models.checkTranscriptInteractionProCancer(many=True)
     return schema.dump(result)
@@ -715,20 +630,16 @@ def read_mirna_for_specific_interaction(dataset_ID: int = None, disease_name=Non
     :return: all miRNAs contributing to the interactions between transcripts of interest
     """
 
-    # get datasets 
-    disease_query = _dataset_query(disease_name=disease_name, dataset_ID=dataset_ID)
-    diseases = [d.dataset_ID for d in disease_query]  
-
     # get runs
-    run_query = db.select(models.SpongeRun.sponge_run_ID).where(models.SpongeRun.dataset_ID.in_(diseases))
+    run_IDs = _run_IDs(disease_name=disease_name, dataset_ID=dataset_ID)
 
     # get transcripts 
-    transcript_query = db.select(models.Transcript.transcript_ID).where(models.Transcript.enst_number.in_(enst_number))
+    transcript_IDs = identifiers.transcripts().lookup("enst_number", enst_number)
     
     # get interactions for given transcripts and runs
     base_interaction_query = db.select(models.miRNAInteractionTranscript).where(
-        models.miRNAInteractionTranscript.transcript_ID.in_(transcript_query),
-        models.miRNAInteractionTranscript.sponge_run_ID.in_(run_query)
+        models.miRNAInteractionTranscript.transcript_ID.in_(transcript_IDs),
+        models.miRNAInteractionTranscript.sponge_run_ID.in_(run_IDs)
     )
 
     base_interaction = db.session.execute(base_interaction_query).scalars().all()
@@ -737,14 +648,14 @@ def read_mirna_for_specific_interaction(dataset_ID: int = None, disease_name=Non
     if between:
         # subquery to count distinct transcripts
         distinct_query = db.select(db.func.count(db.distinct(models.miRNAInteractionTranscript.transcript_ID))) \
-            .where(models.miRNAInteractionTranscript.transcript_ID.in_(transcript_query)) \
-            .where(models.miRNAInteractionTranscript.sponge_run_ID.in_(run_query))
+            .where(models.miRNAInteractionTranscript.transcript_ID.in_(transcript_IDs)) \
+            .where(models.miRNAInteractionTranscript.sponge_run_ID.in_(run_IDs))
         
 
         # subquery to get miRNA IDs that are shared between transcripts
         mirna_query = db.select(models.miRNAInteractionTranscript.miRNA_ID) \
-            .where(models.miRNAInteractionTranscript.transcript_ID.in_(transcript_query)) \
-            .where(models.miRNAInteractionTranscript.sponge_run_ID.in_(run_query)) \
+            .where(models.miRNAInteractionTranscript.transcript_ID.in_(transcript_IDs)) \
+            .where(models.miRNAInteractionTranscript.sponge_run_ID.in_(run_IDs)) \
             .group_by(models.miRNAInteractionTranscript.miRNA_ID) \
             .having(db.func.count(models.miRNAInteractionTranscript.transcript_ID) == distinct_query)
         
@@ -788,20 +699,9 @@ def getTranscriptCounts(dataset_ID: int = None, disease_name=None, enst_number=N
 
     queries = []
 
-    run = db.select(models.SpongeRun)
-
-    # if specific disease_name is given
-    if disease_name is not None:
-        run = run.join(models.Dataset, models.Dataset.dataset_ID == models.SpongeRun.dataset_ID) \
-            .where(models.Dataset.disease_name.like("%" + disease_name + "%"))
+    run_IDs = _run_IDs('any', disease_name=disease_name, dataset_ID=dataset_ID)
 
-    if dataset_ID is not None:
-        run = run.where(models.SpongeRun.dataset_ID == dataset_ID)
-
-    run = db.session.execute(run).scalars().all()
-
-    if len(run) > 0:
-        run_IDs = [i.sponge_run_ID for i in run]
+    if len(run_IDs) > 0:
         queries.append(models.TranscriptCounts.sponge_run_ID.in_(run_IDs))
     else:
         return jsonify({
@@ -811,12 +711,9 @@ def getTranscriptCounts(dataset_ID: int = None, disease_name=None, enst_number=N
             "type": "about:blank"
         }), 400
 
-    transcript = models.Transcript.query \
-        .filter(models.Transcript.enst_number.in_(enst_number)) \
-        .all()
+    transcript_ID = identifiers.transcripts().lookup("enst_number", enst_number)
 
-    if len(transcript) > 0:
-        transcript_ID = [t.transcript_ID for t in transcript]
+    if len(transcript_ID) > 0:
         queries.append(models.TranscriptCounts.transcript_ID.in_(transcript_ID))
 
     else:
@@ -850,7 +747,22 @@ def getTranscriptCounts(dataset_ID: int = None, disease_name=None, enst_number=N
         }), 200
 
 
-@cache.cached(query_string=True)
+# edgeSorting of the network endpoint -> (column, descending)
+EDGE_SORTING = {"pValue": ("p_value", False), "mscor": ("mscor", True), "correlation": ("correlation", True)}
+
+
+def _network_schemas(fields):
+    """
+    :param fields: fields parameter of the network endpoint
+    :return: schemas of the edges and of the nodes, projected to the requested fields
+    :raises InvalidFields: if a requested field does not exist
+    """
+    projection = serialization.split_fields(fields, ("edges", "nodes"))
+    return serialization.project(models.TranscriptInteractionDatasetLongSchema, projection["edges"], many=True), \
+        serialization.project(models.networkAnalysisSchemaTranscript, projection["nodes"], many=True)
+
+
+@cache.cached(query_string=True, coalesce=True)
 def get_transcript_network(dataset_ID: int = None, disease_name=None,
                            ensemblID: list[str] = None,
                             minBetweenness:float = None, minNodeDegree:float = None, minEigenvector:float = None,
@@ -858,6 +770,7 @@ def get_transcript_network(dataset_ID: int = None, disease_name=None,
                             edgeSorting: str = None, nodeSorting: list[str] = None,
                             maxNodes: int = 100, maxEdges: int = 100, 
                             offsetNodes: int = None, offsetEdges: int = None,
+                            format: str = "full", fields=None, centrality: str = "run",
                             sponge_db_version: int = LATEST):
     """
     Optimized function for fetching ceRNA network nodes and edges with applied filters and sorting. Handles route /ceRNAInteraction/getTranscriptNetwork
@@ -876,62 +789,58 @@ def get_transcript_network(dataset_ID: int = None, disease_name=None,
     :param maxEdges: maximum number of edges
     :param offsetNodes: offset for node pagination
     :param offsetEdges: offset for edge pagination
+    :param format: "full" or "compact" (lookup tables and parallel arrays, see app/compact.py)
+    :param fields: fields of the edges and nodes in the full format, prefixed with "edges." or "nodes.", all if None
+    :param centrality: "run" for the betweenness, eigenvector and degree of the nodes in the complete network of the run,
+        "subnetwork" for those in the returned subnetwork (computed, see app/centrality.py)
     :param sponge_db_version: version of the sponge database
     :return: all ceRNAInteractions in the dataset of interest that satisfy the given filters
      
     """
-    transcript_query = db.select(models.Transcript.transcript_ID)
-    
+    try:
+        edge_schema, node_schema = _network_schemas(fields)
+    except serialization.InvalidFields as e:
+        return serialization.invalid_fields(e)
+
     if ensemblID: 
-        transcript_query = transcript_query.filter(
-            models.Transcript.enst_number.in_(ensemblID)
-        )
+        transcript_IDs = identifiers.transcripts().lookup("enst_number", ensemblID)
 
     # Step 1: Filter for SpongeRun IDs
-    run_query = db.select(models.SpongeRun.sponge_run_ID).filter(
-        models.SpongeRun.sponge_db_version == sponge_db_version
-    )
-    if disease_name:
-        run_query = run_query.join(models.Dataset).filter(
-            models.Dataset.disease_name.like(f"%{disease_name}%")
-        )
-    if dataset_ID:
-        run_query = run_query.filter(
-            models.SpongeRun.dataset_ID == dataset_ID
-        )
+    run_IDs = _run_IDs(sponge_db_version, disease_name=disease_name, dataset_ID=dataset_ID)
 
     # Step 2: Prefilter edges by SpongeRun ID and p-value
     edge_query = db.select(models.TranscriptInteraction).filter(
-        models.TranscriptInteraction.sponge_run_ID.in_(run_query),
+        models.TranscriptInteraction.sponge_run_ID.in_(run_IDs),
     )
 
     # filter for transcripts: only consider edges where at least one transcript is in the provided list
     if ensemblID:
         edge_query = edge_query.filter(
-            sa.or_(
-                models.TranscriptInteraction.transcript_ID_1.in_(transcript_query),
-                models.TranscriptInteraction.transcript_ID_2.in_(transcript_query)
-            )
+            levels.interactions_of(levels.TRANSCRIPT, sponge_db_version, run_IDs, transcript_IDs)
         )
 
-    if maxPValue: 
-        edge_query = edge_query.filter(
-            models.TranscriptInteraction.p_value <= maxPValue
-        )
-    
-    # Get prefiltered edges 
-    edges = db.session.execute(edge_query).scalars().all()
-    tr_ids_in_edges = set([edge.transcript_ID_1 for edge in edges] + [edge.transcript_ID_2 for edge in edges])
+    cutoffs = [("p_value", "<=", maxPValue)] if maxPValue else []
+    edge_query = edge_query.filter(*columnar.where(models.TranscriptInteraction, cutoffs))
+
+    interactions = columnar.interactions("transcript", run_IDs)
+    if interactions is not None:
+        # the transcripts of the prefiltered edges are found without loading the edges
+        prefiltered = interactions.mask(nodes=transcript_IDs if ensemblID else None, cutoffs=cutoffs)
+        tr_ids_in_edges = interactions.nodes(prefiltered).tolist()
+    else:
+        # the transcripts of the prefiltered edges are selected by the database as a subquery, see app/idsets.py
+        tr_ids_in_edges = sa.union(edge_query.with_only_columns(models.TranscriptInteraction.transcript_ID_1),
+                                   edge_query.with_only_columns(models.TranscriptInteraction.transcript_ID_2))
 
     # Filter nodes by edges that pass the p-value filter
     node_query = db.select(models.networkAnalysisTranscript).filter(
-        models.networkAnalysisTranscript.sponge_run_ID.in_(run_query),
-        models.networkAnalysisTranscript.transcript_ID.in_(tr_ids_in_edges)
+        models.networkAnalysisTranscript.sponge_run_ID.in_(run_IDs),
+        idsets.member(models.networkAnalysisTranscript.transcript_ID, tr_ids_in_edges)
     )
 
     if ensemblID: 
         node_query = node_query.filter(
-            models.networkAnalysisTranscript.transcript_ID.in_(transcript_query)
+            idsets.member(models.networkAnalysisTranscript.transcript_ID, transcript_IDs)
         )
 
     # Apply node-specific filters
@@ -942,53 +851,83 @@ def get_transcript_network(dataset_ID: int = None, disease_name=None,
     if minEigenvector:
         node_query = node_query.filter(models.networkAnalysisTranscript.eigenvector >= minEigenvector)
 
-    # Sorting nodes: if more than one sorting key, rank by each key individually and sort by the mean of the ranks
+    # Sorting nodes by their ranks in the run, by the mean of the ranks for more than one key
     if nodeSorting:
-        if any([key not in ['betweenness', 'node_degree', 'eigenvector'] for key in nodeSorting]):
+        if any([key not in levels.NODE_SORTING for key in nodeSorting]):
             raise ValueError("Invalid node sorting key. Choose from 'betweenness', 'node_degree', 'eigenvector'")
-        rank_columns = [db.func.rank().over(order_by=getattr(models.networkAnalysisTranscript, col).desc()).label(f"{col}_rank") for col in nodeSorting]
-        mean_rank = sum(rank_columns) / len(rank_columns)
-        node_query = node_query.order_by(mean_rank)
+        node_query = levels.sort_nodes(levels.TRANSCRIPT, node_query, sponge_db_version, run_IDs, nodeSorting)
 
     # node pagination
     node_query = node_query.offset(offsetNodes).limit(maxNodes)    
     
+    # the nodes are read once, as plain columns for the compact format and as objects to dump otherwise
+    if format == "compact":
+        nodes = db.session.execute(node_query.with_only_columns(
+            models.networkAnalysisTranscript.transcript_ID, models.networkAnalysisTranscript.sponge_run_ID,
+            models.networkAnalysisTranscript.betweenness, models.networkAnalysisTranscript.eigenvector, models.networkAnalysisTranscript.node_degree)).all()
+    else:
+        nodes = db.session.execute(node_query
+                                   .add_columns(models.networkAnalysisTranscript.transcript_ID, models.networkAnalysisTranscript.sponge_run_ID)
+                                   .options(*models.eager_load_options(node_schema))).all()
+
     # filter edges based on filtered nodes
-    nodes = db.session.execute(node_query).scalars().all()
     node_tr_ids = set([node.transcript_ID for node in nodes])
     edge_query = edge_query.filter(
         and_(
-            models.TranscriptInteraction.transcript_ID_1.in_(node_tr_ids),
-            models.TranscriptInteraction.transcript_ID_2.in_(node_tr_ids)
+            idsets.member(models.TranscriptInteraction.transcript_ID_1, node_tr_ids),
+            idsets.member(models.TranscriptInteraction.transcript_ID_2, node_tr_ids)
         )
     )
 
     # Apply edge-specific filters
+    edge_cutoffs = []
     if minMscor:
-        edge_query = edge_query.filter(models.TranscriptInteraction.mscor >= minMscor)
+        edge_cutoffs.append(("mscor", ">=", minMscor))
     if minCorrelation:
-        edge_query = edge_query.filter(models.TranscriptInteraction.correlation >= minCorrelation)
-
-    # Sort edges
-    if edgeSorting == "pValue":
-        edge_query = edge_query.order_by(models.TranscriptInteraction.p_value.asc())
-    elif edgeSorting == "mscor":
-        edge_query = edge_query.order_by(models.TranscriptInteraction.mscor.desc())
-    elif edgeSorting == "correlation":
-        edge_query = edge_query.order_by(models.TranscriptInteraction.correlation.desc())
+        edge_cutoffs.append(("correlation", ">=", minCorrelation))
+    edge_query = edge_query.filter(*columnar.where(models.TranscriptInteraction, edge_cutoffs))
+
+    # Sort edges, ties in the order of the primary key
+    if edgeSorting not in EDGE_SORTING:
+        raise ValueError("Invalid edge sorting key. Choose one of 'pValue', 'mscor', 'correlation'")
+    sort_column, descending = EDGE_SORTING[edgeSorting]
+    order = getattr(models.TranscriptInteraction, sort_column)
+    order = [order.desc() if descending else order.asc(), models.TranscriptInteraction.interactions_transcripttranscript_ID]
+
+    if interactions is not None:
+        # the engine selects the primary keys of the page
+        mask = prefiltered & interactions.mask(nodes=node_tr_ids, both=True, cutoffs=edge_cutoffs)
+        IDs = interactions.select(mask, sort_column, descending, offsetEdges, maxEdges)
+        edge_query = db.select(models.TranscriptInteraction) \
+            .filter(models.TranscriptInteraction.interactions_transcripttranscript_ID.in_(IDs)) \
+            .order_by(*order)
     else:
-        raise ValueError("Invalid edge sorting key. Choose one of 'pValue', 'mscor', 'correlation'")    
+        # edge pagination
+        edge_query = edge_query.order_by(*order).offset(offsetEdges).limit(maxEdges)
+
+    # centralities of the returned nodes with all interactions between them that pass the edge filters
+    centralities = None
+    if centrality == "subnetwork":
+        centralities = subnetwork_centralities("transcript", sponge_db_version,
+                                               [(node.sponge_run_ID, node.transcript_ID) for node in nodes],
+                                               cutoffs + edge_cutoffs)
 
-    # edge pagination
-    edge_query = edge_query.offset(offsetEdges).limit(maxEdges)
+    if format == "compact":
+        return levels.compact_network(levels.TRANSCRIPT, edge_query, nodes, sponge_db_version, centralities)
 
     # Execute queries
-    node_results = db.session.execute(node_query).scalars().all()
-    edge_results = db.session.execute(edge_query).scalars().all()
+    edge_results = db.session.execute(edge_query.options(*models.eager_load_options(edge_schema))).scalars().all()
 
     # Return results 
-    return jsonify({
-        "edges": models.TranscriptInteractionDatasetLongSchema(many=True).dump(edge_results),
-        "nodes": models.networkAnalysisSchemaTranscript(many=True).dump(node_results)
-    })
+    response = {
+        "edges": edge_schema.dump(edge_results),
+        "nodes": node_schema.dump([node[0] for node in nodes])
+    }
+    if centralities is not None:
+        values, approximate = centralities
+        for dumped, node in zip(response["nodes"], nodes):
+            dumped.update({name: value for name, value in values[(node.sponge_run_ID, node.transcript_ID)].items()
+                           if name in dumped})
+        response["centrality"] = {"scope": "subnetwork", "approximate": approximate}
+    return jsonify(response)
 
@@ -0,0 +1,200 @@
+"""
+Adjacency graph of the ceRNA network of a sponge run for neighbourhood queries.
+
+``Graph`` stores the interactions of a run (see ``app.columnar.RunColumns``) in compressed sparse
+row form: the nodes (gene_IDs / transcript_IDs) sorted, ``indptr`` with the start of the neighbours
+of every node and, per neighbour, its node position and the position of the interaction in the
+run's columns. k-hop expansion, induced subgraphs and shortest paths are breadth-first searches
+over whole frontiers with NumPy instead of one query per hop.
+
+Edge filters (p_value, mscor) are a boolean mask over the interactions of the run; edges that fail
+it are skipped during the search, the graph itself is built once per run and data release. With
+``SPONGE_COLUMNAR_DIR`` the arrays are stored next to the run's columns and memory-mapped, so all
+workers share them.
+"""
+
+import logging
+
+import numpy as np
+
+from app import columnar
+
+logger = logging.getLogger(__name__)
+
+ARRAYS = ("nodes", "indptr", "neighbours", "edges")
+
+
+class Graph:
+    """
+    CSR adjacency of the interactions of one sponge run, every interaction is stored in both directions.
+    """
+
+    def __init__(self, arrays, run):
+        """
+        :param arrays: dict name (see ARRAYS) -> array
+        :param run: RunColumns the graph was built from
+        """
+        self.nodes = arrays["nodes"]
+        self.indptr = arrays["indptr"]
+        self.neighbours = arrays["neighbours"]
+        self.edges = arrays["edges"]
+        self.run = run
+
+    @property
+    def arrays(self):
+        return {name: getattr(self, name) for name in ARRAYS}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @classmethod
+    def from_run(cls, run):
+        """
+        :param run: RunColumns of a sponge run
+        """
+        node1, node2 = run.columns["node1"], run.columns["node2"]
+        nodes = np.union1d(node1, node2)
+        first, second = np.searchsorted(nodes, node1), np.searchsorted(nodes, node2)
+        sources = np.concatenate([first, second])
+        targets = np.concatenate([second, first])
+        edges = np.tile(np.arange(len(node1), dtype=np.int64), 2)
+        order = np.lexsort((edges, targets, sources))
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(nodes)), out=indptr[1:])
+        return cls({"nodes": nodes, "indptr": indptr, "neighbours": targets[order], "edges": edges[order]}, run)
+
+    def positions(self, node_IDs):
+        """
+        :param node_IDs: gene_IDs / transcript_IDs
+        :return: sorted positions of the IDs that are nodes of the graph
+        """
+        node_IDs = np.asarray(list(node_IDs), dtype=np.int64)
+        positions = np.searchsorted(self.nodes, node_IDs).clip(max=max(len(self.nodes) - 1, 0))
+        found = self.nodes[positions] == node_IDs if len(self.nodes) else np.zeros(len(node_IDs), dtype=bool)
+        return np.unique(positions[found])
+
+    def edge_mask(self, cutoffs=()):
+        """
+        :param cutoffs: list of (column, operator, value), see ``columnar.where``
+        :return: boolean mask of the interactions of the run that may be used
+        """
+        return columnar.Interactions([self.run]).mask(cutoffs=cutoffs)
+
+    def expand(self, frontier, allowed):
+        """
+        All usable neighbours of the nodes of a frontier.
+        :param frontier: node positions
+        :param allowed: edge mask
+        :return: arrays of (node position, neighbour position, interaction position), in CSR order
+        """
+        starts, ends = self.indptr[frontier], self.indptr[frontier + 1]
+        counts = ends - starts
+        slots = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        sources = np.repeat(frontier, counts)
+        edges = self.edges[slots]
+        usable = allowed[edges]
+        return sources[usable], self.neighbours[slots][usable], edges[usable]
+
+    def neighbourhood(self, seeds, hops, allowed, max_nodes=None):
+        """
+        :param seeds: node positions to start from
+        :param hops: maximum distance
+        :param allowed: edge mask
+        :param max_nodes: stop when this many nodes are reached (the last hop is cut in the order of the node IDs)
+        :return: node positions and their distances, ordered by distance and node ID
+        """
+        distance = np.full(len(self.nodes), -1, dtype=np.int64)
+        frontier = np.unique(seeds)
+        distance[frontier] = 0
+        found = [frontier]
+        for hop in range(1, hops + 1):
+            if len(frontier) == 0 or (max_nodes is not None and sum(map(len, found)) >= max_nodes):
+                break
+            _, neighbours, _ = self.expand(frontier, allowed)
+            frontier = np.unique(neighbours[distance[neighbours] < 0])
+            distance[frontier] = hop
+            found.append(frontier)
+        positions = np.concatenate(found)[:max_nodes]
+        return positions, distance[positions]
+
+    def induced(self, positions, allowed):
+        """
+        :param positions: node positions
+        :param allowed: edge mask
+        :return: sorted positions of the usable interactions between the nodes
+        """
+        _, neighbours, edges = self.expand(np.unique(positions), allowed)
+        return np.unique(edges[np.isin(neighbours, positions)])
+
+    def shortest_paths(self, sources, targets, allowed, max_length):
+        """
+        One shortest path to every target from the closest of the sources.
+        :param sources: node positions the paths start at
+        :param targets: node positions the paths end at
+        :param allowed: edge mask
+        :param max_length: maximum number of edges of a path
+        :return: list of (node positions, interaction positions) per reachable target, in the order of targets
+        """
+        parent = np.full(len(self.nodes), -1, dtype=np.int64)
+        parent_edge = np.full(len(self.nodes), -1, dtype=np.int64)
+        reached = np.zeros(len(self.nodes), dtype=bool)
+        frontier = np.unique(sources)
+        reached[frontier] = True
+        targets = np.unique(targets)
+        for _ in range(max_length):
+            if len(frontier) == 0 or reached[targets].all():
+                break
+            origins, neighbours, edges = self.expand(frontier, allowed)
+            new = ~reached[neighbours]
+            # the first edge reaching a node (lowest origin position) becomes its parent
+            neighbours, first = np.unique(neighbours[new], return_index=True)
+            parent[neighbours] = origins[new][first]
+            parent_edge[neighbours] = edges[new][first]
+            reached[neighbours] = True
+            frontier = neighbours
+
+        paths = []
+        for target in targets[reached[targets]]:
+            nodes, edges = [int(target)], []
+            while parent[nodes[-1]] >= 0:
+                edges.append(int(parent_edge[nodes[-1]]))
+                nodes.append(int(parent[nodes[-1]]))
+            paths.append((nodes[::-1], edges[::-1]))
+        return paths
+
+
+_graphs = columnar.RunCache()
+
+
+def graph(table, sponge_run_ID):
+    """
+    :param table: "gene" or "transcript"
+    :param sponge_run_ID: ID of the sponge run
+    :return: Graph of the run, built (or loaded from the column directory) on first use
+    """
+    def load():
+        # the loaded runs of the columnar engine are only shared if it is enabled
+        if columnar.enabled():
+            run = columnar.run_columns(table, sponge_run_ID)
+        else:
+            run = columnar.load_run(table, sponge_run_ID)
+        directory = columnar.path(table, sponge_run_ID)
+        arrays = columnar.load_arrays(directory + ".graph", ARRAYS) if directory else None
+        if arrays is not None:
+            return Graph(arrays, run)
+        result = Graph.from_run(run)
+        if directory:
+            columnar.save_arrays(directory + ".graph", result.arrays)
+            result = Graph(columnar.load_arrays(directory + ".graph", ARRAYS), run)
+        logger.info(f"Built the {table} graph of sponge run {sponge_run_ID} with {len(result)} nodes")
+        return result
+
+    return _graphs.get(table, sponge_run_ID, load)
+
+
+def reset():
+    """
+    Drop the loaded graphs (and the run columns they are built from).
+    """
+    _graphs.clear()
+    columnar.reset()
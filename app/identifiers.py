@@ -0,0 +1,211 @@
+"""
+In-memory identifier index for the SPONGE API.
+
+Nearly every endpoint translates ``ensg_number``, ``gene_symbol``, ``enst_number``,
+``mimat_number`` or ``hs_number`` to the internal IDs of the gene, transcript and
+mirna tables before it queries the actual data. ``IdentifierIndex`` keeps these
+mappings in NumPy arrays (sorted, lower cased keys and the row positions they
+belong to), so a lookup is a ``searchsorted`` instead of a database round trip
+that builds ORM objects just to read the primary key.
+
+The arrays hold no Python objects per row. An index loaded in the gunicorn master
+(``preload_app``, see ``preload``) is therefore shared copy-on-write with all
+workers; without preloading every worker loads it on first use.
+"""
+
+import logging
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class IdentifierIndex:
+    """
+    Array-backed mapping between the internal IDs of a table and its identifier columns.
+    Lookups of string columns are case insensitive, like the collation of the database.
+    """
+
+    def __init__(self, id_column, ids, columns):
+        """
+        :param id_column: name of the primary key column
+        :param ids: primary keys
+        :param columns: dict of column name -> values of the column, in the order of ids
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        self.id_column = id_column
+        self.ids = ids[order]
+        self.Record = namedtuple("Record", [id_column, *columns])
+        self._values = {}
+        self._keys = {}
+        self._order = {}
+        for name, values in columns.items():
+            values = np.asarray(values)[order] if len(ids) else np.asarray(values)
+            if values.dtype == object or len(values) == 0:
+                values = np.array(["" if v is None else str(v) for v in values], dtype=str)
+            keys = np.char.lower(values) if values.dtype.kind == "U" else values
+            positions = np.argsort(keys, kind="stable")
+            self._values[name] = values
+            self._keys[name] = keys[positions]
+            self._order[name] = positions
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _needles(self, name, values):
+        if self._values[name].dtype.kind == "U":
+            return np.char.lower(np.asarray([str(v) for v in values], dtype=str))
+        return np.asarray(values, dtype=self._values[name].dtype)
+
+    def _positions(self, name, values, ignore_case=True):
+        if isinstance(values, (str, int)):
+            values = [values]
+        values = [v for v in values if v is not None and v != ""]
+        if not values:
+            return np.empty(0, dtype=np.int64)
+        keys, order = self._keys[name], self._order[name]
+        needles = self._needles(name, values)
+        left = np.searchsorted(keys, needles, side="left")
+        right = np.searchsorted(keys, needles, side="right")
+        positions = np.concatenate([order[l:r] for l, r in zip(left, right)])
+        if not ignore_case:
+            positions = positions[np.isin(self._values[name][positions], values)]
+        return np.unique(positions)
+
+    def lookup(self, name, values, ignore_case=True):
+        """
+        :param name: identifier column to search
+        :param values: value or list of values
+        :param ignore_case: match string identifiers case insensitive
+        :return: sorted list of IDs whose identifier is one of the values
+        """
+        return self.ids[self._positions(name, values, ignore_case)].tolist()
+
+    def prefix(self, name, value):
+        """
+        Equivalent to ``column LIKE 'value%'``.
+        :param name: identifier column to search
+        :param value: prefix of the identifier
+        :return: sorted list of IDs whose identifier starts with the value (case insensitive)
+        """
+        keys, order = self._keys[name], self._order[name]
+        value = str(value).lower()
+        left = np.searchsorted(keys, value, side="left")
+        right = np.searchsorted(keys, value + "\U0010ffff", side="left")
+        return np.sort(self.ids[order[left:right]]).tolist()
+
+    def contains(self, name, value):
+        """
+        Equivalent to ``column LIKE '%value%'``.
+        :param name: identifier column to search
+        :param value: substring of the identifier
+        :return: sorted list of IDs whose identifier contains the value (case insensitive)
+        """
+        keys = np.char.lower(self._values[name])
+        return self.ids[np.flatnonzero(np.char.find(keys, str(value).lower()) >= 0)].tolist()
+
+    def _id_positions(self, IDs):
+        IDs = np.asarray(IDs, dtype=np.int64)
+        positions = np.searchsorted(self.ids, IDs).clip(max=max(len(self.ids) - 1, 0))
+        found = self.ids[positions] == IDs if len(self.ids) else np.zeros(len(IDs), dtype=bool)
+        return positions[found]
+
+    def values(self, name, IDs):
+        """
+        Reverse lookup.
+        :param name: identifier column
+        :param IDs: list of IDs
+        :return: identifiers of the known IDs in the order of IDs
+        """
+        return self._values[name][self._id_positions(IDs)].tolist()
+
+    def records(self, IDs=None):
+        """
+        :param IDs: list of IDs, all rows if None
+        :return: list of named tuples with the ID and all identifier columns of the rows
+        """
+        positions = np.arange(len(self.ids)) if IDs is None else self._id_positions(IDs)
+        columns = [self.ids[positions].tolist()]
+        for values in self._values.values():
+            column = values[positions].tolist()
+            # missing identifiers are stored as empty strings
+            columns.append([v or None for v in column] if values.dtype.kind == "U" else column)
+        return [self.Record(*row) for row in zip(*columns)]
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def _sources():
+    import app.models as models
+    return {
+        "gene": (models.Gene.gene_ID, [models.Gene.ensg_number, models.Gene.gene_symbol]),
+        "transcript": (models.Transcript.transcript_ID, [models.Transcript.enst_number, models.Transcript.gene_ID]),
+        "mirna": (models.miRNA.miRNA_ID, [models.miRNA.mir_ID, models.miRNA.hs_nr]),
+    }
+
+
+def _load(name):
+    from app.config import db
+
+    id_column, columns = _sources()[name]
+    rows = db.session.execute(db.select(id_column, *columns)).all()
+    data = list(zip(*rows)) or [[] for _ in range(len(columns) + 1)]
+    index = IdentifierIndex(id_column.key, data[0], {c.key: values for c, values in zip(columns, data[1:])})
+    logger.info(f"Loaded identifier index for {name} with {len(index)} entries")
+    return index
+
+
+def get_index(name):
+    """
+    :param name: "gene", "transcript" or "mirna"
+    :return: identifier index of the table, loaded on first use (needs an app context)
+    """
+    index = _indexes.get(name)
+    if index is None:
+        with _lock:
+            index = _indexes.get(name)
+            if index is None:
+                index = _indexes[name] = _load(name)
+    return index
+
+
+def genes():
+    return get_index("gene")
+
+
+def transcripts():
+    return get_index("transcript")
+
+
+def mirnas():
+    return get_index("mirna")
+
+
+def preload(app):
+    """
+    Load all indexes before the workers are forked (gunicorn ``--preload``), so they share the arrays.
+    Database connections opened for loading are disposed, workers must not inherit them.
+    A failure is logged and the indexes are loaded lazily by the workers instead.
+    """
+    from app.config import db
+
+    try:
+        with app.app_context():
+            for name in _sources():
+                get_index(name)
+            db.engine.dispose()
+    except Exception:
+        logger.exception("Preloading the identifier indexes failed")
+
+
+def reset():
+    """
+    Drop the loaded indexes, e.g. after the identifier tables were updated.
+    """
+    with _lock:
+        _indexes.clear()
@@ -0,0 +1,129 @@
+"""
+Filters of a column by sets of IDs of any size.
+
+``column IN (...)`` with one bound parameter per ID suits the handful of genes a client asks for, but
+some sets are derived from data: all genes of a gene_type or all nodes of a prefiltered network hold
+tens of thousands of IDs. Inlined, such a set is loaded into Python, rendered into the statement, sent
+back and parsed, and the database plans it as a list of that many ranges. IDSet keeps either the IDs or
+the select they come from and renders the cheapest filter for its size:
+
+- IDs that come from a select: ``IN (subquery)``, the database runs it as a semi-join and the IDs
+  never leave it,
+- up to ``ID_SET_INLINE_MAX`` IDs: the plain ``IN`` list,
+- more IDs: a temporary table of the database session, filled with one executemany and joined as
+  ``IN (SELECT ID FROM sponge_id_set_<n>)``.
+
+Temporary tables live as long as the connection. They are reused: the n-th table of a transaction is
+``sponge_id_set_<n>``, emptied before it is filled, so a pooled connection keeps at most as many tables
+as one request needed. MySQL cannot open a temporary table twice in one statement, every filter of a
+set therefore gets a table of its own.
+
+Where the inline list and the temporary table cross over depends on the database server, measure it
+with otherStuff/scripts/benchmark_id_sets.py. An in-process sqlite database parses long lists cheaply and
+never crosses over; MySQL plans an IN list as one range per value and falls back to a full scan once
+the ranges exceed range_optimizer_max_mem_size, which the default of 2000 IDs stays well below.
+"""
+
+import sqlalchemy as sa
+from flask import current_app
+
+_metadata = sa.MetaData()
+_tables = {}
+
+
+def _table(slot):
+    if slot not in _tables:
+        _tables[slot] = sa.Table(f"sponge_id_set_{slot}", _metadata, sa.Column("ID", sa.BigInteger, primary_key=True),
+                                 prefixes=["TEMPORARY"])
+    return _tables[slot]
+
+
+def temporary_table(IDs):
+    """
+    :param IDs: IDs to store
+    :return: select of the IDs from a temporary table of the current transaction
+    """
+    from app.config import db
+
+    session = db.session()
+    connection = session.connection()
+    transaction = session.get_transaction()
+    owner, slot = session.info.get("id_sets", (None, 0))
+    if owner is not transaction:
+        slot = 0
+    session.info["id_sets"] = (transaction, slot + 1)
+
+    table = _table(slot)
+    connection.execute(sa.schema.CreateTable(table, if_not_exists=True))
+    connection.execute(table.delete())
+    connection.execute(table.insert(), [{"ID": ID} for ID in sorted(set(IDs))])
+    return sa.select(table.c.ID)
+
+
+class IDSet:
+    """
+    A set of IDs, given as values or as the select producing them.
+    """
+
+    def __init__(self, IDs=None, query=None):
+        """
+        :param IDs: the IDs
+        :param query: select of one column producing the IDs (used instead of IDs)
+        """
+        if (IDs is None) == (query is None):
+            raise ValueError("IDSet needs either IDs or a query")
+        self.query = query
+        self._IDs = None if IDs is None else list(IDs)
+
+    def values(self):
+        """
+        :return: list of the IDs, the query is executed once
+        """
+        if self._IDs is None:
+            from app.config import db
+            self._IDs = db.session.execute(self.query).scalars().all()
+        return self._IDs
+
+    def is_empty(self):
+        """
+        :return: whether the set has no IDs, checked with EXISTS for a query that was not executed yet
+        """
+        if self._IDs is not None:
+            return len(self._IDs) == 0
+        from app.config import db
+        return not db.session.execute(sa.select(self.query.exists())).scalar()
+
+    def filter(self, column, name=None):
+        """
+        :param column: column to filter
+        :param name: name of the bound parameter of an inline list (generated if None)
+        :return: filter of the rows whose column value is in the set
+        """
+        if self._IDs is None:
+            return column.in_(self.query)
+        if len(self._IDs) <= current_app.config.get("ID_SET_INLINE_MAX", 2000):
+            if name is not None:
+                return column.in_(sa.bindparam(name, self._IDs, expanding=True))
+            return column.in_(self._IDs)
+        return column.in_(temporary_table(self._IDs))
+
+
+def as_set(IDs):
+    """
+    :param IDs: IDSet, select of one column or collection of IDs
+    :return: IDSet of the IDs
+    """
+    if isinstance(IDs, IDSet):
+        return IDs
+    return IDSet(query=IDs) if isinstance(IDs, sa.sql.expression.SelectBase) else IDSet(IDs)
+
+
+def member(column, IDs, name=None):
+    """
+    ``column IN IDs`` for sets of any size.
+    :param column: column to filter
+    :param IDs: IDSet, select of one column or collection of IDs
+    :param name: name of the bound parameter of an inline list (generated if None)
+    :return: filter of the rows whose column value is in IDs
+    """
+    return as_set(IDs).filter(column, name)
@@ -1,5 +1,6 @@
 from marshmallow import fields
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, joinedload, selectinload, load_only
+from sqlalchemy.orm.properties import ColumnProperty
 
 from app.config import db, ma
 
@@ -74,6 +75,16 @@ class GeneInteraction(db.Model):
     mscor = db.Column(db.Float)
     correlation = db.Column(db.Float)
 
+class GeneInteractionAdjacency(db.Model):
+    # one row per endpoint of an interaction, (gene_ID1, gene_ID2) are stored with gene_ID1 < gene_ID2
+    # written by otherStuff/scripts/fillDataBase.R and otherStuff/scripts/canonical_interactions.sql, runs
+    # without adjacency rows are queried over both endpoint columns (see app/controllers/levels.py)
+    __tablename__ = "interactions_genegene_adjacency"
+    sponge_run_ID = db.Column(db.Integer, db.ForeignKey('sponge_run.sponge_run_ID'), primary_key=True)
+    gene_ID = db.Column(db.Integer, db.ForeignKey('gene.gene_ID'), primary_key=True)
+    interactions_genegene_ID = db.Column(db.Integer, db.ForeignKey('interactions_genegene.interactions_genegene_ID'),
+                                         primary_key=True)
+
 class miRNAInteraction(db.Model):
     __tablename__ = "interactions_genemirna"
     interactions_genemirna_ID = db.Column(db.Integer, primary_key=True)
@@ -143,6 +154,16 @@ class networkAnalysis(db.Model):
     betweenness = db.Column(db.Float)
     node_degree = db.Column(db.Float)
 
+    # ranks within the run (1 = highest value, ties share a rank) and the mean of the three ranks,
+    # filled at ingestion, see otherStuff/scripts/centrality_ranks.sql (NULL until then, see levels.sort_nodes)
+    betweenness_rank = db.Column(db.Integer)
+    eigenvector_rank = db.Column(db.Integer)
+    node_degree_rank = db.Column(db.Integer)
+    combined_rank = db.Column(db.Float)
+
+    __table_args__ = tuple(db.Index(f"idx_network_analysis_gene_{rank}", "sponge_run_ID", rank)
+                           for rank in ("betweenness_rank", "eigenvector_rank", "node_degree_rank", "combined_rank"))
+
 # chris: Change
 class networkAnalysisTranscript(db.Model):
     __tablename__ = "network_analysis_transcript"
@@ -158,6 +179,16 @@ class networkAnalysisTranscript(db.Model):
     betweenness = db.Column(db.Float)
     node_degree = db.Column(db.Float)
 
+    # ranks within the run (1 = highest value, ties share a rank) and the mean of the three ranks,
+    # filled at ingestion, see otherStuff/scripts/centrality_ranks.sql (NULL until then, see levels.sort_nodes)
+    betweenness_rank = db.Column(db.Integer)
+    eigenvector_rank = db.Column(db.Integer)
+    node_degree_rank = db.Column(db.Integer)
+    combined_rank = db.Column(db.Float)
+
+    __table_args__ = tuple(db.Index(f"idx_network_analysis_transcript_{rank}", "sponge_run_ID", rank)
+                           for rank in ("betweenness_rank", "eigenvector_rank", "node_degree_rank", "combined_rank"))
+
 
 class GeneExpressionValues(db.Model):
     __tablename__ = "expression_data_gene"
@@ -344,6 +375,16 @@ class TranscriptInteraction(db.Model):
     correlation = db.Column(db.Float)
 
 
+class TranscriptInteractionAdjacency(db.Model):
+    # one row per endpoint of an interaction, see GeneInteractionAdjacency
+    __tablename__ = "interactions_transcripttranscript_adjacency"
+    sponge_run_ID = db.Column(db.Integer, db.ForeignKey('sponge_run.sponge_run_ID'), primary_key=True)
+    transcript_ID = db.Column(db.Integer, db.ForeignKey('transcript.transcript_ID'), primary_key=True)
+    interactions_transcripttranscript_ID = db.Column(
+        db.Integer, db.ForeignKey('interactions_transcripttranscript.interactions_transcripttranscript_ID'),
+        primary_key=True)
+
+
 class TranscriptCounts(db.Model):
     __tablename__ = "transcript_counts"
     transcript_counts_ID = db.Column(db.Integer, primary_key=True)
@@ -656,6 +697,49 @@ class DiseaseSchema(ma.SQLAlchemyAutoSchema):
 
     dataset_IDs = fields.List(fields.Integer)
 
+def _column_attributes(schema, cls):
+    mapper = cls.__mapper__
+    attributes = [mapper.get_property_by_column(column).class_attribute for column in mapper.primary_key]
+    for field in schema.dump_fields.values():
+        attribute = getattr(cls, field.attribute or field.name, None)
+        if isinstance(getattr(attribute, "property", None), ColumnProperty):
+            attributes.append(attribute)
+    return attributes
+
+
+def eager_load_options(schema):
+    """
+    Loader options for the relationships a schema declares in ``Meta.eager_load`` (dotted paths like
+    "sponge_run.dataset"). Without them dumping n rows lazy loads every nested object with its own SELECT.
+    Many-to-one relationships are joined into the query, collections are loaded with one SELECT ... IN.
+    For a schema projected with ``only`` (the ``fields`` parameter) relationships without requested fields
+    are not loaded and only the requested columns are selected.
+    :param schema: schema class or instance
+    :return: list of options for ``query.options``
+    """
+    projected = not isinstance(schema, type) and schema.only is not None
+    options = []
+    for path in getattr(schema.Meta, "eager_load", ()):
+        option, cls, nested = None, schema.Meta.model, schema
+        for name in path.split("."):
+            if projected and name not in nested.dump_fields:
+                break
+            attribute = getattr(cls, name)
+            if attribute.property.uselist:
+                option = selectinload(attribute) if option is None else option.selectinload(attribute)
+            else:
+                option = joinedload(attribute) if option is None else option.joinedload(attribute)
+            cls = attribute.property.mapper.class_
+            if projected:
+                nested = nested.dump_fields[name].schema
+                option = option.load_only(*_column_attributes(nested, cls))
+        if option is not None:
+            options.append(option)
+    if projected:
+        options.append(load_only(*_column_attributes(schema, schema.Meta.model)))
+    return options
+
+
 class DatasetSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = Dataset
@@ -685,6 +769,7 @@ class TranscriptSchemaShort(ma.SQLAlchemyAutoSchema):
         model = Transcript
         sqla_session = db.session
         fields = ["enst_number", "gene"]
+        eager_load = ("gene",)
     
     gene = ma.Nested(lambda: GeneSchema(only=("ensg_number", "gene_symbol")))
 
@@ -725,6 +810,7 @@ class GeneInteractionDatasetLongSchema(ma.SQLAlchemyAutoSchema):
         model = GeneInteraction
         sqla_session = db.session
         fields = ["correlation", "mscor", "p_value", "run", "gene1", "gene2"]
+        eager_load = ("gene1", "gene2")
 
     sponge_run = ma.Nested(lambda: SpongeRunSchema(only=("sponge_run_ID", "dataset")))
     gene1 = ma.Nested(GeneSchema)
@@ -735,6 +821,7 @@ class GeneInteractionDatasetShortSchema(ma.SQLAlchemyAutoSchema):
         model = GeneInteraction
         sqla_session = db.session
         fields = ["correlation", "mscor", "p_value", "sponge_run", "gene1", "gene2"]
+        eager_load = ("sponge_run.dataset", "gene1", "gene2")
 
     sponge_run = ma.Nested(lambda: SpongeRunSchema(only=("sponge_run_ID", "dataset")))
     gene1 = ma.Nested(lambda: GeneSchema(only=("ensg_number", "gene_symbol")))
@@ -795,6 +882,7 @@ class networkAnalysisSchema(ma.SQLAlchemyAutoSchema):
         model = networkAnalysis
         sqla_session = db.session
         fields = ["betweenness", "eigenvector", "gene", "node_degree", "sponge_run"]
+        eager_load = ("sponge_run.dataset", "gene")
 
     sponge_run = ma.Nested(lambda: SpongeRunSchema(only=("sponge_run_ID", "dataset")))
     gene = ma.Nested(lambda: GeneSchema(only=("ensg_number", "gene_symbol")))
@@ -805,6 +893,7 @@ class networkAnalysisSchemaTranscript(ma.SQLAlchemyAutoSchema):
         model = networkAnalysisTranscript
         sqla_session = db.session
         fields = ["betweenness", "eigenvector", "transcript", "node_degree", "sponge_run"]
+        eager_load = ("sponge_run.dataset", "transcript.gene")
 
     sponge_run = ma.Nested(lambda: SpongeRunSchema(only=("sponge_run_ID", "dataset")))
     transcript = ma.Nested(lambda: TranscriptSchema(only=("enst_number", "gene")))
@@ -815,6 +904,7 @@ class geneExpressionSchema(ma.SQLAlchemyAutoSchema):
         model = GeneExpressionValues
         sqla_session = db.session
         fields = ["expr_value", "gene", "sample_ID"]
+        eager_load = ("gene",)
 
     # dataset = ma.Nested(lambda: DatasetSchema(only=("dataset_ID", "disease_name", "disease_subtype")))
     gene = ma.Nested(lambda: GeneSchema(only=("ensg_number", "gene_symbol")))
@@ -825,6 +915,7 @@ class miRNAExpressionSchema(ma.SQLAlchemyAutoSchema):
         model = MiRNAExpressionValues
         sqla_session = db.session
         fields = ["dataset", "expr_value", "mirna", "sample_ID"]
+        eager_load = ("dataset", "mirna")
 
     dataset = ma.Nested(lambda: DatasetSchema(only=("dataset_ID", "disease_name")))
     mirna = ma.Nested(lambda: miRNASchema(only=("mir_ID", "hs_nr")))
@@ -834,6 +925,7 @@ class occurencesMiRNASchema(ma.SQLAlchemyAutoSchema):
         model = OccurencesMiRNA
         sqla_session = db.session
         fields = ["mirna", "occurences", "sponge_run"]
+        eager_load = ("sponge_run.dataset", "mirna")
 
     sponge_run = ma.Nested(lambda: SpongeRunSchema(only=("sponge_run_ID", "dataset")))
     mirna = ma.Nested(lambda: miRNASchema(only=("mir_ID", "hs_nr")))
@@ -844,6 +936,7 @@ class occurencesMiRNASchemaTranscript(ma.SQLAlchemyAutoSchema):
         model = OccurencesMiRNATranscript
         sqla_session = db.session
         fields = ["mirna", "occurences", "sponge_run"]
+        eager_load = ("sponge_run.dataset", "mirna")
 
     sponge_run = ma.Nested(lambda: SpongeRunSchema(only=("sponge_run_ID", "dataset")))
     mirna = ma.Nested(lambda: miRNASchema(only=("mir_ID", "hs_nr")))
@@ -864,6 +957,7 @@ class SurvivalRateSchema(ma.SQLAlchemyAutoSchema):
         model = SurvivalRate
         sql_session = db.session
         fields = ["dataset", "gene", "overexpression", "patient_information"]
+        eager_load = ("dataset", "gene", "patient_information")
 
     dataset = ma.Nested(lambda: DatasetSchema(only=("dataset_ID", "disease_name")))
     gene = ma.Nested(lambda: GeneSchema(only=("ensg_number", "gene_symbol")))
@@ -887,6 +981,7 @@ class checkGeneInteractionProCancer(ma.SQLAlchemyAutoSchema):
     disease_subtype = fields.String()
     sponge_run_ID = fields.Integer()
     include = fields.Integer()
+    genes = fields.Dict(keys=fields.String(), values=fields.Integer())
 
 class checkTranscriptInteractionProCancer(ma.SQLAlchemyAutoSchema):
     class Meta:
@@ -897,12 +992,14 @@ class checkTranscriptInteractionProCancer(ma.SQLAlchemyAutoSchema):
     disease_subtype = fields.String()
     sponge_run_ID = fields.Integer()
     include = fields.Integer()
+    transcripts = fields.Dict(keys=fields.String(), values=fields.Integer())
 
 class GeneCountSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = GeneCount
         sql_session = db.session
         fields = ["sponge_run", "gene", "count_all", "count_sign"]
+        eager_load = ("sponge_run.dataset", "gene")
 
     sponge_run = ma.Nested(lambda: SpongeRunSchema(only=("sponge_run_ID", "dataset")))
     gene = ma.Nested(lambda: GeneSchema(only=("ensg_number", "gene_symbol")))
@@ -995,6 +1092,7 @@ class TranscriptInteractionDatasetLongSchema(ma.SQLAlchemyAutoSchema):
         model = TranscriptInteraction
         sqla_session = db.session
         fields = ["correlation", "mscor", "p_value", "sponge_run", "transcript_1", "transcript_2"]
+        eager_load = ("sponge_run.dataset", "transcript_1.gene", "transcript_2.gene")
 
     sponge_run = ma.Nested(lambda: SpongeRunSchema(only=("sponge_run_ID", "dataset")))
     transcript_1 = ma.Nested(TranscriptSchema)
@@ -1005,6 +1103,7 @@ class TranscriptInteractionDatasetShortSchema(ma.SQLAlchemyAutoSchema):
         model = TranscriptInteraction
         sqla_session = db.session
         fields = ["correlation", "mscor", "p_value", "sponge_run", "transcript_1", "transcript_2"]
+        eager_load = ("sponge_run.dataset", "transcript_1", "transcript_2")
 
     sponge_run = ma.Nested(lambda: SpongeRunSchema(only=("sponge_run_ID", "dataset")))
     transcript_1 = ma.Nested(lambda: TranscriptSchema(only=("enst_number", )))
@@ -1067,6 +1166,7 @@ class ExpressionDataTranscriptSchema(ma.SQLAlchemyAutoSchema):
         model = ExpressionDataTranscript
         sqla_session = db.session
         fields = ["dataset", "transcript", "expr_value", "sample_ID"]
+        eager_load = ("dataset", "transcript.gene")
 
     dataset = ma.Nested(lambda: DatasetSchema(only=("dataset_ID", "disease_name", "disease_subtype")))
     transcript = ma.Nested(lambda: TranscriptSchema(only=("enst_number", "gene")))
@@ -1122,6 +1222,7 @@ class SpongEffectsGeneModuleSchema(ma.SQLAlchemyAutoSchema):
                   'gene',
                   'mean_gini_decrease',
                   'mean_accuracy_decrease']
+        eager_load = ("gene",)
         
     gene = ma.Nested(lambda: GeneSchema(only=("ensg_number", "gene_symbol")))
 
@@ -1134,6 +1235,7 @@ class SpongEffectsGeneModuleMembersSchema(ma.SQLAlchemyAutoSchema):
         fields = ['spongEffects_gene_module_members_ID', 
                   'spongEffects_gene_module_ID', 
                   'gene']
+        eager_load = ("gene",)
         
     gene = ma.Nested(lambda: GeneSchema(only=("ensg_number", "gene_symbol")))
 
@@ -1147,6 +1249,7 @@ class SpongEffectsTranscriptModuleSchema(ma.SQLAlchemyAutoSchema):
                   'transcript',
                   'mean_gini_decrease',
                   'mean_accuracy_decrease']
+        eager_load = ("transcript.gene",)
         
     transcript = ma.Nested(lambda: TranscriptSchema(only=("enst_number", "gene")))
 
@@ -1159,6 +1262,7 @@ class SpongEffectsTranscriptModuleMembersSchema(ma.SQLAlchemyAutoSchema):
         fields = ['spongEffects_transcript_module_members_ID',
                   'spongEffects_transcript_module_ID',
                    'transcript']
+        eager_load = ("transcript.gene",)
         
     transcript = ma.Nested(lambda: TranscriptSchema(only=("enst_number", "gene")))
     gene = ma.Nested(lambda: GeneSchema(only=("ensg_number", "gene_symbol")))
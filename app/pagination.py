@@ -0,0 +1,158 @@
+"""
+Keyset (cursor) pagination for the list endpoints of the SPONGE API.
+
+With ``offset`` the database has to sort and skip all earlier rows, so deep pages get slower the
+further a client pages. A cursor instead encodes the sort key and primary key of the last row of
+a page; the next page starts with a range condition on these values and costs the same as the
+first one. Ties in the sort key are broken by the primary key, so rows neither repeat nor go
+missing between pages.
+
+Endpoints return the cursor of the next page in the ``X-Next-Cursor`` header (only if there are
+more rows). Offset paging stays available: a cursor is returned for offset pages as well.
+
+The cursor has to hold the stored sort keys exactly: MySQL returns FLOAT columns rounded, and a seek
+condition on a rounded value repeats or skips the rows at the page boundary. The keys of the cursor are
+therefore selected next to the rows, FLOAT columns as ``column + 0E0`` (a DOUBLE, exact like in
+app/columnar.py).
+"""
+
+import base64
+import hashlib
+import json
+
+from flask import jsonify
+from sqlalchemy import Double, Float, and_, literal_column, or_, true, false, type_coerce
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+
+CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _order_keys(order):
+    """
+    :param order: ORDER BY clauses (columns, ``column.desc()``, ``column.asc()``)
+    :return: list of (column, descending)
+    """
+    keys = []
+    for clause in order:
+        clause = getattr(clause, "expression", clause)
+        if isinstance(clause, UnaryExpression) and clause.modifier in (operators.desc_op, operators.asc_op):
+            keys.append((clause.element, clause.modifier is operators.desc_op))
+        else:
+            keys.append((clause, False))
+    return keys
+
+
+def _exact(column):
+    """
+    :return: expression selecting the stored value of a sort key, FLOAT columns widened to DOUBLE
+    """
+    if isinstance(getattr(column.type, "impl", column.type), Float):
+        return type_coerce(column + literal_column("0E0"), Double())
+    return column
+
+
+def _signature(keys):
+    spec = ",".join(f"{column.table.name}.{column.key}{'-' if descending else '+'}" for column, descending in keys)
+    return hashlib.sha1(spec.encode("utf-8")).hexdigest()[:8]
+
+
+def encode_cursor(keys, values):
+    """
+    :param keys: list of (column, descending) the cursor belongs to
+    :param values: values of the keys of the last row of a page
+    :return: opaque cursor token
+    """
+    data = json.dumps({"s": _signature(keys), "k": list(values)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(keys, cursor):
+    """
+    :param keys: list of (column, descending) of the current request
+    :param cursor: token from the X-Next-Cursor header
+    :return: values of the keys of the last row of the previous page
+    :raises InvalidCursor: if the token is malformed or belongs to a different sorting
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        signature, values = data["s"], data["k"]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("Malformed cursor")
+    if signature != _signature(keys) or len(values) != len(keys):
+        raise InvalidCursor("Cursor does not match the sorting of the request")
+    return values
+
+
+def _after(column, descending, value):
+    # NULL sorts first in ascending order (MySQL, sqlite)
+    if value is None:
+        return column.isnot(None) if not descending else false()
+    if descending:
+        return or_(column < value, column.is_(None))
+    return column > value
+
+
+def _equal(column, value):
+    return column.is_(None) if value is None else column == value
+
+
+def seek_condition(keys, values):
+    """
+    Rows after the row with the given key values: (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+    Written out instead of a row value comparison because the directions of the keys may differ.
+    """
+    conditions = []
+    for i, (column, descending) in enumerate(keys):
+        equal = [_equal(c, v) for (c, _), v in zip(keys[:i], values[:i])]
+        conditions.append(and_(*equal, _after(column, descending, values[i])))
+    return or_(*conditions) if conditions else true()
+
+
+def paginate(query, order, primary_key, limit, offset=None, cursor=None):
+    """
+    Fetch one page of an ORM query.
+    :param query: ``Model.query`` with all filters applied
+    :param order: ORDER BY clauses of the request
+    :param primary_key: primary key column of the model, appended as tie breaker
+    :param limit: number of rows of the page
+    :param offset: number of rows to skip (ignored if a cursor is given)
+    :param cursor: cursor of the previous page
+    :return: rows of the page and the cursor of the next page (None on the last page)
+    :raises InvalidCursor: if the cursor is not valid for the request
+    """
+    keys = _order_keys([*order, primary_key])
+    query = query.order_by(*[column.desc() if descending else column.asc() for column, descending in keys])
+    if cursor:
+        query = query.filter(seek_condition(keys, decode_cursor(keys, cursor)))
+    elif offset:
+        query = query.offset(offset)
+    if limit is None:
+        return query.all(), None
+
+    # the exact sort keys of every row follow the row, the cursor is built from those of the last one
+    rows = query.add_columns(*[_exact(column).label(f"cursor_key_{i}") for i, (column, _) in enumerate(keys)]) \
+        .limit(limit + 1).all()
+    if len(rows) <= limit:
+        return [row[0] for row in rows], None
+    return [row[0] for row in rows[:limit]], encode_cursor(keys, list(rows[limit - 1][1:]))
+
+
+def cursor_headers(next_cursor):
+    """
+    :return: response headers announcing the next page
+    """
+    return {CURSOR_HEADER: next_cursor} if next_cursor else {}
+
+
+def invalid_cursor(error):
+    return jsonify({
+        "detail": f"{error}. Please restart paging without cursor.",
+        "status": 400,
+        "title": "Bad Request",
+        "type": "about:blank"
+    }), 400
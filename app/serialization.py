@@ -0,0 +1,228 @@
+"""
+Fast serialization path for flat result schemas of the SPONGE API.
+
+Dumping a result with marshmallow first loads one ORM object per row (plus the nested objects)
+and then walks every field of the schema for every row. For the large, flat results of the
+expression endpoints this dominates the response time.
+
+``Layout`` compiles a schema once into the columns it reads (nested schemas of many-to-one
+relationships become outer joins) and a list of (key, column index, converter) entries. Rows
+are then selected with SQLAlchemy Core as plain tuples and turned into the same dicts / JSON
+text the schema produces, in the same key order and with the same value conversions.
+
+The path is opt-in (``SPONGE_FAST_SERIALIZATION=1``); endpoints check ``enabled()``.
+
+``project`` restricts a schema to the fields a client asks for with the ``fields`` parameter.
+A projected schema selects fewer columns in its ``Layout`` and loads fewer relationships and
+columns in ``models.eager_load_options``.
+"""
+
+import functools
+import json
+
+from flask import current_app, jsonify
+from marshmallow import fields
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.properties import ColumnProperty
+from sqlalchemy.orm.relationships import RelationshipProperty
+
+# converters of the field types generated for plain columns, equivalent to Field._serialize
+_CONVERTERS = {
+    fields.Integer: int,
+    fields.Float: float,
+    fields.String: str,
+    fields.Boolean: bool,
+}
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def enabled():
+    """
+    :return: whether the endpoints should use the fast serialization path
+    """
+    return current_app.config.get("FAST_SERIALIZATION", False)
+
+
+def _unknown_fields(schema, names):
+    unknown = []
+    for name in names:
+        head, _, rest = name.partition(".")
+        field = schema.fields.get(head)
+        if field is None or (rest and not isinstance(field, fields.Nested)):
+            unknown.append(name)
+        elif rest:
+            unknown += [f"{head}.{n}" for n in _unknown_fields(field.schema, [rest])]
+    return unknown
+
+
+def _normalize_fields(names):
+    # marshmallow intersects the only option of a nested schema that has its own only with the requested
+    # names, which drops paths deeper than one level ("transcript.gene.ensg_number" -> "transcript.gene")
+    names = {".".join(name.split(".")[:2]) for name in names}
+    # a requested nested object is dumped completely
+    return sorted(name for name in names if name.split(".")[0] == name or name.split(".")[0] not in names)
+
+
+def project(schema, only=None, **kwargs):
+    """
+    Schema restricted to the fields requested with the ``fields`` parameter of an endpoint.
+    :param schema: schema class
+    :param only: field names, fields of nested schemas as dotted paths (e.g. "gene1.ensg_number"); all fields if empty.
+                 Paths into nested schemas of nested schemas select the complete object of the second level.
+    :param kwargs: further arguments of the schema, e.g. many=True
+    :return: schema instance
+    :raises InvalidFields: if a name is not a field of the schema
+    """
+    if not only:
+        return schema(**kwargs)
+    unknown = _unknown_fields(schema(), only)
+    if unknown:
+        raise InvalidFields(f"Unknown field(s) {', '.join(sorted(unknown))}")
+    return schema(only=_normalize_fields(only), **kwargs)
+
+
+def split_fields(only, groups):
+    """
+    Split the ``fields`` parameter of an endpoint that returns several lists, e.g. "edges.mscor,nodes.gene".
+    :param only: requested fields prefixed with the name of their group
+    :param groups: names of the groups
+    :return: dict group -> requested fields of the group (None: all fields)
+    :raises InvalidFields: if a name does not start with a group
+    """
+    split = {group: [] for group in groups}
+    unknown = []
+    for name in only or ():
+        group, _, field = name.partition(".")
+        if group not in split:
+            unknown.append(name)
+        elif split[group] is not None:
+            # the group itself selects all of its fields
+            split[group] = split[group] + [field] if field else None
+    if unknown:
+        raise InvalidFields(f"Unknown field(s) {', '.join(sorted(unknown))}, fields must start with one of {', '.join(groups)}")
+    return {group: names or None for group, names in split.items()}
+
+
+def invalid_fields(error):
+    return jsonify({
+        "detail": f"{error}. Please choose from the fields of the response.",
+        "status": 400,
+        "title": "Bad Request",
+        "type": "about:blank"
+    }), 400
+
+
+def _converter(field, name):
+    convert = _CONVERTERS.get(type(field))
+    if convert is not None and not getattr(field, "as_string", False):
+        return convert
+    return functools.partial(field._serialize, attr=name, obj=None)
+
+
+class Layout:
+    """
+    Precompiled field layout of a schema whose fields are columns or nested schemas of many-to-one relationships.
+    """
+
+    def __init__(self, schema):
+        """
+        :param schema: schema class or instance
+        :raises ValueError: if the schema has fields that cannot be read from a column
+        """
+        schema = schema() if isinstance(schema, type) else schema
+        self.model = schema.Meta.model
+        self.columns = []
+        self._joins = []
+        self._nodes = self._compile(schema, self.model)
+
+    def _column(self, column):
+        self.columns.append(column)
+        return len(self.columns) - 1
+
+    def _compile(self, schema, entity):
+        nodes = []
+        for key, field in schema.dump_fields.items():
+            name = field.attribute or field.name
+            attribute = getattr(entity, name, None)
+            if attribute is None:
+                # marshmallow skips attributes the object does not have
+                continue
+            prop = getattr(attribute, "property", None)
+            if isinstance(field, fields.Nested) and isinstance(prop, RelationshipProperty):
+                if prop.uselist:
+                    raise ValueError(f"{type(schema).__name__}.{name}: collections are not supported")
+                target = aliased(prop.mapper.class_)
+                self._joins.append((target, attribute.of_type(target)))
+                # the relationship is None if the joined row is missing
+                presence = self._column(getattr(target, prop.mapper.primary_key[0].key))
+                nodes.append((key, presence, None, self._compile(field.schema, target)))
+            elif isinstance(prop, ColumnProperty) and not isinstance(field, fields.Nested):
+                nodes.append((key, self._column(attribute), _converter(field, name), None))
+            else:
+                raise ValueError(f"{type(schema).__name__}.{name}: field is not a column")
+        return nodes
+
+    def select(self, *filters):
+        """
+        :param filters: WHERE clauses on the model of the schema
+        :return: Core select of exactly the columns the schema reads
+        """
+        query = select(*self.columns).select_from(self.model)
+        for target, on in self._joins:
+            query = query.outerjoin(target, on)
+        return query.where(*filters)
+
+    def _build(self, nodes, row):
+        data = {}
+        for key, index, convert, children in nodes:
+            value = row[index]
+            if children is not None:
+                data[key] = None if value is None else self._build(children, row)
+            else:
+                data[key] = None if value is None else convert(value)
+        return data
+
+    def dump(self, row):
+        """
+        :param row: row of ``select()``
+        :return: the dict ``schema.dump`` returns for the corresponding object
+        """
+        return self._build(self._nodes, row)
+
+    def dumps(self, row):
+        """
+        :param row: row of ``select()``
+        :return: the JSON text ``schema.dumps`` returns for the corresponding object
+        """
+        return json.dumps(self._build(self._nodes, row))
+
+    def stream(self, rows, batch=1000):
+        """
+        :param rows: rows of ``select()``
+        :param batch: number of rows per chunk, every chunk is a separate write of the response
+        :return: generator of the chunks of the JSON array of the rows
+        """
+        nodes, build, dumps = self._nodes, self._build, json.dumps
+        for start in range(0, len(rows), batch):
+            chunk = ",".join([dumps(build(nodes, row)) for row in rows[start:start + batch]])
+            yield ("[" if start == 0 else ",") + chunk
+        yield "]" if rows else "[]"
+
+
+@functools.lru_cache(maxsize=256)
+def _layout(schema, only):
+    return Layout(project(schema, only))
+
+
+def layout(schema, only=None):
+    """
+    :param schema: schema class
+    :param only: requested fields, see ``project``
+    :return: compiled layout of the (projected) schema, compiled on first use
+    :raises InvalidFields: if a requested name is not a field of the schema
+    """
+    return _layout(schema, tuple(sorted(set(only))) if only else None)
@@ -0,0 +1,178 @@
+"""
+Cache warm-up for the SPONGE API.
+
+Replays a manifest of requests through the connexion test client, so the responses are computed and
+stored in the cache before users ask for them (e.g. after a redis restart or a new database version).
+A manifest is a text file whose lines are either JSON objects (``{"path": "/getOverallCounts",
+"query": {"sponge_db_version": 2}}`` or ``{"url": "/sponge-api/getOverallCounts?sponge_db_version=2"}``)
+or lines of an access log (gunicorn access log or the "Incoming request" lines logged by the app).
+
+Usage: ``python -m app.warmup <manifest> [--concurrency 4] [--top 500]``
+"""
+
+import argparse
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = "/sponge-api"
+
+_log_patterns = [
+    re.compile(r'"GET (\S+) HTTP/[\d.]+"\s+(\d{3})'),
+    re.compile(r"Incoming request: GET (\S+)"),
+]
+
+
+def canonical_url(url):
+    """
+    Bring a request url into a canonical form: without host, with API prefix and sorted query parameters.
+    :param url: url or path with query string
+    :return: canonical url
+    """
+    parts = urlsplit(url)
+    path = parts.path
+    if not path.startswith(API_PREFIX):
+        path = API_PREFIX + ("" if path.startswith("/") else "/") + path
+    query = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    return path + ("?" + urlencode(query) if query else "")
+
+
+def parse_manifest_line(line):
+    """
+    :param line: line of a manifest file
+    :return: canonical url of the request or None if the line does not describe a GET request
+    """
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith("{"):
+        entry = json.loads(line)
+        if entry.get("method", "GET").upper() != "GET":
+            return None
+        if "url" in entry:
+            return canonical_url(entry["url"])
+        query = [(k, v) for k, values in entry.get("query", {}).items()
+                 for v in (values if isinstance(values, list) else [values])]
+        return canonical_url(entry["path"] + ("?" + urlencode(query) if query else ""))
+    for pattern in _log_patterns:
+        match = pattern.search(line)
+        if match:
+            if len(match.groups()) > 1 and not match.group(2).startswith("2"):
+                return None
+            return canonical_url(match.group(1))
+    return None
+
+
+def read_manifest(path, top=None):
+    """
+    Read the distinct requests of a manifest, the most frequent ones first.
+    :param path: path of the manifest or access log
+    :param top: only return the most frequent requests
+    :return: list of canonical urls
+    """
+    counts = Counter()
+    with open(path) as f:
+        for line in f:
+            try:
+                url = parse_manifest_line(line)
+            except (ValueError, KeyError):
+                logger.warning(f"Skipping invalid manifest line: {line.strip()}")
+                continue
+            if url is not None and not url.startswith(API_PREFIX + "/ui"):
+                counts[url] += 1
+    return [url for url, _ in counts.most_common(top)]
+
+
+def warm_up(connex_app, urls, concurrency=4):
+    """
+    Request all urls with a bounded number of concurrent requests.
+    :param connex_app: connexion app with the API added (see server.py)
+    :param urls: canonical urls to request
+    :param concurrency: number of concurrent requests
+    :return: per endpoint statistics: requests, failed requests, total and maximal time in seconds
+    """
+    local = threading.local()
+    report = {}
+    lock = threading.Lock()
+
+    def request(url):
+        if not hasattr(local, "client"):
+            local.client = connex_app.test_client()
+        start = time.perf_counter()
+        try:
+            failed = local.client.get(url).status_code >= 500
+        except Exception:
+            logger.exception(f"Warm-up request {url} failed")
+            failed = True
+        duration = time.perf_counter() - start
+        endpoint = urlsplit(url).path
+        with lock:
+            stats = report.setdefault(endpoint, {"requests": 0, "failed": 0, "seconds": 0.0, "max_seconds": 0.0})
+            stats["requests"] += 1
+            stats["failed"] += failed
+            stats["seconds"] += duration
+            stats["max_seconds"] = max(stats["max_seconds"], duration)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(request, urls))
+    return report
+
+
+def format_report(report):
+    lines = [f"{'endpoint':<60} {'requests':>8} {'failed':>6} {'seconds':>9} {'max':>8}"]
+    for endpoint, stats in sorted(report.items(), key=lambda kv: kv[1]["seconds"], reverse=True):
+        lines.append(f"{endpoint:<60} {stats['requests']:>8} {stats['failed']:>6} "
+                     f"{stats['seconds']:>9.2f} {stats['max_seconds']:>8.2f}")
+    return "\n".join(lines)
+
+
+def start_warmup_thread(connex_app, cache, manifest, concurrency=2, top=None):
+    """
+    Warm up the cache in a background thread after the start of the server. With several workers only
+    the first one that gets the lock replays the manifest.
+    """
+    lock = cache._lock(f"warmup:{manifest}", 60 * 60)
+
+    def run():
+        try:
+            if not lock.acquire():
+                return
+            urls = read_manifest(manifest, top)
+            logger.info(f"Warming up the cache with {len(urls)} requests from {manifest}")
+            report = warm_up(connex_app, urls, concurrency)
+            logger.info("Cache warm-up finished\n" + format_report(report))
+        except Exception:
+            logger.exception("Cache warm-up failed")
+
+    thread = threading.Thread(target=run, name="cache-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm up the SPONGE API cache from a manifest or access log")
+    parser.add_argument("manifest", help="JSON lines manifest or access log")
+    parser.add_argument("--concurrency", type=int, default=4, help="number of concurrent requests")
+    parser.add_argument("--top", type=int, default=None, help="only replay the most frequent requests")
+    args = parser.parse_args(argv)
+
+    from server import connex_app
+
+    urls = read_manifest(args.manifest, args.top)
+    start = time.perf_counter()
+    report = warm_up(connex_app, urls, args.concurrency)
+    print(format_report(report))
+    print(f"{len(urls)} requests in {time.perf_counter() - start:.2f}s")
+    return 1 if any(stats["failed"] for stats in report.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,28 @@
+"""
+Hooks of the gunicorn server of the Docker image (see Dockerfile).
+
+The app is preloaded: server.py is imported once by the master and the workers are forked from it.
+Connections the master opened while loading (database, redis) must not be inherited by the workers,
+and threads of the master do not survive the fork, so background work is started in the workers.
+"""
+
+
+def pre_fork(server, worker):
+    """
+    Close the connections of the master before each worker is forked, the pools reconnect on first use.
+    """
+    from app.config import app, db, cache
+
+    with app.app_context():
+        db.engine.dispose()
+    cache.disconnect()
+
+
+def post_worker_init(worker):
+    """
+    Start the cache warm-up in the worker. With redis only the first worker that gets the warm-up lock
+    replays the manifest (see app/warmup.py).
+    """
+    import server
+
+    server.start_warmup()
@@ -0,0 +1,87 @@
+"""
+Benchmark of the serialization paths of the expression endpoints.
+
+Fills a scratch sqlite database with synthetic expression values, requests every endpoint with
+marshmallow (default) and with the fast path (SPONGE_FAST_SERIALIZATION) and prints the median
+response times. The responses of both paths are compared byte for byte.
+
+Run from the repository root:
+    python otherStuff/scripts/benchmark_serialization.py --rows 50000 --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+os.environ["SPONGE_DB_URI"] = "sqlite://"
+os.environ["SPONGE_CACHE_BACKEND"] = "local"
+
+import server
+from app.config import app, db, cache
+import app.models as models
+
+GENES = 10
+ENDPOINTS = {
+    "getceRNA": "/exprValue/getceRNA?ensg_number=" + ",".join(f"ENSG{i}" for i in range(1, GENES + 1)),
+    "getTranscriptExpr": "/exprValue/getTranscriptExpr?enst_number=" + ",".join(f"ENST{i}" for i in range(1, GENES + 1)),
+    "getmiRNA": "/exprValue/getmiRNA?mimat_number=" + ",".join(f"MIMAT{i}" for i in range(1, GENES + 1)),
+}
+
+
+def fill(rows):
+    db.create_all()
+    db.session.add_all([
+        models.Disease(disease_ID=1, disease_name="breast"),
+        models.Dataset(dataset_ID=1, disease_ID=1, disease_name="breast", disease_subtype="Basal", sponge_db_version=2),
+    ])
+    for i in range(1, GENES + 1):
+        db.session.add_all([
+            models.Gene(gene_ID=i, ensg_number=f"ENSG{i}", gene_symbol=f"G{i}"),
+            models.Transcript(transcript_ID=i, gene_ID=i, enst_number=f"ENST{i}"),
+            models.miRNA(miRNA_ID=i, mir_ID=f"MIMAT{i}", hs_nr=f"hsa-{i}"),
+        ])
+    db.session.commit()
+    for table in (models.GeneExpressionValues, models.ExpressionDataTranscript, models.MiRNAExpressionValues):
+        foreign_key = {models.GeneExpressionValues: "gene_ID", models.ExpressionDataTranscript: "transcript_ID",
+                       models.MiRNAExpressionValues: "miRNA_ID"}[table]
+        db.session.execute(table.__table__.insert(), [
+            {"dataset_ID": 1, foreign_key: i % GENES + 1, "expr_value": i / 7, "sample_ID": f"TCGA-{i}"}
+            for i in range(rows)
+        ])
+    db.session.commit()
+
+
+def measure(client, url, repeat):
+    times, content = [], None
+    for _ in range(repeat):
+        cache.clear()
+        start = time.perf_counter()
+        response = client.get("/sponge-api" + url)
+        content = response.content
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), content
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000, help="expression values per table")
+    parser.add_argument("--repeat", type=int, default=5, help="requests per endpoint and path")
+    args = parser.parse_args()
+
+    with app.app_context():
+        fill(args.rows)
+        client = server.connex_app.test_client()
+        print(f"{'endpoint':<20}{'marshmallow [s]':>18}{'fast [s]':>12}{'speedup':>10}  identical")
+        for name, url in ENDPOINTS.items():
+            app.config["FAST_SERIALIZATION"] = False
+            slow, expected = measure(client, url, args.repeat)
+            app.config["FAST_SERIALIZATION"] = True
+            fast, content = measure(client, url, args.repeat)
+            print(f"{name:<20}{slow:>18.3f}{fast:>12.3f}{slow / fast:>9.1f}x  {content == expected}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+-- Canonical undirected storage of the ceRNA interactions.
+--
+-- ceRNA interactions are undirected. They are stored once with the smaller ID as first endpoint
+-- (gene_ID1 < gene_ID2, transcript_ID_1 < transcript_ID_2), and the adjacency tables hold one row
+-- per endpoint, so "all interactions of gene X in run R" is a single range scan of the primary key
+-- (no UNION / OR over both endpoint columns).
+--
+-- The script is idempotent: run it once to migrate existing databases and after imports that do not write
+-- canonical pairs and adjacency rows themselves (otherStuff/scripts/fillDataBase.R does). Until a run has
+-- adjacency rows the api finds its interactions with the slower filter over both endpoint columns.
+
+-- 1. canonical endpoint order
+-- swapped without user variables: single-table UPDATEs assign left to right, each assignment sees the
+-- values of the previous ones
+UPDATE interactions_genegene
+SET gene_ID1 = gene_ID1 + gene_ID2, gene_ID2 = gene_ID1 - gene_ID2, gene_ID1 = gene_ID1 - gene_ID2
+WHERE gene_ID1 > gene_ID2;
+
+UPDATE interactions_transcripttranscript
+SET transcript_ID_1 = transcript_ID_1 + transcript_ID_2, transcript_ID_2 = transcript_ID_1 - transcript_ID_2,
+    transcript_ID_1 = transcript_ID_1 - transcript_ID_2
+WHERE transcript_ID_1 > transcript_ID_2;
+
+-- 2. adjacency tables
+CREATE TABLE IF NOT EXISTS interactions_genegene_adjacency(
+sponge_run_ID int NOT NULL,
+gene_ID int NOT NULL,
+interactions_genegene_ID int NOT NULL,
+PRIMARY KEY(sponge_run_ID, gene_ID, interactions_genegene_ID),
+FOREIGN KEY(sponge_run_ID) REFERENCES sponge_run(sponge_run_ID),
+FOREIGN KEY(gene_ID) REFERENCES gene(gene_ID),
+FOREIGN KEY(interactions_genegene_ID) REFERENCES interactions_genegene(interactions_genegene_ID) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS interactions_transcripttranscript_adjacency(
+sponge_run_ID int NOT NULL,
+transcript_ID int NOT NULL,
+interactions_transcripttranscript_ID int NOT NULL,
+PRIMARY KEY(sponge_run_ID, transcript_ID, interactions_transcripttranscript_ID),
+FOREIGN KEY(sponge_run_ID) REFERENCES sponge_run(sponge_run_ID),
+FOREIGN KEY(transcript_ID) REFERENCES transcript(transcript_ID),
+FOREIGN KEY(interactions_transcripttranscript_ID)
+    REFERENCES interactions_transcripttranscript(interactions_transcripttranscript_ID) ON DELETE CASCADE
+);
+
+-- 3. fill the adjacency tables, rows that already exist are skipped
+INSERT IGNORE INTO interactions_genegene_adjacency(sponge_run_ID, gene_ID, interactions_genegene_ID)
+SELECT sponge_run_ID, gene_ID1, interactions_genegene_ID FROM interactions_genegene;
+INSERT IGNORE INTO interactions_genegene_adjacency(sponge_run_ID, gene_ID, interactions_genegene_ID)
+SELECT sponge_run_ID, gene_ID2, interactions_genegene_ID FROM interactions_genegene;
+
+INSERT IGNORE INTO interactions_transcripttranscript_adjacency(sponge_run_ID, transcript_ID, interactions_transcripttranscript_ID)
+SELECT sponge_run_ID, transcript_ID_1, interactions_transcripttranscript_ID FROM interactions_transcripttranscript;
+INSERT IGNORE INTO interactions_transcripttranscript_adjacency(sponge_run_ID, transcript_ID, interactions_transcripttranscript_ID)
+SELECT sponge_run_ID, transcript_ID_2, interactions_transcripttranscript_ID FROM interactions_transcripttranscript;
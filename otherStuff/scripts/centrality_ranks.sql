@@ -0,0 +1,69 @@
+-- Precomputed centrality ranks of the network analysis tables.
+--
+-- getGeneNetwork / getTranscriptNetwork sort nodes by one or more of betweenness, node_degree and
+-- eigenvector. Instead of rank() window functions over every request's node set, each node stores its
+-- rank within its sponge run per value (1 = highest value, ties share the lowest rank, NULL last) and the
+-- mean of the three ranks. Every rank column is indexed together with sponge_run_ID, so selecting the
+-- top nodes of a run is an index range scan.
+--
+-- The script is idempotent (MySQL 8): run it once to migrate and again after every import of new
+-- sponge runs. Until then the nodes of new runs have NULL ranks, the api ranks them with window functions
+-- over the unranked nodes of their run when they are read (slower, same order).
+
+-- 1. rank columns and indexes, added only if they do not exist yet
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.columns
+               WHERE table_schema = DATABASE() AND table_name = 'network_analysis_gene'
+                 AND column_name = 'combined_rank') = 0,
+    'ALTER TABLE network_analysis_gene
+        ADD COLUMN betweenness_rank int, ADD COLUMN eigenvector_rank int,
+        ADD COLUMN node_degree_rank int, ADD COLUMN combined_rank double,
+        ADD INDEX idx_network_analysis_gene_betweenness_rank (sponge_run_ID, betweenness_rank),
+        ADD INDEX idx_network_analysis_gene_eigenvector_rank (sponge_run_ID, eigenvector_rank),
+        ADD INDEX idx_network_analysis_gene_node_degree_rank (sponge_run_ID, node_degree_rank),
+        ADD INDEX idx_network_analysis_gene_combined_rank (sponge_run_ID, combined_rank)',
+    'DO 0');
+PREPARE statement FROM @ddl;
+EXECUTE statement;
+DEALLOCATE PREPARE statement;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.columns
+               WHERE table_schema = DATABASE() AND table_name = 'network_analysis_transcript'
+                 AND column_name = 'combined_rank') = 0,
+    'ALTER TABLE network_analysis_transcript
+        ADD COLUMN betweenness_rank int, ADD COLUMN eigenvector_rank int,
+        ADD COLUMN node_degree_rank int, ADD COLUMN combined_rank double,
+        ADD INDEX idx_network_analysis_transcript_betweenness_rank (sponge_run_ID, betweenness_rank),
+        ADD INDEX idx_network_analysis_transcript_eigenvector_rank (sponge_run_ID, eigenvector_rank),
+        ADD INDEX idx_network_analysis_transcript_node_degree_rank (sponge_run_ID, node_degree_rank),
+        ADD INDEX idx_network_analysis_transcript_combined_rank (sponge_run_ID, combined_rank)',
+    'DO 0');
+PREPARE statement FROM @ddl;
+EXECUTE statement;
+DEALLOCATE PREPARE statement;
+
+-- 2. ranks per run
+UPDATE network_analysis_gene n
+JOIN (
+    SELECT network_analysis_gene_ID,
+           RANK() OVER (PARTITION BY sponge_run_ID ORDER BY betweenness DESC) AS betweenness_rank,
+           RANK() OVER (PARTITION BY sponge_run_ID ORDER BY eigenvector DESC) AS eigenvector_rank,
+           RANK() OVER (PARTITION BY sponge_run_ID ORDER BY node_degree DESC) AS node_degree_rank
+    FROM network_analysis_gene
+) r USING (network_analysis_gene_ID)
+SET n.betweenness_rank = r.betweenness_rank,
+    n.eigenvector_rank = r.eigenvector_rank,
+    n.node_degree_rank = r.node_degree_rank,
+    n.combined_rank = (r.betweenness_rank + r.eigenvector_rank + r.node_degree_rank) / 3;
+
+UPDATE network_analysis_transcript n
+JOIN (
+    SELECT network_analysis_transcript_ID,
+           RANK() OVER (PARTITION BY sponge_run_ID ORDER BY betweenness DESC) AS betweenness_rank,
+           RANK() OVER (PARTITION BY sponge_run_ID ORDER BY eigenvector DESC) AS eigenvector_rank,
+           RANK() OVER (PARTITION BY sponge_run_ID ORDER BY node_degree DESC) AS node_degree_rank
+    FROM network_analysis_transcript
+) r USING (network_analysis_transcript_ID)
+SET n.betweenness_rank = r.betweenness_rank,
+    n.eigenvector_rank = r.eigenvector_rank,
+    n.node_degree_rank = r.node_degree_rank,
+    n.combined_rank = (r.betweenness_rank + r.eigenvector_rank + r.node_degree_rank) / 3;
@@ -15,6 +15,24 @@ connex_app = config.connex_app
 swagger_file = os.path.join(os.path.dirname(__file__), "swagger.yml")
 connex_app.add_api(swagger_file, resolver=RelativeResolver('app.controllers'))
 
+# load the identifier indexes before gunicorn forks the workers (--preload), so all workers share them
+if os.getenv("SPONGE_PRELOAD_IDENTIFIERS"):
+    from app import identifiers
+    identifiers.preload(config.app)
+
+
+def start_warmup():
+    """
+    Optionally warm up the cache with the requests of a manifest or access log (see app/warmup.py).
+    Called by the gunicorn workers (see gunicorn.conf.py) and the development server, not on import:
+    with --preload the module is imported by the gunicorn master, whose threads do not survive the fork.
+    """
+    if os.getenv("CACHE_WARMUP_MANIFEST"):
+        from app.warmup import start_warmup_thread
+        start_warmup_thread(connex_app, config.cache, os.getenv("CACHE_WARMUP_MANIFEST"),
+                            top=int(os.getenv("CACHE_WARMUP_TOP", 0)) or None)
+
+
 # create a URL route in our application for "/"
 @connex_app.route("/sponge-api/")
 def home():
@@ -22,5 +40,6 @@ def home():
 
 if __name__ == "__main__":
     print("serving on port: ", config.PORT)
+    start_warmup()
     connex_app.run(port=config.PORT)
 